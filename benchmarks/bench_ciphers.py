@@ -0,0 +1,73 @@
+"""
+Микробенчмарк шифров сессии.
+
+Запуск: python -m benchmarks.bench_ciphers
+"""
+
+import os
+import argparse
+
+import security
+from benchmarks.common import measure, format_size, print_table
+
+PAYLOAD_SIZES = (100, 4 * 1024, 256 * 1024)
+
+
+def bench_cipher(name: str, size: int, number: int) -> list:
+    """
+    Замеряет шифрование и дешифрование одного фрейма.
+
+    :param name: Название шифра.
+    :type name: str
+    :param size: Размер открытых данных.
+    :type size: int
+    :param number: Количество итераций.
+    :type number: int
+    :return: Строка таблицы результатов.
+    :rtype: list
+    """
+    secret = security.generate_fernet_key()
+    sender = security.create_session_cipher(name, secret, security.DIRECTION_SERVER)
+    receiver = security.create_session_cipher(name, secret, security.DIRECTION_CLIENT)
+
+    payload = os.urandom(size)
+    encrypted = sender.encrypt(payload)
+
+    encrypt_time = measure(lambda: sender.encrypt(payload), number=number)
+    # AEAD отклоняет повтор фрейма: каждый замер расшифровывает новый фрейм
+    frames = iter([sender.encrypt(payload) for _ in range(number * 5)])
+    decrypt_time = measure(lambda: receiver.decrypt(next(frames)), number=number, repeat=5)
+    throughput = size / encrypt_time / (1024 * 1024)
+
+    return [
+        name,
+        format_size(size),
+        f"{encrypt_time * 1e6:.1f}",
+        f"{decrypt_time * 1e6:.1f}",
+        f"{throughput:.0f}",
+        f"{len(encrypted) / size:.2f}",
+    ]
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк шифров сессии")
+    parser.add_argument("--number", type=int, default=200, help="Итераций на замер")
+    args = parser.parse_args()
+
+    rows = []
+    for size in PAYLOAD_SIZES:
+        number = max(1, args.number * 1024 // max(size, 1024))
+        for name in security.SUPPORTED_CIPHERS:
+            rows.append(bench_cipher(name, size, number))
+
+    print_table(
+        ["cipher", "payload", "encrypt, us", "decrypt, us", "encrypt MiB/s", "overhead x"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Бенчмарк сериализации пакетов по типам действий.
+
+Сравнивает старую схему (`json-legacy`: `data` - строка JSON внутри JSON, клиент
+разбирает её вторым `json.loads`) со структурными кодеками (`json`, а также
+`msgpack`/`cbor`, если установлены).
+
+Запуск: python -m benchmarks.bench_codecs
+"""
+
+import json
+import argparse
+from datetime import datetime
+
+from dto.models import ServerResponse, SendMessageRequest, IncomingMessagePacket
+from protocol import codecs
+from benchmarks.common import measure, print_table
+
+
+def sample_packets() -> dict:
+    """
+    Типичные пакеты каждого действия.
+
+    :return: Имя действия -> пакет.
+    :rtype: dict
+    """
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    incoming = IncomingMessagePacket(
+        sender_id=1, sender_login="alice", content="Привет! Как дела?", timestamp=now
+    )
+    history = [
+        {
+            "sender_login": "alice" if i % 2 else "bob",
+            "content": f"Сообщение номер {i} в истории переписки",
+            "timestamp": now.isoformat(),
+            "is_me": bool(i % 2),
+        }
+        for i in range(20)
+    ]
+    users = [{"id": i, "login": f"user{i}", "username": f"User {i}"} for i in range(5)]
+
+    return {
+        "message": SendMessageRequest(
+            token="x" * 150, request_id=1, receiver_id=2, content="Привет! Как дела?"
+        ),
+        "success": ServerResponse(action="success", data="Сообщение отправлено!", request_id=1),
+        "new_message": ServerResponse(action="new_message", data=incoming.model_dump(mode="json")),
+        "message_history_result": ServerResponse(
+            action="message_history_result", data=history, request_id=2
+        ),
+        "user_list_result": ServerResponse(action="user_list_result", data=users, request_id=3),
+    }
+
+
+def client_decode(codec, payload: bytes) -> dict:
+    """
+    Декодирование на клиенте, включая второй разбор строки `data` у старого кодека.
+
+    :param codec: Кодек.
+    :param payload: Байты пакета.
+    :type payload: bytes
+    :return: Словарь пакета.
+    :rtype: dict
+    """
+    packet = codec.load(payload)
+    data = packet.get("data")
+    if codec.name == codecs.CODEC_LEGACY and isinstance(data, str) and data[:1] in "[{":
+        packet["data"] = json.loads(data)
+    return packet
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк кодеков пакетов")
+    parser.add_argument("--number", type=int, default=5000, help="Итераций на замер")
+    args = parser.parse_args()
+
+    names = (codecs.CODEC_LEGACY,) + codecs.SUPPORTED_CODECS
+    rows = []
+    for action, packet in sample_packets().items():
+        for name in names:
+            codec = codecs.get_codec(name)
+            payload = codec.dump(packet)
+            encode_time = measure(lambda: codec.dump(packet), number=args.number)
+            decode_time = measure(lambda: client_decode(codec, payload), number=args.number)
+            rows.append(
+                [
+                    action,
+                    name,
+                    len(payload),
+                    f"{encode_time * 1e6:.1f}",
+                    f"{decode_time * 1e6:.1f}",
+                ]
+            )
+
+    print_table(["action", "codec", "bytes", "encode, us", "decode, us"], rows)
+
+
+if __name__ == "__main__":
+    main()
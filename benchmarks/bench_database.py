@@ -0,0 +1,235 @@
+"""
+Бенчмарк SQLite под смешанной нагрузкой: настройки по умолчанию против PRAGMA
+и раздельных соединений писателя и читателей.
+
+Запускает настоящие эндпоинты `message`, `history` и `user_list` на временной
+БД с --tasks одновременными задачами (как одновременные запросы клиентов)
+в течение --duration секунд. Доля записей - --write-ratio. Сравниваются:
+
+- default: rollback журнал, synchronous=FULL, общий пул соединений;
+- pragmas: DEFAULT_PRAGMAS (WAL, synchronous=NORMAL, ...), общий пул;
+- split: DEFAULT_PRAGMAS, один писатель и пул из --readers читателей;
+- group: как split, плюс групповая запись сообщений (`server.message_writer`).
+
+Запуск: python -m benchmarks.bench_database --tasks 64 --duration 5
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from server import database, message_writer, user_directory
+from server.db_models import User, Message
+from server.controllers.chat import ChatController
+from server.controllers.users import UsersController
+from dto.models import SendMessageRequest, HistoryRequest, UserListRequest
+from benchmarks.common import percentile, print_table
+
+
+class BenchContext:
+    """Контекст без соединения: авторизация без проверки токена, ответы отбрасываются."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.failed = False
+
+    def authenticate(self, token: str) -> int:
+        return self.user_id
+
+    def create_session(self):
+        return database.async_session()
+
+    def create_read_session(self):
+        return database.read_session()
+
+    async def reply(self, status, data=None, next_cursor=None):
+        self.failed = status == "error"
+
+    async def reply_error(self, message):
+        self.failed = True
+
+    async def reply_success(self, message):
+        self.failed = False
+
+
+async def populate(users: int, messages: int):
+    """
+    Заполняет БД пользователями и историей переписки.
+
+    :param users: Количество пользователей.
+    :type users: int
+    :param messages: Количество сообщений.
+    :type messages: int
+    """
+    async with database.async_session() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="0" * 64)
+            for index in range(1, users + 1)
+        )
+        await session.commit()
+        session.add_all(
+            Message(
+                sender_id=random.randint(1, users),
+                receiver_id=random.randint(1, users),
+                content="x" * 64,
+            )
+            for _ in range(messages)
+        )
+        await session.commit()
+
+
+async def run_mixed(
+    users: int, tasks: int, duration: float, write_ratio: float
+) -> tuple[dict, dict, int]:
+    """
+    Смешанная нагрузка через эндпоинты контроллеров.
+
+    :param users: Количество пользователей в БД.
+    :type users: int
+    :param tasks: Одновременных задач.
+    :type tasks: int
+    :param duration: Длительность (секунды).
+    :type duration: float
+    :param write_ratio: Доля запросов `message`.
+    :type write_ratio: float
+    :return: Задержки записей, задержки чтений по действиям, число ошибок.
+    :rtype: tuple[dict, dict, int]
+    """
+    writes: list[float] = []
+    reads: dict[str, list[float]] = {"history": [], "user_list": []}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            user_id = random.randint(1, users)
+            ctx = BenchContext(user_id)
+            target = random.randint(1, users)
+            start = time.perf_counter()
+            try:
+                if random.random() < write_ratio:
+                    await ChatController(ctx).send_message(
+                        SendMessageRequest(token="t", receiver_id=target, content="x" * 64)
+                    )
+                    samples = writes
+                elif random.random() < 0.5:
+                    await ChatController(ctx).get_history(
+                        HistoryRequest(token="t", target_user_id=target, limit=20)
+                    )
+                    samples = reads["history"]
+                else:
+                    await UsersController(ctx).get_users(
+                        UserListRequest(token="t", page=random.randint(1, 5), page_size=20)
+                    )
+                    samples = reads["user_list"]
+            except Exception:
+                errors += 1
+                continue
+            if ctx.failed:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(tasks)))
+    return writes, reads, errors
+
+
+async def run_config(
+    name: str, pragmas: dict, readers: int, batch: int, args: argparse.Namespace, tmp: str
+) -> list:
+    """
+    Прогон одной конфигурации БД на свежем файле.
+
+    :param name: Название конфигурации.
+    :type name: str
+    :param pragmas: PRAGMA соединений.
+    :type pragmas: dict
+    :param readers: Соединений в пуле читателей.
+    :type readers: int
+    :param batch: Максимум сообщений в пачке групповой записи (0 - без неё).
+    :type batch: int
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param tmp: Временный каталог.
+    :type tmp: str
+    :return: Строка таблицы.
+    :rtype: list
+    """
+    database.setup_database(os.path.join(tmp, f"{name}.db"), pragmas, readers)
+    try:
+        await database.init_db()
+        await populate(args.users, args.messages)
+        user_directory.setup_user_directory()
+        message_writer.setup_message_writer(database.async_session, batch)
+        start = time.perf_counter()
+        writes, reads, errors = await run_mixed(
+            args.users, args.tasks, args.duration, args.write_ratio
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        await message_writer.shutdown()
+        await database.dispose()
+
+    all_reads = reads["history"] + reads["user_list"]
+    return [
+        name,
+        f"{len(writes) / elapsed:.0f}",
+        f"{percentile(writes, 0.5) * 1000:.1f}",
+        f"{percentile(writes, 0.99) * 1000:.1f}",
+        f"{len(all_reads) / elapsed:.0f}",
+        f"{percentile(all_reads, 0.5) * 1000:.1f}",
+        f"{percentile(all_reads, 0.99) * 1000:.1f}",
+        errors,
+    ]
+
+
+async def run(args: argparse.Namespace) -> list:
+    """
+    Прогон всех конфигураций.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Строки таблицы.
+    :rtype: list
+    """
+    configs = [
+        ("default", {}, 0, 0),
+        ("pragmas", database.DEFAULT_PRAGMAS, 0, 0),
+        ("split", database.DEFAULT_PRAGMAS, args.readers, 0),
+        ("group", database.DEFAULT_PRAGMAS, args.readers, message_writer.DEFAULT_MAX_BATCH),
+    ]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, pragmas, readers, batch in configs:
+            random.seed(args.seed)
+            rows.append(await run_config(name, pragmas, readers, batch, args, tmp))
+    return rows
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк SQLite под смешанной нагрузкой")
+    parser.add_argument("--tasks", type=int, default=64, help="Одновременных запросов")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность (секунды)")
+    parser.add_argument("--write-ratio", type=float, default=0.5, help="Доля запросов message")
+    parser.add_argument("--users", type=int, default=200, help="Пользователей в БД")
+    parser.add_argument("--messages", type=int, default=20000, help="Сообщений в БД до замера")
+    parser.add_argument("--readers", type=int, default=database.DEFAULT_READERS, help="Читателей")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    print(f"Задач: {args.tasks}, доля записей: {args.write_ratio}, секунд: {args.duration}")
+    print_table(
+        ["config", "writes/s", "w p50 ms", "w p99 ms", "reads/s", "r p50 ms", "r p99 ms", "errors"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Бенчмарк `ServerRouter` без сокетов: запросов в секунду через разбор пакета
+(байты -> модель запроса) и вызов эндпоинта.
+
+Эндпоинты принимают настоящие модели запросов из `dto.models`, но ничего не делают,
+поэтому замер показывает накладные расходы роутера, а не БД.
+
+Запуск: python -m benchmarks.bench_dispatch
+"""
+
+import time
+import asyncio
+import argparse
+
+from dto.models import (
+    LoginRequest,
+    RegisterRequest,
+    HistoryRequest,
+    SendMessageRequest,
+    UserListRequest,
+)
+from server.framework import ServerRouter, ServerContext, BaseController, action
+from benchmarks.common import print_table
+
+
+class NullWriter:
+    """Writer без сокета."""
+
+    def get_extra_info(self, name):
+        return ("bench", 0)
+
+    def writelines(self, parts):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullController(BaseController):
+    """Эндпоинты с реальными моделями запросов и пустым телом."""
+
+    @action("login")
+    async def login(self, req: LoginRequest):
+        pass
+
+    @action("register")
+    async def register(self, req: RegisterRequest):
+        pass
+
+    @action("history")
+    async def history(self, req: HistoryRequest):
+        pass
+
+    @action("message", ordered_by="receiver_id")
+    async def message(self, req: SendMessageRequest):
+        pass
+
+    @action("user_list")
+    async def user_list(self, req: UserListRequest):
+        pass
+
+
+def sample_requests(request_id: int | None) -> dict:
+    """
+    Закодированные пакеты каждого действия.
+
+    :param request_id: ID запроса (None - последовательный режим старых клиентов).
+    :type request_id: int | None
+    :return: Имя действия -> байты пакета.
+    :rtype: dict
+    """
+    token = "x" * 150
+    packets = [
+        LoginRequest(login="alice", password_hash="0" * 64),
+        RegisterRequest(login="alice", username="Alice", password_hash="0" * 64),
+        HistoryRequest(token=token, target_user_id=2, limit=20),
+        SendMessageRequest(token=token, receiver_id=2, content="Привет! Как дела?"),
+        UserListRequest(token=token, page=1, page_size=5, search_query="ali"),
+    ]
+    return {
+        packet.action: packet.model_copy(update={"request_id": request_id})
+        .model_dump_json()
+        .encode("utf-8")
+        for packet in packets
+    }
+
+
+async def bench_submit(router: ServerRouter, data: bytes, number: int) -> float:
+    """
+    Замеряет запросов в секунду через `router.submit`.
+
+    :param router: Роутер.
+    :type router: ServerRouter
+    :param data: Байты пакета.
+    :type data: bytes
+    :param number: Количество запросов.
+    :type number: int
+    :return: Запросов в секунду.
+    :rtype: float
+    """
+    ctx = ServerContext(None, NullWriter(), None, max_inflight=64)
+    start = time.perf_counter()
+    for _ in range(number):
+        await router.submit(ctx, data)
+    while ctx.tasks:
+        await asyncio.gather(*ctx.tasks)
+    return number / (time.perf_counter() - start)
+
+
+def bench_parse(router: ServerRouter, data: bytes, number: int) -> float:
+    """
+    Замеряет разборов в секунду (только `router.parse`).
+
+    :param router: Роутер.
+    :type router: ServerRouter
+    :param data: Байты пакета.
+    :type data: bytes
+    :param number: Количество разборов.
+    :type number: int
+    :return: Разборов в секунду.
+    :rtype: float
+    """
+    codec = ServerContext(None, NullWriter(), None).codec
+    start = time.perf_counter()
+    for _ in range(number):
+        router.parse(codec, data)
+    return number / (time.perf_counter() - start)
+
+
+async def run(number: int) -> list:
+    """
+    Прогон по всем действиям.
+
+    :param number: Запросов на замер.
+    :type number: int
+    :return: Строки таблицы.
+    :rtype: list
+    """
+    router = ServerRouter()
+    router.register(NullController)
+
+    sequential = sample_requests(None)
+    pipelined = sample_requests(1)
+
+    rows = []
+    for action_name, data in sequential.items():
+        rows.append(
+            [
+                action_name,
+                len(data),
+                f"{bench_parse(router, data, number):.0f}",
+                f"{await bench_submit(router, data, number):.0f}",
+                f"{await bench_submit(router, pipelined[action_name], number):.0f}",
+            ]
+        )
+    return rows
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк роутера сервера")
+    parser.add_argument("--number", type=int, default=20000, help="Запросов на замер")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args.number))
+    print_table(["action", "bytes", "parse/s", "dispatch/s", "pipelined/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк handshake: RSA-2048 OAEP против эфемерного X25519.
+
+Запуск: python -m benchmarks.bench_handshake
+"""
+
+import io
+import time
+import base64
+import asyncio
+import argparse
+import contextlib
+
+import security
+import main_server
+import main_client
+from client.framework import Context
+from benchmarks.common import measure, print_table
+
+
+def rsa_handshake_crypto(private_key, pem_base64: bytes):
+    """
+    Криптография одного RSA handshake (клиент + сервер).
+
+    :param private_key: Приватный RSA ключ сервера.
+    :param pem_base64: PEM строка сервера.
+    :type pem_base64: bytes
+    """
+    public_key = security.pem_to_public_key(base64.b64decode(pem_base64))
+    session_key = security.generate_fernet_key()
+    encrypted = security.encrypt_rsa(public_key, session_key)
+    security.decrypt_rsa(private_key, encrypted)
+
+
+def x25519_handshake_crypto(private_key):
+    """
+    Криптография одного X25519 handshake (клиент + сервер, с подписью сервера).
+
+    :param private_key: Приватный RSA ключ сервера.
+    """
+    client_private, client_public = security.generate_x25519_keys()
+    server_private, server_public = security.generate_x25519_keys()
+    security.x25519_session_secret(
+        server_private, security.x25519_public_bytes(client_public)
+    )
+    security.x25519_session_secret(
+        client_private, security.x25519_public_bytes(server_public)
+    )
+    signature = security.sign_rsa(private_key, b"transcript")
+    security.verify_rsa(private_key.public_key(), b"transcript", signature)
+
+
+async def loopback_handshakes(kex: str, total: int, concurrency: int, server_key=None) -> float:
+    """
+    Проводит handshake через реальный `handle_client` на loopback.
+
+    :param kex: Способ обмена ключами.
+    :type kex: str
+    :param server_key: Известный клиенту ключ сервера (сервер его не пересылает).
+    :param total: Всего соединений.
+    :type total: int
+    :param concurrency: Одновременных соединений.
+    :type concurrency: int
+    :return: Handshake в секунду.
+    :rtype: float
+    """
+    server = await asyncio.start_server(
+        lambda r, w: main_server.handle_client(r, w, None), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            ctx = Context(writer)
+            await main_client.perform_handshake(
+                reader, writer, ctx, kexes=(kex,), server_key=server_key
+            )
+            writer.close()
+            await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+    return total / elapsed
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк handshake")
+    parser.add_argument("--number", type=int, default=200, help="Итераций крипто-замера")
+    parser.add_argument("--connections", type=int, default=500, help="Соединений на loopback")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных соединений")
+    args = parser.parse_args()
+
+    private_key, public_key = security.generate_rsa_keys()
+    pem_base64 = base64.b64encode(security.public_key_to_pem(public_key))
+    main_server.set_server_key(private_key)
+
+    crypto = {
+        security.KEX_RSA: measure(
+            lambda: rsa_handshake_crypto(private_key, pem_base64), number=args.number
+        ),
+        security.KEX_X25519: measure(
+            lambda: x25519_handshake_crypto(private_key), number=args.number
+        ),
+    }
+
+    rows = []
+    for kex in security.SUPPORTED_KEX:
+        for known in (None, public_key):
+            with contextlib.redirect_stdout(io.StringIO()):
+                rate = asyncio.run(
+                    loopback_handshakes(kex, args.connections, args.concurrency, known)
+                )
+            rows.append(
+                [
+                    kex,
+                    "yes" if known else "no",
+                    f"{crypto[kex] * 1e6:.0f}",
+                    f"{1 / crypto[kex]:.0f}",
+                    f"{rate:.0f}",
+                ]
+            )
+
+    print_table(["kex", "known key", "crypto, us", "crypto hs/s", "loopback hs/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Бенчмарк поиска сообщений (`/search`): FTS5 индекс против LIKE '%q%'.
+
+Заполняет БД --messages сообщениями из случайных слов словаря (по умолчанию
+3M) между --users пользователями. Пользователь 1 участвует в каждом
+--hot-every сообщении. Замеряет страницу поиска для пользователя 1 и для
+обычного пользователя: частое и редкое слово, два слова, поиск в одном
+диалоге и глубокая страница по курсору.
+
+Запуск: python -m benchmarks.bench_message_search --messages 3000000
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+from server import database, search
+from benchmarks.common import print_table
+
+PAGE_SIZE = 20
+HOT_USER = 1
+SYLLABLES = ["ка", "ро", "ми", "ла", "то", "ве", "ну", "ди", "са", "пе", "жи", "го", "ры", "бо"]
+
+
+def vocabulary(size: int) -> list[str]:
+    """
+    Словарь случайных "слов" из слогов.
+
+    :param size: Размер словаря.
+    :type size: int
+    :return: Слова без повторов.
+    :rtype: list[str]
+    """
+    words = set()
+    while len(words) < size:
+        words.add("".join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    return sorted(words)
+
+
+def populate(path: str, users: int, messages: int, hot_every: int, words: list[str], batch: int = 100_000):
+    """
+    Заполняет БД напрямую через sqlite3 (FTS индекс - триггерами).
+
+    Частота слов убывает как у естественного языка (распределение Ципфа).
+
+    :param path: Путь к БД со схемой.
+    :type path: str
+    :param users: Количество пользователей.
+    :type users: int
+    :param messages: Количество сообщений.
+    :type messages: int
+    :param hot_every: Каждое какое сообщение - с пользователем HOT_USER.
+    :type hot_every: int
+    :param words: Словарь.
+    :type words: list[str]
+    :param batch: Строк в одной транзакции.
+    :type batch: int
+    """
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executemany(
+        "INSERT INTO user (id, login, username, password_hash) VALUES (?, ?, ?, ?)",
+        ((index, f"user{index}", f"User {index}", "0" * 64) for index in range(1, users + 1)),
+    )
+
+    started = datetime(2024, 1, 1)
+    written = 0
+    while written < messages:
+        rows = []
+        for index in range(written, min(written + batch, messages)):
+            sender = HOT_USER if index % hot_every == 0 else random.randint(2, users)
+            receiver = random.randint(2, users)
+            content = " ".join(random.choices(words, weights, k=random.randint(3, 12)))
+            timestamp = (started + timedelta(seconds=index)).isoformat(" ")
+            low, high = min(sender, receiver), max(sender, receiver)
+            rows.append((sender, receiver, content, 0, timestamp, low, high))
+        connection.executemany(
+            "INSERT INTO message (sender_id, receiver_id, content, is_readed, timestamp, "
+            "conversation_low, conversation_high) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+        written += len(rows)
+        print(f"\rСообщений: {written}/{messages}", end="", flush=True)
+    print()
+    connection.close()
+
+
+async def timed(session, query, repeat: int) -> tuple[float, list]:
+    """
+    Медиана времени страницы поиска.
+
+    :param session: Сессия БД.
+    :param query: Запрос поиска.
+    :param repeat: Повторов.
+    :type repeat: int
+    :return: Время (миллисекунды) и строки страницы.
+    :rtype: tuple[float, list]
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = (await session.execute(query.limit(PAGE_SIZE))).all()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, rows
+
+
+async def run(path: str, words: list[str], users: int, repeat: int, like: bool) -> list:
+    """
+    Замеры поиска через FTS5 (и через LIKE).
+
+    :param path: Путь к заполненной БД.
+    :type path: str
+    :param words: Словарь, которым заполнена БД.
+    :type words: list[str]
+    :param users: Количество пользователей.
+    :type users: int
+    :param repeat: Повторов на замер.
+    :type repeat: int
+    :param like: Замерять и LIKE (полный просмотр, медленно).
+    :type like: bool
+    :return: Строки таблицы.
+    :rtype: list
+    """
+    common, rare = words[0], words[len(words) // 10]
+    regular_user = users // 2
+    cases = [
+        ("частое слово", common, HOT_USER, None),
+        ("редкое слово", rare, HOT_USER, None),
+        ("два слова", f"{common} {words[1]}", HOT_USER, None),
+        ("частое, обычный пользователь", common, regular_user, None),
+        ("редкое, обычный пользователь", rare, regular_user, None),
+    ]
+    database.setup_database(path)
+    rows = []
+    try:
+        async with database.read_session() as session:
+            if not await search.fts_available(session, search.MESSAGE_SEARCH_TABLE):
+                print("SQLite без FTS5: оба столбца - LIKE")
+
+            # Собеседник пользователя 1 - для поиска в одном диалоге
+            _, page = await timed(session, search.message_search_query(common, HOT_USER, True), 1)
+            if page:
+                message = page[0][0]
+                target = message.receiver_id if message.sender_id == HOT_USER else message.sender_id
+                cases.append(("в одном диалоге", common, HOT_USER, target))
+
+            for name, query, user_id, target_id in cases:
+                fts_ms, found = await timed(
+                    session, search.message_search_query(query, user_id, True, target_id), repeat
+                )
+                like_ms = "-"
+                if like:
+                    like_ms, _ = await timed(
+                        session,
+                        search.message_search_query(query, user_id, False, target_id),
+                        repeat,
+                    )
+                    like_ms = f"{like_ms:.1f}"
+                rows.append([name, query, user_id, len(found), f"{fts_ms:.2f}", like_ms])
+
+            # Страница 50 по курсору: граница - последнее сообщение 49-й страницы
+            before_id = None
+            for _ in range(49):
+                _, page = await timed(
+                    session, search.message_search_query(common, HOT_USER, True, before_id=before_id), 1
+                )
+                if len(page) < PAGE_SIZE:
+                    break
+                before_id = page[-1][0].id
+            else:
+                fts_ms, found = await timed(
+                    session,
+                    search.message_search_query(common, HOT_USER, True, before_id=before_id),
+                    repeat,
+                )
+                rows.append(["страница 50 (курсор)", common, HOT_USER, len(found), f"{fts_ms:.2f}", "-"])
+    finally:
+        await database.dispose()
+    return rows
+
+
+async def prepare(path: str, words: list[str], args: argparse.Namespace):
+    """
+    Создаёт схему (с FTS индексом) и заполняет БД, если файла ещё нет.
+
+    :param path: Путь к БД.
+    :type path: str
+    :param words: Словарь.
+    :type words: list[str]
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    """
+    if os.path.exists(path):
+        return
+    database.setup_database(path)
+    await database.init_db()
+    await database.dispose()
+    populate(path, args.users, args.messages, args.hot_every, words)
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Поиск сообщений: FTS5 против LIKE")
+    parser.add_argument("--messages", type=int, default=3_000_000, help="Сообщений")
+    parser.add_argument("--users", type=int, default=10_000, help="Пользователей")
+    parser.add_argument("--hot-every", type=int, default=100, help="Каждое N-е сообщение - от пользователя 1")
+    parser.add_argument("--words", type=int, default=5000, help="Размер словаря")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на замер")
+    parser.add_argument("--no-like", dest="like", action="store_false", help="Не замерять LIKE")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора")
+    parser.add_argument("--db-path", help="Файл БД для повторных прогонов (по умолчанию временный)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    words = vocabulary(args.words)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db_path or os.path.join(tmp, "messages.db")
+        asyncio.run(prepare(path, words, args))
+        rows = asyncio.run(run(path, words, args.users, args.repeat, args.like))
+
+    print(f"Сообщений: {args.messages}, пользователей: {args.users}, страница: {PAGE_SIZE}")
+    print_table(["запрос", "строка", "user", "найдено", "fts ms", "like ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
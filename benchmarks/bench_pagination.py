@@ -0,0 +1,203 @@
+"""
+Бенчмарк постраничной выдачи: OFFSET против курсора (keyset) на глубоких страницах.
+
+Заполняет БД --messages сообщениями (по умолчанию 10M), из которых
+--conversation приходятся на один диалог, и --users пользователями, затем
+замеряет запрос страницы истории и списка пользователей на разной глубине:
+через OFFSET (как `page` раньше) и через курсор (`before_id`/`id > X`).
+С курсором время не зависит от глубины, с OFFSET растёт линейно.
+
+Заполнение 10M строк занимает минуты, поэтому БД можно сохранить и
+переиспользовать: --db-path путь (если файл есть, он не перезаполняется).
+
+Запуск: python -m benchmarks.bench_pagination --messages 10000000
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlmodel import select, col
+
+from server import database
+from server.db_models import User
+from server.controllers.chat import history_query
+from benchmarks.common import print_table
+
+PAGE_SIZE = 20
+HOT_PAIR = (1, 2)
+
+
+def populate(path: str, users: int, messages: int, conversation: int, batch: int = 100_000):
+    """
+    Быстро заполняет БД напрямую через sqlite3 (индекс диалога строится после загрузки).
+
+    :param path: Путь к БД со схемой.
+    :type path: str
+    :param users: Количество пользователей.
+    :type users: int
+    :param messages: Всего сообщений.
+    :type messages: int
+    :param conversation: Сообщений в диалоге HOT_PAIR.
+    :type conversation: int
+    :param batch: Строк в одной транзакции.
+    :type batch: int
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute("DROP INDEX IF EXISTS ix_message_conversation")
+    connection.executemany(
+        "INSERT INTO user (id, login, username, password_hash) VALUES (?, ?, ?, ?)",
+        ((index, f"user{index}", f"User {index}", "0" * 64) for index in range(1, users + 1)),
+    )
+
+    started = datetime(2024, 1, 1)
+    hot_every = max(1, messages // max(conversation, 1))
+    written = 0
+    while written < messages:
+        rows = []
+        for index in range(written, min(written + batch, messages)):
+            if index % hot_every == 0:
+                sender, receiver = HOT_PAIR if index % 2 else HOT_PAIR[::-1]
+            else:
+                sender, receiver = random.randint(3, users), random.randint(3, users)
+            low, high = min(sender, receiver), max(sender, receiver)
+            timestamp = (started + timedelta(seconds=index)).isoformat(" ")
+            rows.append((sender, receiver, "x" * 64, 0, timestamp, low, high))
+        connection.executemany(
+            "INSERT INTO message (sender_id, receiver_id, content, is_readed, timestamp, "
+            "conversation_low, conversation_high) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+        written += len(rows)
+        print(f"\rСообщений: {written}/{messages}", end="", flush=True)
+
+    print("\nПостроение индекса диалога...")
+    connection.execute(
+        "CREATE INDEX ix_message_conversation ON message (conversation_low, conversation_high, id)"
+    )
+    connection.execute("ANALYZE")
+    connection.commit()
+    connection.close()
+
+
+async def timed(session, query, repeat: int) -> float:
+    """
+    Медиана времени запроса с выборкой всех строк.
+
+    :param session: Сессия БД.
+    :param query: Запрос.
+    :param repeat: Повторов.
+    :type repeat: int
+    :return: Время (миллисекунды).
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        (await session.execute(query)).all()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run(path: str, depths: list[int], repeat: int) -> list:
+    """
+    Замеры страниц истории и списка пользователей на разной глубине.
+
+    :param path: Путь к заполненной БД.
+    :type path: str
+    :param depths: Номера страниц.
+    :type depths: list[int]
+    :param repeat: Повторов на замер.
+    :type repeat: int
+    :return: Строки таблицы.
+    :rtype: list
+    """
+    database.setup_database(path)
+    rows = []
+    try:
+        async with database.read_session() as session:
+            for depth in depths:
+                offset = depth * PAGE_SIZE
+                # ID записи перед страницей - то, что клиент получил бы в курсоре
+                message = (
+                    await session.execute(history_query(*HOT_PAIR, 1).offset(offset - 1))
+                ).scalar()
+                boundary = message.id if message is not None else None
+                user_boundary = (
+                    await session.execute(
+                        select(User.id).order_by(col(User.id)).offset(offset - 1).limit(1)
+                    )
+                ).scalar()
+                if boundary is None or user_boundary is None:
+                    break
+
+                rows.append(
+                    [
+                        depth,
+                        f"{await timed(session, history_query(*HOT_PAIR, PAGE_SIZE).offset(offset), repeat):.2f}",
+                        f"{await timed(session, history_query(*HOT_PAIR, PAGE_SIZE, before_id=boundary), repeat):.2f}",
+                        f"{await timed(session, select(User).order_by(col(User.id)).offset(offset).limit(PAGE_SIZE), repeat):.2f}",
+                        f"{await timed(session, select(User).order_by(col(User.id)).where(User.id > user_boundary).limit(PAGE_SIZE), repeat):.2f}",
+                    ]
+                )
+    finally:
+        await database.dispose()
+    return rows
+
+
+async def prepare(path: str, args: argparse.Namespace):
+    """
+    Создаёт схему и заполняет БД, если файла ещё нет.
+
+    :param path: Путь к БД.
+    :type path: str
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    """
+    if os.path.exists(path):
+        return
+    database.setup_database(path)
+    await database.init_db()
+    await database.dispose()
+    populate(path, args.users, args.messages, args.conversation)
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="OFFSET против курсора на глубоких страницах")
+    parser.add_argument("--messages", type=int, default=10_000_000, help="Всего сообщений")
+    parser.add_argument("--conversation", type=int, default=1_000_000, help="Сообщений в одном диалоге")
+    parser.add_argument("--users", type=int, default=200_000, help="Пользователей")
+    parser.add_argument(
+        "--depths", default="1,10,100,1000,5000,10000", help="Номера страниц (от 1) через запятую"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на замер")
+    parser.add_argument("--db-path", help="Файл БД для повторных прогонов (по умолчанию временный)")
+    args = parser.parse_args()
+
+    depths = [int(depth) for depth in args.depths.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db_path or os.path.join(tmp, "pagination.db")
+        asyncio.run(prepare(path, args))
+        rows = asyncio.run(run(path, depths, args.repeat))
+
+    print(f"Сообщений: {args.messages}, в диалоге: {args.conversation}, пользователей: {args.users}")
+    print_table(
+        ["page", "history offset ms", "history cursor ms", "users offset ms", "users cursor ms"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Бенчмарк отправки сообщений с кэшем справочника пользователей и без него.
+
+Гоняет эндпоинт `message` на временной БД (раздельные писатель и читатели,
+групповая запись) из --tasks одновременных задач. Отправители и получатели
+выбираются из --active активных пользователей среди --users. Сравниваются:
+
+- no-cache: кэш отключён, получатель и отправитель читаются из таблицы user;
+- lazy: кэш заполняется по промахам;
+- warm: кэш загружен при старте (`UserDirectory.warm`).
+
+Кроме скорости считаются SELECT к таблице user на пути отправки.
+
+Запуск: python -m benchmarks.bench_user_directory --messages 20000
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from sqlalchemy import event
+
+from server import database, message_writer, user_directory
+from server.db_models import User
+from server.controllers.chat import ChatController
+from dto.models import SendMessageRequest
+from benchmarks.common import percentile, print_table
+from benchmarks.bench_database import BenchContext
+
+
+async def populate(users: int):
+    """
+    Заполняет БД пользователями.
+
+    :param users: Количество пользователей.
+    :type users: int
+    """
+    async with database.async_session() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="0" * 64)
+            for index in range(1, users + 1)
+        )
+        await session.commit()
+
+
+async def send_messages(active: int, tasks: int, messages: int) -> tuple[list[float], int]:
+    """
+    Отправляет сообщения через ChatController.send_message.
+
+    :param active: Активных пользователей (ID 1..active).
+    :type active: int
+    :param tasks: Одновременных задач.
+    :type tasks: int
+    :param messages: Всего сообщений.
+    :type messages: int
+    :return: Задержки отправки и число ошибок.
+    :rtype: tuple[list[float], int]
+    """
+    latencies: list[float] = []
+    errors = 0
+    remaining = messages
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            ctx = BenchContext(random.randint(1, active))
+            request = SendMessageRequest(
+                token="t", receiver_id=random.randint(1, active), content="x" * 64
+            )
+            start = time.perf_counter()
+            await ChatController(ctx).send_message(request)
+            latencies.append(time.perf_counter() - start)
+            errors += ctx.failed
+
+    await asyncio.gather(*(worker() for _ in range(tasks)))
+    return latencies, errors
+
+
+async def run_config(name: str, cache_size: int, warm: bool, args: argparse.Namespace, tmp: str) -> list:
+    """
+    Прогон одной конфигурации кэша.
+
+    :param name: Имя конфигурации.
+    :type name: str
+    :param cache_size: Размер кэша (0 - без кэша).
+    :type cache_size: int
+    :param warm: Загрузить кэш перед прогоном.
+    :type warm: bool
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param tmp: Каталог для файла БД.
+    :type tmp: str
+    :return: Строка таблицы результатов.
+    :rtype: list
+    """
+    database.setup_database(os.path.join(tmp, f"{name}.db"), readers=args.readers)
+    user_selects = 0
+
+    def count_user_selects(conn, cursor, statement, parameters, context, executemany):
+        nonlocal user_selects
+        if statement.startswith("SELECT") and "FROM user" in statement:
+            user_selects += 1
+
+    try:
+        await database.init_db()
+        await populate(args.users)
+        directory = user_directory.setup_user_directory(cache_size)
+        if warm:
+            await directory.warm(database.read_session)
+        directory.reset_stats()
+        event.listen(database.read_engine.sync_engine, "before_cursor_execute", count_user_selects)
+        message_writer.setup_message_writer(database.async_session)
+
+        start = time.perf_counter()
+        latencies, errors = await send_messages(args.active, args.tasks, args.messages)
+        elapsed = time.perf_counter() - start
+        stats = directory.stats()
+    finally:
+        await message_writer.shutdown()
+        await database.dispose()
+
+    return [
+        name,
+        f"{len(latencies) / elapsed:.0f}",
+        f"{percentile(latencies, 0.5) * 1000:.2f}",
+        f"{percentile(latencies, 0.99) * 1000:.2f}",
+        user_selects,
+        f"{stats['hit_rate']:.1%}",
+        errors,
+    ]
+
+
+async def run(args: argparse.Namespace) -> list:
+    """
+    Прогон всех конфигураций.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Строки таблицы результатов.
+    :rtype: list
+    """
+    configs = [
+        ("no-cache", 0, False),
+        ("lazy", user_directory.DEFAULT_USER_CACHE_SIZE, False),
+        ("warm", user_directory.DEFAULT_USER_CACHE_SIZE, True),
+    ]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cache_size, warm in configs:
+            random.seed(args.seed)
+            rows.append(await run_config(name, cache_size, warm, args, tmp))
+    return rows
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Отправка сообщений с кэшем пользователей и без")
+    parser.add_argument("--users", type=int, default=10_000, help="Пользователей в БД")
+    parser.add_argument("--active", type=int, default=1000, help="Активных пользователей")
+    parser.add_argument("--messages", type=int, default=20_000, help="Сообщений")
+    parser.add_argument("--tasks", type=int, default=64, help="Одновременных задач")
+    parser.add_argument("--readers", type=int, default=database.DEFAULT_READERS, help="Соединений читателей")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    print(f"Пользователей: {args.users}, активных: {args.active}, сообщений: {args.messages}")
+    print_table(
+        ["config", "msg/s", "p50 ms", "p99 ms", "user SELECT", "hit rate", "errors"], rows
+    )
+
+
+if __name__ == "__main__":
+    main()
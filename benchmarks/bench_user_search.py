@@ -0,0 +1,155 @@
+"""
+Бенчмарк поиска пользователей (`/find`): FTS5 trigram индекс против LIKE '%q%'.
+
+Заполняет БД --users пользователями (по умолчанию 1M) и замеряет первую
+страницу поиска для запросов разной селективности: точный логин, начало
+логина, частая и редкая подстрока имени, короткий запрос (меньше 3 символов
+всегда идёт через LIKE).
+
+Запуск: python -m benchmarks.bench_user_search --users 1000000
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import statistics
+import tempfile
+
+from server import database, search
+from benchmarks.common import print_table
+
+PAGE_SIZE = 20
+FIRST_NAMES = ["Anna", "Boris", "Vera", "Gleb", "Daria", "Egor", "Inna", "Kirill", "Lada", "Mark"]
+LAST_NAMES = ["Ivanov", "Petrova", "Sidorov", "Orlova", "Smirnov", "Volkova", "Zaitsev", "Lebedeva"]
+
+
+def populate(path: str, users: int, batch: int = 100_000):
+    """
+    Заполняет БД пользователями напрямую через sqlite3 (FTS индекс - триггерами).
+
+    :param path: Путь к БД со схемой.
+    :type path: str
+    :param users: Количество пользователей.
+    :type users: int
+    :param batch: Строк в одной транзакции.
+    :type batch: int
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA synchronous=OFF")
+    for start in range(1, users + 1, batch):
+        connection.executemany(
+            "INSERT INTO user (id, login, username, password_hash) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    index,
+                    f"user{index}",
+                    f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)} {index % 9973}",
+                    "0" * 64,
+                )
+                for index in range(start, min(start + batch, users + 1))
+            ),
+        )
+        connection.commit()
+        print(f"\rПользователей: {min(start + batch - 1, users)}/{users}", end="", flush=True)
+    print()
+    connection.close()
+
+
+async def timed(session, query, repeat: int) -> tuple[float, int]:
+    """
+    Медиана времени первой страницы поиска.
+
+    :param session: Сессия БД.
+    :param query: Запрос поиска.
+    :param repeat: Повторов.
+    :type repeat: int
+    :return: Время (миллисекунды) и число найденных на странице.
+    :rtype: tuple[float, int]
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = (await session.execute(query.limit(PAGE_SIZE))).all()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, len(rows)
+
+
+async def run(path: str, users: int, repeat: int) -> list:
+    """
+    Замеры поиска через FTS5 и через LIKE.
+
+    :param path: Путь к заполненной БД.
+    :type path: str
+    :param users: Количество пользователей в БД.
+    :type users: int
+    :param repeat: Повторов на замер.
+    :type repeat: int
+    :return: Строки таблицы.
+    :rtype: list
+    """
+    queries = [
+        ("точный логин", f"user{users // 2}"),
+        ("начало логина", f"user{users // 20}"),
+        ("частая подстрока", "Petrov"),
+        ("редкая подстрока", "Orlova 4242"),
+        ("нет совпадений", "qwerty"),
+        ("короткий", "Gl"),
+    ]
+    database.setup_database(path)
+    rows = []
+    try:
+        async with database.read_session() as session:
+            if not await search.fts_available(session, search.USER_SEARCH_TABLE):
+                print("SQLite без FTS5/trigram: оба столбца - LIKE")
+            for name, query in queries:
+                fts_ms, found = await timed(session, search.user_search_query(query, True), repeat)
+                like_ms, _ = await timed(session, search.user_search_query(query, False), repeat)
+                rows.append([name, query, found, f"{fts_ms:.2f}", f"{like_ms:.2f}"])
+    finally:
+        await database.dispose()
+    return rows
+
+
+async def prepare(path: str, users: int):
+    """
+    Создаёт схему (с FTS индексом) и заполняет БД, если файла ещё нет.
+
+    :param path: Путь к БД.
+    :type path: str
+    :param users: Количество пользователей.
+    :type users: int
+    """
+    if os.path.exists(path):
+        return
+    database.setup_database(path)
+    await database.init_db()
+    await database.dispose()
+    populate(path, users)
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Поиск пользователей: FTS5 против LIKE")
+    parser.add_argument("--users", type=int, default=1_000_000, help="Пользователей")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на замер")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора")
+    parser.add_argument("--db-path", help="Файл БД для повторных прогонов (по умолчанию временный)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db_path or os.path.join(tmp, "users.db")
+        asyncio.run(prepare(path, args.users))
+        rows = asyncio.run(run(path, args.users, args.repeat))
+
+    print(f"Пользователей: {args.users}, страница: {PAGE_SIZE}")
+    print_table(["запрос", "строка", "найдено", "fts ms", "like ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import time
+import statistics
+from typing import Callable, Awaitable
+
+
+def measure(
+    func: Callable, number: int = 1000, repeat: int = 5, aggregate: Callable = statistics.median
+) -> float:
+    """
+    Замеряет среднее время одного вызова функции.
+
+    По умолчанию берётся медиана по повторам, чтобы сгладить шум планировщика.
+
+    :param func: Функция без аргументов.
+    :type func: Callable
+    :param number: Количество вызовов в одном повторе.
+    :type number: int
+    :param repeat: Количество повторов.
+    :type repeat: int
+    :param aggregate: Функция свёртки времён повторов (медиана, минимум).
+    :type aggregate: Callable
+    :return: Время одного вызова (секунды).
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return aggregate(timings)
+
+
+async def measure_async(
+    func: Callable[[], Awaitable],
+    number: int = 1000,
+    repeat: int = 5,
+    aggregate: Callable = statistics.median,
+) -> float:
+    """
+    Замеряет среднее время одного вызова корутинной функции в текущем loop.
+
+    :param func: Корутинная функция без аргументов.
+    :type func: Callable[[], Awaitable]
+    :param number: Количество вызовов в одном повторе.
+    :type number: int
+    :param repeat: Количество повторов.
+    :type repeat: int
+    :param aggregate: Функция свёртки времён повторов (медиана, минимум).
+    :type aggregate: Callable
+    :return: Время одного вызова (секунды).
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        timings.append((time.perf_counter() - start) / number)
+    return aggregate(timings)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Перцентиль выборки (ближайший ранг).
+
+    :param values: Значения.
+    :type values: list[float]
+    :param q: Уровень от 0 до 1.
+    :type q: float
+    :return: Перцентиль или 0 для пустой выборки.
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def format_size(size: int) -> str:
+    """
+    Форматирует размер в байтах для таблиц.
+
+    :param size: Размер (байты).
+    :type size: int
+    :return: Человекочитаемый размер.
+    :rtype: str
+    """
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)} MiB"
+    if size >= 1024:
+        return f"{size // 1024} KiB"
+    return f"{size} B"
+
+
+def print_table(headers: list[str], rows: list[list]) -> None:
+    """
+    Печатает результаты в виде таблицы.
+
+    :param headers: Заголовки колонок.
+    :type headers: list[str]
+    :param rows: Строки таблицы.
+    :type rows: list[list]
+    """
+    widths = [
+        max(len(str(value)) for value in [header] + [row[i] for row in rows])
+        for i, header in enumerate(headers)
+    ]
+    print(" | ".join(f"{header:<{widths[i]}}" for i, header in enumerate(headers)))
+    print("-+-".join("-" * width for width in widths))
+    for row in rows:
+        print(" | ".join(f"{str(value):<{widths[i]}}" for i, value in enumerate(row)))
@@ -0,0 +1,470 @@
+"""
+Сквозной бенчмарк: сколько пользователей выдерживает один сервер.
+
+Поднимает настоящий `main_server.py` на временной SQLite БД и открывает
+--clients одновременных клиентов. Каждый проходит реальный
+`perform_handshake`, регистрацию и вход, затем --duration секунд выполняет
+смесь запросов `message`, `history` и `user_list` в пропорции --mix
+(закрытый цикл: следующий запрос после ответа на предыдущий).
+
+Отчёт: скорость handshake, сообщений в секунду, задержка доставки от
+отправителя до получателя (время отправки зашито в текст сообщения - клиенты
+живут в одном процессе) и p50/p95/p99 по каждому действию. Результат
+пишется в JSON (--output) вместе с коммитом и параметрами прогона, чтобы
+сравнивать прогоны между коммитами (--compare предыдущий.json).
+
+Запуск: python -m benchmarks.e2e --clients 2000 --duration 30 --output e2e.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import jwt
+
+import main_client
+import event_loop
+from dto.models import (
+    RegisterRequest,
+    LoginRequest,
+    SendMessageRequest,
+    HistoryRequest,
+    UserListRequest,
+)
+from benchmarks.common import percentile, print_table
+from benchmarks.load import LoadClient, start_server, stop_server, wait_for_port
+
+ACTIONS = ("message", "history", "user_list")
+DEFAULT_MIX = "message=6,history=2,user_list=2"
+PASSWORD_HASH = "0" * 64
+
+
+class E2EClient(LoadClient):
+    """
+    Клиент сквозного бенчмарка: вход, смесь запросов, задержки по действиям.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Создаёт клиента поверх открытого соединения.
+
+        :param reader: Поток чтения.
+        :type reader: asyncio.StreamReader
+        :param writer: Поток записи.
+        :type writer: asyncio.StreamWriter
+        """
+        super().__init__(reader, writer)
+        self.latencies: dict[str, list[float]] = {name: [] for name in ACTIONS}
+        self.errors: dict[str, int] = {name: 0 for name in ACTIONS}
+        self.delivery_latencies: list[float] = []
+
+    async def handshake(self):
+        """
+        Проводит handshake и запускает чтение ответов.
+        """
+        await main_client.perform_handshake(self.reader, self.writer, self.ctx)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def register(self, login: str):
+        """
+        Регистрирует пользователя.
+
+        :param login: Логин пользователя.
+        :type login: str
+        :raises RuntimeError: Сервер отклонил регистрацию.
+        """
+        response = await self._call(
+            RegisterRequest(login=login, username=login, password_hash=PASSWORD_HASH)
+        )
+        if response["action"] != "auth_success":
+            raise RuntimeError(f"Регистрация {login}: {response['data']}")
+        payload = jwt.decode(response["data"], options={"verify_signature": False})
+        self.user_id = int(payload["sub"])
+
+    async def login(self, login: str):
+        """
+        Входит под зарегистрированным пользователем и сохраняет токен.
+
+        :param login: Логин пользователя.
+        :type login: str
+        :raises RuntimeError: Сервер отклонил вход.
+        """
+        response = await self._call(LoginRequest(login=login, password_hash=PASSWORD_HASH))
+        if response["action"] != "auth_success":
+            raise RuntimeError(f"Вход {login}: {response['data']}")
+        self.ctx.token = response["data"]
+
+    async def run_mix(
+        self, user_ids: list[int], weights: list[int], deadline: float, size: int, think: float
+    ):
+        """
+        Выполняет смесь запросов до наступления срока.
+
+        :param user_ids: ID всех пользователей прогона (собеседники).
+        :type user_ids: list[int]
+        :param weights: Веса действий в порядке ACTIONS.
+        :type weights: list[int]
+        :param deadline: Срок окончания (time.perf_counter).
+        :type deadline: float
+        :param size: Размер сообщения (символы).
+        :type size: int
+        :param think: Пауза между запросами (секунды).
+        :type think: float
+        """
+        peers = [user_id for user_id in user_ids if user_id != self.user_id] or user_ids
+        while time.perf_counter() < deadline:
+            name = random.choices(ACTIONS, weights)[0]
+            if name == "message":
+                stamp = f"{time.perf_counter():.6f}:"
+                packet = SendMessageRequest(
+                    receiver_id=random.choice(peers), content=stamp.ljust(size, "x")
+                )
+            elif name == "history":
+                packet = HistoryRequest(target_user_id=random.choice(peers), limit=20)
+            else:
+                packet = UserListRequest(page=random.randint(1, 3), page_size=20)
+
+            start = time.perf_counter()
+            try:
+                response = await self._call(packet)
+            except ConnectionError:
+                self.errors[name] += 1
+                return
+            self.latencies[name].append(time.perf_counter() - start)
+            if response["action"] == "error":
+                self.errors[name] += 1
+            if think:
+                await asyncio.sleep(think)
+
+    def on_delivery(self, response: dict):
+        """
+        Считает задержку доставки по времени отправки из текста сообщения.
+
+        :param response: Пакет new_message.
+        :type response: dict
+        """
+        super().on_delivery(response)
+        stamp, _, _ = response["data"]["content"].partition(":")
+        try:
+            self.delivery_latencies.append(time.perf_counter() - float(stamp))
+        except ValueError:
+            pass
+
+    async def _call(self, packet) -> dict:
+        """
+        Отправляет запрос с текущим токеном и ждёт ответ.
+
+        :param packet: Пакет запроса.
+        :return: Ответ сервера.
+        :rtype: dict
+        """
+        packet.token = self.ctx.token
+        return await (await self.ctx.request(packet))
+
+
+def parse_mix(value: str) -> list[int]:
+    """
+    Разбирает пропорции действий вида "message=6,history=2,user_list=2".
+
+    :param value: Строка пропорций.
+    :type value: str
+    :return: Веса в порядке ACTIONS.
+    :rtype: list[int]
+    :raises ValueError: Неизвестное действие или некорректный вес.
+    """
+    weights = dict.fromkeys(ACTIONS, 0)
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in weights:
+            raise ValueError(f"Неизвестное действие в смеси: {name}")
+        weights[name.strip()] = int(weight)
+    if any(weight < 0 for weight in weights.values()) or not any(weights.values()):
+        raise ValueError(f"Некорректные веса смеси: {value}")
+    return [weights[name] for name in ACTIONS]
+
+
+def raise_fd_limit(needed: int) -> int:
+    """
+    Поднимает мягкий лимит открытых файлов (его наследует и сервер).
+
+    :param needed: Требуемое число дескрипторов.
+    :type needed: int
+    :return: Установленный мягкий лимит.
+    :rtype: int
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    return soft
+
+
+def summarize(samples: list[float], elapsed: float, errors: int = 0) -> dict:
+    """
+    Сводка по выборке задержек.
+
+    :param samples: Задержки (секунды).
+    :type samples: list[float]
+    :param elapsed: Длительность фазы (секунды).
+    :type elapsed: float
+    :param errors: Количество ошибок.
+    :type errors: int
+    :return: Количество, частота и перцентили в миллисекундах.
+    :rtype: dict
+    """
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "rate": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
+
+
+async def run_e2e(
+    host: str,
+    port: int,
+    clients: int,
+    connect_concurrency: int,
+    duration: float,
+    weights: list[int],
+    size: int,
+    think: float,
+) -> dict:
+    """
+    Один сквозной прогон против запущенного сервера.
+
+    :param host: Хост.
+    :type host: str
+    :param port: Порт.
+    :type port: int
+    :param clients: Количество клиентов.
+    :type clients: int
+    :param connect_concurrency: Одновременных подключений при разгоне.
+    :type connect_concurrency: int
+    :param duration: Длительность смеси запросов (секунды).
+    :type duration: float
+    :param weights: Веса действий в порядке ACTIONS.
+    :type weights: list[int]
+    :param size: Размер сообщения (символы).
+    :type size: int
+    :param think: Пауза между запросами клиента (секунды).
+    :type think: float
+    :return: Результаты прогона.
+    :rtype: dict
+    """
+    semaphore = asyncio.Semaphore(connect_concurrency)
+    handshakes = []
+    prefix = f"e{os.getpid() % 1000}_"
+
+    async def connect() -> E2EClient:
+        async with semaphore:
+            start = time.perf_counter()
+            reader, writer = await asyncio.open_connection(host, port)
+            client = E2EClient(reader, writer)
+            await client.handshake()
+            handshakes.append(time.perf_counter() - start)
+            return client
+
+    async def authenticate(client: E2EClient, login: str, registers: list, logins: list):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.register(login)
+            registers.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await client.login(login)
+            logins.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    e2e_clients = await asyncio.gather(*(connect() for _ in range(clients)))
+    handshake_elapsed = time.perf_counter() - start
+
+    registers, logins = [], []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            authenticate(client, f"{prefix}{index}", registers, logins)
+            for index, client in enumerate(e2e_clients)
+        )
+    )
+    auth_elapsed = time.perf_counter() - start
+
+    user_ids = [client.user_id for client in e2e_clients]
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(
+        *(client.run_mix(user_ids, weights, deadline, size, think) for client in e2e_clients)
+    )
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.5)
+    for client in e2e_clients:
+        await client.close()
+
+    actions = {}
+    for name in ACTIONS:
+        samples = [value for client in e2e_clients for value in client.latencies[name]]
+        errors = sum(client.errors[name] for client in e2e_clients)
+        actions[name] = summarize(samples, elapsed, errors)
+
+    delivery = [value for client in e2e_clients for value in client.delivery_latencies]
+    return {
+        "clients": clients,
+        "duration": round(elapsed, 3),
+        "handshake": summarize(handshakes, handshake_elapsed),
+        "register": summarize(registers, auth_elapsed),
+        "login": summarize(logins, auth_elapsed),
+        "actions": actions,
+        "messages_per_second": round(
+            (actions["message"]["count"] - actions["message"]["errors"]) / elapsed, 1
+        ),
+        "delivery": summarize(delivery, elapsed),
+    }
+
+
+def git_commit() -> str | None:
+    """
+    Текущий коммит репозитория для сравнения прогонов.
+
+    :return: Короткий хеш коммита или None вне git.
+    :rtype: str | None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: dict, previous: dict | None = None):
+    """
+    Печатает результаты прогона, при наличии - с изменением к предыдущему.
+
+    :param result: Результаты прогона.
+    :type result: dict
+    :param previous: Результаты предыдущего прогона.
+    :type previous: dict | None
+    """
+    def delta(section: str, name: str, key: str) -> str:
+        if not previous:
+            return ""
+        old = previous.get(section, {}).get(name, {}) if section else previous.get(name, {})
+        new = result.get(section, {}).get(name, {}) if section else result.get(name, {})
+        if not old.get(key):
+            return ""
+        return f" ({(new[key] - old[key]) / old[key] * 100:+.0f}%)"
+
+    rows = []
+    for section, name in [("", "handshake"), ("", "register"), ("", "login")] + [
+        ("actions", action_name) for action_name in ACTIONS
+    ] + [("", "delivery")]:
+        stats = result[section][name] if section else result[name]
+        rows.append(
+            [
+                name,
+                stats["count"],
+                stats["errors"],
+                f"{stats['rate']:.0f}{delta(section, name, 'rate')}",
+                f"{stats['p50_ms']:.2f}{delta(section, name, 'p50_ms')}",
+                f"{stats['p99_ms']:.2f}{delta(section, name, 'p99_ms')}",
+            ]
+        )
+
+    print(
+        f"Коммит: {result['meta']['commit']}, клиентов: {result['clients']}, "
+        f"секунд: {result['duration']}, сообщений/с: {result['messages_per_second']}"
+    )
+    print_table(["phase", "count", "errors", "per s", "p50 ms", "p99 ms"], rows)
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк сервера реальными клиентами")
+    parser.add_argument("--clients", type=int, default=500, help="Одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность смеси (секунды)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Пропорции действий")
+    parser.add_argument("--size", type=int, default=64, help="Размер сообщения (символы)")
+    parser.add_argument("--think-ms", type=float, default=0, help="Пауза клиента между запросами")
+    parser.add_argument(
+        "--connect-concurrency", type=int, default=100, help="Одновременных подключений при разгоне"
+    )
+    parser.add_argument("--port", type=int, default=12701, help="Порт сервера")
+    parser.add_argument("--workers", type=int, default=1, help="Воркеров сервера")
+    parser.add_argument(
+        "--event-loop", default="asyncio", choices=event_loop.SUPPORTED_LOOPS, help="Event loop"
+    )
+    parser.add_argument("--server-arg", action="append", default=[], help="Доп. аргумент сервера")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    loop_name = event_loop.get_loop_factory(args.event_loop)[0]
+    fd_limit = raise_fd_limit(args.clients * 2 + 256)
+    if fd_limit < args.clients * 2 + 64:
+        print(f"Лимит открытых файлов {fd_limit} мал для {args.clients} клиентов", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = start_server(
+            args.port, args.workers, loop_name, os.path.join(tmp, "e2e.db"), args.server_arg
+        )
+        try:
+            event_loop.run(wait_for_port("127.0.0.1", args.port), loop_name)
+            result = event_loop.run(
+                run_e2e(
+                    "127.0.0.1",
+                    args.port,
+                    args.clients,
+                    args.connect_concurrency,
+                    args.duration,
+                    weights,
+                    args.size,
+                    args.think_ms / 1000,
+                ),
+                loop_name,
+            )
+        finally:
+            stop_server(process)
+
+    result["meta"] = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "event_loop": loop_name,
+        "args": vars(args),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            previous = json.load(file)
+    print_report(result, previous)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
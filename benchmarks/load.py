@@ -0,0 +1,360 @@
+"""
+Нагрузочный бенчмарк: соединений и сообщений в секунду в зависимости
+от числа воркеров и реализации event loop.
+
+Для каждого loop из --event-loops и каждого N от 1 до --max-workers поднимает
+`main_server.py --workers N --event-loop <loop>` на временной БД, подключает
+клиентов (handshake + регистрация, отсюда соединений в секунду), затем каждый
+клиент пишет соседу по кругу (часть доставок идёт через брокер) - отсюда
+подтверждённые сервером сообщения в секунду. Генератор нагрузки работает
+на том же loop, что и сервер.
+
+--variant NAME="АРГУМЕНТЫ" повторяет замер с другими аргументами сервера,
+например запись сообщений по одному против групповой:
+python -m benchmarks.load --max-workers 1 --variant single="--message-batch-size 0" --variant group=""
+
+Запуск: python -m benchmarks.load --max-workers 4 --event-loops asyncio,uvloop
+"""
+
+import os
+import sys
+import time
+import shlex
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import jwt
+
+import main_client
+import event_loop
+from client.framework import Context
+from dto.models import RegisterRequest, SendMessageRequest
+from protocol import framing
+from benchmarks.common import print_table
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main_server.py")
+
+
+class LoadClient:
+    """
+    Клиент без интерфейса: handshake, регистрация и счётчик входящих доставок.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Создаёт клиента поверх открытого соединения.
+
+        :param reader: Поток чтения.
+        :type reader: asyncio.StreamReader
+        :param writer: Поток записи.
+        :type writer: asyncio.StreamWriter
+        """
+        self.reader = reader
+        self.writer = writer
+        self.ctx = Context(writer)
+        self.user_id: int | None = None
+        self.delivered = 0
+        self._listener: asyncio.Task | None = None
+
+    async def start(self, login: str):
+        """
+        Проводит handshake, регистрирует пользователя и запускает чтение ответов.
+
+        :param login: Логин пользователя.
+        :type login: str
+        """
+        await main_client.perform_handshake(self.reader, self.writer, self.ctx)
+        self._listener = asyncio.create_task(self._listen())
+
+        response = await (
+            await self.ctx.request(
+                RegisterRequest(login=login, username=login, password_hash="0" * 64)
+            )
+        )
+        self.ctx.token = response["data"]
+        payload = jwt.decode(self.ctx.token, options={"verify_signature": False})
+        self.user_id = int(payload["sub"])
+
+    async def send_messages(self, receiver_id: int, count: int, window: int, content: str):
+        """
+        Отправляет сообщения конвейером, держа не больше `window` запросов в полёте.
+
+        :param receiver_id: ID получателя.
+        :type receiver_id: int
+        :param count: Количество сообщений.
+        :type count: int
+        :param window: Максимум неподтверждённых запросов.
+        :type window: int
+        :param content: Текст сообщения.
+        :type content: str
+        """
+        inflight = set()
+        for _ in range(count):
+            if len(inflight) >= window:
+                _, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            inflight.add(
+                await self.ctx.request(SendMessageRequest(receiver_id=receiver_id, content=content))
+            )
+        if inflight:
+            await asyncio.wait(inflight)
+
+    async def close(self):
+        """
+        Закрывает соединение.
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def on_delivery(self, response: dict):
+        """
+        Обработка входящего сообщения от другого пользователя.
+
+        :param response: Пакет new_message.
+        :type response: dict
+        """
+        self.delivered += 1
+
+    async def _listen(self):
+        """
+        Фоновая задача: сопоставление ответов и подсчёт входящих сообщений.
+        """
+        frame_reader = framing.FrameReader(self.reader, self.ctx.framing)
+        try:
+            while (frame := await frame_reader.read()) is not None:
+                response = self.ctx.codec.load(
+                    self.ctx.open_payload(frame.payload, frame.flags)
+                )
+                if not self.ctx.resolve(response) and response.get("action") == "new_message":
+                    self.on_delivery(response)
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.ctx.fail_pending(ConnectionError("Соединение закрыто"))
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 30.0):
+    """
+    Ждёт, пока сервер начнёт принимать соединения.
+
+    :param host: Хост.
+    :type host: str
+    :param port: Порт.
+    :type port: int
+    :param timeout: Максимальное время ожидания (секунды).
+    :type timeout: float
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_load(host: str, port: int, clients: int, messages: int, window: int, size: int) -> dict:
+    """
+    Один прогон нагрузки против запущенного сервера.
+
+    :param host: Хост.
+    :type host: str
+    :param port: Порт.
+    :type port: int
+    :param clients: Количество клиентов.
+    :type clients: int
+    :param messages: Сообщений от каждого клиента.
+    :type messages: int
+    :param window: Запросов в полёте на клиента.
+    :type window: int
+    :param size: Размер сообщения (символы).
+    :type size: int
+    :return: Результаты прогона.
+    :rtype: dict
+    """
+    async def connect(index: int) -> LoadClient:
+        reader, writer = await asyncio.open_connection(host, port)
+        client = LoadClient(reader, writer)
+        await client.start(f"load{index}_{os.getpid() % 1000}")
+        return client
+
+    start = time.perf_counter()
+    load_clients = await asyncio.gather(*(connect(index) for index in range(clients)))
+    connect_elapsed = time.perf_counter() - start
+
+    content = "x" * size
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client.send_messages(
+                load_clients[(index + 1) % clients].user_id, messages, window, content
+            )
+            for index, client in enumerate(load_clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.2)
+    delivered = sum(client.delivered for client in load_clients)
+    for client in load_clients:
+        await client.close()
+
+    total = clients * messages
+    return {
+        "connections": clients / connect_elapsed,
+        "messages": total,
+        "elapsed": elapsed,
+        "rate": total / elapsed,
+        "delivered": delivered,
+    }
+
+
+def start_server(
+    port: int, workers: int, loop_name: str, db_path: str, extra_args: list[str]
+) -> subprocess.Popen:
+    """
+    Запускает сервер отдельным процессом.
+
+    :param port: Порт.
+    :type port: int
+    :param workers: Количество воркеров.
+    :type workers: int
+    :param loop_name: Реализация event loop сервера.
+    :type loop_name: str
+    :param db_path: Путь к временной БД.
+    :type db_path: str
+    :param extra_args: Дополнительные аргументы сервера.
+    :type extra_args: list[str]
+    :return: Процесс сервера.
+    :rtype: subprocess.Popen
+    """
+    return subprocess.Popen(
+        [
+            sys.executable,
+            SERVER_SCRIPT,
+            "--port", str(port),
+            "--db-path", db_path,
+            "--workers", str(workers),
+            "--event-loop", loop_name,
+            *extra_args,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_server(process: subprocess.Popen):
+    """
+    Останавливает сервер (SIGTERM, затем kill по таймауту).
+
+    :param process: Процесс сервера.
+    :type process: subprocess.Popen
+    """
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Масштабирование по воркерам и event loop")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Максимум воркеров")
+    parser.add_argument("--port", type=int, default=12700, help="Порт сервера")
+    parser.add_argument("--clients", type=int, default=20, help="Клиентов")
+    parser.add_argument("--messages", type=int, default=100, help="Сообщений от каждого клиента")
+    parser.add_argument("--window", type=int, default=8, help="Запросов в полёте на клиента")
+    parser.add_argument("--size", type=int, default=64, help="Размер сообщения (символы)")
+    parser.add_argument(
+        "--event-loops",
+        default=",".join(event_loop.SUPPORTED_LOOPS),
+        help="Реализации event loop через запятую",
+    )
+    parser.add_argument("--server-arg", action="append", default=[], help="Доп. аргумент сервера")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        metavar='NAME="ARGS"',
+        help="Вариант аргументов сервера для сравнения (можно несколько раз)",
+    )
+    args = parser.parse_args()
+
+    variants = [("default", [])]
+    if args.variant:
+        variants = []
+        for value in args.variant:
+            name, _, server_args = value.partition("=")
+            variants.append((name, shlex.split(server_args)))
+
+    rows = []
+    for loop_name in args.event_loops.split(","):
+        if event_loop.get_loop_factory(loop_name)[0] != loop_name:
+            print(f"Пропуск {loop_name}: не установлен")
+            continue
+
+        baseline = None
+        for variant, variant_args in variants:
+            for workers in range(1, args.max_workers + 1):
+                with tempfile.TemporaryDirectory() as tmp:
+                    process = start_server(
+                        args.port,
+                        workers,
+                        loop_name,
+                        os.path.join(tmp, "load.db"),
+                        args.server_arg + variant_args,
+                    )
+                    try:
+                        event_loop.run(wait_for_port("127.0.0.1", args.port), loop_name)
+                        result = event_loop.run(
+                            run_load(
+                                "127.0.0.1",
+                                args.port,
+                                args.clients,
+                                args.messages,
+                                args.window,
+                                args.size,
+                            ),
+                            loop_name,
+                        )
+                    finally:
+                        stop_server(process)
+
+                baseline = baseline or result["rate"]
+                rows.append(
+                    [
+                        loop_name,
+                        variant,
+                        workers,
+                        f"{result['connections']:.0f}",
+                        result["messages"],
+                        f"{result['elapsed']:.2f}",
+                        f"{result['rate']:.0f}",
+                        f"x{result['rate'] / baseline:.2f}",
+                        result["delivered"],
+                    ]
+                )
+
+    print(f"CPU: {os.cpu_count()}, клиентов: {args.clients}, окно: {args.window}")
+    print_table(
+        ["loop", "variant", "workers", "conn/s", "messages", "seconds", "msg/s", "scale", "delivered"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
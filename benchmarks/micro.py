@@ -0,0 +1,434 @@
+"""
+Микробенчмарки горячих путей с базовой линией и проверкой регрессий.
+
+Замеряет время одной операции для `security` (JWT, Fernet, RSA handshake),
+моделей `dto.models` (валидация из JSON и сериализация), `ServerRouter.submit`
+и клиентского `CommandRouter.dispatch`. Число вызовов в повторе подбирается
+так, чтобы повтор длился около --target-time секунд. Как и в `timeit`,
+результат - минимум по --repeat повторам при выключенном сборщике мусора:
+шум планировщика только добавляет время, поэтому минимум стабильнее медианы.
+Все операции проходятся по кругу --rounds раз, в зачёт идёт лучший круг.
+
+Результаты сравниваются с базовой линией (--baseline). Если операция стала
+медленнее больше чем на --threshold процентов, бенчмарк завершается с
+кодом 1. --save записывает текущие результаты как новую базовую линию.
+
+Запуск:
+    python -m benchmarks.micro --save          # записать базовую линию
+    python -m benchmarks.micro --threshold 10  # сравнить с ней
+    python -m benchmarks.micro -k jwt          # только операции с "jwt" в имени
+"""
+
+import io
+import os
+import gc
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import platform
+import contextlib
+from typing import Callable
+
+from cryptography.fernet import Fernet
+
+import security
+from dto.models import (
+    LoginRequest,
+    RegisterRequest,
+    HistoryRequest,
+    SendMessageRequest,
+    UserListRequest,
+    IncomingMessagePacket,
+    ServerResponse,
+)
+from server.framework import ServerRouter, ServerContext
+from client.framework import Context, CommandRouter, command
+from client.controllers.base import BaseController as ClientController
+from benchmarks.common import measure, measure_async, print_table
+from benchmarks.bench_dispatch import NullWriter, NullController, sample_requests
+from benchmarks.e2e import git_commit
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".benchmarks", "micro.json"
+)
+
+BENCHMARKS: dict[str, Callable] = {}
+"""Зарегистрированные бенчмарки: имя операции -> фабрика замеряемой функции."""
+
+
+def benchmark(name: str):
+    """
+    Декоратор регистрации бенчмарка.
+
+    Фабрика готовит состояние и возвращает функцию без аргументов (обычную
+    или корутинную), время вызова которой замеряется.
+
+    :param name: Имя операции в отчёте и базовой линии.
+    :type name: str
+    :return: Функция-декоратор.
+    :rtype: Callable
+    """
+
+    def decorator(factory: Callable) -> Callable:
+        BENCHMARKS[name] = factory
+        return factory
+
+    return decorator
+
+
+class ClientNullController(ClientController):
+    """Клиентская команда с аргументами и пустым телом."""
+
+    @command("msg")
+    async def send_msg(self, user_id: int, content: str):
+        pass
+
+
+def sample_models() -> dict:
+    """
+    Модели пакетов для замеров DTO.
+
+    :return: Имя модели -> экземпляр.
+    :rtype: dict
+    """
+    token = "x" * 150
+    return {
+        "login": LoginRequest(login="alice", password_hash="0" * 64),
+        "register": RegisterRequest(login="alice", username="Alice", password_hash="0" * 64),
+        "history": HistoryRequest(token=token, target_user_id=2, limit=20),
+        "message": SendMessageRequest(token=token, receiver_id=2, content="Привет! Как дела?"),
+        "user_list": UserListRequest(token=token, page=1, page_size=5, search_query="ali"),
+        "incoming": IncomingMessagePacket(
+            sender_id=1, sender_login="alice", content="Привет!", timestamp="2024-01-01T12:00:00"
+        ),
+        "response": ServerResponse(
+            action="user_list_result",
+            data=[{"id": index, "login": f"user{index}", "username": "User"} for index in range(5)],
+        ),
+    }
+
+
+@benchmark("jwt.create")
+def bench_jwt_create():
+    return lambda: security.create_jwt(1, "alice")
+
+
+@benchmark("jwt.verify")
+def bench_jwt_verify():
+    token = security.create_jwt(1, "alice")
+    cache = security.TokenCache(0)
+
+    def verify():
+        security.token_cache, previous = cache, security.token_cache
+        try:
+            security.verify_jwt(token)
+        finally:
+            security.token_cache = previous
+
+    return verify
+
+
+@benchmark("jwt.verify_cached")
+def bench_jwt_verify_cached():
+    token = security.create_jwt(1, "alice")
+    security.verify_jwt(token)
+    return lambda: security.verify_jwt(token)
+
+
+@benchmark("fernet.encrypt_1k")
+def bench_fernet_encrypt():
+    fernet = Fernet(security.generate_fernet_key())
+    data = os.urandom(1024)
+    return lambda: security.encrypt_fernet(fernet, data)
+
+
+@benchmark("fernet.decrypt_1k")
+def bench_fernet_decrypt():
+    fernet = Fernet(security.generate_fernet_key())
+    token = security.encrypt_fernet(fernet, os.urandom(1024))
+    return lambda: security.decrypt_fernet(fernet, token)
+
+
+@benchmark("rsa.client_handshake")
+def bench_rsa_client():
+    _, public_key = security.generate_rsa_keys()
+    pem_base64 = base64.b64encode(security.public_key_to_pem(public_key))
+
+    def client_side():
+        key = security.pem_to_public_key(base64.b64decode(pem_base64))
+        security.encrypt_rsa(key, security.generate_fernet_key())
+
+    return client_side
+
+
+@benchmark("rsa.server_handshake")
+def bench_rsa_server():
+    private_key, public_key = security.generate_rsa_keys()
+    encrypted = security.encrypt_rsa(public_key, security.generate_fernet_key())
+    return lambda: security.decrypt_rsa(private_key, encrypted)
+
+
+def register_dto_benchmarks():
+    """
+    Регистрирует валидацию и сериализацию каждой модели из `sample_models`.
+    """
+    for name, model in sample_models().items():
+        data = model.model_dump_json().encode("utf-8")
+        model_cls = type(model)
+        BENCHMARKS[f"dto.{name}.validate"] = (
+            lambda model_cls=model_cls, data=data: lambda: model_cls.model_validate_json(data)
+        )
+        BENCHMARKS[f"dto.{name}.dump"] = lambda model=model: lambda: model.model_dump_json()
+
+
+register_dto_benchmarks()
+
+
+def register_router_benchmarks():
+    """
+    Регистрирует `ServerRouter.submit` для каждого действия (последовательный режим).
+    """
+    router = ServerRouter()
+    router.register(NullController)
+    for name, data in sample_requests(None).items():
+
+        def factory(data=data):
+            ctx = ServerContext(None, NullWriter(), None)
+            return lambda: router.submit(ctx, data)
+
+        BENCHMARKS[f"router.dispatch.{name}"] = factory
+
+
+register_router_benchmarks()
+
+
+@benchmark("client.dispatch.msg")
+def bench_client_dispatch():
+    router = CommandRouter(Context(NullWriter()))
+    with contextlib.redirect_stdout(io.StringIO()):
+        router.register_controller(ClientNullController)
+    return lambda: router.dispatch("/msg 2 Привет! Как дела?")
+
+
+def next_number(number: int, elapsed: float, target_time: float) -> int | None:
+    """
+    Шаг подбора числа вызовов, чтобы один повтор длился около `target_time`.
+
+    :param number: Число вызовов в пробном повторе.
+    :type number: int
+    :param elapsed: Длительность пробного повтора (секунды).
+    :type elapsed: float
+    :param target_time: Желаемая длительность повтора (секунды).
+    :type target_time: float
+    :return: Итоговое число вызовов или None, если нужен следующий пробный повтор.
+    :rtype: int | None
+    """
+    if elapsed >= target_time / 10 or number >= 1_000_000:
+        return max(1, int(number * target_time / max(elapsed, 1e-9)))
+    return None
+
+
+def run_sync(func: Callable, repeat: int, target_time: float) -> float:
+    """
+    Замер обычной функции с подбором числа вызовов.
+
+    :param func: Замеряемая функция.
+    :type func: Callable
+    :param repeat: Повторов.
+    :type repeat: int
+    :param target_time: Длительность одного повтора (секунды).
+    :type target_time: float
+    :return: Время одного вызова (секунды).
+    :rtype: float
+    """
+    number = 1
+    while (calibrated := next_number(number, measure(func, number, 1) * number, target_time)) is None:
+        number *= 10
+    return measure(func, calibrated, repeat, aggregate=min)
+
+
+async def run_async(func: Callable, repeat: int, target_time: float) -> float:
+    """
+    Замер корутинной функции с подбором числа вызовов в одном event loop.
+
+    :param func: Замеряемая корутинная функция.
+    :type func: Callable
+    :param repeat: Повторов.
+    :type repeat: int
+    :param target_time: Длительность одного повтора (секунды).
+    :type target_time: float
+    :return: Время одного вызова (секунды).
+    :rtype: float
+    """
+    number = 1
+    while (
+        calibrated := next_number(
+            number, await measure_async(func, number, 1) * number, target_time
+        )
+    ) is None:
+        number *= 10
+    return await measure_async(func, calibrated, repeat, aggregate=min)
+
+
+def run_benchmarks(names: list[str], repeat: int, target_time: float, rounds: int) -> dict:
+    """
+    Прогоняет выбранные бенчмарки.
+
+    Операции замеряются по кругу `rounds` раз, в зачёт идёт лучший круг:
+    так медленный период машины (соседи, частота CPU) задевает не одну
+    операцию целиком, а только один из её кругов.
+
+    :param names: Имена операций.
+    :type names: list[str]
+    :param repeat: Повторов на операцию в круге.
+    :type repeat: int
+    :param target_time: Длительность одного повтора (секунды).
+    :type target_time: float
+    :param rounds: Кругов по всем операциям.
+    :type rounds: int
+    :return: Имя операции -> время одного вызова (секунды).
+    :rtype: dict
+    """
+    funcs = {name: BENCHMARKS[name]() for name in names}
+    results = {}
+    for _ in range(rounds):
+        for name, func in funcs.items():
+            probe = func()
+            gc.disable()
+            try:
+                if asyncio.iscoroutine(probe):
+                    probe.close()
+                    elapsed = asyncio.run(run_async(func, repeat, target_time))
+                else:
+                    elapsed = run_sync(func, repeat, target_time)
+            finally:
+                gc.enable()
+            results[name] = min(elapsed, results.get(name, elapsed))
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple[list, list]:
+    """
+    Сравнивает результаты с базовой линией.
+
+    :param results: Текущие результаты (секунды на вызов).
+    :type results: dict
+    :param baseline: Результаты базовой линии.
+    :type baseline: dict
+    :param threshold: Допустимое замедление (проценты).
+    :type threshold: float
+    :return: Строки таблицы и имена операций с регрессией.
+    :rtype: tuple[list, list]
+    """
+    rows, regressions = [], []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            rows.append([name, f"{current * 1e6:.2f}", "-", "-", "новая"])
+            continue
+        change = (current - previous) / previous * 100
+        status = "ok"
+        if change > threshold:
+            status = "РЕГРЕССИЯ"
+            regressions.append(name)
+        elif change < -threshold:
+            status = "быстрее"
+        rows.append(
+            [name, f"{current * 1e6:.2f}", f"{previous * 1e6:.2f}", f"{change:+.1f}%", status]
+        )
+    return rows, regressions
+
+
+def load_baseline(path: str) -> dict:
+    """
+    Читает файл базовой линии.
+
+    :param path: Путь к файлу.
+    :type path: str
+    :return: Содержимое файла или пустая базовая линия.
+    :rtype: dict
+    """
+    if not os.path.exists(path):
+        return {"meta": {}, "results": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def environment() -> dict:
+    """
+    Описание окружения прогона для файла базовой линии.
+
+    :return: Коммит, время, версия Python и платформа.
+    :rtype: dict
+    """
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    """
+    Стартовая точка бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description="Микробенчмарки с проверкой регрессий")
+    parser.add_argument("-k", "--filter", default="", help="Только операции, содержащие строку")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на операцию в круге")
+    parser.add_argument("--rounds", type=int, default=3, help="Кругов по всем операциям")
+    parser.add_argument(
+        "--target-time", type=float, default=0.05, help="Длительность одного повтора (секунды)"
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Файл базовой линии")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое замедление, %%")
+    parser.add_argument("--save", action="store_true", help="Записать результаты как базовую линию")
+    parser.add_argument("--list", action="store_true", help="Показать операции и выйти")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+    if not names:
+        print(f"Нет операций, содержащих '{args.filter}'", file=sys.stderr)
+        sys.exit(2)
+
+    security.setup_jwt("micro-benchmark-secret", "HS256", 1)
+    results = run_benchmarks(names, args.repeat, args.target_time, args.rounds)
+
+    baseline = load_baseline(args.baseline)
+    meta = environment()
+    if baseline["meta"] and baseline["meta"].get("python") != meta["python"]:
+        print(
+            f"Базовая линия снята на Python {baseline['meta'].get('python')}, "
+            f"сравнение может быть неточным",
+            file=sys.stderr,
+        )
+
+    rows, regressions = compare(results, baseline["results"], args.threshold)
+    print(f"Базовая линия: {args.baseline} (коммит {baseline['meta'].get('commit')})")
+    print_table(["operation", "us/op", "baseline", "change", "status"], rows)
+
+    if args.save:
+        baseline["results"].update(results)
+        baseline["meta"] = meta
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Базовая линия записана в {args.baseline}")
+        return
+
+    if regressions:
+        print(
+            f"Регрессия больше {args.threshold:.0f}%: {', '.join(regressions)}", file=sys.stderr
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
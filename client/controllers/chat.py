@@ -1,7 +1,7 @@
 from client.controllers.base import BaseController
 from client.framework import command
 from client.logger import log_info
-from dto.models import SendMessageRequest, HistoryRequest
+from dto.models import SendMessageRequest, HistoryRequest, SearchMessagesRequest
 
 
 class ChatController(BaseController):
@@ -37,4 +37,46 @@ class ChatController(BaseController):
         """
         log_info(f"Запрос истории с пользователем ID {user_id}...")
         req = HistoryRequest(target_user_id=user_id)
+        self.ctx.start_pages("message_history_result", req)
+        await self.ctx.send(req)
+
+    @command("older")
+    async def get_older_history(self):
+        """
+        Более ранние сообщения последней запрошенной истории.
+        /older
+        """
+        req = self.ctx.next_pages.get("message_history_result")
+        if req is None:
+            log_info("Более ранних сообщений нет. Сначала запросите /history <ID пользователя>.")
+            return
+        log_info(f"Запрос более ранних сообщений с пользователем ID {req.target_user_id}...")
+        await self.ctx.send(req)
+
+    @command("search")
+    async def search_messages(self, query: str):
+        """
+        Поиск сообщений во всех своих диалогах.
+        /search <слова>
+
+        :param self: self
+        :param query: Слова для поиска.
+        :type query: str
+        """
+        log_info(f"Поиск сообщений по запросу '{query}'...")
+        req = SearchMessagesRequest(query=query)
+        self.ctx.start_pages("message_search_result", req)
+        await self.ctx.send(req)
+
+    @command("more")
+    async def more_search_results(self):
+        """
+        Более ранние совпадения последнего поиска.
+        /more
+        """
+        req = self.ctx.next_pages.get("message_search_result")
+        if req is None:
+            log_info("Других совпадений нет. Сначала выполните /search <слова>.")
+            return
+        log_info(f"Запрос следующих совпадений по запросу '{req.query}'...")
         await self.ctx.send(req)
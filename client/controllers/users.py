@@ -20,6 +20,7 @@ class UsersController(BaseController):
         """
         log_info(f"Запрос списка пользователей (страница {page})...")
         request = UserListRequest(page=page)
+        self.ctx.start_pages("user_list_result", request)
         await self.ctx.send(request)
 
     @command("find")
@@ -33,4 +34,18 @@ class UsersController(BaseController):
         """
         log_info(f"Поиск пользователей по запросу '{query}'...")
         request = UserListRequest(search_query=query, page=1)
+        self.ctx.start_pages("user_list_result", request)
+        await self.ctx.send(request)
+
+    @command("next")
+    async def next_users(self):
+        """
+        Следующая страница последнего /users или /find.
+        /next
+        """
+        request = self.ctx.next_pages.get("user_list_result")
+        if request is None:
+            log_info("Следующей страницы нет. Сначала выполните /users или /find.")
+            return
+        log_info("Запрос следующей страницы пользователей...")
         await self.ctx.send(request)
@@ -1,10 +1,14 @@
 import inspect
 import asyncio
+import itertools
 from typing import Callable, Dict
 
 from pydantic import BaseModel
 
 from client.logger import log_info
+from protocol.framing import FRAMING_LINE, encode_frame, frame_aad
+from protocol.compression import Compressor
+from protocol.codecs import CODEC_LEGACY, get_codec
 from client.exceptions import (
     UnknownCommandException,
     ArgumentMismatchCommandException,
@@ -25,8 +29,14 @@ class Context:
         """
         self._writer = writer
         self.cipher = None
+        self.framing = FRAMING_LINE
+        self.compressor = Compressor()
+        self.codec = get_codec(CODEC_LEGACY)
         self.token: str | None = None
         self.router = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_pages: Dict[str, BaseModel] = {}
+        self._request_ids = itertools.count(1)
 
     async def send(self, packet: BaseModel):
         """
@@ -39,18 +49,119 @@ class Context:
         if self.token and hasattr(packet, "token") and packet.token is None:
             packet.token = self.token
 
-        data_str = packet.model_dump_json()
+        if hasattr(packet, "request_id") and packet.request_id is None:
+            packet.request_id = next(self._request_ids)
+
+        payload = self.codec.dump(packet)
+        payload, flags = self.compressor.compress(payload)
 
         if self.cipher:
-            raw_bytes = data_str.encode("utf-8")
-            encrypted_payload = self.cipher.encrypt(raw_bytes)
-            self._writer.write(encrypted_payload + b"\n")
-        else:
-            payload = (data_str + "\n").encode("utf-8")
-            self._writer.write(payload)
+            payload = self.cipher.encrypt(payload, frame_aad(self.framing, flags))
 
+        self._writer.writelines(encode_frame(payload, self.framing, flags))
         await self._writer.drain()
 
+    def open_payload(self, payload: bytes | memoryview, flags: int = 0) -> bytes:
+        """
+        Расшифровывает и распаковывает входящий пакет.
+
+        :param self: self
+        :param payload: Шифртекст.
+        :type payload: bytes | memoryview
+        :param flags: Флаги фрейма.
+        :type flags: int
+        :return: Пакет.
+        :rtype: bytes
+        """
+        if self.cipher:
+            payload = self.cipher.decrypt(payload, frame_aad(self.framing, flags))
+        return self.compressor.decompress(payload, flags)
+
+    async def request(self, packet: BaseModel) -> asyncio.Future:
+        """
+        Отправляет запрос и возвращает future ответа с тем же request_id.
+
+        Несколько запросов можно отправить подряд и дождаться ответов позже:
+        сервер выполняет их параллельно и отвечает в порядке готовности.
+
+        :param self: self
+        :param packet: Отправляемый пакет данных.
+        :type packet: BaseModel
+        :return: Future, который получит словарь ответа сервера.
+        :rtype: asyncio.Future
+        """
+        packet.request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[packet.request_id] = future
+        try:
+            await self.send(packet)
+        except Exception:
+            self.pending.pop(packet.request_id, None)
+            raise
+        return future
+
+    def resolve(self, response: dict) -> bool:
+        """
+        Передаёт ответ сервера в future ожидающего запроса.
+
+        :param self: self
+        :param response: Ответ сервера.
+        :type response: dict
+        :return: True, если ответ ждал запрос из `request`.
+        :rtype: bool
+        """
+        future = self.pending.pop(response.get("request_id"), None)
+        if future is None:
+            return False
+        if not future.done():
+            future.set_result(response)
+        return True
+
+    def start_pages(self, result_action: str, packet: BaseModel):
+        """
+        Запоминает запрос списка, чтобы ответ на него мог открыть следующую страницу.
+
+        :param self: self
+        :param result_action: Тип ответа со списком (например, user_list_result).
+        :type result_action: str
+        :param packet: Запрос первой страницы.
+        :type packet: BaseModel
+        """
+        self.next_pages[result_action] = packet
+
+    def advance_pages(self, result_action: str, next_cursor: str | None):
+        """
+        Готовит запрос следующей страницы по курсору из ответа сервера.
+
+        :param self: self
+        :param result_action: Тип ответа.
+        :type result_action: str
+        :param next_cursor: Курсор из ответа (None - страниц больше нет).
+        :type next_cursor: str | None
+        """
+        packet = self.next_pages.get(result_action)
+        if packet is None:
+            return
+        if next_cursor is None:
+            del self.next_pages[result_action]
+            return
+        self.next_pages[result_action] = packet.model_copy(
+            update={"cursor": next_cursor, "token": None, "request_id": None}
+        )
+
+    def fail_pending(self, exc: Exception):
+        """
+        Завершает все ожидающие запросы ошибкой (например, при разрыве соединения).
+
+        :param self: self
+        :param exc: Исключение.
+        :type exc: Exception
+        """
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
 
 def command(name: str):
     """
@@ -12,6 +12,9 @@ class BasePacket(BaseModel):
     token: Optional[str] = None
     """JWT токен пользователя (Опционально)."""
 
+    request_id: Optional[int] = None
+    """ID запроса для сопоставления ответа (Опционально). Сервер возвращает его в ответе."""
+
 
 class RegisterRequest(BasePacket):
     """
@@ -60,6 +63,36 @@ class HistoryRequest(BasePacket):
     limit: int = 20
     """Максимальное количество сообщений в ответе (опционально)."""
 
+    before_id: Optional[int] = None
+    """Только сообщения с ID меньше заданного - более ранние (опционально)."""
+
+    after_id: Optional[int] = None
+    """Только сообщения с ID больше заданного - более новые (опционально)."""
+
+    cursor: Optional[str] = None
+    """Курсор следующей страницы из `next_cursor` прошлого ответа (опционально, заменяет before_id/after_id)."""
+
+
+class SearchMessagesRequest(BasePacket):
+    """
+    Пакет поиска сообщений в своих диалогах.
+    """
+
+    action: Literal["search_messages"] = "search_messages"
+    """Тип пакета. Фиксированное значение 'search_messages'."""
+
+    query: str = Field(..., min_length=1, max_length=200)
+    """Слова для поиска (сообщения, где есть все слова)."""
+
+    target_user_id: Optional[int] = None
+    """Искать только в диалоге с этим пользователем (опционально)."""
+
+    limit: int = Field(default=20, ge=1, le=100)
+    """Максимальное количество сообщений в ответе (опционально)."""
+
+    cursor: Optional[str] = None
+    """Курсор следующей страницы из `next_cursor` прошлого ответа (опционально)."""
+
 
 class SendMessageRequest(BasePacket):
     """
@@ -106,11 +139,15 @@ class ServerResponse(BasePacket):
         "user_list_result",
         "new_message",
         "message_history_result",
+        "message_search_result",
     ]
     """Тип ответа (успех, ошибка, данные и т.д.)."""
 
-    data: str | None
-    """Данные ответа (JSON строка или сообщение)."""
+    data: str | list | dict | None
+    """Данные ответа: текст сообщения или структурные данные (список, объект)."""
+
+    next_cursor: Optional[str] = Field(default=None, exclude_if=lambda value: value is None)
+    """Курсор следующей страницы списка (только в ответах с продолжением)."""
 
 
 class UserListRequest(BasePacket):
@@ -129,3 +166,6 @@ class UserListRequest(BasePacket):
 
     search_query: Optional[str] = None
     """Строка поиска (логин или username)."""
+
+    cursor: Optional[str] = None
+    """Курсор следующей страницы из `next_cursor` прошлого ответа (опционально, вместо `page`)."""
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Callable, Coroutine
+
+LOOP_ASYNCIO = "asyncio"
+LOOP_UVLOOP = "uvloop"
+SUPPORTED_LOOPS = (LOOP_ASYNCIO, LOOP_UVLOOP)
+
+
+def get_loop_factory(name: str) -> tuple[str, Callable[[], asyncio.AbstractEventLoop] | None]:
+    """
+    Возвращает фабрику event loop по имени.
+
+    Если uvloop не установлен (или не поддерживается платформой, например Windows),
+    используется стандартный asyncio.
+
+    :param name: Имя реализации (`asyncio` или `uvloop`).
+    :type name: str
+    :return: Фактически выбранное имя и фабрика (None - стандартный loop).
+    :rtype: tuple[str, Callable[[], asyncio.AbstractEventLoop] | None]
+    """
+    if name == LOOP_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            print("[SYSTEM] uvloop не установлен, используется asyncio")
+            return LOOP_ASYNCIO, None
+        return LOOP_UVLOOP, uvloop.new_event_loop
+
+    return LOOP_ASYNCIO, None
+
+
+def run(main: Coroutine[Any, Any, Any], name: str = LOOP_ASYNCIO) -> Any:
+    """
+    Аналог `asyncio.run` с выбором реализации event loop.
+
+    :param main: Корутина точки входа.
+    :type main: Coroutine[Any, Any, Any]
+    :param name: Имя реализации (`asyncio` или `uvloop`).
+    :type name: str
+    :return: Результат корутины.
+    :rtype: Any
+    """
+    _, loop_factory = get_loop_factory(name)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(main)
+
+
+def current_loop_name() -> str:
+    """
+    Имя реализации запущенного event loop (для логов и бенчмарков).
+
+    :return: `uvloop` или `asyncio`.
+    :rtype: str
+    """
+    module = type(asyncio.get_running_loop()).__module__
+    return LOOP_UVLOOP if module.startswith("uvloop") else LOOP_ASYNCIO
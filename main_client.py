@@ -1,14 +1,15 @@
+import os
 import asyncio
 import base64
-import json
 import argparse
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.patch_stdout import patch_stdout
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidSignature
 
 
 import security
+import event_loop
 from client.framework import CommandRouter, Context
 from client.controllers.auth import AuthController
 from client.controllers.users import UsersController
@@ -16,8 +17,9 @@ from client.controllers.token import TokenController
 from client.controllers.chat import ChatController
 from client.controllers.system import SystemController
 from client.logger import log_ok, log_info, log_notify, log_error, style
-from dto.models import IncomingMessagePacket
 from client.exceptions import CommandException
+from protocol import framing, handshake, compression, codecs
+from server.exceptions import CodecError, HandshakeError
 
 handshake_completed = asyncio.Event()
 
@@ -31,33 +33,34 @@ async def listen_from_server(reader: asyncio.StreamReader, ctx: Context):
     :param ctx: Контекст.
     :type ctx: Context
     """
+    frame_reader = framing.FrameReader(reader, ctx.framing)
     try:
         while True:
-            data = await reader.readline()
-            if not data:
+            frame = await frame_reader.read()
+            if frame is None:
                 log_error("Некорретные данные, разрыв соединения.")
                 break
 
-            data = data.strip()
-            if not data:
-                continue
+            data = frame.payload
 
             if ctx.cipher:
                 try:
-                    decrypted = ctx.cipher.decrypt(data)
-                    message_str = decrypted.decode("utf-8")
+                    decrypted = ctx.open_payload(data, frame.flags)
                 except Exception as e:
                     log_error(f"Ошибка дешифровки: {e}")
                     continue
 
             else:
-                log_error(f"Raw сообщение: {data}")
+                log_error(f"Raw сообщение: {bytes(data)}")
                 continue
 
             try:
-                response_dict = json.loads(message_str)
+                response_dict = ctx.codec.load(decrypted)
+                ctx.resolve(response_dict)
                 action = response_dict.get("action")
                 content = response_dict.get("data")
+                next_cursor = response_dict.get("next_cursor")
+                ctx.advance_pages(action, next_cursor)
 
                 if action == "auth_success":
                     ctx.token = content
@@ -65,7 +68,7 @@ async def listen_from_server(reader: asyncio.StreamReader, ctx: Context):
                         "\n[SYSTEM]: Успешная авторизация: Токен успешно установлен!\n"
                     )
                 elif action == "user_list_result":
-                    users = json.loads(content)
+                    users = content
                     if not users:
                         log_info("\n[USERS]: Пользователи не найдены.\n")
                     else:
@@ -76,17 +79,16 @@ async def listen_from_server(reader: asyncio.StreamReader, ctx: Context):
                                 f"{u['id']:<5} | {u['login']:<15} | {u['username']:<20}"
                             )
                         log_ok("-" * 45 + "\n")
+                        if next_cursor:
+                            log_info("Следующая страница: /next\n")
                 elif action == "new_message":
-                    msg_dict = json.loads(content)
-                    msg = IncomingMessagePacket(**msg_dict)
-
                     log_notify(
-                        f"\n>>> НОВОЕ СООБЩЕНИЕ ОТ {msg.sender_login} (ID {msg.sender_id}):"
+                        f"\n>>> НОВОЕ СООБЩЕНИЕ ОТ {content['sender_login']} (ID {content['sender_id']}):"
                     )
-                    log_info(f"    {msg.content}")
+                    log_info(f"    {content['content']}")
                     log_notify(">>>\n")
                 elif action == "message_history_result":
-                    history = json.loads(content)
+                    history = content
                     if not history:
                         log_info("\n[HISTORY]: История пуста.\n")
                     else:
@@ -100,18 +102,41 @@ async def listen_from_server(reader: asyncio.StreamReader, ctx: Context):
                             else:
                                 log_notify(f"[{time_str}] {prefix}: {item['content']}")
                         log_ok(f"{'- КОНЕЦ ИСТОРИИ -':^50}\n")
+                        if next_cursor:
+                            log_info("Более ранние сообщения: /older\n")
+                elif action == "message_search_result":
+                    found = content
+                    if not found:
+                        log_info("\n[SEARCH]: Ничего не найдено.\n")
+                    else:
+                        log_ok(f"\n{'- НАЙДЕННЫЕ СООБЩЕНИЯ -':^50}")
+                        for item in found:
+                            time_str = item["timestamp"].replace("T", " ")[:16]
+                            if item["is_me"]:
+                                log_info(
+                                    f"[{time_str}] Вы -> ID {item['receiver_id']}: {item['snippet']}"
+                                )
+                            else:
+                                log_notify(
+                                    f"[{time_str}] {item['sender_login']} (ID {item['sender_id']}): {item['snippet']}"
+                                )
+                        log_ok(f"{'- КОНЕЦ ПОИСКА -':^50}\n")
+                        if next_cursor:
+                            log_info("Ещё совпадения: /more\n")
                 elif action == "error":
                     log_error(f"\n[SYSTEM]: Ошибка: {content}\n")
                 else:
-                    log_info(f"\n[SERVER]: {message_str}\n")
-            except json.JSONDecodeError:
-                log_error("\n[SYSTEM]: Внутренняя ошибка парсинга JSON\n")
+                    log_info(f"\n[SERVER]: {response_dict}\n")
+            except CodecError:
+                log_error("\n[SYSTEM]: Внутренняя ошибка парсинга пакета\n")
             except Exception as ex:
                 log_error(f"\n[SYSTEM]: Произошла непредвиденная ошибка: {ex}")
     except asyncio.CancelledError:
         pass
     except Exception as e:
         log_error(f"Ошибка чтения: {e}")
+    finally:
+        ctx.fail_pending(ConnectionError("Соединение с сервером закрыто"))
 
 
 async def user_input_loop(ctx: Context):
@@ -154,10 +179,22 @@ async def user_input_loop(ctx: Context):
 
 
 async def perform_handshake(
-    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, ctx: Context
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    ctx: Context,
+    framings: tuple[str, ...] = framing.SUPPORTED_FRAMINGS,
+    ciphers: tuple[str, ...] = security.SUPPORTED_CIPHERS,
+    kexes: tuple[str, ...] = security.SUPPORTED_KEX,
+    compressions: tuple[str, ...] = compression.SUPPORTED_COMPRESSIONS,
+    codecs_offered: tuple[str, ...] = codecs.SUPPORTED_CODECS,
+    server_key=None,
 ):
     """
-    Проведение хендшейка с сервером: обмен Fernet ключами.
+    Проведение хендшейка с сервером: обмен ключом сессии, согласование фрейминга и шифра.
+
+    Клиент говорит первым. Если ключ сервера известен (`server_key`), сервер
+    не присылает его, а присланный ключ должен с ним совпасть (закрепление).
+    При X25519 ответ сервера проверяется по подписи RSA ключа сервера.
 
     :param reader: Поток чтения.
     :type reader: asyncio.StreamReader
@@ -165,27 +202,127 @@ async def perform_handshake(
     :type writer: asyncio.StreamWriter
     :param ctx: Контекст.
     :type ctx: Context
+    :param framings: Предлагаемые режимы фрейминга в порядке предпочтения.
+    :type framings: tuple[str, ...]
+    :param ciphers: Предлагаемые шифры сессии в порядке предпочтения.
+    :type ciphers: tuple[str, ...]
+    :param kexes: Предлагаемые способы обмена ключами в порядке предпочтения.
+    :type kexes: tuple[str, ...]
+    :param compressions: Предлагаемые алгоритмы сжатия в порядке предпочтения.
+    :type compressions: tuple[str, ...]
+    :param codecs_offered: Предлагаемые кодеки пакетов в порядке предпочтения.
+    :type codecs_offered: tuple[str, ...]
+    :param server_key: Известный (закреплённый) публичный RSA ключ сервера.
+    :return: Публичный RSA ключ сервера.
+    :raises HandshakeError: Если ключ или подпись сервера не проходят проверку.
+    :raises ConnectionError: Если сервер закрыл соединение.
     """
-    try:
-        pem_base64 = await reader.readline()
-        if not pem_base64:
-            raise ConnectionError("Сервер закрыл соединение")
-
-        pem_bytes = base64.b64decode(pem_base64)
-        server_public_key = security.pem_to_public_key(pem_bytes)
-
+    hello = {
+        "kex": list(kexes),
+        "framing": list(framings),
+        "cipher": list(ciphers),
+        "compression": list(compressions),
+        "codec": list(codecs_offered),
+    }
+    if server_key is not None:
+        hello["key_id"] = security.public_key_fingerprint(server_key)
+
+    session_key = None
+    if server_key is not None and kexes[0] == security.KEX_RSA:
         session_key = security.generate_fernet_key()
+        hello["key"] = security.encrypt_rsa(server_key, session_key).decode("ascii")
+
+    private_key = None
+    if security.KEX_X25519 in kexes:
+        private_key, public_key = security.generate_x25519_keys()
+        hello["public_key"] = base64.b64encode(
+            security.x25519_public_bytes(public_key)
+        ).decode("ascii")
+
+    hello_line = handshake.encode_hello(hello)
+    writer.write(hello_line)
+    await writer.drain()
+
+    presented_key = None
+    server_hello_line = await reader.readline()
+    if server_hello_line and not handshake.is_client_hello(server_hello_line):
+        # Приветствие пришло позже ожидания сервера: сначала PEM строка для старых клиентов
+        presented_key = security.pem_to_public_key(base64.b64decode(server_hello_line))
+        server_hello_line = await reader.readline()
+    if not server_hello_line:
+        raise ConnectionError("Сервер закрыл соединение")
+
+    server_hello = handshake.decode_hello(server_hello_line)
+    if "server_key" in server_hello:
+        presented_key = security.pem_to_public_key(base64.b64decode(server_hello["server_key"]))
+    presented_key = presented_key or server_key
+    if presented_key is None:
+        raise HandshakeError("Сервер не прислал свой ключ")
+    if server_key is not None and security.public_key_fingerprint(
+        presented_key
+    ) != security.public_key_fingerprint(server_key):
+        raise HandshakeError("Ключ сервера не совпадает с закреплённым")
+
+    kex = server_hello.get("kex")
+    if kex == security.KEX_X25519 and private_key is not None:
+        try:
+            security.verify_rsa(
+                presented_key,
+                handshake.transcript(hello_line, server_hello),
+                str(server_hello.get("signature", "")).encode("ascii"),
+            )
+        except InvalidSignature as e:
+            raise HandshakeError("Неверная подпись сервера") from e
+        server_public_key = base64.b64decode(server_hello["public_key"])
+        session_key = security.x25519_session_secret(private_key, server_public_key)
+    elif kex == security.KEX_RSA:
+        if "key" not in hello:
+            session_key = security.generate_fernet_key()
+            encrypted_session_key = security.encrypt_rsa(presented_key, session_key)
+            writer.write(handshake.encode_hello({"key": encrypted_session_key.decode("ascii")}))
+            await writer.drain()
+    else:
+        raise HandshakeError(f"Сервер выбрал непредложенный обмен ключами: {kex}")
+
+    ctx.framing = server_hello.get("framing", framing.FRAMING_LINE)
+    ctx.compressor = compression.Compressor(
+        server_hello.get("compression", compression.COMPRESSION_NONE)
+    )
+    ctx.codec = codecs.get_codec(server_hello.get("codec", codecs.CODEC_LEGACY))
+    ctx.cipher = security.create_session_cipher(
+        server_hello.get("cipher", security.CIPHER_FERNET),
+        session_key,
+        security.DIRECTION_CLIENT,
+    )
+
+    handshake_completed.set()
+    return presented_key
+
+
+def load_server_key(path: str):
+    """
+    Загружает закреплённый публичный ключ сервера.
 
-        encrypted_session_key = security.encrypt_rsa(server_public_key, session_key)
+    :param path: PEM файл ключа.
+    :type path: str
+    :return: Публичный ключ или None, если файла ещё нет.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as key_file:
+        return security.pem_to_public_key(key_file.read())
 
-        writer.write(encrypted_session_key + b"\n")
-        await writer.drain()
 
-        ctx.cipher = Fernet(session_key)
+def save_server_key(path: str, public_key):
+    """
+    Закрепляет публичный ключ сервера при первом подключении.
 
-        handshake_completed.set()
-    except Exception as e:
-        log_error(f"Ошибка HANDSHAKE: {e}")
+    :param path: PEM файл ключа.
+    :type path: str
+    :param public_key: Публичный ключ сервера.
+    """
+    with open(path, "wb") as key_file:
+        key_file.write(security.public_key_to_pem(public_key))
 
 
 def parse_args():
@@ -198,14 +335,57 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Клиент консольного мессенджера")
     parser.add_argument("--host", type=str, default="127.0.0.1", help="IP Сервера")
     parser.add_argument("--port", type=int, default=12000, help="Порт")
+    parser.add_argument(
+        "--framing",
+        choices=framing.SUPPORTED_FRAMINGS,
+        default=framing.FRAMING_BINARY,
+        help="Предпочтительный режим фрейминга",
+    )
+    parser.add_argument(
+        "--cipher",
+        choices=security.SUPPORTED_CIPHERS,
+        default=security.CIPHER_AES_GCM,
+        help="Предпочтительный шифр сессии",
+    )
+    parser.add_argument(
+        "--kex",
+        choices=security.SUPPORTED_KEX,
+        default=security.KEX_X25519,
+        help="Предпочтительный способ обмена ключами",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=compression.SUPPORTED_COMPRESSIONS,
+        default=compression.SUPPORTED_COMPRESSIONS[0],
+        help="Предпочтительный алгоритм сжатия больших ответов (none - без сжатия)",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=codecs.SUPPORTED_CODECS,
+        default=codecs.SUPPORTED_CODECS[0],
+        help="Предпочтительный кодек пакетов (msgpack/cbor - если установлены)",
+    )
+    parser.add_argument(
+        "--server-key",
+        default=None,
+        help="PEM файл закреплённого ключа сервера (сохраняется при первом подключении)",
+    )
+    parser.add_argument(
+        "--event-loop",
+        choices=event_loop.SUPPORTED_LOOPS,
+        default=event_loop.LOOP_ASYNCIO,
+        help="Реализация event loop (uvloop - если установлен)",
+    )
     return parser.parse_args()
 
 
-async def main():
+async def main(args: argparse.Namespace):
     """
     Стартовая точка логики клиента.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
     """
-    args = parse_args()
 
     with patch_stdout():
         try:
@@ -216,13 +396,32 @@ async def main():
             return
 
         ctx = Context(writer)
+        known_key = load_server_key(args.server_key) if args.server_key else None
 
         try:
-            await perform_handshake(reader, writer, ctx)
-        except Exception:
+            server_key = await perform_handshake(
+                reader,
+                writer,
+                ctx,
+                handshake.prefer_option(args.framing, framing.SUPPORTED_FRAMINGS),
+                handshake.prefer_option(args.cipher, security.SUPPORTED_CIPHERS),
+                handshake.prefer_option(args.kex, security.SUPPORTED_KEX),
+                handshake.prefer_option(args.compression, compression.SUPPORTED_COMPRESSIONS),
+                handshake.prefer_option(args.codec, codecs.SUPPORTED_CODECS),
+                known_key,
+            )
+        except Exception as e:
+            log_error(f"Ошибка HANDSHAKE: {e}")
             writer.close()
             return
 
+        fingerprint = security.public_key_fingerprint(server_key)
+        if args.server_key and known_key is None:
+            save_server_key(args.server_key, server_key)
+            log_notify(f"Ключ сервера закреплён в {args.server_key} (SHA-256: {fingerprint})")
+        elif known_key is None:
+            log_info(f"Отпечаток ключа сервера (SHA-256): {fingerprint}")
+
         listener_task = asyncio.create_task(listen_from_server(reader, ctx))
 
         try:
@@ -236,7 +435,8 @@ async def main():
 
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
+        event_loop.run(main(args), args.event_loop)
     except KeyboardInterrupt:
         pass
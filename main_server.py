@@ -1,31 +1,188 @@
+import time
+
+IMPORT_STARTED_AT = time.perf_counter()
+
+import os
 import asyncio
-import json
 import base64
 import argparse
+import signal
+import logging
+import tempfile
+import multiprocessing
 from pathlib import Path
 
-from cryptography.fernet import Fernet
-
 import security
-from server.framework import ServerRouter, ServerContext
+import event_loop
+from server.framework import (
+    ServerRouter,
+    ServerContext,
+    deliver_local,
+    disconnect_user,
+    DEFAULT_MAX_INFLIGHT,
+    DEFAULT_OUTBOUND_QUEUE_SIZE,
+    OVERFLOW_POLICIES,
+    OVERFLOW_SPILL,
+)
 from server.controllers.auth import AuthController
 from server.controllers.users import UsersController
 from server.controllers.chat import ChatController
-from server import database
-from server.framework import CONNECTED_USERS
-from server.exceptions import ServerException
+from server import (
+    database,
+    crypto_executor,
+    bus,
+    logger,
+    metrics,
+    profiling,
+    message_writer,
+    user_directory,
+)
+from server.exceptions import ServerException, CodecError, HandshakeError
+from protocol import framing, handshake, compression, codecs
+from server.startup import StartupProfile
 
 SERVER_PRIVATE_KEY = None
 SERVER_PUBLIC_KEY = None
+SERVER_PEM_LINE = b""
+SERVER_PEM_BASE64 = ""
+SERVER_KEY_ID = ""
+CLIENT_HELLO_WAIT = handshake.DEFAULT_CLIENT_HELLO_WAIT
 
 router = ServerRouter()
 router.register(AuthController)
 router.register(UsersController)
 router.register(ChatController)
 
+connections_log = logger.get_logger(logger.CATEGORY_CONNECTIONS)
+packets_log = logger.get_logger(logger.CATEGORY_PACKETS)
+stats_log = logger.get_logger(logger.CATEGORY_STATS)
+
+IMPORTS_FINISHED_AT = time.perf_counter()
+
+
+async def server_handshake(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, ctx: ServerContext
+) -> bool:
+    """
+    Серверная часть handshake: обмен ключами и согласование параметров соединения.
+
+    Новый клиент сразу присылает JSON приветствие со списками поддерживаемых
+    вариантов. Старый клиент ждёт PEM строку сервера: если приветствия нет
+    CLIENT_HELLO_WAIT секунд, сервер отправляет её, и клиент отвечает строкой
+    с RSA-зашифрованным ключом Fernet (или приветствием).
+
+    Публичный ключ сервера уходит в ответе, только если у клиента его нет
+    (`key_id` не совпадает с отпечатком). При X25519 сервер подписывает запись
+    handshake RSA ключом, при RSA клиент присылает зашифрованный ключ
+    сессии в приветствии или отдельной строкой после ответа.
+
+    :param reader: Поток чтения.
+    :type reader: asyncio.StreamReader
+    :param writer: Поток записи.
+    :type writer: asyncio.StreamWriter
+    :param ctx: Контекст соединения.
+    :type ctx: ServerContext
+    :return: True, если канал зашифрован.
+    :rtype: bool
+    :raises HandshakeError: Если приветствие некорректно.
+    """
+    pem_sent = False
+    try:
+        first_line = await asyncio.wait_for(reader.readline(), CLIENT_HELLO_WAIT)
+    except asyncio.TimeoutError:
+        writer.write(SERVER_PEM_LINE)
+        await writer.drain()
+        pem_sent = True
+        first_line = await reader.readline()
+    if not first_line:
+        return False
+
+    if not handshake.is_client_hello(first_line):
+        if not pem_sent:
+            raise HandshakeError("Некорректное приветствие")
+        session_secret = await crypto_executor.executor.run(
+            security.decrypt_rsa, SERVER_PRIVATE_KEY, first_line.strip()
+        )
+        ctx.cipher = security.create_session_cipher(
+            security.CIPHER_FERNET, session_secret, security.DIRECTION_SERVER
+        )
+        return True
+
+    hello = handshake.decode_hello(first_line)
+    kex = handshake.select_option(hello.get("kex"), security.SUPPORTED_KEX, security.KEX_RSA)
+    server_hello = {}
+
+    if kex == security.KEX_X25519:
+        private_key, public_key = security.generate_x25519_keys()
+        client_public_key = base64.b64decode(str(hello.get("public_key", "")))
+        session_secret = security.x25519_session_secret(private_key, client_public_key)
+        server_hello["public_key"] = base64.b64encode(
+            security.x25519_public_bytes(public_key)
+        ).decode("ascii")
+
+    ctx.framing = handshake.select_option(
+        hello.get("framing"), framing.SUPPORTED_FRAMINGS, framing.FRAMING_LINE
+    )
+    # Строковый фрейминг передаёт base64 токены: двоичный шифртекст AEAD в нём не передать
+    ciphers = security.SUPPORTED_CIPHERS
+    if ctx.framing == framing.FRAMING_LINE:
+        ciphers = (security.CIPHER_FERNET,)
+    cipher_name = handshake.select_option(hello.get("cipher"), ciphers, security.CIPHER_FERNET)
+    compression_name = compression.COMPRESSION_NONE
+    if ctx.framing == framing.FRAMING_BINARY:
+        compression_name = handshake.select_option(
+            hello.get("compression"),
+            compression.SUPPORTED_COMPRESSIONS,
+            compression.COMPRESSION_NONE,
+        )
+    ctx.compressor = compression.Compressor(compression_name)
+    ctx.codec = codecs.get_codec(
+        handshake.select_option(hello.get("codec"), codecs.SUPPORTED_CODECS, codecs.CODEC_LEGACY)
+    )
+    server_hello.update(
+        {
+            "kex": kex,
+            "framing": ctx.framing,
+            "cipher": cipher_name,
+            "compression": compression_name,
+            "codec": ctx.codec.name,
+        }
+    )
+    if kex == security.KEX_X25519:
+        signature = await crypto_executor.executor.run(
+            security.sign_rsa, SERVER_PRIVATE_KEY, handshake.transcript(first_line, server_hello)
+        )
+        server_hello["signature"] = signature.decode("ascii")
+    if not pem_sent and hello.get("key_id") != SERVER_KEY_ID:
+        server_hello["server_key"] = SERVER_PEM_BASE64
+    writer.write(handshake.encode_hello(server_hello))
+
+    if kex == security.KEX_RSA:
+        wrapped_key = hello.get("key")
+        if wrapped_key is None:
+            await writer.drain()
+            key_line = await reader.readline()
+            if not key_line:
+                return False
+            wrapped_key = handshake.decode_hello(key_line).get("key", "")
+        session_secret = await crypto_executor.executor.run(
+            security.decrypt_rsa, SERVER_PRIVATE_KEY, str(wrapped_key).encode("ascii")
+        )
+
+    ctx.cipher = security.create_session_cipher(
+        cipher_name, session_secret, security.DIRECTION_SERVER
+    )
+    return True
+
 
 async def handle_client(
-    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, db_session_maker
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    db_session_maker,
+    max_inflight: int = DEFAULT_MAX_INFLIGHT,
+    outbound_queue_size: int = DEFAULT_OUTBOUND_QUEUE_SIZE,
+    overflow_policy: str = OVERFLOW_SPILL,
+    read_session_maker=None,
 ):
     """
     Функция для обработки сообщений клиентов.
@@ -35,64 +192,161 @@ async def handle_client(
     :param writer: Поток записи.
     :type writer: asyncio.StreamWriter
     :param db_session_maker: Фабрика сессий с БД.
+    :param max_inflight: Максимум одновременно выполняемых запросов соединения.
+    :type max_inflight: int
+    :param outbound_queue_size: Максимум фреймов в исходящей очереди соединения.
+    :type outbound_queue_size: int
+    :param overflow_policy: Поведение при переполнении исходящей очереди.
+    :type overflow_policy: str
+    :param read_session_maker: Фабрика сессий только для чтения.
     """
-    ctx = ServerContext(reader, writer, db_session_maker)
+    ctx = ServerContext(
+        reader,
+        writer,
+        db_session_maker,
+        max_inflight,
+        outbound_queue_size,
+        overflow_policy,
+        read_session_maker,
+    )
     address = writer.get_extra_info("peername")
-    print(f"Подключение от {address}")
+    peer = logger.peer_fields(address)
+    connections_log.info("Подключение", extra=peer)
+    metrics.active_connections.inc()
 
     try:
-        print(f"[{address}] Начало HANDSHAKE")
-
-        pem_key = security.public_key_to_pem(SERVER_PUBLIC_KEY)
-        pem_base64 = base64.b64encode(pem_key)
-        writer.write(pem_base64 + b"\n")
-        await writer.drain()
+        connections_log.debug("Начало HANDSHAKE", extra=peer)
 
-        encrypted_fernet_key_base64 = await reader.readline()
-        if not encrypted_fernet_key_base64:
-            print("Клиент не поддержал Handshake")
+        started = time.perf_counter()
+        if not await server_handshake(reader, writer, ctx):
+            metrics.handshakes_total.inc("failed")
+            connections_log.warning("Клиент не поддержал Handshake", extra=peer)
             return
+        metrics.handshakes_total.inc("ok")
+        metrics.handshake_latency.observe(time.perf_counter() - started)
 
-        fernet_key = security.decrypt_rsa(
-            SERVER_PRIVATE_KEY, encrypted_fernet_key_base64.strip()
+        connections_log.info(
+            "Успешный HANDSHAKE! Канал зашифрован",
+            extra={
+                **peer,
+                "framing": ctx.framing,
+                "cipher": ctx.cipher.name,
+                "compression": ctx.compressor.name,
+                "codec": ctx.codec.name,
+            },
         )
-        ctx.cipher = Fernet(fernet_key)
 
-        print(f"[{address}] Успешный HANDSHAKE! Канал зашифрован.")
+        frame_reader = framing.FrameReader(reader, ctx.framing)
 
         while True:
-            encrypted_line = await reader.readline()
-            if not encrypted_line:
+            frame = await frame_reader.read()
+            if frame is None:
                 break
 
-            encrypted_line = encrypted_line.strip()
-            if not encrypted_line:
-                continue
-
+            metrics.bytes_in.inc(amount=len(frame.payload))
             try:
-                json_bytes = ctx.cipher.decrypt(encrypted_line)
-                message_str = json_bytes.decode("utf-8")
-                print(f"Получено (дешифрованно): {message_str}")
+                started = time.perf_counter()
+                packet_bytes = await crypto_executor.executor.run(
+                    ctx.open_payload, frame.payload, frame.flags, size=len(frame.payload)
+                )
+                timings = (
+                    profiling.RequestTimings(time.perf_counter() - started)
+                    if profiling.slow_log_enabled()
+                    else None
+                )
+                if packets_log.isEnabledFor(logging.DEBUG):
+                    packets_log.debug(
+                        "Получено (дешифрованно): %s",
+                        packet_bytes.decode("utf-8", "replace"),
+                        extra=peer,
+                    )
 
-                base_data = json.loads(message_str)
-                await router.dispatch(ctx, base_data)
+                await router.submit(ctx, packet_bytes, timings)
+            except CodecError as e:
+                metrics.errors_total.inc("", e.__class__.__name__)
+                packets_log.warning("Недействительный пакет: %s", e, extra=peer)
+                continue
             except ServerException as e:
                 await ctx.reply_error(f"{e.__class__.__name__}: {e}")
-            except json.JSONDecodeError:
-                print("Недействительный JSON")
-                continue
 
     except Exception as ex:
-        print(f"Произошла непредвиденная ошибка: {ex}")
+        connections_log.error("Произошла непредвиденная ошибка: %s", ex, extra=peer)
     finally:
-        if ctx.user_id and ctx.user_id in CONNECTED_USERS:
-            del CONNECTED_USERS[ctx.user_id]
-            print(f"[OFFLINE] Отключение пользователя {ctx.user_id}")
-        print(f"Отключение: {address}")
+        if ctx.tasks:
+            await asyncio.gather(*ctx.tasks, return_exceptions=True)
+        if disconnect_user(ctx):
+            connections_log.info("Отключение пользователя", extra={**peer, "user_id": ctx.user_id})
+        await ctx.close_outbound()
+        connections_log.info("Отключение", extra=peer)
+        metrics.active_connections.dec()
         writer.close()
         await writer.wait_closed()
 
 
+def format_compression_stats() -> str:
+    """
+    Строка со счётчиками сжатия для логов.
+
+    :return: Коэффициент сжатия, объём и CPU время.
+    :rtype: str
+    """
+    stats = compression.stats.stats()
+    return (
+        f"[COMPRESSION] frames={stats['compressed_frames']} skipped={stats['skipped_frames']} "
+        f"ratio={stats['ratio']:.2f} ({stats['bytes_in']} -> {stats['bytes_out']} B) "
+        f"cpu compress={stats['compress_time'] * 1000:.1f}ms "
+        f"decompress={stats['decompress_time'] * 1000:.1f}ms"
+    )
+
+
+def format_auth_stats() -> str:
+    """
+    Строка со счётчиками кэша проверенных токенов для логов.
+
+    :return: Режим авторизации, попадания и промахи кэша.
+    :rtype: str
+    """
+    stats = security.token_cache.stats()
+    return (
+        f"[AUTH] mode={security.CONFIG['AUTH_MODE']} token cache hits={stats['hits']} "
+        f"misses={stats['misses']} hit_rate={stats['hit_rate']:.1%} size={stats['size']}"
+    )
+
+
+def format_user_directory_stats() -> str:
+    """
+    Строка со счётчиками кэша справочника пользователей для логов.
+
+    :return: Попадания и промахи кэша.
+    :rtype: str
+    """
+    stats = user_directory.directory.stats()
+    return (
+        f"[USERS] directory hits={stats['hits']} misses={stats['misses']} "
+        f"hit_rate={stats['hit_rate']:.1%} size={stats['size']}"
+    )
+
+
+async def report_crypto_stats(interval: float):
+    """
+    Периодически выводит счётчики пула криптографии, сжатия и кэшей.
+
+    :param interval: Период вывода (секунды).
+    :type interval: float
+    """
+    while True:
+        await asyncio.sleep(interval)
+        stats = crypto_executor.executor.stats()
+        stats_log.info(
+            f"[CRYPTO] inline={stats['inline_calls']} offloaded={stats['offloaded_calls']} "
+            f"queue={stats['queue_depth']} (max {stats['max_queue_depth']}) "
+            f"wait avg={stats['wait_time_avg'] * 1000:.2f}ms max={stats['wait_time_max'] * 1000:.2f}ms"
+        )
+        stats_log.info(format_compression_stats())
+        stats_log.info(format_auth_stats())
+        stats_log.info(format_user_directory_stats())
+
+
 def parse_args():
     """
     Парсинг аргументов.
@@ -104,34 +358,343 @@ def parse_args():
     parser.add_argument("--host", type=str, default="127.0.0.1", help="IP Хоста")
     parser.add_argument("--port", type=int, default=12000, help="Порт")
     parser.add_argument("--db-path", type=str, default="server/database.db", help="Путь к SQLite базе данных",)
+    parser.add_argument(
+        "--db-pragma",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Переопределить PRAGMA соединений SQLite (например synchronous=FULL), можно несколько раз",
+    )
+    parser.add_argument(
+        "--no-db-tuning",
+        dest="db_tuning",
+        action="store_false",
+        help=(
+            "Не применять PRAGMA (rollback журнал, synchronous=FULL, как SQLite по умолчанию); "
+            "busy_timeout при --workers > 1 задаётся всегда"
+        ),
+    )
+    parser.add_argument(
+        "--db-readers",
+        type=int,
+        default=database.DEFAULT_READERS,
+        help="Соединений в пуле читателей SQLite (0 - без отдельного писателя)",
+    )
+    parser.add_argument(
+        "--message-batch-size",
+        type=int,
+        default=message_writer.DEFAULT_MAX_BATCH,
+        help="Максимум сообщений в одной транзакции групповой записи (0 - каждое сообщение своей транзакцией)",
+    )
+    parser.add_argument(
+        "--message-batch-wait-ms",
+        type=float,
+        default=message_writer.DEFAULT_MAX_WAIT_MS,
+        help="Ожидание новых сообщений в пачку после первого (мс)",
+    )
+    parser.add_argument(
+        "--user-cache-size",
+        type=int,
+        default=user_directory.DEFAULT_USER_CACHE_SIZE,
+        help="Максимум пользователей в кэше справочника (0 - без кэша)",
+    )
+    parser.add_argument(
+        "--user-cache-warm",
+        action="store_true",
+        help="Загрузить пользователей в кэш справочника при старте",
+    )
+    parser.add_argument(
+        "--rebuild-search",
+        action="store_true",
+        help="Пересоздать поисковые индексы FTS5 (пользователи, сообщения) и выйти",
+    )
     parser.add_argument("--jwt-secret", default="UNSAFE_JWT_SECRET_KEY", help="JWT Секретный ключ")
     parser.add_argument("--jwt-algo", default="HS256", help="Алгоритм JWT")
     parser.add_argument("--jwt-exp", type=int, default=24, help="Часы истечения JWT")
+    parser.add_argument(
+        "--auth-mode",
+        choices=security.AUTH_MODES,
+        default=security.AUTH_TOKEN,
+        help="token - проверять токен каждого пакета (с кэшем), "
+        "connection - авторизовать соединение один раз до истечения токена",
+    )
+    parser.add_argument(
+        "--token-cache-size",
+        type=int,
+        default=security.DEFAULT_TOKEN_CACHE_SIZE,
+        help="Максимум проверенных токенов в кэше (0 - без кэша)",
+    )
+    parser.add_argument(
+        "--key-path",
+        default=None,
+        help="PEM файл приватного RSA ключа сервера (создаётся, если его нет)",
+    )
+    parser.add_argument(
+        "--client-hello-wait-ms",
+        type=float,
+        default=handshake.DEFAULT_CLIENT_HELLO_WAIT * 1000,
+        help="Ожидание приветствия клиента (мс), затем PEM строка для старых клиентов",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=DEFAULT_MAX_INFLIGHT,
+        help="Максимум одновременно выполняемых запросов одного соединения",
+    )
+    parser.add_argument(
+        "--outbound-queue-size",
+        type=int,
+        default=DEFAULT_OUTBOUND_QUEUE_SIZE,
+        help="Максимум фреймов в исходящей очереди соединения",
+    )
+    parser.add_argument(
+        "--outbound-overflow",
+        choices=OVERFLOW_POLICIES,
+        default=OVERFLOW_SPILL,
+        help=(
+            "Поведение при переполнении исходящей очереди: drop - сообщение отбрасывается "
+            "и помечается прочитанным, disconnect - соединение закрывается, "
+            "spill - сообщение остаётся непрочитанным в БД"
+        ),
+    )
+    parser.add_argument(
+        "--crypto-workers",
+        type=int,
+        default=crypto_executor.DEFAULT_WORKERS,
+        help="Потоков для криптографии (0 - всё в event loop)",
+    )
+    parser.add_argument(
+        "--crypto-threshold",
+        type=int,
+        default=crypto_executor.DEFAULT_THRESHOLD,
+        help="Размер фрейма (байты), начиная с которого шифрование выносится в потоки",
+    )
+    parser.add_argument(
+        "--crypto-stats-interval",
+        type=float,
+        default=0,
+        help="Период вывода счётчиков пула криптографии, сжатия и кэша токенов (секунды, 0 - не выводить)",
+    )
+    parser.add_argument(
+        "--compression-threshold",
+        type=int,
+        default=compression.DEFAULT_THRESHOLD,
+        help="Минимальный размер ответа (байты) для сжатия",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Количество процессов-воркеров на одном порту (SO_REUSEPORT)",
+    )
+    parser.add_argument(
+        "--broker-path",
+        default=None,
+        help="Путь к Unix сокету брокера доставки между воркерами",
+    )
+    parser.add_argument(
+        "--event-loop",
+        choices=event_loop.SUPPORTED_LOOPS,
+        default=event_loop.LOOP_ASYNCIO,
+        help="Реализация event loop (uvloop - если установлен)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Порт HTTP listener метрик в формате Prometheus (0 - выключен)",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Хост HTTP listener метрик (по умолчанию только локальный)",
+    )
+    parser.add_argument(
+        "--metrics-socket",
+        default=None,
+        help="Unix сокет listener метрик (вместо порта)",
+    )
+    parser.add_argument(
+        "--admin-token",
+        default=None,
+        help="Токен админ эндпоинтов listener метрик (без него они доступны только с loopback)",
+    )
+    parser.add_argument(
+        "--slow-request-ms",
+        type=float,
+        default=0,
+        help="Порог журнала медленных запросов в мс (0 - выключен, меняется через /slowlog)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=profiling.DEFAULT_PROFILE_DIR,
+        help="Каталог для результатов профилирования (pstats и снимки tracemalloc)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=logger.LEVELS,
+        default="INFO",
+        help="Уровень логов сервера",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=logger.FORMATS,
+        default=logger.FORMAT_TEXT,
+        help="Формат логов (text или json - одна запись JSON на строку)",
+    )
+    parser.add_argument(
+        "--log-rate-limit",
+        type=float,
+        default=logger.DEFAULT_RATE_LIMIT,
+        help="Максимум записей в секунду на категорию логов (0 - без ограничения)",
+    )
+    parser.add_argument(
+        "--log-sample",
+        action="append",
+        default=[],
+        metavar="CATEGORY=N",
+        help="Писать только каждую N-ю запись категории (например packets=100)",
+    )
+    parser.add_argument(
+        "--log-payloads",
+        action="store_true",
+        help="Логировать расшифрованные пакеты (переключается SIGUSR1)",
+    )
+    parser.add_argument(
+        "--sql-echo",
+        action="store_true",
+        help="Логировать SQL запросы (переключается SIGUSR2)",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Вывести замер фаз холодного старта",
+    )
     return parser.parse_args()
 
 
-async def main():
-    """
-    Стартовая точка логики сервера.
+def set_server_key(private_key):
     """
-    global SERVER_PRIVATE_KEY, SERVER_PUBLIC_KEY
-    args = parse_args()
+    Устанавливает ключ сервера и заранее готовит PEM строку и отпечаток для handshake.
 
-    security.setup_jwt(args.jwt_secret, args.jwt_algo, args.jwt_exp)
+    :param private_key: Приватный RSA ключ сервера.
+    """
+    global SERVER_PRIVATE_KEY, SERVER_PUBLIC_KEY, SERVER_PEM_LINE, SERVER_PEM_BASE64, SERVER_KEY_ID
+    SERVER_PRIVATE_KEY = private_key
+    SERVER_PUBLIC_KEY = private_key.public_key()
+    SERVER_PEM_BASE64 = base64.b64encode(security.public_key_to_pem(SERVER_PUBLIC_KEY)).decode("ascii")
+    SERVER_PEM_LINE = SERVER_PEM_BASE64.encode("ascii") + b"\n"
+    SERVER_KEY_ID = security.public_key_fingerprint(SERVER_PUBLIC_KEY)
 
-    db_path = Path(args.db_path).as_posix()
 
-    session_maker = database.setup_database(db_path)
+def load_server_key(args: argparse.Namespace):
+    """
+    Загружает ключ сервера из --key-path или генерирует новый.
 
-    await database.init_db()
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Приватный RSA ключ сервера.
+    """
+    if args.key_path:
+        private_key, _, created = security.load_or_create_rsa_keys(args.key_path)
+        key_status = "сгенерирован и сохранён" if created else "загружен"
+        print(f"RSA ключ сервера {key_status}: {args.key_path}")
+        return private_key
 
     print("Генерация RSA ключей сервера...")
-    SERVER_PRIVATE_KEY, SERVER_PUBLIC_KEY = security.generate_rsa_keys()
+    private_key, _ = security.generate_rsa_keys()
     print("RSA ключи сгенерированы.")
+    return private_key
+
+
+async def start_metrics_listener(args: argparse.Namespace, worker_id: int | None = None):
+    """
+    Поднимает HTTP listener метрик и админ эндпоинтов профилирования, если он задан аргументами.
+
+    В многопроцессном режиме у каждого воркера свои метрики: воркер слушает
+    порт `--metrics-port + worker_id` или сокет `--metrics-socket.<worker_id>`.
 
-    server_handler = lambda reader, writer: handle_client(reader, writer, session_maker)
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param worker_id: Номер воркера (None - однопроцессный режим).
+    :type worker_id: int | None
+    :return: Сервер метрик или None.
+    :rtype: asyncio.Server | None
+    """
+    offset = worker_id or 0
+    if args.metrics_socket:
+        path = args.metrics_socket if worker_id is None else f"{args.metrics_socket}.{worker_id}"
+        server = await metrics.start_listener(path=path)
+        print(f"[SYSTEM] Метрики: unix:{path} /metrics")
+        return server
+    if args.metrics_port:
+        port = args.metrics_port + offset
+        server = await metrics.start_listener(args.metrics_host, port)
+        print(f"[SYSTEM] Метрики: http://{args.metrics_host}:{port}/metrics")
+        return server
+    return None
+
+
+async def serve(
+    args: argparse.Namespace,
+    session_maker,
+    profile: StartupProfile | None = None,
+    reuse_port: bool = False,
+    worker_id: int | None = None,
+    read_session_maker=None,
+):
+    """
+    Поднимает TCP сервер и обслуживает соединения до остановки.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param session_maker: Фабрика сессий с БД.
+    :param profile: Профиль холодного старта.
+    :type profile: StartupProfile | None
+    :param reuse_port: Слушать порт вместе с другими воркерами (SO_REUSEPORT).
+    :type reuse_port: bool
+    :param worker_id: Номер воркера (None - однопроцессный режим).
+    :type worker_id: int | None
+    :param read_session_maker: Фабрика сессий только для чтения.
+    """
+    global CLIENT_HELLO_WAIT
+    CLIENT_HELLO_WAIT = args.client_hello_wait_ms / 1000
+    crypto_executor.setup_crypto_executor(args.crypto_workers, args.crypto_threshold)
+    compression.setup_compression(args.compression_threshold)
+    message_writer.setup_message_writer(
+        session_maker, args.message_batch_size, args.message_batch_wait_ms
+    )
+    user_directory.setup_user_directory(args.user_cache_size)
+    if args.user_cache_warm:
+        loaded = await user_directory.directory.warm(read_session_maker or session_maker)
+        print(f"[SYSTEM] Пользователей в кэше справочника: {loaded}")
+    stats_task = None
+    if args.crypto_stats_interval > 0:
+        stats_task = asyncio.create_task(report_crypto_stats(args.crypto_stats_interval))
+    profiling.setup_profiling(args.profile_dir, args.slow_request_ms, router.routes)
+    metrics.setup_admin(args.admin_token)
+    metrics.ADMIN_ROUTES.update(profiling.ADMIN_ROUTES)
+    metrics_server = await start_metrics_listener(args, worker_id)
+
+    server_handler = lambda reader, writer: handle_client(
+        reader,
+        writer,
+        session_maker,
+        args.max_inflight,
+        args.outbound_queue_size,
+        args.outbound_overflow,
+        read_session_maker,
+    )
+
+    profile = profile or StartupProfile()
+    with profile.phase("start_server"):
+        server = await asyncio.start_server(
+            server_handler, args.host, args.port, reuse_port=reuse_port
+        )
+
+    if args.startup_profile:
+        print(profile.report())
 
-    server = await asyncio.start_server(server_handler, args.host, args.port)
     try:
         async with server:
             print(
@@ -141,13 +704,274 @@ async def main():
     except asyncio.CancelledError:
         print("\n[SYSTEM] Получен сигнал остановки сервера...")
     finally:
+        if stats_task:
+            stats_task.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        profiling.profiler.stop()
+        crypto_executor.executor.shutdown()
+        print(f"[SYSTEM] Пул криптографии: {crypto_executor.executor.stats()}")
+        print(format_compression_stats())
+        print(format_auth_stats())
+        print(format_user_directory_stats())
+        writer_stats = await message_writer.shutdown()
+        if writer_stats is not None:
+            print(f"[SYSTEM] Групповая запись сообщений: {writer_stats}")
+        if bus.client is not None:
+            await bus.client.close()
         if database.engine:
-            await database.engine.dispose()
+            await database.dispose()
             print("[SYSTEM] Соединение с БД успешно закрыто.")
         print("[SYSTEM] Сервер остановлен.")
 
+
+def setup_server_database(args: argparse.Namespace) -> tuple:
+    """
+    Настраивает БД процесса: PRAGMA соединений, писатель и пул читателей.
+
+    С `--no-db-tuning` в многопроцессном режиме busy_timeout всё равно
+    задаётся: без него запись воркеров упирается в "database is locked".
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Фабрики сессий записи и чтения (с метриками).
+    :rtype: tuple
+    """
+    pragmas = database.parse_pragmas(args.db_pragma) if args.db_tuning else {}
+    if args.workers > 1:
+        pragmas.setdefault("busy_timeout", database.DEFAULT_PRAGMAS["busy_timeout"])
+    session_maker = database.setup_database(
+        Path(args.db_path).as_posix(), pragmas, args.db_readers
+    )
+    return (
+        metrics.instrument_sessions(session_maker),
+        metrics.instrument_sessions(database.read_session),
+    )
+
+
+def setup_server_logging(args: argparse.Namespace):
+    """
+    Настраивает логирование процесса сервера по аргументам командной строки.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    """
+    logger.setup_logging(
+        args.log_level,
+        args.log_format,
+        args.log_rate_limit,
+        logger.parse_sampling(args.log_sample),
+        payloads=args.log_payloads,
+        sql_echo=args.sql_echo,
+    )
+    logger.install_signal_toggles()
+
+
+def forward_signal_toggles(processes: list):
+    """
+    Пересылает воркерам сигналы переключения отладочных логов (SIGUSR1/SIGUSR2).
+
+    :param processes: Процессы воркеров.
+    :type processes: list
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def forward(signum: int):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGUSR1, signal.SIGUSR2):
+        loop.add_signal_handler(signum, forward, signum)
+
+
+def stop_on_sigterm():
+    """
+    Останавливает текущую задачу по SIGTERM так же, как по Ctrl+C,
+    чтобы корректно закрыть БД, пул потоков и воркеры.
+    """
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel
+        )
+    except NotImplementedError:
+        pass
+
+
+async def worker_main(
+    args: argparse.Namespace, private_pem: bytes, broker_path: str, worker_id: int = 0
+):
+    """
+    Стартовая точка воркера в многопроцессном режиме.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param private_pem: PEM приватного ключа сервера (общий для всех воркеров).
+    :type private_pem: bytes
+    :param broker_path: Путь к Unix сокету брокера доставки.
+    :type broker_path: str
+    :param worker_id: Номер воркера.
+    :type worker_id: int
+    """
+    stop_on_sigterm()
+    setup_server_logging(args)
+    security.setup_jwt(args.jwt_secret, args.jwt_algo, args.jwt_exp)
+    security.setup_auth(args.auth_mode, args.token_cache_size)
+    session_maker, read_session_maker = setup_server_database(args)
+    set_server_key(security.load_rsa_private_key_pem(private_pem))
+
+    bus.client = bus.BusClient(broker_path, deliver_local)
+    await bus.client.connect()
+
+    serve_task = asyncio.create_task(
+        serve(
+            args,
+            session_maker,
+            reuse_port=True,
+            worker_id=worker_id,
+            read_session_maker=read_session_maker,
+        )
+    )
+    try:
+        await asyncio.wait(
+            [serve_task, asyncio.create_task(bus.client.wait_closed())],
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if not serve_task.done():
+            logger.get_logger(logger.CATEGORY_BUS).error("Брокер недоступен, остановка воркера")
+    finally:
+        if not serve_task.done():
+            serve_task.cancel()
+            await asyncio.wait([serve_task])
+
+
+def run_worker(args: argparse.Namespace, private_pem: bytes, broker_path: str, worker_id: int = 0):
+    """
+    Точка входа процесса-воркера.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    :param private_pem: PEM приватного ключа сервера.
+    :type private_pem: bytes
+    :param broker_path: Путь к Unix сокету брокера доставки.
+    :type broker_path: str
+    :param worker_id: Номер воркера.
+    :type worker_id: int
+    """
+    try:
+        event_loop.run(worker_main(args, private_pem, broker_path, worker_id), args.event_loop)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        logger.shutdown_logging()
+
+
+async def run_workers(args: argparse.Namespace):
+    """
+    Многопроцессный режим: брокер доставки в главном процессе и N воркеров
+    на одном порту (SO_REUSEPORT).
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    """
+    journal_mode = await database.set_journal_mode("WAL")
+    print(f"[SYSTEM] Режим журнала SQLite: {journal_mode}")
+    await database.dispose()
+
+    broker_path = args.broker_path or os.path.join(
+        tempfile.gettempdir(), f"console-messager-{os.getpid()}.sock"
+    )
+    if os.path.exists(broker_path):
+        os.unlink(broker_path)
+
+    broker = bus.DeliveryBroker(broker_path)
+    await broker.start()
+    print(f"[BROKER] Брокер доставки: {broker_path}")
+
+    private_pem = security.private_key_to_pem(SERVER_PRIVATE_KEY)
+    mp_context = multiprocessing.get_context("spawn")
+    processes = [
+        mp_context.Process(
+            target=run_worker,
+            args=(args, private_pem, broker_path, worker_id),
+            name=f"worker-{worker_id}",
+        )
+        for worker_id in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    forward_signal_toggles(processes)
+    print(f"[SYSTEM] Запущено воркеров: {args.workers}")
+
+    try:
+        await asyncio.gather(*(asyncio.to_thread(process.join) for process in processes))
+    except asyncio.CancelledError:
+        print("\n[SYSTEM] Получен сигнал остановки сервера...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            await asyncio.to_thread(process.join, 5)
+            if process.is_alive():
+                process.kill()
+        await broker.close()
+        if os.path.exists(broker_path):
+            os.unlink(broker_path)
+        print(f"[BROKER] Переслано доставок: {broker.routed}")
+        print("[SYSTEM] Сервер остановлен.")
+
+
+async def main(args: argparse.Namespace):
+    """
+    Стартовая точка логики сервера.
+
+    :param args: Аргументы командной строки.
+    :type args: argparse.Namespace
+    """
+    stop_on_sigterm()
+    setup_server_logging(args)
+    print(f"[SYSTEM] Event loop: {event_loop.current_loop_name()}")
+
+    profile = StartupProfile(IMPORT_STARTED_AT)
+    profile.add("imports", IMPORTS_FINISHED_AT - IMPORT_STARTED_AT)
+
+    security.setup_jwt(args.jwt_secret, args.jwt_algo, args.jwt_exp)
+    security.setup_auth(args.auth_mode, args.token_cache_size)
+
+    with profile.phase("setup_database"):
+        session_maker, read_session_maker = setup_server_database(args)
+
+    with profile.phase("init_db"):
+        await database.init_db()
+
+    if args.rebuild_search:
+        tables = await database.rebuild_search()
+        print(f"[SYSTEM] Поисковые индексы пересозданы: {', '.join(tables) or 'FTS5 недоступен'}")
+        await database.dispose()
+        return
+
+    with profile.phase("server_key"):
+        set_server_key(load_server_key(args))
+
+    print(f"Отпечаток ключа сервера (SHA-256): {security.public_key_fingerprint(SERVER_PUBLIC_KEY)}")
+
+    if args.workers > 1:
+        if args.startup_profile:
+            print(profile.report())
+        await run_workers(args)
+        return
+
+    await serve(args, session_maker, profile, read_session_maker=read_session_maker)
+
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
+        event_loop.run(main(args), args.event_loop)
+    except (KeyboardInterrupt, asyncio.CancelledError):
         pass
+    finally:
+        logger.shutdown_logging()
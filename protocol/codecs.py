@@ -0,0 +1,255 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Dict
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+from server.exceptions import CodecError
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+CODEC_LEGACY = "json-legacy"
+"""Кодек старых клиентов: JSON, структурные `data` ответа передаются строкой JSON."""
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+CODEC_CBOR = "cbor"
+
+
+class Codec(ABC):
+    """
+    Базовый кодек пакетов.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def dump(self, packet: BaseModel) -> bytes:
+        """
+        Кодирует пакет.
+
+        :param packet: Пакет.
+        :type packet: BaseModel
+        :return: Байты пакета.
+        :rtype: bytes
+        """
+
+    @abstractmethod
+    def load(self, data: bytes) -> dict:
+        """
+        Декодирует пакет в словарь.
+
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Словарь пакета.
+        :rtype: dict
+        """
+
+    def validate(self, adapter: TypeAdapter, data: bytes):
+        """
+        Декодирует пакет и валидирует его моделью.
+
+        :param adapter: Валидатор пакетов.
+        :type adapter: TypeAdapter
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Модель пакета.
+        :raises pydantic.ValidationError: Если пакет не проходит валидацию.
+        """
+        return adapter.validate_python(self.load(data))
+
+
+class JsonCodec(Codec):
+    """
+    JSON кодек: пакет целиком, `data` ответа - структурные данные без повторного кодирования.
+    """
+
+    name = CODEC_JSON
+
+    def dump(self, packet: BaseModel) -> bytes:
+        """
+        Кодирует пакет.
+
+        :param packet: Пакет.
+        :type packet: BaseModel
+        :return: Байты пакета.
+        :rtype: bytes
+        """
+        return packet.model_dump_json().encode("utf-8")
+
+    def load(self, data: bytes) -> dict:
+        """
+        Декодирует пакет.
+
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Словарь пакета.
+        :rtype: dict
+        :raises CodecError: Если данные не являются JSON объектом.
+        """
+        try:
+            packet = json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError) as ex:
+            raise CodecError(f"Недействительный JSON: {ex}") from ex
+        return _ensure_dict(packet)
+
+    def validate(self, adapter: TypeAdapter, data: bytes):
+        """
+        Валидирует пакет прямо из байт JSON, без промежуточного словаря.
+
+        :param adapter: Валидатор пакетов.
+        :type adapter: TypeAdapter
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Модель пакета.
+        :raises pydantic.ValidationError: Если пакет не проходит валидацию.
+        """
+        return adapter.validate_json(data)
+
+
+class LegacyJsonCodec(JsonCodec):
+    """
+    JSON кодек старых клиентов: они ожидают `data` строкой и разбирают её вторым `json.loads`.
+    """
+
+    name = CODEC_LEGACY
+
+    def dump(self, packet: BaseModel) -> bytes:
+        """
+        Кодирует пакет, превращая структурные `data` в строку JSON.
+
+        :param packet: Пакет.
+        :type packet: BaseModel
+        :return: Байты пакета.
+        :rtype: bytes
+        """
+        data = getattr(packet, "data", None)
+        if data is not None and not isinstance(data, str):
+            packet = packet.model_copy(update={"data": to_json(data).decode("utf-8")})
+        return super().dump(packet)
+
+
+class MsgpackCodec(Codec):
+    """
+    Бинарный кодек MessagePack (если установлен `msgpack`).
+    """
+
+    name = CODEC_MSGPACK
+
+    def dump(self, packet: BaseModel) -> bytes:
+        """
+        Кодирует пакет.
+
+        :param packet: Пакет.
+        :type packet: BaseModel
+        :return: Байты пакета.
+        :rtype: bytes
+        """
+        return msgpack.packb(packet.model_dump(mode="json"))
+
+    def load(self, data: bytes) -> dict:
+        """
+        Декодирует пакет.
+
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Словарь пакета.
+        :rtype: dict
+        :raises CodecError: Если данные повреждены.
+        """
+        try:
+            packet = msgpack.unpackb(data)
+        except (ValueError, msgpack.UnpackException) as ex:
+            raise CodecError(f"Недействительный msgpack: {ex}") from ex
+        return _ensure_dict(packet)
+
+
+class CborCodec(Codec):
+    """
+    Бинарный кодек CBOR (если установлен `cbor2`).
+    """
+
+    name = CODEC_CBOR
+
+    def dump(self, packet: BaseModel) -> bytes:
+        """
+        Кодирует пакет.
+
+        :param packet: Пакет.
+        :type packet: BaseModel
+        :return: Байты пакета.
+        :rtype: bytes
+        """
+        return cbor2.dumps(packet.model_dump(mode="json"))
+
+    def load(self, data: bytes) -> dict:
+        """
+        Декодирует пакет.
+
+        :param data: Байты пакета.
+        :type data: bytes
+        :return: Словарь пакета.
+        :rtype: dict
+        :raises CodecError: Если данные повреждены.
+        """
+        try:
+            packet = cbor2.loads(data)
+        except (ValueError, cbor2.CBORDecodeError) as ex:
+            raise CodecError(f"Недействительный CBOR: {ex}") from ex
+        return _ensure_dict(packet)
+
+
+def _ensure_dict(packet) -> dict:
+    """
+    Проверяет, что декодированный пакет - объект.
+
+    :param packet: Декодированные данные.
+    :return: Словарь пакета.
+    :rtype: dict
+    :raises CodecError: Если пакет не является объектом.
+    """
+    if not isinstance(packet, dict):
+        raise CodecError("Пакет должен быть объектом")
+    return packet
+
+
+CODECS: Dict[str, Codec] = {
+    CODEC_LEGACY: LegacyJsonCodec(),
+    CODEC_JSON: JsonCodec(),
+}
+"""Доступные кодеки по имени."""
+
+if msgpack is not None:
+    CODECS[CODEC_MSGPACK] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS[CODEC_CBOR] = CborCodec()
+
+SUPPORTED_CODECS = tuple(
+    name for name in (CODEC_MSGPACK, CODEC_CBOR, CODEC_JSON) if name in CODECS
+)
+"""Кодеки для согласования в handshake в порядке предпочтения (msgpack и CBOR - если установлены)."""
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Возвращает кодек по имени.
+
+    :param name: Имя кодека.
+    :type name: str
+    :return: Кодек.
+    :rtype: Codec
+    :raises CodecError: Если кодек недоступен.
+    """
+    codec = CODECS.get(name)
+    if codec is None:
+        raise CodecError(f"Кодек {name} недоступен")
+    return codec
@@ -0,0 +1,335 @@
+import time
+import zlib
+import threading
+from typing import Callable, Dict
+
+from server.exceptions import CompressionError
+from protocol.framing import FLAG_COMPRESSED, MAX_FRAME_SIZE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_LZ4 = "lz4"
+
+DEFAULT_THRESHOLD = 1024
+"""Пакеты меньше порога (байты) не сжимаются: короткие сообщения чата почти не ужимаются."""
+
+CONFIG = {"THRESHOLD": DEFAULT_THRESHOLD}
+
+
+def _zlib_decompress(data: bytes, max_size: int) -> bytes:
+    """
+    Распаковка zlib с ограничением размера результата.
+
+    :param data: Сжатые данные.
+    :type data: bytes
+    :param max_size: Максимальный размер результата.
+    :type max_size: int
+    :return: Распакованные данные.
+    :rtype: bytes
+    :raises CompressionError: Если данные повреждены, поток не завершён или превышен лимит.
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        result = decompressor.decompress(data, max_size)
+    except zlib.error as ex:
+        raise CompressionError(f"Ошибка распаковки zlib: {ex}") from ex
+    if decompressor.unconsumed_tail:
+        raise CompressionError(f"Распакованный фрейм превышает лимит {max_size}")
+    if not decompressor.eof:
+        raise CompressionError("Неполный сжатый фрейм zlib")
+    return result
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    """
+    Сжатие zstd (ZstdCompressor не потокобезопасен, поэтому создаётся на вызов).
+
+    :param data: Исходные данные.
+    :type data: bytes
+    :return: Сжатые данные.
+    :rtype: bytes
+    """
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data: bytes, max_size: int) -> bytes:
+    """
+    Распаковка zstd с ограничением размера результата.
+
+    :param data: Сжатые данные.
+    :type data: bytes
+    :param max_size: Максимальный размер результата.
+    :type max_size: int
+    :return: Распакованные данные.
+    :rtype: bytes
+    :raises CompressionError: Если данные повреждены или превышен лимит.
+    """
+    try:
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+    except zstandard.ZstdError as ex:
+        raise CompressionError(f"Ошибка распаковки zstd: {ex}") from ex
+
+
+def _lz4_decompress(data: bytes, max_size: int) -> bytes:
+    """
+    Распаковка lz4 с ограничением размера результата.
+
+    :param data: Сжатые данные.
+    :type data: bytes
+    :param max_size: Максимальный размер результата.
+    :type max_size: int
+    :return: Распакованные данные.
+    :rtype: bytes
+    :raises CompressionError: Если данные повреждены, фрейм не завершён или превышен лимит.
+    """
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+    try:
+        result = decompressor.decompress(data, max_length=max_size)
+    except RuntimeError as ex:
+        raise CompressionError(f"Ошибка распаковки lz4: {ex}") from ex
+    if not decompressor.eof:
+        if len(result) >= max_size:
+            raise CompressionError(f"Распакованный фрейм превышает лимит {max_size}")
+        raise CompressionError("Неполный сжатый фрейм lz4")
+    return result
+
+
+CODECS: Dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes, int], bytes]]] = {
+    COMPRESSION_ZLIB: (zlib.compress, _zlib_decompress),
+}
+"""Доступные алгоритмы: имя -> (сжатие, распаковка с лимитом размера)."""
+
+if zstandard is not None:
+    CODECS[COMPRESSION_ZSTD] = (_zstd_compress, _zstd_decompress)
+if lz4 is not None:
+    CODECS[COMPRESSION_LZ4] = (lz4.frame.compress, _lz4_decompress)
+
+SUPPORTED_COMPRESSIONS = tuple(
+    name for name in (COMPRESSION_ZSTD, COMPRESSION_LZ4, COMPRESSION_ZLIB) if name in CODECS
+) + (COMPRESSION_NONE,)
+"""Поддерживаемые алгоритмы в порядке предпочтения (zstd и lz4 - если установлены)."""
+
+
+def setup_compression(threshold: int):
+    """
+    Настройка порога сжатия.
+
+    :param threshold: Минимальный размер пакета для сжатия (байты).
+    :type threshold: int
+    """
+    CONFIG["THRESHOLD"] = threshold
+
+
+class CompressionStats:
+    """
+    Счётчики сжатия (потокобезопасные: сжатие может выполняться в пуле криптографии).
+
+    Кроме общих счётчиков ведутся счётчики по алгоритмам для метрик
+    (`server.metrics` читает их при выводе).
+    """
+
+    def __init__(self):
+        """
+        Создаёт пустые счётчики.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Обнуляет счётчики.
+        """
+        with self._lock:
+            self.compressed_frames = 0
+            self.skipped_frames = 0
+            self.decompressed_frames = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.compress_time = 0.0
+            self.decompress_time = 0.0
+            self.algorithms: Dict[str, dict] = {}
+
+    def _algorithm(self, name: str) -> dict:
+        """
+        Счётчики алгоритма (вызывается под блокировкой).
+
+        :param name: Алгоритм сжатия.
+        :type name: str
+        :return: Счётчики алгоритма.
+        :rtype: dict
+        """
+        counters = self.algorithms.get(name)
+        if counters is None:
+            counters = self.algorithms[name] = {
+                "compressed_frames": 0,
+                "skipped_frames": 0,
+                "decompressed_frames": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "compress_time": 0.0,
+                "decompress_time": 0.0,
+            }
+        return counters
+
+    def record_compress(self, name: str, size_in: int, size_out: int, cpu_time: float):
+        """
+        Учитывает сжатый пакет.
+
+        :param name: Алгоритм сжатия.
+        :type name: str
+        :param size_in: Исходный размер (байты).
+        :type size_in: int
+        :param size_out: Сжатый размер (байты).
+        :type size_out: int
+        :param cpu_time: CPU время сжатия (секунды).
+        :type cpu_time: float
+        """
+        with self._lock:
+            self.compressed_frames += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.compress_time += cpu_time
+            counters = self._algorithm(name)
+            counters["compressed_frames"] += 1
+            counters["bytes_in"] += size_in
+            counters["bytes_out"] += size_out
+            counters["compress_time"] += cpu_time
+
+    def record_skip(self, name: str):
+        """
+        Учитывает пакет, отправленный без сжатия.
+
+        :param name: Согласованный алгоритм сжатия.
+        :type name: str
+        """
+        with self._lock:
+            self.skipped_frames += 1
+            self._algorithm(name)["skipped_frames"] += 1
+
+    def record_decompress(self, name: str, cpu_time: float):
+        """
+        Учитывает распакованный пакет.
+
+        :param name: Алгоритм сжатия.
+        :type name: str
+        :param cpu_time: CPU время распаковки (секунды).
+        :type cpu_time: float
+        """
+        with self._lock:
+            self.decompressed_frames += 1
+            self.decompress_time += cpu_time
+            counters = self._algorithm(name)
+            counters["decompressed_frames"] += 1
+            counters["decompress_time"] += cpu_time
+
+    def stats(self) -> dict:
+        """
+        Снимок счётчиков.
+
+        :return: Счётчики, коэффициент сжатия (исходный размер / сжатый) и CPU время.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "compressed_frames": self.compressed_frames,
+                "skipped_frames": self.skipped_frames,
+                "decompressed_frames": self.decompressed_frames,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 1.0,
+                "compress_time": self.compress_time,
+                "decompress_time": self.decompress_time,
+            }
+
+    def by_algorithm(self) -> Dict[str, dict]:
+        """
+        Снимок счётчиков по алгоритмам.
+
+        :return: Алгоритм -> счётчики (как в `stats`, без коэффициента).
+        :rtype: Dict[str, dict]
+        """
+        with self._lock:
+            return {name: dict(counters) for name, counters in self.algorithms.items()}
+
+
+stats = CompressionStats()
+"""Счётчики сжатия текущего процесса."""
+
+
+class Compressor:
+    """
+    Сжатие пакетов соединения выбранным при handshake алгоритмом.
+    """
+
+    def __init__(self, name: str = COMPRESSION_NONE, threshold: int | None = None):
+        """
+        Создаёт компрессор.
+
+        :param name: Алгоритм сжатия.
+        :type name: str
+        :param threshold: Минимальный размер пакета для сжатия (по умолчанию из CONFIG).
+        :type threshold: int | None
+        """
+        self.name = name
+        self.threshold = CONFIG["THRESHOLD"] if threshold is None else threshold
+        self._compress, self._decompress = CODECS.get(name, (None, None))
+
+    def compress(self, payload: bytes) -> tuple[bytes, int]:
+        """
+        Сжимает пакет, если он не меньше порога и сжатие даёт выигрыш.
+
+        :param payload: Пакет (JSON).
+        :type payload: bytes
+        :return: Пакет и флаги фрейма.
+        :rtype: tuple[bytes, int]
+        """
+        if self._compress is None or len(payload) < self.threshold:
+            stats.record_skip(self.name)
+            return payload, 0
+
+        started = time.thread_time()
+        compressed = self._compress(payload)
+        cpu_time = time.thread_time() - started
+
+        if len(compressed) >= len(payload):
+            stats.record_skip(self.name)
+            return payload, 0
+
+        stats.record_compress(self.name, len(payload), len(compressed), cpu_time)
+        return compressed, FLAG_COMPRESSED
+
+    def decompress(self, payload: bytes, flags: int, max_size: int = MAX_FRAME_SIZE) -> bytes:
+        """
+        Распаковывает пакет, если у фрейма стоит флаг сжатия.
+
+        :param payload: Пакет после расшифровки.
+        :type payload: bytes
+        :param flags: Флаги фрейма.
+        :type flags: int
+        :param max_size: Максимальный размер распакованного пакета.
+        :type max_size: int
+        :return: Исходный пакет.
+        :rtype: bytes
+        :raises CompressionError: Если сжатие не согласовано, данные повреждены или превышен лимит.
+        """
+        if not flags & FLAG_COMPRESSED:
+            return payload
+
+        if self._decompress is None:
+            raise CompressionError("Сжатый фрейм без согласованного сжатия")
+
+        started = time.thread_time()
+        result = self._decompress(payload, max_size)
+        stats.record_decompress(self.name, time.thread_time() - started)
+        return result
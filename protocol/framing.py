@@ -0,0 +1,174 @@
+import asyncio
+import struct
+
+from server.exceptions import FrameTooLargeError
+
+FRAMING_LINE = "line"
+"""Старый режим: один base64 токен на строку, разделитель `\\n`."""
+
+FRAMING_BINARY = "binary"
+"""Бинарный режим: фиксированный заголовок + сырой шифртекст."""
+
+SUPPORTED_FRAMINGS = (FRAMING_BINARY, FRAMING_LINE)
+"""Поддерживаемые режимы в порядке предпочтения."""
+
+HEADER = struct.Struct("!IBB")
+"""Заголовок бинарного фрейма: длина (uint32), флаги (uint8), тип (uint8)."""
+
+FRAME_DATA = 0
+"""Тип фрейма: зашифрованный пакет данных."""
+
+FLAG_COMPRESSED = 0x01
+"""Флаг фрейма: пакет сжат перед шифрованием (только бинарный режим)."""
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+"""Максимальный размер полезной нагрузки фрейма (байты)."""
+
+LINE_DELIMITER = b"\n"
+
+
+class Frame:
+    """
+    Принятый фрейм.
+    """
+
+    __slots__ = ("payload", "flags", "frame_type")
+
+    def __init__(self, payload: memoryview, flags: int = 0, frame_type: int = FRAME_DATA):
+        """
+        Создаёт фрейм.
+
+        :param payload: Полезная нагрузка (шифртекст).
+        :type payload: memoryview
+        :param flags: Флаги фрейма.
+        :type flags: int
+        :param frame_type: Тип фрейма.
+        :type frame_type: int
+        """
+        self.payload = payload
+        self.flags = flags
+        self.frame_type = frame_type
+
+
+def encode_frame(
+    payload: bytes,
+    framing: str,
+    flags: int = 0,
+    frame_type: int = FRAME_DATA,
+) -> list[bytes]:
+    """
+    Формирует части фрейма для `writer.writelines` без склейки байт.
+
+    :param payload: Полезная нагрузка (шифртекст).
+    :type payload: bytes
+    :param framing: Режим фрейминга.
+    :type framing: str
+    :param flags: Флаги фрейма (только бинарный режим).
+    :type flags: int
+    :param frame_type: Тип фрейма (только бинарный режим).
+    :type frame_type: int
+    :return: Список буферов для записи.
+    :rtype: list[bytes]
+    :raises FrameTooLargeError: Если полезная нагрузка превышает лимит.
+    """
+    if framing == FRAMING_BINARY:
+        size = len(payload)
+        if size > MAX_FRAME_SIZE:
+            raise FrameTooLargeError(f"Размер фрейма {size} превышает лимит")
+        return [HEADER.pack(size, flags, frame_type), payload]
+    return [payload, LINE_DELIMITER]
+
+
+def frame_aad(framing: str, flags: int = 0, frame_type: int = FRAME_DATA) -> bytes:
+    """
+    Связанные данные шифра сессии: поля заголовка, не входящие в шифртекст.
+
+    Длина фрейма защищена самим шифртекстом, флаги (в том числе
+    FLAG_COMPRESSED) и тип - только через связанные данные.
+
+    :param framing: Режим фрейминга.
+    :type framing: str
+    :param flags: Флаги фрейма.
+    :type flags: int
+    :param frame_type: Тип фрейма.
+    :type frame_type: int
+    :return: Флаги и тип (пусто в строковом режиме - там заголовка нет).
+    :rtype: bytes
+    """
+    if framing == FRAMING_BINARY:
+        return bytes((flags, frame_type))
+    return b""
+
+
+class FrameReader:
+    """
+    Чтение фреймов из потока в выбранном режиме фрейминга.
+    """
+
+    def __init__(self, reader, framing: str = FRAMING_LINE, max_size: int = MAX_FRAME_SIZE):
+        """
+        Создаёт читателя фреймов.
+
+        :param reader: Поток чтения.
+        :type reader: asyncio.StreamReader
+        :param framing: Режим фрейминга.
+        :type framing: str
+        :param max_size: Максимальный размер полезной нагрузки.
+        :type max_size: int
+        """
+        self.reader = reader
+        self.framing = framing
+        self.max_size = max_size
+
+    async def read(self) -> Frame | None:
+        """
+        Читает следующий фрейм.
+
+        В строковом режиме пустые строки пропускаются.
+
+        :return: Фрейм или None, если соединение закрыто.
+        :rtype: Frame | None
+        :raises FrameTooLargeError: Если заявленный размер превышает лимит.
+        """
+        if self.framing == FRAMING_BINARY:
+            return await self._read_binary()
+        return await self._read_line()
+
+    async def _read_binary(self) -> Frame | None:
+        """
+        Читает бинарный фрейм через `readexactly`.
+
+        :return: Фрейм или None, если соединение закрыто.
+        :rtype: Frame | None
+        """
+        try:
+            header = await self.reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+
+        size, flags, frame_type = HEADER.unpack(header)
+        if size > self.max_size:
+            raise FrameTooLargeError(f"Размер фрейма {size} превышает лимит")
+
+        try:
+            payload = await self.reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return None
+
+        return Frame(memoryview(payload), flags, frame_type)
+
+    async def _read_line(self) -> Frame | None:
+        """
+        Читает строку с base64 токеном.
+
+        :return: Фрейм или None, если соединение закрыто.
+        :rtype: Frame | None
+        """
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return None
+
+            line = line.strip()
+            if line:
+                return Frame(memoryview(line))
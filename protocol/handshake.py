@@ -0,0 +1,118 @@
+import json
+
+from server.exceptions import HandshakeError
+
+HELLO_PREFIX = b"{"
+"""Признак расширенного приветствия клиента (base64 старых клиентов не содержит `{`)."""
+
+DEFAULT_CLIENT_HELLO_WAIT = 0.2
+"""Ожидание приветствия клиента (секунды), затем сервер шлёт PEM строку для старых клиентов."""
+
+TRANSCRIPT_CONTEXT = b"console-messager handshake v1\n"
+"""Префикс подписываемой записи handshake."""
+
+UNSIGNED_FIELDS = ("signature", "server_key")
+"""Поля ответа сервера, не входящие в подписываемую запись."""
+
+
+def is_client_hello(line: bytes) -> bool:
+    """
+    Проверяет, является ли первая строка клиента расширенным приветствием.
+
+    :param line: Первая строка от клиента.
+    :type line: bytes
+    :return: True, если клиент прислал JSON приветствие.
+    :rtype: bool
+    """
+    return line.lstrip().startswith(HELLO_PREFIX)
+
+
+def encode_hello(params: dict) -> bytes:
+    """
+    Сериализует приветствие в строку протокола.
+
+    :param params: Параметры приветствия.
+    :type params: dict
+    :return: JSON строка с разделителем.
+    :rtype: bytes
+    """
+    return json.dumps(params, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode_hello(line: bytes) -> dict:
+    """
+    Десериализует приветствие.
+
+    :param line: Строка приветствия.
+    :type line: bytes
+    :return: Параметры приветствия.
+    :rtype: dict
+    :raises HandshakeError: Если строка не является JSON объектом.
+    """
+    try:
+        params = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise HandshakeError("Некорректное приветствие") from e
+
+    if not isinstance(params, dict):
+        raise HandshakeError("Некорректное приветствие")
+    return params
+
+
+def transcript(client_hello: bytes, server_params: dict) -> bytes:
+    """
+    Запись handshake, которую сервер подписывает RSA ключом.
+
+    В неё входят приветствие клиента целиком (с его X25519 ключом) и ответ
+    сервера без UNSIGNED_FIELDS (с эфемерным ключом сервера и выбранными
+    параметрами), поэтому подмена ключа или параметров ломает подпись.
+
+    :param client_hello: Строка приветствия клиента.
+    :type client_hello: bytes
+    :param server_params: Ответ сервера.
+    :type server_params: dict
+    :return: Байты для подписи.
+    :rtype: bytes
+    """
+    signed = {key: value for key, value in server_params.items() if key not in UNSIGNED_FIELDS}
+    return (
+        TRANSCRIPT_CONTEXT
+        + client_hello.strip()
+        + b"\n"
+        + json.dumps(signed, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    )
+
+
+def select_option(offered, supported, default: str) -> str:
+    """
+    Выбирает первый вариант из предложенных клиентом, который поддерживает сервер.
+
+    :param offered: Варианты клиента в порядке предпочтения.
+    :param supported: Варианты, поддерживаемые сервером.
+    :param default: Значение, если клиент ничего не предложил.
+    :type default: str
+    :return: Выбранный вариант.
+    :rtype: str
+    :raises HandshakeError: Если общих вариантов нет.
+    """
+    if not offered:
+        return default
+
+    for option in offered:
+        if option in supported:
+            return option
+
+    raise HandshakeError(f"Нет общих вариантов: {offered}")
+
+
+def prefer_option(preferred: str, supported) -> tuple[str, ...]:
+    """
+    Формирует список вариантов, в котором предпочтительный вариант стоит первым.
+
+    :param preferred: Предпочтительный вариант.
+    :type preferred: str
+    :param supported: Все поддерживаемые варианты.
+    :return: Варианты в порядке предпочтения.
+    :rtype: tuple[str, ...]
+    """
+    return (preferred,) + tuple(option for option in supported if option != preferred)
@@ -1,10 +1,20 @@
+import os
 import jwt
+import time
 import base64
+import struct
+import hashlib
+import itertools
 import datetime
+import threading
+from collections import OrderedDict
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag, InvalidSignature
 from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
 from server.exceptions import ExpiredSignatureServerError, InvalidTokenServerError
 
@@ -21,6 +31,92 @@ def generate_rsa_keys():
     return private_key, public_key
 
 
+def private_key_to_pem(private_key) -> bytes:
+    """
+    Сериализация приватного ключа в PEM формат (PKCS8, без пароля)
+
+    :param private_key: Приватный ключ.
+    :return: Ключ в формате PEM.
+    :rtype: bytes
+    """
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def load_rsa_private_key_pem(pem_bytes: bytes):
+    """
+    Десериализация приватного RSA ключа сервера из PEM.
+
+    Ключ создаёт сам сервер, поэтому дорогая проверка простых чисел RSA пропускается.
+
+    :param pem_bytes: PEM байты.
+    :type pem_bytes: bytes
+    :return: Приватный ключ.
+    :rtype: Any
+    :raises ValueError: Если PEM не является приватным RSA ключом.
+    """
+    private_key = serialization.load_pem_private_key(
+        pem_bytes, password=None, unsafe_skip_rsa_key_validation=True
+    )
+    if not isinstance(private_key, rsa.RSAPrivateKey):
+        raise ValueError("PEM не является приватным RSA ключом")
+    return private_key
+
+
+def load_or_create_rsa_keys(key_path: str):
+    """
+    Загружает приватный RSA ключ сервера из PEM файла.
+
+    Если файла нет, генерирует пару ключей и сохраняет приватный ключ
+    (права 0600, атомарная запись через временный файл).
+
+    :param key_path: Путь к PEM файлу.
+    :type key_path: str
+    :return: Приватный и публичный ключи, флаг "ключ создан".
+    :rtype: tuple
+    :raises ValueError: Если файл не является приватным RSA ключом.
+    """
+    if os.path.exists(key_path):
+        with open(key_path, "rb") as key_file:
+            private_key = load_rsa_private_key_pem(key_file.read())
+        return private_key, private_key.public_key(), False
+
+    private_key, public_key = generate_rsa_keys()
+
+    directory = os.path.dirname(key_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{key_path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(private_key_to_pem(private_key))
+    os.replace(tmp_path, key_path)
+
+    return private_key, public_key, True
+
+
+def public_key_fingerprint(public_key) -> str:
+    """
+    SHA-256 отпечаток публичного ключа (DER SubjectPublicKeyInfo).
+
+    :param public_key: Публичный ключ.
+    :return: Отпечаток в hex.
+    :rtype: str
+    """
+    digest = hashes.Hash(hashes.SHA256())
+    digest.update(
+        public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    return digest.finalize().hex()
+
+
 def public_key_to_pem(public_key) -> bytes:
     """
     Сериализация публичного ключа в PEM формат
@@ -90,6 +186,99 @@ def decrypt_rsa(private_key, b64_ciphered: bytes) -> bytes:
     return plain_text
 
 
+def sign_rsa(private_key, data: bytes) -> bytes:
+    """
+    Подписывает данные приватным RSA ключом (PSS, SHA-256).
+
+    :param private_key: Приватный ключ.
+    :param data: Подписываемые байты.
+    :type data: bytes
+    :return: Подпись в Base64.
+    :rtype: bytes
+    """
+    signature = private_key.sign(
+        data,
+        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+        hashes.SHA256(),
+    )
+    return base64.b64encode(signature)
+
+
+def verify_rsa(public_key, data: bytes, b64_signature: bytes):
+    """
+    Проверяет подпись `sign_rsa` публичным RSA ключом.
+
+    :param public_key: Публичный ключ.
+    :param data: Подписанные байты.
+    :type data: bytes
+    :param b64_signature: Подпись в Base64.
+    :type b64_signature: bytes
+    :raises InvalidSignature: Если подпись не подходит к данным и ключу.
+    """
+    try:
+        signature = base64.b64decode(b64_signature, validate=True)
+    except ValueError as e:
+        raise InvalidSignature() from e
+    public_key.verify(
+        signature,
+        data,
+        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+        hashes.SHA256(),
+    )
+
+
+KEX_RSA = "rsa"
+"""Клиент шифрует секрет сессии публичным RSA ключом сервера."""
+
+KEX_X25519 = "x25519"
+"""Эфемерный обмен ключами X25519 (ECDH) + HKDF, сервер подписывает обмен RSA ключом."""
+
+SUPPORTED_KEX = (KEX_X25519, KEX_RSA)
+"""Поддерживаемые способы обмена ключами в порядке предпочтения."""
+
+
+def generate_x25519_keys():
+    """
+    Генерирует эфемерную пару ключей X25519.
+
+    :return: Приватный и публичный ключи.
+    :rtype: tuple
+    """
+    private_key = x25519.X25519PrivateKey.generate()
+    return private_key, private_key.public_key()
+
+
+def x25519_public_bytes(public_key) -> bytes:
+    """
+    Сериализует публичный ключ X25519 в сырые 32 байта.
+
+    :param public_key: Публичный ключ X25519.
+    :return: Сырые байты ключа.
+    :rtype: bytes
+    """
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+    )
+
+
+def x25519_session_secret(private_key, peer_public_bytes: bytes) -> bytes:
+    """
+    Вычисляет секрет сессии по своему приватному и чужому публичному ключу X25519.
+
+    Результат имеет формат ключа Fernet, поэтому подходит для любого шифра сессии.
+
+    :param private_key: Свой приватный ключ X25519.
+    :param peer_public_bytes: Сырые байты публичного ключа собеседника.
+    :type peer_public_bytes: bytes
+    :return: Секрет сессии.
+    :rtype: bytes
+    :raises ValueError: Если публичный ключ некорректен.
+    """
+    peer_public_key = x25519.X25519PublicKey.from_public_bytes(peer_public_bytes)
+    shared_key = private_key.exchange(peer_public_key)
+    return base64.urlsafe_b64encode(derive_key(shared_key, b"console-messager x25519"))
+
+
 def generate_fernet_key() -> bytes:
     """
     Генерирует симметричный ключ Fernet
@@ -114,27 +303,346 @@ def encrypt_fernet(fernet: Fernet, data: bytes) -> bytes:
     return fernet.encrypt(data)
 
 
-def decrypt_fernet(fernet: Fernet, data: bytes) -> bytes:
+def decrypt_fernet(fernet: Fernet, data: bytes | memoryview) -> bytes:
     """
     Дешифрует с помощью симметричного ключа.
 
+    Fernet принимает только bytes, поэтому memoryview фрейма копируется.
+
     :param fernet: Ключ Fernet.
     :type fernet: Fernet
     :param data: Байты для расшифрования.
-    :type data: bytes
+    :type data: bytes | memoryview
     :return: Расшифрованные байты.
     :rtype: bytes
     """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
     return fernet.decrypt(data)
 
 
+CIPHER_FERNET = "fernet"
+"""Fernet (AES-CBC + HMAC-SHA256, base64). Используется старыми клиентами."""
+
+CIPHER_AES_GCM = "aes-256-gcm"
+"""AEAD AES-256-GCM с сырым бинарным шифртекстом."""
+
+CIPHER_CHACHA20 = "chacha20-poly1305"
+"""AEAD ChaCha20-Poly1305 с сырым бинарным шифртекстом."""
+
+SUPPORTED_CIPHERS = (CIPHER_AES_GCM, CIPHER_CHACHA20, CIPHER_FERNET)
+"""Поддерживаемые шифры сессии в порядке предпочтения."""
+
+DIRECTION_CLIENT = 0
+"""Направление клиент -> сервер (префикс nonce)."""
+
+DIRECTION_SERVER = 1
+"""Направление сервер -> клиент (префикс nonce)."""
+
+NONCE = struct.Struct("!IQ")
+"""Nonce AEAD: направление (uint32) + счётчик (uint64), 12 байт."""
+
+_AEAD_CLASSES = {
+    CIPHER_AES_GCM: AESGCM,
+    CIPHER_CHACHA20: ChaCha20Poly1305,
+}
+
+
+class FernetCipher:
+    """
+    Шифр сессии на основе Fernet.
+    """
+
+    name = CIPHER_FERNET
+
+    def __init__(self, key: bytes):
+        """
+        Создаёт шифр сессии.
+
+        :param key: Ключ Fernet.
+        :type key: bytes
+        """
+        self.fernet = Fernet(key)
+
+    def encrypt(self, data: bytes, aad: bytes = b"") -> bytes:
+        """
+        Шифрует данные.
+
+        У Fernet нет связанных данных, поэтому `aad` шифруется вместе с данными
+        и сверяется при расшифровке.
+
+        :param data: Открытые данные.
+        :type data: bytes
+        :param aad: Связанные данные (заголовок фрейма).
+        :type aad: bytes
+        :return: Токен Fernet.
+        :rtype: bytes
+        """
+        return encrypt_fernet(self.fernet, aad + data if aad else data)
+
+    def decrypt(self, data: bytes | memoryview, aad: bytes = b"") -> bytes:
+        """
+        Дешифрует данные.
+
+        :param data: Токен Fernet.
+        :type data: bytes | memoryview
+        :param aad: Связанные данные (заголовок фрейма).
+        :type aad: bytes
+        :return: Открытые данные.
+        :rtype: bytes
+        :raises InvalidToken: Если токен повреждён или связанные данные не совпадают.
+        """
+        plain = decrypt_fernet(self.fernet, data)
+        if not aad:
+            return plain
+        if plain[: len(aad)] != aad:
+            raise InvalidToken()
+        return plain[len(aad) :]
+
+
+class AEADCipher:
+    """
+    Шифр сессии на основе AEAD (AES-GCM / ChaCha20-Poly1305).
+
+    Nonce строится из направления и счётчика отправленных фреймов и
+    передаётся перед шифртекстом, поэтому повторов nonce не бывает.
+    Счётчик - `itertools.count`, `next()` атомарен, поэтому шифрование можно
+    вызывать из разных потоков (порядок отправки обеспечивает вызывающий).
+    На приёме счётчик должен строго расти: повтор или перестановка
+    перехваченного фрейма отклоняется.
+    """
+
+    def __init__(self, name: str, key: bytes, send_direction: int):
+        """
+        Создаёт шифр сессии.
+
+        :param name: Название шифра.
+        :type name: str
+        :param key: 32-байтный ключ.
+        :type key: bytes
+        :param send_direction: Направление отправки этой стороны.
+        :type send_direction: int
+        """
+        self.name = name
+        self.aead = _AEAD_CLASSES[name](key)
+        self.send_direction = send_direction
+        self.receive_direction = (
+            DIRECTION_SERVER if send_direction == DIRECTION_CLIENT else DIRECTION_CLIENT
+        )
+        self.counter = itertools.count()
+        self.last_received = -1
+
+    def encrypt(self, data: bytes, aad: bytes = b"") -> bytes:
+        """
+        Шифрует данные.
+
+        :param data: Открытые данные.
+        :type data: bytes
+        :param aad: Связанные данные (заголовок фрейма), защищаются тегом.
+        :type aad: bytes
+        :return: Nonce + шифртекст с тегом.
+        :rtype: bytes
+        """
+        nonce = NONCE.pack(self.send_direction, next(self.counter))
+        return nonce + self.aead.encrypt(nonce, data, aad or None)
+
+    def decrypt(self, data: bytes | memoryview, aad: bytes = b"") -> bytes:
+        """
+        Дешифрует данные.
+
+        :param data: Nonce + шифртекст с тегом.
+        :type data: bytes | memoryview
+        :param aad: Связанные данные (заголовок фрейма).
+        :type aad: bytes
+        :return: Открытые данные.
+        :rtype: bytes
+        :raises InvalidTag: Если данные или связанные данные повреждены, nonce чужого
+            направления или счётчик не больше уже принятого (повтор).
+        """
+        view = memoryview(data)
+        nonce = view[: NONCE.size]
+        if len(nonce) != NONCE.size:
+            raise InvalidTag()
+        direction, counter = NONCE.unpack(nonce)
+        if direction != self.receive_direction or counter <= self.last_received:
+            raise InvalidTag()
+        plain = self.aead.decrypt(nonce, view[NONCE.size :], aad or None)
+        self.last_received = counter
+        return plain
+
+
+def derive_key(secret: bytes, info: bytes, length: int = 32) -> bytes:
+    """
+    Выводит ключ из общего секрета через HKDF-SHA256.
+
+    :param secret: Общий секрет.
+    :type secret: bytes
+    :param info: Контекст вывода ключа.
+    :type info: bytes
+    :param length: Длина ключа.
+    :type length: int
+    :return: Ключ.
+    :rtype: bytes
+    """
+    return HKDF(algorithm=hashes.SHA256(), length=length, salt=None, info=info).derive(
+        secret
+    )
+
+
+def create_session_cipher(name: str, secret: bytes, send_direction: int):
+    """
+    Создаёт шифр сессии по названию набора.
+
+    Для Fernet секрет используется как ключ Fernet напрямую (совместимость
+    со старыми клиентами), для AEAD ключ выводится через HKDF.
+
+    :param name: Название шифра.
+    :type name: str
+    :param secret: Секрет сессии, переданный при handshake.
+    :type secret: bytes
+    :param send_direction: Направление отправки этой стороны.
+    :type send_direction: int
+    :return: Шифр сессии.
+    :rtype: FernetCipher | AEADCipher
+    :raises ValueError: Если шифр неизвестен.
+    """
+    if name == CIPHER_FERNET:
+        return FernetCipher(secret)
+    if name in _AEAD_CLASSES:
+        key = derive_key(secret, b"console-messager session " + name.encode("ascii"))
+        return AEADCipher(name, key, send_direction)
+    raise ValueError(f"Неизвестный шифр: {name}")
+
+
+AUTH_TOKEN = "token"
+"""Каждый пакет с токеном проверяется (через кэш проверенных токенов)."""
+
+AUTH_CONNECTION = "connection"
+"""Соединение авторизуется один раз, дальше пакеты с тем же токеном не проверяются до `exp`."""
+
+AUTH_MODES = (AUTH_TOKEN, AUTH_CONNECTION)
+
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
 CONFIG = {
     "JWT_SECRET": "DEFAULT_UNSAFE_SECRET",
     "JWT_ALGORITHM": "HS256",
     "JWT_EXP_HOURS": 24,
+    "KEY_GENERATION": 0,
+    "AUTH_MODE": AUTH_TOKEN,
 }
 
 
+class TokenCache:
+    """
+    LRU кэш проверенных JWT: SHA-256 токена -> (payload, exp).
+
+    Токены хранятся только в виде дайджеста. Запись действительна до `exp`
+    токена и только для поколения ключа, под которым была проверена, поэтому
+    смена секрета (`setup_jwt`) сразу делает все записи недействительными.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        """
+        Создаёт пустой кэш.
+
+        :param max_size: Максимум записей (0 - кэш отключён).
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[dict, float, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """
+        Ключ кэша для токена.
+
+        :param token: JWT токен.
+        :type token: str
+        :return: SHA-256 токена.
+        :rtype: bytes
+        """
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> dict | None:
+        """
+        Возвращает payload проверенного токена.
+
+        :param token: JWT токен.
+        :type token: str
+        :return: Payload или None, если токена нет в кэше, он истёк или проверен старым ключом.
+        :rtype: dict | None
+        """
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at, generation = entry
+                if generation == CONFIG["KEY_GENERATION"] and time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: dict):
+        """
+        Запоминает проверенный токен.
+
+        :param token: JWT токен.
+        :type token: str
+        :param payload: Payload токена.
+        :type payload: dict
+        """
+        if self.max_size <= 0 or "exp" not in payload:
+            return
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (payload, float(payload["exp"]), CONFIG["KEY_GENERATION"])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Очищает кэш.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        """
+        Обнуляет счётчики попаданий.
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Снимок счётчиков.
+
+        :return: Попадания, промахи, доля попаданий и размер кэша.
+        :rtype: dict
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+
+token_cache = TokenCache()
+"""Кэш проверенных токенов текущего процесса."""
+
+
 def setup_jwt(jwt_secret: str, jwt_algo: str, jwt_exp_hours: int):
     """
     Конфигурирует JWT параметры.
@@ -149,6 +657,25 @@ def setup_jwt(jwt_secret: str, jwt_algo: str, jwt_exp_hours: int):
     CONFIG["JWT_SECRET"] = jwt_secret
     CONFIG["JWT_ALGORITHM"] = jwt_algo
     CONFIG["JWT_EXP_HOURS"] = jwt_exp_hours
+    CONFIG["KEY_GENERATION"] += 1
+    token_cache.clear()
+
+
+def setup_auth(mode: str, cache_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+    """
+    Конфигурирует режим авторизации и размер кэша токенов.
+
+    :param mode: Режим авторизации (`token` или `connection`).
+    :type mode: str
+    :param cache_size: Максимум записей кэша проверенных токенов (0 - отключить).
+    :type cache_size: int
+    :raises ValueError: Если режим неизвестен.
+    """
+    if mode not in AUTH_MODES:
+        raise ValueError(f"Неизвестный режим авторизации: {mode}")
+    CONFIG["AUTH_MODE"] = mode
+    token_cache.max_size = cache_size
+    token_cache.clear()
 
 
 def create_jwt(user_id: int, username: str) -> str:
@@ -178,6 +705,8 @@ def verify_jwt(token: str) -> dict | None:
     """
     Валидирует JWT ключ.
 
+    Уже проверенные токены берутся из `token_cache` без повторной проверки подписи.
+
     :param token: JWT токен
     :type token: str
     :return: Payload JWT токена.
@@ -185,10 +714,15 @@ def verify_jwt(token: str) -> dict | None:
     :raises ExpiredSignatureServerError: Если срок действия токена истёк.
     :raises InvalidTokenServerError: Если токен невалиден.
     """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(
             jwt=token, key=CONFIG["JWT_SECRET"], algorithms=CONFIG["JWT_ALGORITHM"]
         )
+        token_cache.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError as e:
         raise ExpiredSignatureServerError("Срок действия токена истёк") from e
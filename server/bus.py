@@ -0,0 +1,332 @@
+import json
+import asyncio
+import itertools
+from typing import AsyncIterator, Awaitable, Callable, Dict
+
+from server import logger
+from server.exceptions import ProtocolError
+from protocol.framing import FRAMING_BINARY, FrameReader, encode_frame
+
+DeliverLocal = Callable[[int, str, str | list | dict | None], Awaitable[bool]]
+
+log = logger.get_logger(logger.CATEGORY_BUS)
+
+
+def send_message(writer: asyncio.StreamWriter, message: dict):
+    """
+    Отправляет сообщение шины бинарным фреймом.
+
+    Доставки несут данные ответа целиком, поэтому строки с разделителем
+    (и лимит StreamReader в 64 КиБ) здесь не подходят.
+
+    :param writer: Поток записи.
+    :type writer: asyncio.StreamWriter
+    :param message: Сообщение шины.
+    :type message: dict
+    """
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    writer.writelines(encode_frame(payload, FRAMING_BINARY))
+
+
+async def write_message(writer: asyncio.StreamWriter, message: dict):
+    """
+    Дожидается, пока буфер записи не опустеет до порога, и отправляет сообщение шины.
+
+    Доставки и подтверждения идут через `write_message`: медленный получатель
+    притормаживает отправителя, а не копит данные в буфере без ограничения
+    (отправитель, не дождавшийся места, ничего не дописывает в буфер).
+    Без ожидания (`send_message`) уходят только короткие online/offline.
+
+    :param writer: Поток записи.
+    :type writer: asyncio.StreamWriter
+    :param message: Сообщение шины.
+    :type message: dict
+    :raises ConnectionError: Если соединение потеряно.
+    """
+    await writer.drain()
+    send_message(writer, message)
+
+
+async def read_messages(reader: asyncio.StreamReader) -> AsyncIterator[dict]:
+    """
+    Читает сообщения шины до закрытия соединения.
+
+    :param reader: Поток чтения.
+    :type reader: asyncio.StreamReader
+    :return: Асинхронный итератор сообщений.
+    :rtype: AsyncIterator[dict]
+    """
+    frame_reader = FrameReader(reader, FRAMING_BINARY)
+    while (frame := await frame_reader.read()) is not None:
+        yield json.loads(bytes(frame.payload))
+
+
+class DeliveryBroker:
+    """
+    Брокер доставки между воркерами (живёт в главном процессе).
+
+    Хранит, какой воркер держит соединение пользователя, и пересылает
+    доставки `new_message` в нужный воркер через Unix сокет.
+    """
+
+    def __init__(self, socket_path: str):
+        """
+        Создаёт брокер.
+
+        :param socket_path: Путь к Unix сокету.
+        :type socket_path: str
+        """
+        self.socket_path = socket_path
+        self.server: asyncio.AbstractServer | None = None
+        self.user_workers: Dict[int, asyncio.StreamWriter] = {}
+        self.pending: Dict[int, tuple[asyncio.StreamWriter, int]] = {}
+        self._ids = itertools.count(1)
+        self.routed = 0
+
+    async def start(self):
+        """
+        Поднимает Unix сокет брокера.
+        """
+        self.server = await asyncio.start_unix_server(self._handle_worker, self.socket_path)
+
+    async def close(self):
+        """
+        Останавливает брокер.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Обработка соединения воркера.
+
+        :param reader: Поток чтения.
+        :type reader: asyncio.StreamReader
+        :param writer: Поток записи.
+        :type writer: asyncio.StreamWriter
+        """
+        try:
+            async for message in read_messages(reader):
+                await self._handle_message(message, writer)
+        except (ConnectionError, ProtocolError, json.JSONDecodeError) as ex:
+            log.warning("Ошибка соединения воркера: %s", ex)
+        finally:
+            for user_id, worker in list(self.user_workers.items()):
+                if worker is writer:
+                    del self.user_workers[user_id]
+            for broker_id, (origin, origin_id) in list(self.pending.items()):
+                if origin is writer:
+                    del self.pending[broker_id]
+            writer.close()
+
+    async def _handle_message(self, message: dict, writer: asyncio.StreamWriter):
+        """
+        Обработка одного сообщения воркера.
+
+        Пока буфер воркера-получателя полон, следующие сообщения отправителя
+        не читаются: backpressure доходит до `drain` отправителя.
+
+        :param message: Сообщение шины.
+        :type message: dict
+        :param writer: Поток записи воркера-отправителя.
+        :type writer: asyncio.StreamWriter
+        """
+        op = message.get("op")
+
+        if op == "online":
+            self.user_workers[message["user_id"]] = writer
+        elif op == "offline":
+            if self.user_workers.get(message["user_id"]) is writer:
+                del self.user_workers[message["user_id"]]
+        elif op == "deliver":
+            target = self.user_workers.get(message["user_id"])
+            if target is None or target.is_closing():
+                await write_message(writer, {"op": "ack", "id": message["id"], "ok": False})
+                return
+
+            broker_id = next(self._ids)
+            self.pending[broker_id] = (writer, message["id"])
+            self.routed += 1
+            try:
+                await write_message(target, {**message, "id": broker_id})
+            except ConnectionError as ex:
+                # Воркер получателя отключился: его соединение закроет свой обработчик
+                log.warning("Ошибка пересылки доставки: %s", ex)
+        elif op == "ack":
+            origin = self.pending.pop(message["id"], None)
+            if origin is not None and not origin[0].is_closing():
+                try:
+                    await write_message(
+                        origin[0], {"op": "ack", "id": origin[1], "ok": message["ok"]}
+                    )
+                except ConnectionError as ex:
+                    log.warning("Ошибка отправки подтверждения: %s", ex)
+
+
+class BusClient:
+    """
+    Клиент шины доставки (живёт в каждом воркере).
+    """
+
+    def __init__(self, socket_path: str, deliver_local: DeliverLocal):
+        """
+        Создаёт клиента шины.
+
+        :param socket_path: Путь к Unix сокету брокера.
+        :type socket_path: str
+        :param deliver_local: Доставка в соединение этого воркера (user_id, status, data).
+        :type deliver_local: DeliverLocal
+        """
+        self.socket_path = socket_path
+        self.deliver_local = deliver_local
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._listener: asyncio.Task | None = None
+        self._deliveries: set[asyncio.Task] = set()
+
+    async def connect(self):
+        """
+        Подключается к брокеру.
+        """
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        """
+        Отключается от брокера.
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    def online(self, user_id: int):
+        """
+        Сообщает брокеру, что пользователь подключен к этому воркеру.
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        """
+        if self.writer is not None and not self.writer.is_closing():
+            send_message(self.writer, {"op": "online", "user_id": user_id})
+
+    def offline(self, user_id: int):
+        """
+        Сообщает брокеру, что пользователь отключился от этого воркера.
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        """
+        if self.writer is not None and not self.writer.is_closing():
+            send_message(self.writer, {"op": "offline", "user_id": user_id})
+
+    async def deliver(
+        self, user_id: int, status: str, data: str | list | dict | None, timeout: float = 5.0
+    ) -> bool | None:
+        """
+        Доставляет ответ пользователю, подключенному к другому воркеру.
+
+        Без подтверждения результат неизвестен, а не отрицателен: брокер мог
+        уже переслать доставку, и повтор дал бы получателю дубликат. Если буфер
+        записи в брокер полон, отправка ждёт `drain` в пределах того же таймаута.
+
+        :param user_id: ID получателя.
+        :type user_id: int
+        :param status: Статус ответа.
+        :type status: str
+        :param data: Данные ответа.
+        :type data: str | list | dict | None
+        :param timeout: Максимальное время отправки и ожидания подтверждения (секунды).
+        :type timeout: float
+        :return: True, если воркер получателя поставил фрейм в очередь, False, если
+            получатель не подключен, None, если подтверждение не пришло (таймаут
+            или потеря соединения с брокером).
+        :rtype: bool | None
+        """
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            async with asyncio.timeout(timeout):
+                await self._send(
+                    {
+                        "op": "deliver",
+                        "id": request_id,
+                        "user_id": user_id,
+                        "status": status,
+                        "data": data,
+                    }
+                )
+                return await future
+        except asyncio.TimeoutError:
+            log.warning("Нет подтверждения доставки %s пользователю %s", request_id, user_id)
+            return None
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _send(self, message: dict):
+        """
+        Отправляет сообщение брокеру, дожидаясь места в буфере записи.
+
+        Потеря соединения не считается ошибкой отправки: ожидающие
+        подтверждения завершит `_listen`.
+
+        :param message: Сообщение шины.
+        :type message: dict
+        """
+        if self.writer is not None and not self.writer.is_closing():
+            try:
+                await write_message(self.writer, message)
+            except ConnectionError as ex:
+                log.warning("Ошибка отправки брокеру: %s", ex)
+
+    async def _listen(self):
+        """
+        Фоновая задача: подтверждения и входящие доставки от брокера.
+        """
+        try:
+            async for message in read_messages(self.reader):
+                if message["op"] == "ack":
+                    future = self.pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message["ok"])
+                elif message["op"] == "deliver":
+                    task = asyncio.create_task(self._deliver_incoming(message))
+                    self._deliveries.add(task)
+                    task.add_done_callback(self._deliveries.discard)
+        except asyncio.CancelledError:
+            pass
+        except (ConnectionError, ProtocolError, json.JSONDecodeError) as ex:
+            log.error("Соединение с брокером потеряно: %s", ex)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_result(None)
+
+    async def wait_closed(self):
+        """
+        Дожидается потери соединения с брокером.
+        """
+        if self._listener is not None:
+            await asyncio.wait([self._listener])
+
+    async def _deliver_incoming(self, message: dict):
+        """
+        Доставляет пересланный брокером ответ в локальное соединение.
+
+        :param message: Сообщение шины.
+        :type message: dict
+        """
+        try:
+            ok = await self.deliver_local(message["user_id"], message["status"], message["data"])
+        except Exception as ex:
+            log.error("Ошибка доставки: %s", ex)
+            ok = False
+        await self._send({"op": "ack", "id": message["id"], "ok": ok})
+
+
+client: BusClient | None = None
+"""Клиент шины текущего воркера (None в однопроцессном режиме)."""
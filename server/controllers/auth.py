@@ -3,7 +3,8 @@ from sqlalchemy.exc import IntegrityError
 
 import security
 from server.db_models import User
-from server.framework import BaseController, action, CONNECTED_USERS
+from server import logger, user_directory
+from server.framework import BaseController, action, connect_user
 from dto.models import LoginRequest, RegisterRequest
 
 
@@ -22,7 +23,7 @@ class AuthController(BaseController):
         :type req: LoginRequest
         """
 
-        async with self.ctx.create_session() as session:
+        async with self.ctx.create_read_session() as session:
             statement = select(User).where(User.login == req.login)
             result = await session.execute(statement=statement)
             user: User = result.scalars().first()
@@ -35,10 +36,13 @@ class AuthController(BaseController):
                 await self.ctx.reply_error("Неверный пароль!")
                 return
 
+            user_directory.directory.put_user(user)
             token = security.create_jwt(user.id, user.username)
-            self.ctx.user_id = user.id
-            CONNECTED_USERS[user.id] = self.ctx
-            print(f"[ONLINE] Подключен пользователь {user.login} (ID: {user.id})")
+            self.ctx.bind_auth(token, security.verify_jwt(token))
+            connect_user(user.id, self.ctx)
+            logger.get_logger(logger.CATEGORY_CONNECTIONS).info(
+                "Подключен пользователь", extra={"login": user.login, "user_id": user.id}
+            )
 
             await self.ctx.reply("auth_success", token)
 
@@ -60,10 +64,11 @@ class AuthController(BaseController):
             try:
                 session.add(new_user)
                 await session.commit()
+                user_directory.directory.put_user(new_user)
 
                 token = security.create_jwt(new_user.id, new_user.username)
-                self.ctx.user_id = new_user.id
-                CONNECTED_USERS[new_user.id] = self.ctx
+                self.ctx.bind_auth(token, security.verify_jwt(token))
+                connect_user(new_user.id, self.ctx)
 
                 await self.ctx.reply("auth_success", token)
 
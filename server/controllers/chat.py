@@ -1,10 +1,57 @@
-import json
-
-from sqlmodel import select, or_, and_, col
-
-from server.framework import BaseController, action, authorized, CONNECTED_USERS
-from server.db_models import Message, User
-from dto.models import SendMessageRequest, IncomingMessagePacket, HistoryRequest
+from sqlmodel import select, col
+
+from server import logger, pagination, search, message_writer, user_directory
+from server.framework import BaseController, action, authorized, deliver_to_user
+from server.db_models import Message, User, conversation_key
+from dto.models import (
+    SendMessageRequest,
+    IncomingMessagePacket,
+    HistoryRequest,
+    SearchMessagesRequest,
+)
+
+
+def history_query(
+    user_id: int,
+    target_id: int,
+    limit: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+):
+    """
+    Запрос страницы сообщений диалога с логином отправителя.
+
+    Фильтр по ключу диалога и сортировка по id идут по индексу
+    ix_message_conversation: поиск диапазона без сортировки во временном B-tree,
+    границы страницы (before_id/after_id) сужают этот же диапазон.
+    Только с after_id сообщения идут от старых к новым, иначе - от новых к старым.
+
+    :param user_id: ID текущего пользователя.
+    :type user_id: int
+    :param target_id: ID собеседника.
+    :type target_id: int
+    :param limit: Максимум сообщений.
+    :type limit: int
+    :param before_id: Только сообщения с меньшим ID.
+    :type before_id: int | None
+    :param after_id: Только сообщения с большим ID.
+    :type after_id: int | None
+    :return: SELECT (Message, User.login).
+    """
+    low, high = conversation_key(user_id, target_id)
+    query = (
+        select(Message, User.login)
+        .join(User, User.id == Message.sender_id)
+        .where(Message.conversation_low == low, Message.conversation_high == high)
+    )
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+
+    if after_id is not None and before_id is None:
+        return query.order_by(col(Message.id).asc()).limit(limit)
+    return query.order_by(col(Message.id).desc()).limit(limit)
 
 
 class ChatController(BaseController):
@@ -12,53 +59,63 @@ class ChatController(BaseController):
     Контроллер чатов с пользователями.
     """
 
-    @action(name="message")
+    @action(name="message", ordered_by="receiver_id")
     @authorized
     async def send_message(self, req: SendMessageRequest):
         """
         Эндпоинт отправки сообщения пользователю. Требует авторизации.
 
+        Сообщение пишется через `server.message_writer`: одной транзакцией
+        с сообщениями других соединений, ответ уходит после commit.
+        Получатель и логин отправителя берутся из `server.user_directory`,
+        таблица user читается только при промахе кэша.
+
         :param self: self
         :param req: Пакет SendMessageRequest
         :type req: SendMessageRequest
         """
         sender_id = self.ctx.user_id
 
-        async with self.ctx.create_session() as session:
-            receiver = await session.get(User, req.receiver_id)
-            if not receiver:
-                await self.ctx.reply_error(f"Пользователь {req.receiver_id} не найден!")
-                return
-
-            message = Message(
-                sender_id=sender_id,
-                receiver_id=req.receiver_id,
-                content=req.content,
-                is_readed=False,
+        users = await user_directory.directory.resolve(
+            self.ctx.create_read_session, (req.receiver_id, sender_id)
+        )
+        if req.receiver_id not in users:
+            await self.ctx.reply_error(f"Пользователь {req.receiver_id} не найден!")
+            return
+        sender = users.get(sender_id)
+        if sender is None:
+            # Токен валиден, но пользователя нет в БД (resolve уже перечитал промах)
+            await self.ctx.reply_error("Отправитель не найден!")
+            return
+
+        message_id, timestamp = await message_writer.write_message(
+            self.ctx.create_session, sender_id, req.receiver_id, req.content
+        )
+
+        packet = IncomingMessagePacket(
+            sender_id=sender_id,
+            sender_login=sender.login,
+            content=req.content,
+            timestamp=timestamp,
+        )
+
+        try:
+            delivered = await deliver_to_user(
+                req.receiver_id, "new_message", packet.model_dump(mode="json")
             )
-            session.add(message)
-            await session.commit()
-
-            sender = await session.get(User, sender_id)
-
-            if req.receiver_id in CONNECTED_USERS:
-                target_ctx = CONNECTED_USERS[req.receiver_id]
-
-                packet = IncomingMessagePacket(
-                    sender_id=sender_id,
-                    sender_login=sender.login,
-                    content=req.content,
-                    timestamp=message.timestamp,
+            if delivered:
+                await message_writer.mark_read(self.ctx.create_session, message_id)
+            elif delivered is None:
+                # Воркер получателя мог показать сообщение: повторная доставка дала бы дубликат
+                logger.get_logger(logger.CATEGORY_DELIVERY).warning(
+                    "Статус доставки сообщения %s неизвестен", message_id
                 )
+        except Exception as ex:
+            logger.get_logger(logger.CATEGORY_DELIVERY).error(
+                "Произошла ошибка при отправке сообщения: %s", ex
+            )
 
-                try:
-                    await target_ctx.reply("new_message", packet.model_dump_json())
-                    message.is_readed = True
-                    await session.commit()
-                except Exception as ex:
-                    print(f"Произошла ошибка при отправке сообщения: {ex}")
-
-            await self.ctx.reply_success("Сообщение отправлено!")
+        await self.ctx.reply_success("Сообщение отправлено!")
 
     @action("history")
     @authorized
@@ -66,44 +123,97 @@ class ChatController(BaseController):
         """
         Эндпоинт получения истории сообщений с пользователем. Требует авторизации.
 
+        Сообщения в ответе идут от старых к новым. Если страница заполнена,
+        в ответе есть `next_cursor`: для before_id (и по умолчанию) он ведёт
+        к более ранним сообщениям, для after_id - к более новым.
+
         :param self: self
         :param req: Пакет HistoryRequest
         :type req: HistoryRequest
         """
         my_id = self.ctx.user_id
         target_id = req.target_user_id
-        async with self.ctx.create_session() as session:
-            query = (
-                select(Message, User.login)
-                .join(User, User.id == Message.sender_id)
-                .where(
-                    or_(
-                        and_(
-                            Message.sender_id == my_id, Message.receiver_id == target_id
-                        ),
-                        and_(
-                            Message.sender_id == target_id, Message.receiver_id == my_id
-                        ),
-                    )
-                )
-                .order_by(col(Message.timestamp).desc())
-                .limit(req.limit)
+        before_id, after_id = req.before_id, req.after_id
+        if req.cursor:
+            direction, last_id = pagination.decode_cursor(req.cursor)
+            before_id, after_id = (
+                (last_id, None) if direction == pagination.BEFORE else (None, last_id)
             )
+        forward = after_id is not None and before_id is None
 
-            result = await session.execute(query)
+        async with self.ctx.create_read_session() as session:
+            result = await session.execute(
+                history_query(my_id, target_id, req.limit, before_id, after_id)
+            )
 
             rows = result.all()
 
-            rows = rows[::-1]
+            if not forward:
+                rows = rows[::-1]
 
             history_data = []
             for message, sender_login in rows:
                 history_data.append(
                     {
+                        "id": message.id,
                         "sender_login": sender_login,
                         "content": message.content,
                         "timestamp": message.timestamp.isoformat(),
                         "is_me": message.sender_id == my_id,
                     }
                 )
-            await self.ctx.reply("message_history_result", json.dumps(history_data))
+
+            next_cursor = None
+            if rows and len(rows) == req.limit:
+                next_cursor = (
+                    pagination.encode_cursor(pagination.AFTER, rows[-1][0].id)
+                    if forward
+                    else pagination.encode_cursor(pagination.BEFORE, rows[0][0].id)
+                )
+            await self.ctx.reply("message_history_result", history_data, next_cursor)
+
+    @action("search_messages")
+    @authorized
+    async def search_messages(self, req: SearchMessagesRequest):
+        """
+        Эндпоинт поиска сообщений в диалогах текущего пользователя. Требует авторизации.
+
+        Найденные сообщения идут от новых к старым, с фрагментом текста вокруг
+        совпадения (`snippet`, слова запроса в квадратных скобках). Если
+        страница заполнена, `next_cursor` ведёт к более ранним совпадениям.
+
+        :param self: self
+        :param req: Пакет SearchMessagesRequest
+        :type req: SearchMessagesRequest
+        """
+        my_id = self.ctx.user_id
+        before_id = None
+        if req.cursor:
+            _, before_id = pagination.decode_cursor(req.cursor, pagination.BEFORE)
+
+        async with self.ctx.create_read_session() as session:
+            use_fts = await search.fts_available(session, search.MESSAGE_SEARCH_TABLE)
+            result = await session.execute(
+                search.message_search_query(
+                    req.query, my_id, use_fts, req.target_user_id, before_id
+                ).limit(req.limit)
+            )
+            rows = result.all()
+
+            found = [
+                {
+                    "id": message.id,
+                    "sender_id": message.sender_id,
+                    "receiver_id": message.receiver_id,
+                    "sender_login": sender_login,
+                    "snippet": snippet,
+                    "timestamp": message.timestamp.isoformat(),
+                    "is_me": message.sender_id == my_id,
+                }
+                for message, sender_login, snippet in rows
+            ]
+
+            next_cursor = None
+            if rows and len(rows) == req.limit:
+                next_cursor = pagination.encode_cursor(pagination.BEFORE, rows[-1][0].id)
+            await self.ctx.reply("message_search_result", found, next_cursor)
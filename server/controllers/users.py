@@ -1,7 +1,6 @@
-import json
-
-from sqlmodel import select, or_, col
+from sqlmodel import select, col
 
+from server import pagination, search
 from server.framework import BaseController, action, authorized
 from dto.models import UserListRequest
 from server.db_models import User
@@ -18,23 +17,35 @@ class UsersController(BaseController):
         """
         Эндпоинт получения списка пользователей. Требует авторизации.
 
+        Пользователи идут по возрастанию ID. Следующая страница запрашивается
+        курсором из `next_cursor` (условие id > X по первичному ключу); номер
+        страницы `page` (OFFSET) оставлен для старых клиентов.
+
+        С `search_query` поиск идёт по FTS5 индексу (`server.search`): сначала
+        точные совпадения login/username, затем по началу, затем по подстроке,
+        курсор хранит (ранг, ID) последнего пользователя страницы.
+
         :param self: self
         :param req: Пакет UserListRequest
         :type req: UserListRequest
         """
-        async with self.ctx.create_session() as session:
-            query = select(User)
+        if req.search_query:
+            await self.find_users(req)
+            return
 
-            if req.search_query:
-                search_filter = or_(
-                    col(User.login).contains(req.search_query),
-                    col(User.username).contains(req.search_query),
-                )
-                query = query.where(search_filter)
+        after_id = None
+        if req.cursor:
+            _, after_id = pagination.decode_cursor(req.cursor, pagination.AFTER)
 
-            offset = (req.page - 1) * req.page_size
+        async with self.ctx.create_read_session() as session:
+            query = select(User).order_by(col(User.id))
 
-            query = query.offset(offset).limit(req.page_size)
+            if after_id is not None:
+                query = query.where(User.id > after_id)
+            else:
+                query = query.offset((req.page - 1) * req.page_size)
+
+            query = query.limit(req.page_size)
 
             result = await session.execute(query)
             users = result.scalars().all()
@@ -44,4 +55,37 @@ class UsersController(BaseController):
                 for user in users
             ]
 
-            await self.ctx.reply("user_list_result", json.dumps(users_data))
+            next_cursor = None
+            if users and len(users) == req.page_size:
+                next_cursor = pagination.encode_cursor(pagination.AFTER, users[-1].id)
+            await self.ctx.reply("user_list_result", users_data, next_cursor)
+
+    async def find_users(self, req: UserListRequest):
+        """
+        Поиск пользователей по подстроке login/username с ранжированием.
+
+        :param self: self
+        :param req: Пакет UserListRequest с search_query
+        :type req: UserListRequest
+        """
+        after = pagination.decode_ranked_cursor(req.cursor) if req.cursor else None
+
+        async with self.ctx.create_read_session() as session:
+            use_fts = await search.fts_available(session, search.USER_SEARCH_TABLE)
+            query = search.user_search_query(req.search_query, use_fts, after)
+            if after is None:
+                query = query.offset((req.page - 1) * req.page_size)
+
+            result = await session.execute(query.limit(req.page_size))
+            rows = result.all()
+
+            users_data = [
+                {"id": user.id, "login": user.login, "username": user.username}
+                for user, _ in rows
+            ]
+
+            next_cursor = None
+            if rows and len(rows) == req.page_size:
+                user, rank = rows[-1]
+                next_cursor = pagination.encode_ranked_cursor(rank, user.id)
+            await self.ctx.reply("user_list_result", users_data, next_cursor)
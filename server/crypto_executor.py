@@ -0,0 +1,142 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+DEFAULT_WORKERS = 4
+"""Размер пула потоков по умолчанию."""
+
+DEFAULT_THRESHOLD = 64 * 1024
+"""Размер данных (байты), начиная с которого операция выносится в пул."""
+
+
+class CryptoExecutor:
+    """
+    Пул потоков для тяжёлой криптографии.
+
+    `cryptography` отпускает GIL внутри OpenSSL, поэтому потоки дают
+    настоящий параллелизм и не блокируют event loop. Маленькие операции
+    выполняются на месте: передача в поток стоит дороже самой операции.
+    """
+
+    def __init__(self, max_workers: int = 0, threshold: int = DEFAULT_THRESHOLD):
+        """
+        Создаёт пул.
+
+        :param max_workers: Количество потоков (0 - всё выполняется на месте).
+        :type max_workers: int
+        :param threshold: Порог размера данных для выноса в пул.
+        :type threshold: int
+        """
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self.pool = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crypto")
+            if max_workers > 0
+            else None
+        )
+
+        self._lock = threading.Lock()
+        self.inline_calls = 0
+        self.offloaded_calls = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def run(self, func: Callable, *args, size: int | None = None):
+        """
+        Выполняет операцию на месте или в пуле.
+
+        :param func: Функция.
+        :type func: Callable
+        :param args: Аргументы функции.
+        :param size: Размер обрабатываемых данных. None - операция дорогая
+            сама по себе (например, RSA) и всегда выносится в пул.
+        :type size: int | None
+        :return: Результат функции.
+        """
+        if self.pool is None or (size is not None and size < self.threshold):
+            self.inline_calls += 1
+            return func(*args)
+
+        with self._lock:
+            self.offloaded_calls += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.pool, self._call, func, args, time.perf_counter()
+        )
+
+    def _call(self, func: Callable, args: tuple, submitted_at: float):
+        """
+        Выполняется в потоке пула: учитывает ожидание в очереди.
+
+        :param func: Функция.
+        :type func: Callable
+        :param args: Аргументы функции.
+        :type args: tuple
+        :param submitted_at: Момент постановки в очередь.
+        :type submitted_at: float
+        :return: Результат функции.
+        """
+        wait_time = time.perf_counter() - submitted_at
+        with self._lock:
+            self.queue_depth -= 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+        return func(*args)
+
+    def stats(self) -> dict:
+        """
+        Счётчики пула.
+
+        :return: Словарь счётчиков.
+        :rtype: dict
+        """
+        with self._lock:
+            offloaded = self.offloaded_calls
+            return {
+                "workers": self.max_workers,
+                "threshold": self.threshold,
+                "inline_calls": self.inline_calls,
+                "offloaded_calls": offloaded,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_avg": self.wait_time_total / offloaded if offloaded else 0.0,
+                "wait_time_max": self.wait_time_max,
+            }
+
+    def shutdown(self):
+        """
+        Останавливает пул.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+
+executor = CryptoExecutor()
+
+
+def setup_crypto_executor(
+    max_workers: int = DEFAULT_WORKERS, threshold: int = DEFAULT_THRESHOLD
+) -> CryptoExecutor:
+    """
+    Настройка пула криптографии.
+
+    :param max_workers: Количество потоков.
+    :type max_workers: int
+    :param threshold: Порог размера данных для выноса в пул.
+    :type threshold: int
+    :return: Пул криптографии.
+    :rtype: CryptoExecutor
+    """
+    global executor
+
+    executor.shutdown()
+    executor = CryptoExecutor(max_workers=max_workers, threshold=threshold)
+    return executor
@@ -1,32 +1,145 @@
 from sqlmodel import SQLModel
+from sqlalchemy import text, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from server import migrations, search
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": "-20000",
+    "mmap_size": "268435456",
+    "busy_timeout": "5000",
+    "temp_store": "MEMORY",
+}
+"""
+PRAGMA, применяемые к каждому новому соединению SQLite.
+
+WAL: читатели не блокируются пишущим. synchronous=NORMAL в режиме WAL делает
+fsync только при checkpoint, а не на каждый commit (последние транзакции могут
+потеряться при отключении питания, но база остаётся целой). cache_size в
+отрицательных значениях - КиБ (20 МиБ), mmap_size - байты (256 МиБ).
+busy_timeout - мс ожидания блокировки другого процесса вместо ошибки
+"database is locked".
+"""
+
+DEFAULT_READERS = 4
+"""Соединений в пуле читателей (0 - чтение через соединение писателя)."""
+
+WRITER_POOL_TIMEOUT = 60.0
+"""Максимум ожидания единственного соединения писателя (секунды)."""
+
 engine = None
 async_session = None
+read_engine = None
+read_session = None
+
+
+def parse_pragmas(values: list[str]) -> dict:
+    """
+    Разбирает переопределения PRAGMA вида "synchronous=FULL".
+
+    :param values: Список строк NAME=VALUE.
+    :type values: list[str]
+    :return: PRAGMA по умолчанию с применёнными переопределениями.
+    :rtype: dict
+    :raises ValueError: Некорректный формат.
+    """
+    pragmas = dict(DEFAULT_PRAGMAS)
+    for value in values:
+        name, sep, setting = value.partition("=")
+        if not sep or not name.strip().isidentifier() or not setting.strip():
+            raise ValueError(f"Ожидается NAME=VALUE: {value}")
+        pragmas[name.strip().lower()] = setting.strip()
+    return pragmas
+
+
+def apply_pragmas(sync_engine, pragmas: dict, query_only: bool = False):
+    """
+    Вешает применение PRAGMA на открытие каждого соединения движка.
 
+    :param sync_engine: Синхронный движок (AsyncEngine.sync_engine).
+    :param pragmas: PRAGMA имя -> значение.
+    :type pragmas: dict
+    :param query_only: Запретить запись через соединение (пул читателей).
+    :type query_only: bool
+    """
+    statements = [f"PRAGMA {name}={setting}" for name, setting in pragmas.items()]
+    if query_only:
+        statements.append("PRAGMA query_only=ON")
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
 
-def setup_database(db_path: str):
+
+def setup_database(
+    db_path: str, pragmas: dict | None = None, readers: int = DEFAULT_READERS
+):
     """
     Настройка базы данных.
 
+    Запись идёт через единственное соединение писателя: транзакции процесса
+    выстраиваются в очередь пула, а не соревнуются за блокировку файла.
+    Чтение (история, список пользователей, вход) - через пул из `readers`
+    соединений только для чтения, которые в режиме WAL не ждут писателя.
+    Фабрика сессий чтения - `read_session`.
+
+    SQL запросы не выводятся: логирование SQL включается через `server.logger.set_sql_echo`.
+
     :param db_path: Путь к базе данных
     :type db_path: str
+    :param pragmas: PRAGMA соединений (по умолчанию DEFAULT_PRAGMAS, {} - без настройки).
+    :type pragmas: dict | None
+    :param readers: Соединений в пуле читателей (0 - чтение через писателя).
+    :type readers: int
     :return: Фабрика БД сессий.
     :rtype: sessionmaker
     """
-    global engine, async_session
+    global engine, async_session, read_engine, read_session
 
     database_url = f"sqlite+aiosqlite:///{db_path}"
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+
+    if readers > 0:
+        engine = create_async_engine(
+            database_url, pool_size=1, max_overflow=0, pool_timeout=WRITER_POOL_TIMEOUT
+        )
+        read_engine = create_async_engine(database_url, pool_size=readers, max_overflow=0)
+        apply_pragmas(read_engine.sync_engine, pragmas, query_only=True)
+    else:
+        engine = create_async_engine(database_url)
+        read_engine = engine
+    apply_pragmas(engine.sync_engine, pragmas)
 
-    engine = create_async_engine(database_url, echo=True)
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    read_session = (
+        sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+        if read_engine is not engine
+        else async_session
+    )
     return async_session
 
 
+async def dispose():
+    """
+    Закрывает соединения писателя и пула читателей.
+    """
+    if read_engine is not None and read_engine is not engine:
+        await read_engine.dispose()
+    if engine is not None:
+        await engine.dispose()
+
+
 async def init_db():
     """
-    Создание таблиц
+    Создание таблиц и миграция схемы существующей базы (`server.migrations`).
 
     :raises RuntimeError: Если база данных не инициализирована (engine is None).
     """
@@ -37,3 +150,54 @@ async def init_db():
 
     async with engine.begin() as connection:
         await connection.run_sync(SQLModel.metadata.create_all)
+        await connection.run_sync(migrations.migrate)
+
+
+async def rebuild_search() -> list[str]:
+    """
+    Пересоздаёт поисковые индексы FTS5 по текущим данным (`server.search`).
+
+    Создаёт отсутствующие индексы (например, после обновления SQLite с
+    поддержкой FTS5) и заново индексирует пользователей и сообщения.
+
+    :return: Имена поисковых таблиц в базе после пересоздания.
+    :rtype: list[str]
+    :raises RuntimeError: Если база данных не инициализирована (engine is None).
+    """
+    if engine is None:
+        raise RuntimeError(
+            "База данных не инициализирована. Вызовите setup_database() для начала."
+        )
+
+    async with engine.begin() as connection:
+        await connection.run_sync(migrations.add_user_search)
+        await connection.run_sync(migrations.add_message_search)
+        result = await connection.execute(
+            text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (:users, :messages)"
+            ),
+            {"users": search.USER_SEARCH_TABLE, "messages": search.MESSAGE_SEARCH_TABLE},
+        )
+        return sorted(result.scalars().all())
+
+
+async def set_journal_mode(mode: str = "WAL") -> str:
+    """
+    Переключает режим журнала SQLite (сохраняется в файле БД).
+
+    В режиме WAL несколько процессов-воркеров читают базу, пока один пишет.
+
+    :param mode: Режим журнала.
+    :type mode: str
+    :return: Установленный режим.
+    :rtype: str
+    :raises RuntimeError: Если база данных не инициализирована (engine is None).
+    """
+    if engine is None:
+        raise RuntimeError(
+            "База данных не инициализирована. Вызовите setup_database() для начала."
+        )
+
+    async with engine.begin() as connection:
+        result = await connection.execute(text(f"PRAGMA journal_mode={mode}"))
+        return result.scalar()
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index, event
 from sqlmodel import SQLModel, Field
 
 
@@ -30,11 +31,48 @@ class Message(SQLModel, table=True):
     :ivar content: Текст сообщения.
     :ivar is_readed: Бул прочитанности сообщения.
     :ivar timestamp: Время создания сообщения (UTC).
+    :ivar conversation_low: Меньший ID собеседников (ключ диалога).
+    :ivar conversation_high: Больший ID собеседников (ключ диалога).
     """
 
+    __table_args__ = (
+        Index("ix_message_conversation", "conversation_low", "conversation_high", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     sender_id: int = Field(foreign_key="user.id")
     receiver_id: int = Field(foreign_key="user.id")
     content: str
     is_readed: bool = False
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    conversation_low: int = Field(default=None, nullable=False)
+    conversation_high: int = Field(default=None, nullable=False)
+
+
+def conversation_key(user_a: int, user_b: int) -> tuple[int, int]:
+    """
+    Ключ диалога двух пользователей, не зависящий от направления сообщения.
+
+    :param user_a: ID первого пользователя.
+    :type user_a: int
+    :param user_b: ID второго пользователя.
+    :type user_b: int
+    :return: (меньший ID, больший ID).
+    :rtype: tuple[int, int]
+    """
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+
+@event.listens_for(Message, "before_insert")
+def fill_conversation_key(mapper, connection, message: Message):
+    """
+    Заполняет ключ диалога перед вставкой сообщения.
+
+    :param mapper: Маппер модели.
+    :param connection: Соединение БД.
+    :param message: Вставляемое сообщение.
+    :type message: Message
+    """
+    message.conversation_low, message.conversation_high = conversation_key(
+        message.sender_id, message.receiver_id
+    )
@@ -76,3 +76,35 @@ class InvalidTokenServerError(UnauthorizedError):
     """
 
     pass
+
+
+class FrameTooLargeError(ProtocolError):
+    """
+    Исключение о превышении максимального размера фрейма.
+    """
+
+    pass
+
+
+class HandshakeError(ProtocolError):
+    """
+    Исключение об ошибке согласования параметров соединения.
+    """
+
+    pass
+
+
+class CompressionError(ProtocolError):
+    """
+    Исключение о повреждённом или слишком большом сжатом фрейме.
+    """
+
+    pass
+
+
+class CodecError(ProtocolError):
+    """
+    Исключение о пакете, который не удалось декодировать выбранным кодеком.
+    """
+
+    pass
@@ -1,12 +1,18 @@
+import time
 import asyncio
 import inspect
-from typing import Callable, Dict, Type
+import contextvars
+from typing import Annotated, Callable, Dict, Type, Union
 from functools import wraps
 
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from dto.models import ServerResponse
+from protocol.framing import FRAMING_LINE, encode_frame, frame_aad
+from protocol.compression import Compressor
+from protocol.codecs import CODEC_LEGACY, get_codec
+from server import crypto_executor, bus, logger, metrics, profiling
 from server.exceptions import (
     UnauthorizedError,
     ServerException,
@@ -14,10 +20,37 @@ from server.exceptions import (
     UnknownActionError,
     PacketValidationError,
     InternalServerError,
+    CodecError,
 )
-from security import verify_jwt
+import security
+
+connections_log = logger.get_logger(logger.CATEGORY_CONNECTIONS)
+router_log = logger.get_logger(logger.CATEGORY_ROUTER)
 
 CONNECTED_USERS: Dict[int, "ServerContext"] = {}
+metrics.connected_users.callback = lambda: len(CONNECTED_USERS)
+
+DEFAULT_MAX_INFLIGHT = 8
+"""Максимум одновременно выполняемых запросов одного соединения."""
+
+DEFAULT_OUTBOUND_QUEUE_SIZE = 256
+"""Максимум фреймов в исходящей очереди соединения."""
+
+OVERFLOW_DROP = "drop"
+"""Переполнение очереди: фрейм отбрасывается, доставка считается выполненной (сообщение помечается прочитанным)."""
+
+OVERFLOW_DISCONNECT = "disconnect"
+"""Переполнение очереди: медленное соединение закрывается."""
+
+OVERFLOW_SPILL = "spill"
+"""Переполнение очереди: фрейм не ставится в очередь, данные остаются в офлайн хранилище (БД)."""
+
+OVERFLOW_POLICIES = (OVERFLOW_DROP, OVERFLOW_DISCONNECT, OVERFLOW_SPILL)
+
+current_request: contextvars.ContextVar[tuple["ServerContext", int | None] | None] = (
+    contextvars.ContextVar("current_request", default=None)
+)
+"""Контекст и request_id запроса, который обрабатывается в текущей задаче."""
 
 
 class ServerContext:
@@ -30,6 +63,10 @@ class ServerContext:
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
         db_session_maker,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT,
+        outbound_queue_size: int = DEFAULT_OUTBOUND_QUEUE_SIZE,
+        overflow_policy: str = OVERFLOW_SPILL,
+        read_session_maker=None,
     ):
         """
         Создаёт контекст серверного соединения.
@@ -39,54 +76,301 @@ class ServerContext:
         :param writer: Поток записи.
         :type writer: asyncio.StreamWriter
         :param db_session_maker: Фабрика асинхронных сессий БД.
+        :param max_inflight: Максимум одновременно выполняемых запросов.
+        :type max_inflight: int
+        :param outbound_queue_size: Максимум фреймов в исходящей очереди.
+        :type outbound_queue_size: int
+        :param overflow_policy: Поведение при переполнении очереди (drop, disconnect, spill).
+        :type overflow_policy: str
+        :param read_session_maker: Фабрика сессий только для чтения (None - `db_session_maker`).
         """
         self.reader = reader
         self.writer = writer
         self.db_session_maker = db_session_maker
+        self.read_session_maker = read_session_maker or db_session_maker
         self.peer_name = writer.get_extra_info("peername")
         self.cipher = None
+        self.framing = FRAMING_LINE
+        self.compressor = Compressor()
+        self.codec = get_codec(CODEC_LEGACY)
+        self.controllers: Dict[type, "BaseController"] = {}
         self.user_id: int | None = None
+        self.auth_token: str | None = None
+        self.auth_expires_at = 0.0
+        self.auth_generation = -1
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.tasks: set[asyncio.Task] = set()
+        self.order_tails: Dict[tuple, asyncio.Task] = {}
+
+        self.outbound_queue_size = outbound_queue_size
+        self.overflow_policy = overflow_policy
+        self.outbound: asyncio.Queue[list[bytes]] = asyncio.Queue()
+        self.outbound_task: asyncio.Task | None = None
+        self.seal_lock = asyncio.Lock()
+        self.closed = False
+        self.dropped_frames = 0
+        self.spilled_frames = 0
+
+    @property
+    def outbound_depth(self) -> int:
+        """
+        Количество фреймов, ожидающих записи в сокет.
+
+        :return: Глубина исходящей очереди.
+        :rtype: int
+        """
+        return self.outbound.qsize()
+
+    def bind_auth(self, token: str, payload: dict):
+        """
+        Привязывает проверенный токен к соединению (режим авторизации `connection`).
+
+        :param token: JWT токен.
+        :type token: str
+        :param payload: Payload токена.
+        :type payload: dict
+        """
+        self.user_id = int(payload["sub"])
+        if security.CONFIG["AUTH_MODE"] != security.AUTH_CONNECTION:
+            return
+        self.auth_token = token
+        self.auth_expires_at = float(payload.get("exp", 0))
+        self.auth_generation = security.CONFIG["KEY_GENERATION"]
+
+    def authenticate(self, token: str) -> int:
+        """
+        Проверяет токен пакета и возвращает ID пользователя.
+
+        Если соединение уже авторизовано этим токеном, ключ не менялся и `exp`
+        не наступил, проверка JWT пропускается полностью.
+
+        :param token: JWT токен из пакета.
+        :type token: str
+        :return: ID пользователя.
+        :rtype: int
+        :raises ExpiredSignatureServerError: Если срок действия токена истёк.
+        :raises InvalidTokenServerError: Если токен невалиден.
+        """
+        if (
+            token == self.auth_token
+            and self.auth_generation == security.CONFIG["KEY_GENERATION"]
+            and time.time() < self.auth_expires_at
+        ):
+            return self.user_id
 
-    async def reply(self, status: str, data: str | None = None):
+        self.auth_token = None
+        payload = security.verify_jwt(token)
+        if not payload:
+            raise UnauthorizedError("Unauthorized: Невалидный токен")
+        self.bind_auth(token, payload)
+        return self.user_id
+
+    async def reply(
+        self, status: str, data: str | list | dict | None = None, next_cursor: str | None = None
+    ) -> bool:
         """
-        Отправляет ответ клиенту с заданным статусом.
+        Ставит ответ клиенту с заданным статусом в исходящую очередь.
+
+        Если ответ отправляется в соединение, чей запрос сейчас обрабатывается,
+        в него подставляется request_id этого запроса. Ответы на собственные
+        запросы соединения ограничены `max_inflight` и ставятся в очередь всегда,
+        к push-фреймам (например, new_message) применяется лимит очереди.
+        Push-фрейм, отброшенный по политике drop, считается доставленным,
+        по политике spill - недоставленным (сообщение остаётся непрочитанным).
 
         :param self: self
         :param status: Статус ответа (success, error и тд)
         :type status: str
-        :param data: Данные для отправки
-        :type data: str | None
+        :param data: Данные для отправки (строка или структурные данные)
+        :type data: str | list | dict | None
+        :param next_cursor: Курсор следующей страницы списка (не передаётся, если None).
+        :type next_cursor: str | None
+        :return: True, если фрейм поставлен в очередь или отброшен по политике drop.
+        :rtype: bool
+        """
+        request = current_request.get()
+        own_request = request is not None and request[0] is self
+        request_id = request[1] if own_request else None
+
+        if self.closed:
+            return False
+        if not own_request and not self._has_room():
+            return self.overflow_policy == OVERFLOW_DROP
+
+        timings = profiling.current_timings.get()
+        started = time.perf_counter() if timings is not None else 0.0
+
+        response = ServerResponse(
+            action=status, data=data, request_id=request_id, next_cursor=next_cursor
+        )
+        payload = self.codec.dump(response)
+
+        # Счётчик nonce AEAD должен расти в порядке фреймов в сокете, а большие
+        # пакеты шифруются в пуле потоков: шифрование и постановка в очередь
+        # одного соединения идут по очереди.
+        async with self.seal_lock:
+            payload, flags = await crypto_executor.executor.run(
+                self.seal_payload, payload, size=len(payload)
+            )
+
+            if self.closed:
+                return False
+
+            metrics.responses_total.inc(status)
+            metrics.bytes_out.inc(amount=len(payload))
+            self.outbound.put_nowait(encode_frame(payload, self.framing, flags))
+        if timings is not None:
+            timings.reply += time.perf_counter() - started
+        if self.outbound_task is None:
+            self.outbound_task = asyncio.create_task(self._write_loop())
+        return True
+
+    def seal_payload(self, payload: bytes) -> tuple[bytes, int]:
+        """
+        Сжимает (если согласовано) и шифрует исходящий пакет.
+
+        :param self: self
+        :param payload: Пакет (JSON).
+        :type payload: bytes
+        :return: Шифртекст и флаги фрейма.
+        :rtype: tuple[bytes, int]
+        """
+        payload, flags = self.compressor.compress(payload)
+        if self.cipher:
+            payload = self.cipher.encrypt(payload, frame_aad(self.framing, flags))
+        return payload, flags
+
+    def open_payload(self, payload: bytes, flags: int = 0) -> bytes:
         """
-        response = ServerResponse(action=status, data=data)
-        json_str = response.model_dump_json()
+        Расшифровывает и распаковывает входящий пакет.
 
+        :param self: self
+        :param payload: Шифртекст.
+        :type payload: bytes
+        :param flags: Флаги фрейма.
+        :type flags: int
+        :return: Пакет (JSON).
+        :rtype: bytes
+        """
         if self.cipher:
-            encrypted_payload = self.cipher.encrypt(json_str.encode("utf-8"))
-            self.writer.write(encrypted_payload + b"\n")
+            payload = self.cipher.decrypt(payload, frame_aad(self.framing, flags))
+        return self.compressor.decompress(payload, flags)
+
+    def _has_room(self) -> bool:
+        """
+        Проверяет лимит исходящей очереди и применяет политику переполнения.
+
+        :param self: self
+        :return: True, если фрейм можно поставить в очередь.
+        :rtype: bool
+        """
+        if self.outbound.qsize() < self.outbound_queue_size:
+            return True
+
+        if self.overflow_policy == OVERFLOW_DISCONNECT:
+            connections_log.warning(
+                "Исходящая очередь переполнена, отключение", extra=logger.peer_fields(self.peer_name)
+            )
+            self.closed = True
+            self.writer.close()
+        elif self.overflow_policy == OVERFLOW_SPILL:
+            self.spilled_frames += 1
         else:
-            payload = json_str + "\n"
-            self.writer.write(payload.encode("utf-8"))
-        await self.writer.drain()
+            self.dropped_frames += 1
+        return False
 
-    async def reply_error(self, error_messgage: str):
+    async def _write_loop(self):
+        """
+        Единственная задача записи в сокет: забирает все готовые фреймы
+        и отправляет их одним `writelines` + `drain`.
+
+        :param self: self
+        """
+        try:
+            while True:
+                batch = await self.outbound.get()
+                frames = 1
+                while not self.outbound.empty():
+                    batch.extend(self.outbound.get_nowait())
+                    frames += 1
+
+                try:
+                    self.writer.writelines(batch)
+                    await self.writer.drain()
+                finally:
+                    for _ in range(frames):
+                        self.outbound.task_done()
+        except (ConnectionError, OSError) as ex:
+            connections_log.warning(
+                "Ошибка записи в сокет: %s", ex, extra=logger.peer_fields(self.peer_name)
+            )
+            self.closed = True
+            self._discard_outbound()
+
+    def _discard_outbound(self):
+        """
+        Отбрасывает фреймы, которые уже не будут записаны.
+
+        :param self: self
+        """
+        while not self.outbound.empty():
+            self.outbound.get_nowait()
+            self.outbound.task_done()
+
+    async def flush(self):
+        """
+        Дожидается записи всех фреймов из исходящей очереди.
+
+        :param self: self
+        """
+        if self.outbound_task is not None and not self.closed:
+            await self.outbound.join()
+
+    async def close_outbound(self, timeout: float = 5.0):
+        """
+        Дописывает исходящую очередь (не дольше timeout) и останавливает задачу записи.
+
+        :param self: self
+        :param timeout: Максимальное время ожидания (секунды).
+        :type timeout: float
+        """
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            connections_log.warning(
+                "Не удалось дописать %d фреймов",
+                self.outbound_depth,
+                extra=logger.peer_fields(self.peer_name),
+            )
+        finally:
+            self.closed = True
+            self._discard_outbound()
+            if self.outbound_task is not None:
+                self.outbound_task.cancel()
+
+    async def reply_error(self, error_messgage: str) -> bool:
         """
         Отправляет ответ клиенту с статусом `ошибка`.
 
         :param self: self
         :param error_messgage: Текст ошибки.
         :type error_messgage: str
+        :return: True, если фрейм поставлен в очередь.
+        :rtype: bool
         """
-        await self.reply("error", error_messgage)
+        return await self.reply("error", error_messgage)
 
-    async def reply_success(self, success_message: str):
+    async def reply_success(self, success_message: str) -> bool:
         """
         Отправляет ответ клиенту с статусом `успех`.
 
         :param self: self
         :param success_message: Текст сообщения об успехе.
         :type success_message: str
+        :return: True, если фрейм поставлен в очередь.
+        :rtype: bool
         """
-        await self.reply("success", success_message)
+        return await self.reply("success", success_message)
 
     def create_session(self) -> AsyncSession:
         """
@@ -99,13 +383,107 @@ class ServerContext:
 
         return self.db_session_maker()
 
+    def create_read_session(self) -> AsyncSession:
+        """
+        Создает сессию БД только для чтения (пул читателей, не ждёт писателя).
+
+        :param self: self
+        :return: Асинхронная сессия.
+        :rtype: AsyncSession
+        """
+        return self.read_session_maker()
+
+
+def connect_user(user_id: int, ctx: ServerContext):
+    """
+    Регистрирует соединение авторизованного пользователя.
+
+    :param user_id: ID пользователя.
+    :type user_id: int
+    :param ctx: Контекст соединения.
+    :type ctx: ServerContext
+    """
+    CONNECTED_USERS[user_id] = ctx
+    if bus.client is not None:
+        bus.client.online(user_id)
+
+
+def disconnect_user(ctx: ServerContext) -> bool:
+    """
+    Снимает регистрацию соединения, если оно всё ещё зарегистрировано за пользователем.
+
+    :param ctx: Контекст соединения.
+    :type ctx: ServerContext
+    :return: True, если регистрация снята.
+    :rtype: bool
+    """
+    if not ctx.user_id or CONNECTED_USERS.get(ctx.user_id) is not ctx:
+        return False
+
+    del CONNECTED_USERS[ctx.user_id]
+    if bus.client is not None:
+        bus.client.offline(ctx.user_id)
+    return True
+
 
-def action(name: str):
+async def deliver_local(user_id: int, status: str, data: str | list | dict | None) -> bool:
+    """
+    Доставка ответа в соединение пользователя в этом процессе.
+
+    Доставка - это push-фрейм, а не ответ на запрос: даже если получатель -
+    отправитель текущего запроса, фрейм идёт без его request_id и с лимитом очереди.
+
+    :param user_id: ID получателя.
+    :type user_id: int
+    :param status: Статус ответа.
+    :type status: str
+    :param data: Данные ответа.
+    :type data: str | list | dict | None
+    :return: True, если фрейм поставлен в очередь.
+    :rtype: bool
+    """
+    target_ctx = CONNECTED_USERS.get(user_id)
+    if target_ctx is None:
+        return False
+    token = current_request.set(None)
+    try:
+        return await target_ctx.reply(status, data)
+    finally:
+        current_request.reset(token)
+
+
+async def deliver_to_user(
+    user_id: int, status: str, data: str | list | dict | None
+) -> bool | None:
+    """
+    Доставка ответа пользователю: в своё соединение или через шину в другой воркер.
+
+    :param user_id: ID получателя.
+    :type user_id: int
+    :param status: Статус ответа.
+    :type status: str
+    :param data: Данные ответа.
+    :type data: str | list | dict | None
+    :return: True, если фрейм поставлен в очередь, False, если нет, None, если
+        шина не подтвердила доставку (см. `BusClient.deliver`).
+    :rtype: bool | None
+    """
+    if user_id in CONNECTED_USERS:
+        return await deliver_local(user_id, status, data)
+    if bus.client is not None:
+        return await bus.client.deliver(user_id, status, data)
+    return False
+
+
+def action(name: str, ordered_by: str | None = None):
     """
     Декоратор для эндпоинтов
 
     :param name: Название эндпоинта для роутинга
     :type name: str
+    :param ordered_by: Поле пакета, по значению которого запросы одного соединения
+        выполняются строго по очереди (например, получатель сообщения).
+    :type ordered_by: str | None
     :return: Функция-декоратор с _action_name.
     :rtype: Callable
     """
@@ -116,10 +494,11 @@ def action(name: str):
         
         :param func: Функция.
         :type func: Callable
-        :return: Та же функция с добавленным атрибутом _action_name.
+        :return: Та же функция с добавленными атрибутами _action_name и _ordered_by.
         :rtype: Callable
         """
         func._action_name = name
+        func._ordered_by = ordered_by
         return func
 
     return decorator
@@ -147,14 +526,11 @@ def authorized(func):
         if not req.token:
             raise UnauthorizedError("Нет токена в запросе.")
 
-        payload = verify_jwt(req.token)
-        if not payload:
-            raise UnauthorizedError("Unauthorized: Невалидный токен")
-
-        self.ctx.user_id = int(payload["sub"])
+        self.ctx.authenticate(req.token)
         await func(self, req)
 
     wrapper._action_name = getattr(func, "_action_name", None)
+    wrapper._ordered_by = getattr(func, "_ordered_by", None)
     return wrapper
 
 
@@ -172,6 +548,39 @@ class BaseController:
         self.ctx = ctx
 
 
+class Route:
+    """
+    Предварительно собранная запись эндпоинта: всё, что раньше вычислялось на каждый запрос.
+    """
+
+    __slots__ = ("action", "controller_cls", "method", "request_model", "arity", "ordered_by")
+
+    def __init__(self, action_name: str, controller_cls: Type[BaseController], method: Callable):
+        """
+        Собирает запись по сигнатуре метода контроллера.
+
+        :param action_name: Имя действия.
+        :type action_name: str
+        :param controller_cls: Класс контроллера.
+        :type controller_cls: Type[BaseController]
+        :param method: Метод эндпоинта.
+        :type method: Callable
+        """
+        params = list(inspect.signature(method).parameters.values())
+        param_type = params[1].annotation if len(params) > 1 else None
+
+        self.action = action_name
+        self.controller_cls = controller_cls
+        self.method = method
+        self.arity = len(params) - 1
+        self.request_model = (
+            param_type
+            if inspect.isclass(param_type) and issubclass(param_type, BaseModel)
+            else None
+        )
+        self.ordered_by = getattr(method, "_ordered_by", None)
+
+
 class ServerRouter:
     """
     Класс роутинга на эндпоинты
@@ -179,11 +588,12 @@ class ServerRouter:
 
     def __init__(self):
         """Инициализирует роутер."""
-        self.routes: Dict[str, tuple[Type[BaseController], Callable]] = {}
+        self.routes: Dict[str, Route] = {}
+        self.adapter: TypeAdapter | None = None
 
     def register(self, controller_cls: Type[BaseController]):
         """
-        Регистрирует контроллер с эндпоинтами.
+        Регистрирует контроллер с эндпоинтами и пересобирает общий валидатор пакетов.
 
         :param self: self
         :param controller_cls: Класс контроллера для регистрации.
@@ -194,55 +604,278 @@ class ServerRouter:
         ):
             action_name = getattr(method, "_action_name", None)
             if action_name:
-                self.routes[action_name] = (controller_cls, method)
-                print(
-                    f"[ServerRouter] Регистрация действия: '{action_name}' -> {controller_cls.__name__}.{name}"
+                self.routes[action_name] = Route(action_name, controller_cls, method)
+                router_log.debug(
+                    "Регистрация действия: '%s' -> %s.%s", action_name, controller_cls.__name__, name
                 )
 
-    async def dispatch(self, ctx: ServerContext, raw_json: dict):
+        models = tuple(
+            dict.fromkeys(
+                route.request_model for route in self.routes.values() if route.request_model
+            )
+        )
+        self.adapter = (
+            TypeAdapter(Annotated[Union[models], Field(discriminator="action")])
+            if models
+            else None
+        )
+
+    def parse(self, codec, data: bytes) -> tuple[Route, BaseModel | dict | None]:
         """
-        Роутинг полученных данных на нужный эндпоинт.
+        Разбирает пакет за один проход: из байт сразу в модель запроса
+        (размеченное объединение по `action`, без промежуточного словаря для JSON).
 
         :param self: self
-        :param ctx: Контекст
-        :type ctx: ServerContext
-        :param raw_json: Raw JSON строка
-        :type raw_json: dict
+        :param codec: Кодек соединения.
+        :param data: Расшифрованный пакет.
+        :type data: bytes
+        :return: Запись эндпоинта и запрос.
+        :rtype: tuple[Route, BaseModel | dict | None]
+        :raises CodecError: Если пакет не декодируется или не является объектом.
+        :raises MissingActionError: Если в пакете нет `action`.
+        :raises UnknownActionError: Если действие не зарегистрировано.
+        :raises PacketValidationError: Если пакет не проходит валидацию.
+        """
+        if self.adapter is None:
+            return self._parse_untyped(codec, data)
+
+        try:
+            request = codec.validate(self.adapter, data)
+        except ValidationError as e:
+            error = e.errors()[0]
+            if error["type"] == "union_tag_not_found":
+                raise MissingActionError("Не найден эндпоинт") from e
+            if error["type"] == "union_tag_invalid":
+                return self._parse_untyped(codec, data)
+            if not error["loc"]:
+                raise CodecError(f"Недействительный пакет: {error['msg']}") from e
+            raise PacketValidationError(f"Ошибка валидации JSON: {e}") from e
+
+        return self.routes[request.action], request
+
+    def _parse_untyped(self, codec, data: bytes) -> tuple[Route, dict | None]:
         """
+        Медленный путь для эндпоинтов без модели запроса и неизвестных действий.
+
+        :param self: self
+        :param codec: Кодек соединения.
+        :param data: Расшифрованный пакет.
+        :type data: bytes
+        :return: Запись эндпоинта и словарь пакета (None для эндпоинтов без аргументов).
+        :rtype: tuple[Route, dict | None]
+        """
+        raw_json = codec.load(data)
         action_name = raw_json.get("action")
 
         if not action_name:
             raise MissingActionError("Не найден эндпоинт")
 
-        handler_info = self.routes.get(action_name)
-        if not handler_info:
+        route = self.routes.get(action_name)
+        if not route or route.request_model:
             raise UnknownActionError(f"Неизвестный action: {action_name}")
 
-        controller_cls, method = handler_info
+        return route, raw_json if route.arity else None
 
-        controller_instance = controller_cls(ctx)
-
-        signature = inspect.signature(method)
-        params = list(signature.parameters.values())
+    async def dispatch(self, ctx: ServerContext, route: Route, request: BaseModel | dict | None):
+        """
+        Вызов эндпоинта с уже разобранным запросом (время и ошибки учитываются в метриках).
 
-        request = None
+        :param self: self
+        :param ctx: Контекст
+        :type ctx: ServerContext
+        :param route: Запись эндпоинта.
+        :type route: Route
+        :param request: Запрос.
+        :type request: BaseModel | dict | None
+        """
+        controller_instance = ctx.controllers.get(route.controller_cls)
+        if controller_instance is None:
+            controller_instance = ctx.controllers[route.controller_cls] = route.controller_cls(ctx)
 
-        if len(params) > 1:
-            param_type = params[1].annotation
-            if issubclass(param_type, BaseModel):
-                try:
-                    request = param_type.model_validate(raw_json)
-                except ValidationError as e:
-                    print(f"Ошибка валидации JSON: {e}")
-                    raise PacketValidationError(f"Ошибка валидации JSON: {e}") from e
-            else:
-                request = raw_json
+        profiled = profiling.profiler.active and profiling.profiler.begin(route.action)
+        started = time.perf_counter()
         try:
-            if request:
-                await method(controller_instance, request)
+            if route.arity:
+                await route.method(controller_instance, request)
             else:
-                await method(controller_instance)
-        except ServerException:
+                await route.method(controller_instance)
+        except ServerException as e:
+            metrics.errors_total.inc(route.action, e.__class__.__name__)
             raise
         except Exception as e:
+            metrics.errors_total.inc(route.action, InternalServerError.__name__)
             raise InternalServerError("Внутренняя ошибка сервера") from e
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.requests_total.inc(route.action)
+            metrics.request_latency.observe(elapsed, route.action)
+            if profiled:
+                profiling.profiler.end()
+
+    async def process(
+        self,
+        ctx: ServerContext,
+        route: Route,
+        request: BaseModel | dict | None,
+        request_id: int | None = None,
+        timings: profiling.RequestTimings | None = None,
+    ):
+        """
+        Выполняет запрос и отправляет клиенту ошибку сервера, если она возникла.
+
+        :param self: self
+        :param ctx: Контекст
+        :type ctx: ServerContext
+        :param route: Запись эндпоинта.
+        :type route: Route
+        :param request: Запрос.
+        :type request: BaseModel | dict | None
+        :param request_id: ID запроса.
+        :type request_id: int | None
+        :param timings: Замер фаз запроса для журнала медленных запросов.
+        :type timings: profiling.RequestTimings | None
+        """
+        token = current_request.set((ctx, request_id))
+        timings_token = profiling.current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            await self.dispatch(ctx, route, request)
+        except ServerException as e:
+            await ctx.reply_error(f"{e.__class__.__name__}: {e}")
+        finally:
+            profiling.current_timings.reset(timings_token)
+            current_request.reset(token)
+            if timings is not None:
+                profiling.report_if_slow(
+                    ctx, route.action, request_id, timings, time.perf_counter() - started
+                )
+
+    async def submit(
+        self, ctx: ServerContext, data: bytes, timings: profiling.RequestTimings | None = None
+    ):
+        """
+        Принимает расшифрованный пакет из цикла чтения соединения.
+
+        Запросы без request_id (старые клиенты) выполняются по одному, как раньше.
+        Запросы с request_id выполняются параллельно (не больше `max_inflight`
+        на соединение), ответы уходят в порядке готовности. Запросы эндпоинта
+        с `ordered_by` и одинаковым значением этого поля выполняются по очереди.
+
+        :param self: self
+        :param ctx: Контекст
+        :type ctx: ServerContext
+        :param data: Расшифрованный пакет.
+        :type data: bytes
+        :param timings: Замер фаз запроса для журнала медленных запросов.
+        :type timings: profiling.RequestTimings | None
+        :raises CodecError: Если пакет не декодируется.
+        """
+        started = time.perf_counter() if timings is not None else 0.0
+        try:
+            route, request = self.parse(ctx.codec, data)
+        except CodecError:
+            raise
+        except ServerException as e:
+            metrics.errors_total.inc("", e.__class__.__name__)
+            token = current_request.set((ctx, self._peek_request_id(ctx.codec, data)))
+            try:
+                await ctx.reply_error(f"{e.__class__.__name__}: {e}")
+            finally:
+                current_request.reset(token)
+            return
+
+        if timings is not None:
+            timings.validate = time.perf_counter() - started
+
+        request_id = _field(request, "request_id")
+        if not isinstance(request_id, int):
+            await self.process(ctx, route, request, timings=timings)
+            return
+
+        await ctx.inflight.acquire()
+
+        order_key = (
+            (route.ordered_by, _field(request, route.ordered_by)) if route.ordered_by else None
+        )
+        previous = ctx.order_tails.get(order_key) if order_key else None
+
+        task = asyncio.create_task(
+            self._run_pipelined(ctx, route, request, request_id, previous, timings)
+        )
+        ctx.tasks.add(task)
+        if order_key:
+            ctx.order_tails[order_key] = task
+
+        def done(finished: asyncio.Task):
+            ctx.tasks.discard(finished)
+            ctx.inflight.release()
+            if order_key and ctx.order_tails.get(order_key) is finished:
+                del ctx.order_tails[order_key]
+
+        task.add_done_callback(done)
+
+    @staticmethod
+    def _peek_request_id(codec, data: bytes) -> int | None:
+        """
+        Достаёт request_id из пакета, не прошедшего валидацию (для ответа с ошибкой).
+
+        :param codec: Кодек соединения.
+        :param data: Расшифрованный пакет.
+        :type data: bytes
+        :return: ID запроса или None.
+        :rtype: int | None
+        """
+        try:
+            request_id = codec.load(data).get("request_id")
+        except CodecError:
+            return None
+        return request_id if isinstance(request_id, int) else None
+
+    async def _run_pipelined(
+        self,
+        ctx: ServerContext,
+        route: Route,
+        request: BaseModel | dict | None,
+        request_id: int,
+        previous: asyncio.Task | None,
+        timings: profiling.RequestTimings | None = None,
+    ):
+        """
+        Выполняет запрос, дождавшись предыдущего запроса с тем же ключом порядка.
+
+        :param self: self
+        :param ctx: Контекст
+        :type ctx: ServerContext
+        :param route: Запись эндпоинта.
+        :type route: Route
+        :param request: Запрос.
+        :type request: BaseModel | dict | None
+        :param request_id: ID запроса.
+        :type request_id: int
+        :param previous: Предыдущая задача с тем же ключом.
+        :type previous: asyncio.Task | None
+        :param timings: Замер фаз запроса для журнала медленных запросов.
+        :type timings: profiling.RequestTimings | None
+        """
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        try:
+            await self.process(ctx, route, request, request_id, timings)
+        except Exception as ex:
+            router_log.error("Ошибка обработки запроса %s: %s", request_id, ex)
+
+
+def _field(request: BaseModel | dict | None, name: str):
+    """
+    Значение поля запроса (модель или словарь для эндпоинтов без модели).
+
+    :param request: Запрос.
+    :type request: BaseModel | dict | None
+    :param name: Имя поля.
+    :type name: str
+    :return: Значение поля или None.
+    """
+    if isinstance(request, dict):
+        return request.get(name)
+    return getattr(request, name, None)
@@ -0,0 +1,366 @@
+import sys
+import json
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import logging.handlers
+from typing import Dict, TextIO
+
+ROOT = "messager"
+"""Корневой логгер сервера, категории - дочерние логгеры (`messager.packets` и тд)."""
+
+CATEGORY_CONNECTIONS = "connections"
+CATEGORY_PACKETS = "packets"
+CATEGORY_ROUTER = "router"
+CATEGORY_DELIVERY = "delivery"
+CATEGORY_BUS = "bus"
+CATEGORY_STATS = "stats"
+CATEGORY_SYSTEM = "system"
+CATEGORY_PROFILING = "profiling"
+CATEGORY_SLOW = "slow"
+
+SQL_LOGGER = "sqlalchemy.engine"
+"""Логгер SQLAlchemy: уровень INFO выводит каждый SQL запрос (аналог `echo=True`)."""
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+FORMAT_TEXT = "text"
+FORMAT_JSON = "json"
+FORMATS = (FORMAT_TEXT, FORMAT_JSON)
+
+DEFAULT_RATE_LIMIT = 200.0
+"""Записей в секунду на категорию, сверх лимита записи отбрасываются с подсчётом."""
+
+CONFIG = {
+    "LEVEL": "INFO",
+    "RATE_LIMIT": DEFAULT_RATE_LIMIT,
+    "SAMPLING": {},
+}
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+listener: logging.handlers.QueueListener | None = None
+"""Поток записи логов (None - логирование не настроено)."""
+
+_handler: logging.handlers.QueueHandler | None = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """
+    Логгер категории.
+
+    :param category: Категория (`connections`, `packets` и тд).
+    :type category: str
+    :return: Логгер `messager.<category>`.
+    :rtype: logging.Logger
+    """
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+def peer_fields(address) -> dict:
+    """
+    Структурное поле адреса клиента для `extra=`.
+
+    :param address: Адрес сокета (host, port) или None.
+    :return: {"peer": "host:port"}.
+    :rtype: dict
+    """
+    return {"peer": f"{address[0]}:{address[1]}" if address else "?"}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    """
+    Структурные поля записи (переданные через `extra=`).
+
+    :param record: Запись.
+    :type record: logging.LogRecord
+    :return: Поля, которых нет у стандартной записи.
+    :rtype: dict
+    """
+    return {
+        key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Текстовый формат: время, уровень, категория, сообщение и поля `ключ=значение`.
+    """
+
+    def __init__(self):
+        """
+        Создаёт форматтер.
+        """
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Форматирует запись.
+
+        :param record: Запись.
+        :type record: logging.LogRecord
+        :return: Строка лога.
+        :rtype: str
+        """
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Формат JSON Lines: одна запись - один объект со структурными полями.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Форматирует запись.
+
+        :param record: Запись.
+        :type record: logging.LogRecord
+        :return: Строка JSON.
+        :rtype: str
+        """
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "category": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class CategoryLimiter(logging.Filter):
+    """
+    Сэмплирование и ограничение частоты записей по категориям.
+
+    Работает в потоке вызывающего кода до постановки записи в очередь, поэтому
+    отброшенные записи почти ничего не стоят. Записи уровня ERROR и выше
+    пропускаются всегда. Количество отброшенных записей добавляется в первую
+    прошедшую запись категории полем `suppressed`.
+    """
+
+    def __init__(self, rate_limit: float = DEFAULT_RATE_LIMIT, sampling: Dict[str, int] | None = None):
+        """
+        Создаёт фильтр.
+
+        :param rate_limit: Записей в секунду на категорию (0 - без ограничения).
+        :type rate_limit: float
+        :param sampling: Категория -> N (пропускается каждая N-я запись).
+        :type sampling: Dict[str, int] | None
+        """
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.sampling = dict(sampling or {})
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, list] = {}
+        self._counters: Dict[str, int] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Решает, пропустить ли запись.
+
+        :param record: Запись.
+        :type record: logging.LogRecord
+        :return: True, если запись нужно записать.
+        :rtype: bool
+        """
+        if record.levelno >= logging.ERROR:
+            return True
+
+        category = record.name
+        with self._lock:
+            every = self.sampling.get(category.rpartition(".")[2], 1)
+            if every > 1:
+                count = self._counters.get(category, 0)
+                self._counters[category] = count + 1
+                if count % every:
+                    return False
+
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(category, [self.rate_limit, now])
+                bucket[0] = min(self.rate_limit, bucket[0] + (now - bucket[1]) * self.rate_limit)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self._suppressed[category] = self._suppressed.get(category, 0) + 1
+                    return False
+                bucket[0] -= 1
+
+            suppressed = self._suppressed.pop(category, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def setup_logging(
+    level: str = "INFO",
+    log_format: str = FORMAT_TEXT,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    sampling: Dict[str, int] | None = None,
+    payloads: bool = False,
+    sql_echo: bool = False,
+    stream: TextIO | None = None,
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает неблокирующее логирование.
+
+    Записи кладутся в очередь, а пишет их в поток вывода отдельный поток
+    `QueueListener`, поэтому медленный терминал или pipe не тормозит event loop.
+
+    :param level: Уровень логов сервера.
+    :type level: str
+    :param log_format: Формат (`text` или `json`).
+    :type log_format: str
+    :param rate_limit: Записей в секунду на категорию (0 - без ограничения).
+    :type rate_limit: float
+    :param sampling: Категория -> N (пропускается каждая N-я запись).
+    :type sampling: Dict[str, int] | None
+    :param payloads: Логировать расшифрованные пакеты (DEBUG категории packets).
+    :type payloads: bool
+    :param sql_echo: Логировать SQL запросы.
+    :type sql_echo: bool
+    :param stream: Поток вывода (по умолчанию stdout).
+    :type stream: TextIO | None
+    :return: Запущенный поток записи.
+    :rtype: logging.handlers.QueueListener
+    """
+    global listener, _handler
+    shutdown_logging()
+
+    CONFIG["LEVEL"] = level
+    CONFIG["RATE_LIMIT"] = rate_limit
+    CONFIG["SAMPLING"] = dict(sampling or {})
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if log_format == FORMAT_JSON else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = logging.handlers.QueueHandler(log_queue)
+    _handler.addFilter(CategoryLimiter(rate_limit, sampling))
+
+    for name in (ROOT, SQL_LOGGER):
+        target = logging.getLogger(name)
+        target.addHandler(_handler)
+        target.propagate = False
+
+    logging.getLogger(ROOT).setLevel(level)
+    set_payload_logging(payloads)
+    set_sql_echo(sql_echo)
+
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """
+    Дописывает очередь логов, останавливает поток записи и отключает обработчик очереди.
+    """
+    global listener, _handler
+    if listener is not None:
+        listener.stop()
+        listener = None
+    if _handler is not None:
+        for name in (ROOT, SQL_LOGGER):
+            target = logging.getLogger(name)
+            target.removeHandler(_handler)
+            target.propagate = True
+        _handler = None
+
+
+def set_payload_logging(enabled: bool):
+    """
+    Включает или выключает логирование расшифрованных пакетов.
+
+    :param enabled: Логировать пакеты.
+    :type enabled: bool
+    """
+    root_level = logging.getLogger(ROOT).getEffectiveLevel()
+    get_logger(CATEGORY_PACKETS).setLevel(
+        logging.DEBUG if enabled else max(logging.INFO, root_level)
+    )
+
+
+def payload_logging_enabled() -> bool:
+    """
+    Включено ли логирование расшифрованных пакетов.
+
+    :return: True, если пакеты логируются.
+    :rtype: bool
+    """
+    return get_logger(CATEGORY_PACKETS).isEnabledFor(logging.DEBUG)
+
+
+def set_sql_echo(enabled: bool):
+    """
+    Включает или выключает логирование SQL запросов.
+
+    :param enabled: Логировать SQL.
+    :type enabled: bool
+    """
+    logging.getLogger(SQL_LOGGER).setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def sql_echo_enabled() -> bool:
+    """
+    Включено ли логирование SQL запросов.
+
+    :return: True, если SQL логируется.
+    :rtype: bool
+    """
+    return logging.getLogger(SQL_LOGGER).isEnabledFor(logging.INFO)
+
+
+def install_signal_toggles():
+    """
+    Переключение отладочных логов без перезапуска:
+    SIGUSR1 - пакеты, SIGUSR2 - SQL (только Unix).
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    loop = asyncio.get_running_loop()
+    system = get_logger(CATEGORY_SYSTEM)
+
+    def toggle_payloads():
+        set_payload_logging(not payload_logging_enabled())
+        system.warning("Логирование пакетов: %s", "вкл" if payload_logging_enabled() else "выкл")
+
+    def toggle_sql():
+        set_sql_echo(not sql_echo_enabled())
+        system.warning("Логирование SQL: %s", "вкл" if sql_echo_enabled() else "выкл")
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, toggle_payloads)
+        loop.add_signal_handler(signal.SIGUSR2, toggle_sql)
+    except NotImplementedError:
+        pass
+
+
+def parse_sampling(values: list[str]) -> Dict[str, int]:
+    """
+    Разбирает аргументы сэмплирования `категория=N`.
+
+    :param values: Аргументы командной строки.
+    :type values: list[str]
+    :return: Категория -> N.
+    :rtype: Dict[str, int]
+    :raises ValueError: Если аргумент не в формате `категория=N`.
+    """
+    sampling = {}
+    for value in values:
+        category, _, every = value.partition("=")
+        if not category or not every.isdigit() or int(every) < 1:
+            raise ValueError(f"Ожидается категория=N, получено: {value}")
+        sampling[category] = int(every)
+    return sampling
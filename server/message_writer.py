@@ -0,0 +1,390 @@
+"""
+Групповая запись сообщений в БД (group commit).
+
+Каждое сообщение отдельной транзакцией стоит отдельной записи журнала и
+ожидания единственного соединения писателя. MessageWriter собирает вставки
+со всех соединений процесса в пачки (до `max_batch` штук, дожидаясь новых
+не дольше `max_wait` после первой) и пишет пачку одной транзакцией.
+Отметки о прочтении (`is_readed`) уходят в ту же транзакцию следующей пачки.
+`write` завершается только после commit пачки, поэтому ответ отправителю
+по-прежнему означает, что сообщение сохранено.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import insert, update
+from sqlmodel import col
+
+from server import logger, metrics
+from server.db_models import Message, conversation_key
+
+DEFAULT_MAX_BATCH = 128
+"""Максимум сообщений в одной транзакции."""
+
+DEFAULT_MAX_WAIT_MS = 1.0
+"""Максимум ожидания новых сообщений после первого в пачке (мс)."""
+
+_STOP = object()
+"""Метка остановки в очереди: дописать пачку и завершить задачу."""
+
+
+async def write_batch(
+    session_maker: Callable, rows: list[dict], read_ids: list[int] = ()
+) -> list[int]:
+    """
+    Записывает сообщения и отметки о прочтении одной транзакцией.
+
+    :param session_maker: Фабрика сессий писателя.
+    :type session_maker: Callable
+    :param rows: Значения колонок Message для вставки.
+    :type rows: list[dict]
+    :param read_ids: ID сообщений, доставленных получателю.
+    :type read_ids: list[int]
+    :return: ID вставленных сообщений в порядке `rows`.
+    :rtype: list[int]
+    """
+    async with session_maker() as session:
+        ids = []
+        if rows:
+            result = await session.execute(
+                insert(Message).returning(col(Message.id), sort_by_parameter_order=True),
+                rows,
+            )
+            ids = list(result.scalars().all())
+        if read_ids:
+            await session.execute(
+                update(Message).where(col(Message.id).in_(read_ids)).values(is_readed=True)
+            )
+        await session.commit()
+        return ids
+
+
+def message_row(sender_id: int, receiver_id: int, content: str) -> dict:
+    """
+    Значения колонок нового сообщения (время и ключ диалога - на стороне сервера).
+
+    :param sender_id: ID отправителя.
+    :type sender_id: int
+    :param receiver_id: ID получателя.
+    :type receiver_id: int
+    :param content: Текст.
+    :type content: str
+    :return: Значения колонок Message.
+    :rtype: dict
+    """
+    low, high = conversation_key(sender_id, receiver_id)
+    return {
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "content": content,
+        "is_readed": False,
+        # Наивное UTC время, как у уже сохранённых сообщений (Message.timestamp)
+        "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+        "conversation_low": low,
+        "conversation_high": high,
+    }
+
+
+class MessageWriter:
+    """
+    Фоновая задача групповой записи сообщений процесса.
+    """
+
+    def __init__(
+        self,
+        session_maker: Callable,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ):
+        """
+        Создаёт писателя (запись начинается после `start`).
+
+        :param session_maker: Фабрика сессий писателя.
+        :type session_maker: Callable
+        :param max_batch: Максимум сообщений в транзакции.
+        :type max_batch: int
+        :param max_wait_ms: Ожидание новых сообщений после первого (мс).
+        :type max_wait_ms: float
+        """
+        self.session_maker = session_maker
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.read_ids: list[int] = []
+        self.task: asyncio.Task | None = None
+
+        self.batches = 0
+        self.messages = 0
+        self.max_batch_seen = 0
+
+    def start(self):
+        """
+        Запускает фоновую задачу записи в текущем event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        """
+        Принимает ли писатель сообщения в пачки (запущен и не остановлен).
+
+        :return: True, если фоновая задача записи работает.
+        :rtype: bool
+        """
+        return self.task is not None
+
+    async def write(self, sender_id: int, receiver_id: int, content: str) -> tuple[int, datetime]:
+        """
+        Ставит сообщение в пачку и ждёт commit (после остановки - отдельная транзакция).
+
+        :param sender_id: ID отправителя.
+        :type sender_id: int
+        :param receiver_id: ID получателя.
+        :type receiver_id: int
+        :param content: Текст.
+        :type content: str
+        :return: ID и время сообщения.
+        :rtype: tuple[int, datetime]
+        :raises Exception: Ошибка транзакции пачки.
+        """
+        row = message_row(sender_id, receiver_id, content)
+        if not self.running:
+            (message_id,) = await write_batch(self.session_maker, [row])
+            return message_id, row["timestamp"]
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((row, future))
+        return await future, row["timestamp"]
+
+    def mark_read(self, message_id: int):
+        """
+        Отмечает сообщение прочитанным в транзакции следующей пачки (без ожидания).
+
+        :param message_id: ID сообщения.
+        :type message_id: int
+        """
+        self.read_ids.append(message_id)
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+    async def _collect(self) -> list:
+        """
+        Ждёт первое сообщение и добирает пачку.
+
+        :return: Элементы очереди (None - только отметки о прочтении, _STOP - остановка).
+        :rtype: list
+        """
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            if self.queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        """
+        Цикл записи пачек до метки остановки.
+        """
+        while True:
+            items = await self._collect()
+            await self._flush([item for item in items if item is not None and item is not _STOP])
+            if items[-1] is _STOP:
+                return
+
+    async def _flush(self, batch: list):
+        """
+        Записывает пачку и завершает ожидающих отправителей.
+
+        Если транзакция пачки не прошла, сообщения и отметки о прочтении
+        пишутся по одному: ошибка одной строки не отменяет остальные, а
+        отметка, не записанная и второй раз, отбрасывается и не ломает
+        следующие пачки.
+
+        :param batch: Пары (значения колонок, future).
+        :type batch: list
+        """
+        read_ids, self.read_ids = self.read_ids, []
+        if not batch and not read_ids:
+            return
+        try:
+            ids = await write_batch(self.session_maker, [row for row, _ in batch], read_ids)
+        except Exception as ex:
+            logger.get_logger(logger.CATEGORY_SYSTEM).error("Ошибка записи пачки сообщений: %s", ex)
+            await self._flush_read_marks(read_ids)
+            await self._flush_each(batch, ex, retry_single=bool(read_ids))
+            return
+
+        for (_, future), message_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(message_id)
+
+        if batch:
+            self.batches += 1
+            self.messages += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            metrics.db_write_batch_size.observe(len(batch))
+
+    async def _flush_each(self, batch: list, batch_error: Exception, retry_single: bool = False):
+        """
+        Пишет сообщения несостоявшейся пачки каждое своей транзакцией.
+
+        :param batch: Пары (значения колонок, future).
+        :type batch: list
+        :param batch_error: Ошибка транзакции пачки (для пачки из одного сообщения).
+        :type batch_error: Exception
+        :param retry_single: Повторить и единственное сообщение (в пачке были
+            отметки о прочтении, ошибка могла быть из-за них).
+        :type retry_single: bool
+        """
+        if len(batch) == 1 and not retry_single:
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(batch_error)
+            return
+
+        for row, future in batch:
+            try:
+                (message_id,) = await write_batch(self.session_maker, [row])
+            except Exception as ex:
+                if not future.done():
+                    future.set_exception(ex)
+                continue
+            if not future.done():
+                future.set_result(message_id)
+
+    async def _flush_read_marks(self, read_ids: list[int]):
+        """
+        Повторяет отметки о прочтении несостоявшейся пачки, каждую своей транзакцией.
+
+        Вторая неудача - отметка отбрасывается: сообщение остаётся
+        непрочитанным, как при недоставке.
+
+        :param read_ids: ID сообщений.
+        :type read_ids: list[int]
+        """
+        for message_id in read_ids:
+            try:
+                await write_batch(self.session_maker, [], [message_id])
+            except Exception as ex:
+                logger.get_logger(logger.CATEGORY_SYSTEM).error(
+                    "Отметка о прочтении сообщения %s отброшена: %s", message_id, ex
+                )
+
+    async def close(self):
+        """
+        Останавливает запись, дописав сообщения, поставленные до вызова.
+        """
+        task, self.task = self.task, None
+        if task is not None:
+            self.queue.put_nowait(_STOP)
+            await task
+
+    def stats(self) -> dict:
+        """
+        Счётчики записи.
+
+        :return: Словарь счётчиков.
+        :rtype: dict
+        """
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "messages": self.messages,
+            "avg_batch": self.messages / self.batches if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+        }
+
+
+writer: MessageWriter | None = None
+"""Писатель процесса (None - каждое сообщение своей транзакцией)."""
+
+
+def setup_message_writer(
+    session_maker: Callable,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+) -> MessageWriter | None:
+    """
+    Настройка групповой записи сообщений.
+
+    :param session_maker: Фабрика сессий писателя.
+    :type session_maker: Callable
+    :param max_batch: Максимум сообщений в транзакции (0 - без групповой записи).
+    :type max_batch: int
+    :param max_wait_ms: Ожидание новых сообщений после первого (мс).
+    :type max_wait_ms: float
+    :return: Писатель или None.
+    :rtype: MessageWriter | None
+    """
+    global writer
+
+    writer = MessageWriter(session_maker, max_batch, max_wait_ms) if max_batch > 0 else None
+    if writer is not None:
+        writer.start()
+    return writer
+
+
+async def shutdown() -> dict | None:
+    """
+    Останавливает писателя процесса, дописав очередь.
+
+    :return: Счётчики писателя (None - писатель не был настроен).
+    :rtype: dict | None
+    """
+    global writer
+
+    if writer is None:
+        return None
+    await writer.close()
+    stats, writer = writer.stats(), None
+    return stats
+
+
+async def write_message(
+    session_maker: Callable, sender_id: int, receiver_id: int, content: str
+) -> tuple[int, datetime]:
+    """
+    Сохраняет сообщение: через писателя процесса или отдельной транзакцией.
+
+    :param session_maker: Фабрика сессий (если писатель не настроен).
+    :type session_maker: Callable
+    :param sender_id: ID отправителя.
+    :type sender_id: int
+    :param receiver_id: ID получателя.
+    :type receiver_id: int
+    :param content: Текст.
+    :type content: str
+    :return: ID и время сообщения.
+    :rtype: tuple[int, datetime]
+    """
+    if writer is not None:
+        return await writer.write(sender_id, receiver_id, content)
+    row = message_row(sender_id, receiver_id, content)
+    (message_id,) = await write_batch(session_maker, [row])
+    return message_id, row["timestamp"]
+
+
+async def mark_read(session_maker: Callable, message_id: int):
+    """
+    Отмечает сообщение доставленным: в пачке писателя или отдельной транзакцией.
+
+    :param session_maker: Фабрика сессий (если писатель не настроен).
+    :type session_maker: Callable
+    :param message_id: ID сообщения.
+    :type message_id: int
+    """
+    if writer is not None and writer.running:
+        writer.mark_read(message_id)
+    else:
+        await write_batch(session_maker, [], [message_id])
@@ -0,0 +1,848 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import ipaddress
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable
+from urllib.parse import urlsplit, parse_qsl
+
+import security
+from server import logger, profiling, crypto_executor
+from protocol import compression
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+"""Границы корзин гистограмм задержки (секунды)."""
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+"""Границы корзин гистограмм размера пачки (штуки)."""
+
+QUANTILES = (0.5, 0.95, 0.99)
+"""Квантили задержки, которые отдаются в выводе (p50/p95/p99)."""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Content-Type текстового формата Prometheus."""
+
+ADMIN_ROUTES: Dict[str, Callable[[Dict[str, str]], dict]] = {}
+"""Админ эндпоинты listener метрик: путь -> обработчик (параметры запроса -> ответ JSON)."""
+
+CONFIG = {"ADMIN_TOKEN": None}
+
+
+def setup_admin(token: str | None):
+    """
+    Настройка доступа к админ эндпоинтам listener метрик.
+
+    :param token: Токен (`Authorization: Bearer <token>`). None - админ эндпоинты
+        доступны только с loopback адресов и через Unix сокет.
+    :type token: str | None
+    """
+    CONFIG["ADMIN_TOKEN"] = token or None
+
+
+def _admin_allowed(writer: asyncio.StreamWriter, headers: Dict[str, str]) -> bool:
+    """
+    Проверяет доступ к админ эндпоинтам.
+
+    :param writer: Поток записи соединения.
+    :type writer: asyncio.StreamWriter
+    :param headers: Заголовки запроса (имена в нижнем регистре).
+    :type headers: Dict[str, str]
+    :return: True, если запрос можно выполнить.
+    :rtype: bool
+    """
+    token = CONFIG["ADMIN_TOKEN"]
+    if token is not None:
+        return hmac.compare_digest(
+            headers.get("authorization", "").encode(), f"Bearer {token}".encode()
+        )
+
+    peer = writer.get_extra_info("peername")
+    if not isinstance(peer, tuple):
+        # Unix сокет: доступ ограничен правами на файл
+        return True
+    try:
+        return ipaddress.ip_address(peer[0]).is_loopback
+    except ValueError:
+        return False
+
+
+def _escape(value) -> str:
+    """
+    Экранирует значение метки.
+
+    :param value: Значение метки.
+    :return: Строка с экранированными `\\`, `"` и переводами строк.
+    :rtype: str
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    """
+    Метки метрики в формате Prometheus.
+
+    :param names: Имена меток.
+    :type names: tuple
+    :param values: Значения меток.
+    :type values: tuple
+    :param extra: Дополнительная метка (например `le="0.5"`).
+    :type extra: str
+    :return: `{a="1",b="2"}` или пустая строка.
+    :rtype: str
+    """
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """
+    Число в формате Prometheus.
+
+    :param value: Значение.
+    :type value: float
+    :return: Строка значения.
+    :rtype: str
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Базовая метрика с метками.
+
+    Метрики обновляются только из потока event loop, поэтому обходятся
+    без блокировок: обновление - это поиск в словаре и сложение.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        """
+        Создаёт метрику.
+
+        :param name: Имя метрики.
+        :type name: str
+        :param documentation: Описание (строка HELP).
+        :type documentation: str
+        :param labels: Имена меток.
+        :type labels: Iterable[str]
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[tuple, float] = {}
+
+    def render(self) -> list[str]:
+        """
+        Строки метрики в текстовом формате Prometheus.
+
+        :return: Строки HELP, TYPE и значения.
+        :rtype: list[str]
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        """
+        Обнуляет метрику.
+        """
+        self.values.clear()
+
+
+class Counter(Metric):
+    """
+    Монотонный счётчик.
+    """
+
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        """
+        Увеличивает счётчик.
+
+        :param label_values: Значения меток.
+        :param amount: Приращение.
+        :type amount: float
+        """
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Текущее значение (может расти и уменьшаться или вычисляться при выводе).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        callback: Callable[[], float] | None = None,
+    ):
+        """
+        Создаёт метрику.
+
+        :param name: Имя метрики.
+        :type name: str
+        :param documentation: Описание (строка HELP).
+        :type documentation: str
+        :param labels: Имена меток.
+        :type labels: Iterable[str]
+        :param callback: Функция, вычисляющая значение при выводе (для метрик без меток).
+        :type callback: Callable[[], float] | None
+        """
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def inc(self, *label_values, amount: float = 1):
+        """
+        Увеличивает значение.
+
+        :param label_values: Значения меток.
+        :param amount: Приращение.
+        :type amount: float
+        """
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        """
+        Уменьшает значение.
+
+        :param label_values: Значения меток.
+        :param amount: Уменьшение.
+        :type amount: float
+        """
+        self.values[label_values] = self.values.get(label_values, 0) - amount
+
+    def set(self, value: float, *label_values):
+        """
+        Устанавливает значение.
+
+        :param value: Значение.
+        :type value: float
+        :param label_values: Значения меток.
+        """
+        self.values[label_values] = value
+
+    def render(self) -> list[str]:
+        """
+        Строки метрики в текстовом формате Prometheus.
+
+        :return: Строки HELP, TYPE и значения.
+        :rtype: list[str]
+        """
+        if self.callback is not None:
+            self.values[()] = self.callback()
+        return super().render()
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными корзинами (как в Prometheus) и оценкой квантилей по корзинам.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        """
+        Создаёт метрику.
+
+        :param name: Имя метрики.
+        :type name: str
+        :param documentation: Описание (строка HELP).
+        :type documentation: str
+        :param labels: Имена меток.
+        :type labels: Iterable[str]
+        :param buckets: Верхние границы корзин по возрастанию.
+        :type buckets: tuple
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        """
+        Учитывает наблюдение.
+
+        :param value: Значение (например, задержка в секундах).
+        :type value: float
+        :param label_values: Значения меток.
+        """
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q: float, *label_values) -> float:
+        """
+        Оценка квантиля линейной интерполяцией внутри корзины.
+
+        :param q: Квантиль (0..1).
+        :type q: float
+        :param label_values: Значения меток.
+        :return: Оценка квантиля (0, если наблюдений нет).
+        :rtype: float
+        """
+        series = self.series.get(label_values)
+        if series is None or not series[2]:
+            return 0.0
+
+        rank = q * series[2]
+        cumulative = 0
+        for index, count in enumerate(series[0]):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def count(self, *label_values) -> int:
+        """
+        Количество наблюдений.
+
+        :param label_values: Значения меток.
+        :return: Количество наблюдений.
+        :rtype: int
+        """
+        series = self.series.get(label_values)
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        """
+        Строки гистограммы (корзины, сумма, количество) и квантилей в текстовом формате Prometheus.
+
+        :return: Строки HELP, TYPE и значения.
+        :rtype: list[str]
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, number) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {number}")
+
+        if self.series:
+            name = f"{self.name}_quantile"
+            lines.append(f"# HELP {name} Оценка квантилей {self.name} по корзинам")
+            lines.append(f"# TYPE {name} gauge")
+            for key in sorted(self.series):
+                for q in QUANTILES:
+                    quantile = f'quantile="{q}"'
+                    lines.append(
+                        f"{name}{_format_labels(self.labels, key, quantile)} "
+                        f"{_format_value(self.quantile(q, *key))}"
+                    )
+        return lines
+
+    def reset(self):
+        """
+        Обнуляет метрику.
+        """
+        self.series.clear()
+
+
+class CollectedMetric(Metric):
+    """
+    Метрика, значения которой читаются при выводе из счётчиков другого модуля.
+
+    Для счётчиков, которые обновляются в потоках пула криптографии под своей
+    блокировкой: сами метрики реестра обновляются только из event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        collect: Callable[[], Dict[tuple, float]],
+        labels: Iterable[str] = (),
+    ):
+        """
+        Создаёт метрику.
+
+        :param name: Имя метрики.
+        :type name: str
+        :param documentation: Описание (строка HELP).
+        :type documentation: str
+        :param kind: Тип метрики Prometheus (`counter` или `gauge`).
+        :type kind: str
+        :param collect: Функция, возвращающая значения по меткам при выводе.
+        :type collect: Callable[[], Dict[tuple, float]]
+        :param labels: Имена меток.
+        :type labels: Iterable[str]
+        """
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        """
+        Строки метрики в текстовом формате Prometheus.
+
+        :return: Строки HELP, TYPE и значения.
+        :rtype: list[str]
+        """
+        self.values = dict(self.collect())
+        return super().render()
+
+
+class Registry:
+    """
+    Набор метрик процесса.
+    """
+
+    def __init__(self):
+        """
+        Создаёт пустой реестр.
+        """
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Добавляет метрику в реестр.
+
+        :param metric: Метрика.
+        :type metric: Metric
+        :return: Та же метрика.
+        :rtype: Metric
+        """
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате Prometheus.
+
+        :return: Текст для scrape.
+        :rtype: str
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Обнуляет все метрики (для тестов и бенчмарков).
+        """
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+registry = Registry()
+"""Метрики текущего процесса."""
+
+requests_total = registry.register(
+    Counter("messager_requests_total", "Обработано запросов по действиям", ("action",))
+)
+errors_total = registry.register(
+    Counter(
+        "messager_errors_total",
+        "Ошибки по действиям и классам исключений server.exceptions",
+        ("action", "error"),
+    )
+)
+request_latency = registry.register(
+    Histogram("messager_request_seconds", "Время обработки запроса по действиям", ("action",))
+)
+responses_total = registry.register(
+    Counter("messager_responses_total", "Отправлено ответов по статусам", ("status",))
+)
+bytes_in = registry.register(
+    Counter("messager_received_bytes_total", "Принято байт (полезная нагрузка фреймов)")
+)
+bytes_out = registry.register(
+    Counter("messager_sent_bytes_total", "Отправлено байт (полезная нагрузка фреймов)")
+)
+handshakes_total = registry.register(
+    Counter("messager_handshakes_total", "Handshake по результату", ("result",))
+)
+handshake_latency = registry.register(
+    Histogram("messager_handshake_seconds", "Время handshake")
+)
+active_connections = registry.register(
+    Gauge("messager_active_connections", "Открытые соединения")
+)
+connected_users = registry.register(
+    Gauge("messager_connected_users", "Авторизованные пользователи онлайн (CONNECTED_USERS)")
+)
+db_sessions_total = registry.register(
+    Counter("messager_db_sessions_total", "Открыто сессий БД")
+)
+db_session_latency = registry.register(
+    Histogram("messager_db_session_seconds", "Время жизни сессии БД")
+)
+active_db_sessions = registry.register(
+    Gauge("messager_active_db_sessions", "Открытые сессии БД")
+)
+db_write_batch_size = registry.register(
+    Histogram(
+        "messager_db_write_batch_messages",
+        "Сообщений в одной транзакции групповой записи",
+        buckets=BATCH_BUCKETS,
+    )
+)
+user_directory_lookups = registry.register(
+    Counter(
+        "messager_user_directory_lookups_total",
+        "Обращения к кэшу пользователей по результату (hit/miss)",
+        ("result",),
+    )
+)
+user_directory_size = registry.register(
+    Gauge("messager_user_directory_size", "Пользователей в кэше справочника")
+)
+
+
+def _collect_crypto(field: str) -> Callable[[], Dict[tuple, float]]:
+    """
+    Функция сбора одного счётчика пула криптографии.
+
+    Пул пересоздаётся в `setup_crypto_executor`, поэтому берётся при каждом выводе.
+
+    :param field: Имя счётчика в `CryptoExecutor.stats`.
+    :type field: str
+    :return: Функция для CollectedMetric.
+    :rtype: Callable[[], Dict[tuple, float]]
+    """
+    return lambda: {(): crypto_executor.executor.stats()[field]}
+
+
+def _collect_crypto_calls() -> Dict[tuple, float]:
+    """
+    Вызовы пула криптографии по месту выполнения.
+
+    :return: Значения по меткам.
+    :rtype: Dict[tuple, float]
+    """
+    stats = crypto_executor.executor.stats()
+    return {("inline",): stats["inline_calls"], ("offloaded",): stats["offloaded_calls"]}
+
+
+crypto_calls = registry.register(
+    CollectedMetric(
+        "messager_crypto_calls_total",
+        "Операции криптографии: в event loop (inline) и в пуле потоков (offloaded)",
+        "counter",
+        _collect_crypto_calls,
+        ("mode",),
+    )
+)
+crypto_queue_depth = registry.register(
+    CollectedMetric(
+        "messager_crypto_queue_depth",
+        "Операции в очереди пула криптографии",
+        "gauge",
+        _collect_crypto("queue_depth"),
+    )
+)
+crypto_max_queue_depth = registry.register(
+    CollectedMetric(
+        "messager_crypto_max_queue_depth",
+        "Максимальная глубина очереди пула криптографии",
+        "gauge",
+        _collect_crypto("max_queue_depth"),
+    )
+)
+crypto_wait_seconds = registry.register(
+    CollectedMetric(
+        "messager_crypto_wait_seconds_total",
+        "Суммарное ожидание операций в очереди пула криптографии",
+        "counter",
+        _collect_crypto("wait_time_total"),
+    )
+)
+
+
+def _collect_token_cache() -> Dict[tuple, float]:
+    """
+    Обращения к кэшу проверенных токенов по результату.
+
+    :return: Значения по меткам.
+    :rtype: Dict[tuple, float]
+    """
+    stats = security.token_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+
+token_cache_lookups = registry.register(
+    CollectedMetric(
+        "messager_token_cache_lookups_total",
+        "Обращения к кэшу проверенных токенов по результату (hit/miss)",
+        "counter",
+        _collect_token_cache,
+        ("result",),
+    )
+)
+token_cache_hit_rate = registry.register(
+    CollectedMetric(
+        "messager_token_cache_hit_rate",
+        "Доля попаданий в кэш проверенных токенов",
+        "gauge",
+        lambda: {(): security.token_cache.stats()["hit_rate"]},
+    )
+)
+token_cache_size = registry.register(
+    CollectedMetric(
+        "messager_token_cache_size",
+        "Токенов в кэше проверенных токенов",
+        "gauge",
+        lambda: {(): security.token_cache.stats()["size"]},
+    )
+)
+
+
+def _collect_compression(field: str) -> Callable[[], Dict[tuple, float]]:
+    """
+    Функция сбора одного счётчика `compression.stats` по алгоритмам.
+
+    :param field: Имя счётчика в `CompressionStats.by_algorithm`.
+    :type field: str
+    :return: Функция для CollectedMetric.
+    :rtype: Callable[[], Dict[tuple, float]]
+    """
+    return lambda: {
+        (name,): counters[field] for name, counters in compression.stats.by_algorithm().items()
+    }
+
+
+def _collect_compression_frames() -> Dict[tuple, float]:
+    """
+    Фреймы по алгоритму и результату (сжат, отправлен без сжатия, распакован).
+
+    :return: Значения по меткам.
+    :rtype: Dict[tuple, float]
+    """
+    values = {}
+    for name, counters in compression.stats.by_algorithm().items():
+        for result in ("compressed", "skipped", "decompressed"):
+            values[(name, result)] = counters[f"{result}_frames"]
+    return values
+
+
+def _collect_compression_ratio() -> Dict[tuple, float]:
+    """
+    Коэффициент сжатия (исходный размер / сжатый) по алгоритмам.
+
+    :return: Значения по меткам.
+    :rtype: Dict[tuple, float]
+    """
+    return {
+        (name,): counters["bytes_in"] / counters["bytes_out"]
+        for name, counters in compression.stats.by_algorithm().items()
+        if counters["bytes_out"]
+    }
+
+
+compression_frames = registry.register(
+    CollectedMetric(
+        "messager_compression_frames_total",
+        "Фреймы по алгоритму сжатия и результату",
+        "counter",
+        _collect_compression_frames,
+        ("algorithm", "result"),
+    )
+)
+compression_raw_bytes = registry.register(
+    CollectedMetric(
+        "messager_compression_raw_bytes_total",
+        "Байт до сжатия (только сжатые фреймы)",
+        "counter",
+        _collect_compression("bytes_in"),
+        ("algorithm",),
+    )
+)
+compression_compressed_bytes = registry.register(
+    CollectedMetric(
+        "messager_compression_compressed_bytes_total",
+        "Байт после сжатия",
+        "counter",
+        _collect_compression("bytes_out"),
+        ("algorithm",),
+    )
+)
+compression_ratio = registry.register(
+    CollectedMetric(
+        "messager_compression_ratio",
+        "Коэффициент сжатия (исходный размер / сжатый)",
+        "gauge",
+        _collect_compression_ratio,
+        ("algorithm",),
+    )
+)
+compress_seconds = registry.register(
+    CollectedMetric(
+        "messager_compress_cpu_seconds_total",
+        "CPU время сжатия",
+        "counter",
+        _collect_compression("compress_time"),
+        ("algorithm",),
+    )
+)
+decompress_seconds = registry.register(
+    CollectedMetric(
+        "messager_decompress_cpu_seconds_total",
+        "CPU время распаковки",
+        "counter",
+        _collect_compression("decompress_time"),
+        ("algorithm",),
+    )
+)
+
+
+class TimedSession:
+    """
+    Обёртка сессии БД для `async with`: считает сессии и время их жизни.
+    """
+
+    __slots__ = ("session", "started", "reply_before")
+
+    def __init__(self, session):
+        """
+        Оборачивает сессию.
+
+        :param session: Асинхронная сессия БД.
+        """
+        self.session = session
+        self.started = 0.0
+        self.reply_before = 0.0
+
+    async def __aenter__(self):
+        """
+        Открывает сессию.
+
+        :return: Асинхронная сессия БД.
+        """
+        self.started = time.perf_counter()
+        self.reply_before = profiling.phase_time("reply")
+        db_sessions_total.inc()
+        active_db_sessions.inc()
+        return await self.session.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """
+        Закрывает сессию и учитывает время её жизни.
+        """
+        try:
+            return await self.session.__aexit__(exc_type, exc, tb)
+        finally:
+            elapsed = time.perf_counter() - self.started
+            active_db_sessions.dec()
+            db_session_latency.observe(elapsed)
+            # Ответы внутри сессии уже учтены в фазе reply
+            profiling.add_phase("db", elapsed - (profiling.phase_time("reply") - self.reply_before))
+
+
+def instrument_sessions(session_maker) -> Callable[[], TimedSession]:
+    """
+    Оборачивает фабрику сессий БД сбором метрик.
+
+    :param session_maker: Фабрика асинхронных сессий БД.
+    :return: Фабрика сессий для `async with`.
+    :rtype: Callable[[], TimedSession]
+    """
+
+    def create_session() -> TimedSession:
+        return TimedSession(session_maker())
+
+    return create_session
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Минимальный HTTP обработчик: `GET /metrics` отдаёт метрики, пути из `ADMIN_ROUTES` -
+    ответ обработчика в JSON (параметры берутся из query string), остальное - 404.
+    Админ пути без доступа (см. `_admin_allowed`) получают 403, неверные
+    параметры - 400, прочие ошибки обработчика пишутся в журнал и дают 500.
+
+    :param reader: Поток чтения.
+    :type reader: asyncio.StreamReader
+    :param writer: Поток записи.
+    :type writer: asyncio.StreamWriter
+    """
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        headers = {}
+        while header_line := (await asyncio.wait_for(reader.readline(), 5)).strip():
+            name, _, value = header_line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        parts = request_line.decode("latin-1").split() or [""]
+        url = urlsplit(parts[1] if len(parts) >= 2 else "")
+        handler = ADMIN_ROUTES.get(url.path)
+        if url.path == "/metrics" and parts[0] == "GET":
+            status, content_type, body = "200 OK", CONTENT_TYPE, registry.render().encode("utf-8")
+        elif handler is not None and not _admin_allowed(writer, headers):
+            status, content_type, body = "403 Forbidden", "text/plain", b"forbidden\n"
+        elif handler is not None:
+            try:
+                status, result = "200 OK", handler(dict(parse_qsl(url.query)))
+            except ValueError as ex:
+                status, result = "400 Bad Request", {"error": str(ex)}
+            except Exception as ex:
+                logger.get_logger(logger.CATEGORY_SYSTEM).error(
+                    "Ошибка админ эндпоинта %s: %s", url.path, ex
+                )
+                status, result = "500 Internal Server Error", {"error": "internal error"}
+            content_type = "application/json"
+            body = json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_listener(host: str = "127.0.0.1", port: int | None = None, path: str | None = None):
+    """
+    Поднимает HTTP listener метрик на TCP порту или Unix сокете.
+
+    :param host: Хост (только локальный по умолчанию).
+    :type host: str
+    :param port: TCP порт.
+    :type port: int | None
+    :param path: Путь к Unix сокету (вместо порта).
+    :type path: str | None
+    :return: Сервер asyncio.
+    :rtype: asyncio.Server
+    """
+    if path:
+        if os.path.exists(path):
+            os.unlink(path)
+        return await asyncio.start_unix_server(_handle_scrape, path)
+    return await asyncio.start_server(_handle_scrape, host, port)
@@ -0,0 +1,235 @@
+"""
+Миграции схемы SQLite для уже существующих баз.
+
+Новые таблицы создаёт `SQLModel.metadata.create_all`, но он не меняет
+существующие: не добавляет колонки и индексы. Версия схемы хранится в
+`PRAGMA user_version`, `migrate` применяет шаги из MIGRATIONS начиная с неё.
+Каждый шаг идемпотентен, поэтому на свежей базе (таблицы уже в новой схеме)
+он только отмечает версию.
+"""
+
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+MIGRATIONS: list[Callable[[Connection], None]] = []
+"""Шаги миграции по порядку: шаг i переводит схему из версии i в i + 1."""
+
+
+def migration(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+    """
+    Декоратор регистрации шага миграции (версия - порядковый номер).
+
+    :param func: Шаг миграции, принимает синхронное соединение.
+    :type func: Callable[[Connection], None]
+    :return: Та же функция.
+    :rtype: Callable[[Connection], None]
+    """
+    MIGRATIONS.append(func)
+    return func
+
+
+def columns(connection: Connection, table: str) -> set[str]:
+    """
+    Имена колонок таблицы.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    :param table: Имя таблицы.
+    :type table: str
+    :return: Имена колонок.
+    :rtype: set[str]
+    """
+    return {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table}")'))}
+
+
+@migration
+def add_conversation_key(connection: Connection):
+    """
+    Ключ диалога (conversation_low, conversation_high) у сообщений и индекс
+    (conversation_low, conversation_high, id) для истории переписки.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    """
+    existing = columns(connection, "message")
+    for name in ("conversation_low", "conversation_high"):
+        if name not in existing:
+            connection.execute(
+                text(f"ALTER TABLE message ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+            )
+    connection.execute(
+        text(
+            "UPDATE message SET "
+            "conversation_low = MIN(sender_id, receiver_id), "
+            "conversation_high = MAX(sender_id, receiver_id) "
+            "WHERE conversation_low = 0 OR conversation_high = 0"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_message_conversation "
+            "ON message (conversation_low, conversation_high, id)"
+        )
+    )
+
+
+def create_fts_table(
+    connection: Connection,
+    name: str,
+    columns_sql: str,
+    content: str,
+    tokenize: str = "trigram",
+) -> bool:
+    """
+    Создаёт FTS5 таблицу над таблицей `content`.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    :param name: Имя FTS таблицы.
+    :type name: str
+    :param columns_sql: Индексируемые колонки через запятую.
+    :type columns_sql: str
+    :param content: Исходная таблица или представление (external content, rowid = id).
+    :type content: str
+    :param tokenize: Токенизатор FTS5.
+    :type tokenize: str
+    :return: False, если SQLite собран без FTS5 или токенизатора (поиск через LIKE).
+    :rtype: bool
+    """
+    try:
+        connection.execute(
+            text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+                f"{columns_sql}, content='{content}', content_rowid='id', tokenize='{tokenize}')"
+            )
+        )
+    except OperationalError:
+        return False
+    return True
+
+
+@migration
+def add_user_search(connection: Connection):
+    """
+    FTS5 индекс по login и username пользователей (`server.search`).
+
+    Индекс синхронизируется триггерами на любую вставку, изменение и удаление
+    пользователя, уже существующие пользователи индексируются при миграции.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    """
+    if not create_fts_table(connection, "user_search", "login, username", "user"):
+        return
+    connection.execute(
+        text(
+            'CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON "user" BEGIN '
+            "INSERT INTO user_search (rowid, login, username) "
+            "VALUES (new.id, new.login, new.username); END"
+        )
+    )
+    connection.execute(
+        text(
+            'CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON "user" BEGIN '
+            "INSERT INTO user_search (user_search, rowid, login, username) "
+            "VALUES ('delete', old.id, old.login, old.username); END"
+        )
+    )
+    connection.execute(
+        text(
+            'CREATE TRIGGER IF NOT EXISTS user_search_update AFTER UPDATE OF login, username ON "user" BEGIN '
+            "INSERT INTO user_search (user_search, rowid, login, username) "
+            "VALUES ('delete', old.id, old.login, old.username); "
+            "INSERT INTO user_search (rowid, login, username) "
+            "VALUES (new.id, new.login, new.username); END"
+        )
+    )
+    connection.execute(text("INSERT INTO user_search (user_search) VALUES ('rebuild')"))
+
+
+@migration
+def add_message_search(connection: Connection):
+    """
+    FTS5 индекс по тексту сообщений (`server.search`).
+
+    Кроме текста индексируются участники диалога (токены "u<ID>" из
+    представления message_search_source): поиск ограничивается диалогами
+    пользователя пересечением списков в самом индексе. Индекс обновляется
+    триггерами, существующие сообщения индексируются при миграции.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    """
+    connection.execute(
+        text(
+            "CREATE VIEW IF NOT EXISTS message_search_source AS "
+            "SELECT id, content, 'u' || sender_id || ' u' || receiver_id AS participants "
+            "FROM message"
+        )
+    )
+    if not create_fts_table(
+        connection,
+        "message_search",
+        "content, participants",
+        "message_search_source",
+        "unicode61 remove_diacritics 2",
+    ):
+        return
+    values = "{prefix}.id, {prefix}.content, 'u' || {prefix}.sender_id || ' u' || {prefix}.receiver_id"
+    connection.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS message_search_insert AFTER INSERT ON message BEGIN "
+            "INSERT INTO message_search (rowid, content, participants) "
+            f"VALUES ({values.format(prefix='new')}); END"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS message_search_delete AFTER DELETE ON message BEGIN "
+            "INSERT INTO message_search (message_search, rowid, content, participants) "
+            f"VALUES ('delete', {values.format(prefix='old')}); END"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS message_search_update "
+            "AFTER UPDATE OF content, sender_id, receiver_id ON message BEGIN "
+            "INSERT INTO message_search (message_search, rowid, content, participants) "
+            f"VALUES ('delete', {values.format(prefix='old')}); "
+            "INSERT INTO message_search (rowid, content, participants) "
+            f"VALUES ({values.format(prefix='new')}); END"
+        )
+    )
+    connection.execute(text("INSERT INTO message_search (message_search) VALUES ('rebuild')"))
+
+
+def schema_version(connection: Connection) -> int:
+    """
+    Текущая версия схемы базы.
+
+    :param connection: Соединение БД.
+    :type connection: Connection
+    :return: Значение PRAGMA user_version.
+    :rtype: int
+    """
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(connection: Connection) -> int:
+    """
+    Применяет недостающие шаги миграции.
+
+    :param connection: Соединение БД (внутри транзакции).
+    :type connection: Connection
+    :return: Количество применённых шагов.
+    :rtype: int
+    """
+    version = schema_version(connection)
+    for step in MIGRATIONS[version:]:
+        step(connection)
+    if version < len(MIGRATIONS):
+        connection.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
+    return max(0, len(MIGRATIONS) - version)
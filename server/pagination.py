@@ -0,0 +1,119 @@
+"""
+Непрозрачные курсоры постраничной выдачи (keyset pagination).
+
+Курсор хранит направление и ID последней записи страницы: следующая страница
+запрашивается условием `id < X` или `id > X` по индексу, а не OFFSET, поэтому
+время выборки не растёт с номером страницы. Клиент не разбирает курсор,
+а только возвращает его в следующем запросе.
+"""
+
+import base64
+import binascii
+
+from server.exceptions import PacketValidationError
+
+BEFORE = "b"
+"""Записи с ID меньше курсора (более ранние сообщения)."""
+
+AFTER = "a"
+"""Записи с ID больше курсора (более новые сообщения, следующие пользователи)."""
+
+RANKED = "r"
+"""Записи после (ранг, ID) курсора в выдаче, упорядоченной по рангу (поиск)."""
+
+
+def encode_cursor(direction: str, last_id: int) -> str:
+    """
+    Кодирует курсор следующей страницы.
+
+    :param direction: Направление (BEFORE или AFTER).
+    :type direction: str
+    :param last_id: ID последней записи страницы.
+    :type last_id: int
+    :return: Курсор.
+    :rtype: str
+    """
+    return _encode(f"{direction}{last_id}")
+
+
+def decode_cursor(cursor: str, expected: str | None = None) -> tuple[str, int]:
+    """
+    Разбирает курсор из запроса клиента.
+
+    :param cursor: Курсор.
+    :type cursor: str
+    :param expected: Единственное допустимое направление (None - любое).
+    :type expected: str | None
+    :return: Направление и ID.
+    :rtype: tuple[str, int]
+    :raises PacketValidationError: Если курсор повреждён или направлен не туда.
+    """
+    raw = _decode(cursor)
+    try:
+        direction, last_id = raw[:1], int(raw[1:])
+    except ValueError as e:
+        raise PacketValidationError("Неверный курсор") from e
+    if direction not in (BEFORE, AFTER) or last_id < 0:
+        raise PacketValidationError("Неверный курсор")
+    if expected is not None and direction != expected:
+        raise PacketValidationError("Курсор от другой выдачи")
+    return direction, last_id
+
+
+def encode_ranked_cursor(rank: int, last_id: int) -> str:
+    """
+    Кодирует курсор следующей страницы выдачи, упорядоченной по (ранг, ID).
+
+    :param rank: Ранг последней записи страницы.
+    :type rank: int
+    :param last_id: ID последней записи страницы.
+    :type last_id: int
+    :return: Курсор.
+    :rtype: str
+    """
+    return _encode(f"{RANKED}{rank}:{last_id}")
+
+
+def decode_ranked_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Разбирает курсор выдачи, упорядоченной по (ранг, ID).
+
+    :param cursor: Курсор.
+    :type cursor: str
+    :return: Ранг и ID.
+    :rtype: tuple[int, int]
+    :raises PacketValidationError: Если курсор повреждён.
+    """
+    raw = _decode(cursor)
+    rank, sep, last_id = raw[1:].partition(":")
+    if raw[:1] != RANKED or not sep or not rank.isdigit() or not last_id.isdigit():
+        raise PacketValidationError("Неверный курсор")
+    return int(rank), int(last_id)
+
+
+def _encode(raw: str) -> str:
+    """
+    Кодирует содержимое курсора в base64 без выравнивания.
+
+    :param raw: Содержимое курсора.
+    :type raw: str
+    :return: Курсор.
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> str:
+    """
+    Декодирует курсор из base64.
+
+    :param cursor: Курсор.
+    :type cursor: str
+    :return: Содержимое курсора.
+    :rtype: str
+    :raises PacketValidationError: Если курсор не base64.
+    """
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise PacketValidationError("Неверный курсор") from e
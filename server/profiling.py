@@ -0,0 +1,440 @@
+import os
+import time
+import asyncio
+import cProfile
+import contextvars
+import tracemalloc
+from typing import Callable, Dict, Iterable
+
+from server import logger
+
+MODE_CPROFILE = "cprofile"
+MODE_TRACEMALLOC = "tracemalloc"
+MODES = (MODE_CPROFILE, MODE_TRACEMALLOC)
+
+DEFAULT_PROFILE_DIR = "profiles"
+
+CONFIG = {
+    "PROFILE_DIR": DEFAULT_PROFILE_DIR,
+    "SLOW_THRESHOLD": 0.0,
+    "ACTIONS": frozenset(),
+}
+
+log = logger.get_logger(logger.CATEGORY_PROFILING)
+slow_log = logger.get_logger(logger.CATEGORY_SLOW)
+
+
+def setup_profiling(profile_dir: str, slow_threshold_ms: float, actions: Iterable[str] = ()):
+    """
+    Конфигурирует профилирование.
+
+    :param profile_dir: Каталог для файлов pstats и снимков tracemalloc.
+    :type profile_dir: str
+    :param slow_threshold_ms: Порог журнала медленных запросов (мс, 0 - выключен).
+    :type slow_threshold_ms: float
+    :param actions: Действия роутера, которые можно профилировать по имени.
+    :type actions: Iterable[str]
+    """
+    CONFIG["PROFILE_DIR"] = profile_dir
+    CONFIG["SLOW_THRESHOLD"] = slow_threshold_ms / 1000
+    CONFIG["ACTIONS"] = frozenset(actions)
+
+
+class RequestTimings:
+    """
+    Время фаз одного запроса для журнала медленных запросов (секунды).
+    """
+
+    __slots__ = ("decrypt", "validate", "db", "reply")
+
+    def __init__(self, decrypt: float = 0.0):
+        """
+        Создаёт замер запроса.
+
+        :param decrypt: Время расшифровки и распаковки пакета.
+        :type decrypt: float
+        """
+        self.decrypt = decrypt
+        self.validate = 0.0
+        self.db = 0.0
+        self.reply = 0.0
+
+
+current_timings: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar(
+    "current_timings", default=None
+)
+"""Замер запроса, который сейчас обрабатывается (None - журнал выключен)."""
+
+
+def slow_log_enabled() -> bool:
+    """
+    Включён ли журнал медленных запросов.
+
+    :return: True, если запросы нужно замерять.
+    :rtype: bool
+    """
+    return CONFIG["SLOW_THRESHOLD"] > 0
+
+
+def add_phase(phase: str, elapsed: float):
+    """
+    Добавляет время к фазе текущего запроса (если он замеряется).
+
+    :param phase: Фаза (`db` или `reply`).
+    :type phase: str
+    :param elapsed: Время (секунды).
+    :type elapsed: float
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        setattr(timings, phase, getattr(timings, phase) + elapsed)
+
+
+def phase_time(phase: str) -> float:
+    """
+    Накопленное время фазы текущего запроса.
+
+    :param phase: Фаза (`db` или `reply`).
+    :type phase: str
+    :return: Время (секунды), 0 - если запрос не замеряется.
+    :rtype: float
+    """
+    timings = current_timings.get()
+    return getattr(timings, phase) if timings is not None else 0.0
+
+
+def report_if_slow(ctx, action: str, request_id: int | None, timings: RequestTimings, handler: float):
+    """
+    Пишет запрос в журнал медленных запросов, если он дольше порога.
+
+    :param ctx: Контекст соединения.
+    :param action: Действие.
+    :type action: str
+    :param request_id: ID запроса.
+    :type request_id: int | None
+    :param timings: Замер фаз запроса.
+    :type timings: RequestTimings
+    :param handler: Полное время вызова эндпоинта (включая БД и ответ).
+    :type handler: float
+    """
+    total = timings.decrypt + timings.validate + handler
+    if total < CONFIG["SLOW_THRESHOLD"]:
+        return
+
+    slow_log.warning(
+        "Медленный запрос",
+        extra={
+            "action": action,
+            "request_id": request_id,
+            **logger.peer_fields(ctx.peer_name),
+            "user_id": ctx.user_id,
+            "total_ms": round(total * 1000, 3),
+            "decrypt_ms": round(timings.decrypt * 1000, 3),
+            "validate_ms": round(timings.validate * 1000, 3),
+            "db_ms": round(timings.db * 1000, 3),
+            "reply_ms": round(timings.reply * 1000, 3),
+            "handler_ms": round(max(handler - timings.db - timings.reply, 0.0) * 1000, 3),
+        },
+    )
+
+
+class ProfileSession:
+    """
+    Один запуск профилировщика: следующие N вызовов действия или все действия за окно времени.
+    """
+
+    def __init__(self, mode: str, action: str | None, calls: int | None, seconds: float | None):
+        """
+        Создаёт сессию профилирования.
+
+        :param mode: `cprofile` или `tracemalloc`.
+        :type mode: str
+        :param action: Действие (None - все действия).
+        :type action: str | None
+        :param calls: Сколько вызовов действия профилировать.
+        :type calls: int | None
+        :param seconds: Окно времени (секунды).
+        :type seconds: float | None
+        """
+        self.mode = mode
+        self.action = action
+        self.remaining = calls
+        self.seconds = seconds
+        self.running = 0
+        self.profiled = 0
+        self.started_at = time.time()
+        self.profile = cProfile.Profile() if mode == MODE_CPROFILE else None
+        self.own_tracemalloc = False
+        self.baseline: tracemalloc.Snapshot | None = None
+        self.timer: asyncio.TimerHandle | None = None
+
+    def matches(self, action: str) -> bool:
+        """
+        Профилируется ли вызов действия.
+
+        :param action: Действие.
+        :type action: str
+        :return: True, если вызов нужно профилировать.
+        :rtype: bool
+        """
+        if self.remaining is None:
+            return False
+        return self.remaining > 0 and (self.action is None or self.action == action)
+
+    def describe(self) -> dict:
+        """
+        Состояние сессии для ответа админ эндпоинта.
+
+        :return: Параметры и прогресс.
+        :rtype: dict
+        """
+        return {
+            "mode": self.mode,
+            "action": self.action,
+            "remaining_calls": self.remaining,
+            "seconds": self.seconds,
+            "profiled_calls": self.profiled,
+            "started_at": self.started_at,
+        }
+
+
+class Profiler:
+    """
+    Профилировщик, включаемый администратором на работающем сервере.
+
+    cProfile профилирует весь поток event loop, поэтому пока идут профилируемые
+    вызовы, в профиль попадает и работа других задач, выполнявшихся в то же время.
+    """
+
+    def __init__(self):
+        """
+        Создаёт выключенный профилировщик.
+        """
+        self.session: ProfileSession | None = None
+        self.last_result: str | None = None
+
+    @property
+    def active(self) -> bool:
+        """
+        Идёт ли профилирование по вызовам (проверка на горячем пути роутера).
+
+        :return: True, если вызовы действий нужно отслеживать.
+        :rtype: bool
+        """
+        return self.session is not None and self.session.remaining is not None
+
+    def start(
+        self,
+        mode: str = MODE_CPROFILE,
+        action: str | None = None,
+        calls: int | None = None,
+        seconds: float | None = None,
+    ) -> dict:
+        """
+        Запускает профилирование.
+
+        С `calls` профилируются следующие N вызовов действия `action` (или любых
+        действий), с `seconds` - всё, что выполняется в окне времени.
+
+        :param mode: `cprofile` или `tracemalloc`.
+        :type mode: str
+        :param action: Действие (None - все действия).
+        :type action: str | None
+        :param calls: Сколько вызовов профилировать.
+        :type calls: int | None
+        :param seconds: Окно времени (секунды).
+        :type seconds: float | None
+        :return: Состояние сессии.
+        :rtype: dict
+        :raises ValueError: Если параметры некорректны или профилирование уже идёт.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        # Вызовов несуществующего действия не будет: сессия осталась бы запущенной навсегда.
+        # Имя действия к тому же входит в имя файла результата.
+        if action is not None and action not in CONFIG["ACTIONS"]:
+            raise ValueError(f"Неизвестное действие: {action}")
+        if (calls is None) == (seconds is None):
+            raise ValueError("Нужно указать либо calls, либо seconds")
+        if (calls is not None and calls < 1) or (seconds is not None and seconds <= 0):
+            raise ValueError("calls и seconds должны быть положительными")
+        if self.session is not None:
+            raise ValueError("Профилирование уже запущено")
+
+        session = ProfileSession(mode, action, calls, seconds)
+        self.session = session
+
+        if mode == MODE_TRACEMALLOC:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                session.own_tracemalloc = True
+            session.baseline = tracemalloc.take_snapshot()
+
+        if seconds is not None:
+            if session.profile is not None:
+                session.profile.enable()
+            session.timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+
+        log.warning("Профилирование запущено", extra=session.describe())
+        return session.describe()
+
+    def begin(self, action: str) -> bool:
+        """
+        Начало вызова действия (вызывается роутером, только если `active`).
+
+        :param action: Действие.
+        :type action: str
+        :return: True, если вызов профилируется (тогда нужно вызвать `end`).
+        :rtype: bool
+        """
+        session = self.session
+        if session is None or not session.matches(action):
+            return False
+
+        session.remaining -= 1
+        if session.running == 0 and session.profile is not None:
+            session.profile.enable()
+        session.running += 1
+        return True
+
+    def end(self):
+        """
+        Конец профилируемого вызова.
+        """
+        session = self.session
+        if session is None:
+            return
+
+        session.running -= 1
+        session.profiled += 1
+        if session.running == 0:
+            if session.profile is not None:
+                session.profile.disable()
+            if session.remaining == 0:
+                self.stop()
+
+    def stop(self) -> str | None:
+        """
+        Останавливает профилирование и записывает результат в файл.
+
+        Вызывается и из роутера после профилируемого запроса, поэтому ошибка
+        записи файла только логируется.
+
+        :return: Путь к файлу pstats или снимку tracemalloc (None - профилирование
+            не шло или результат не записан).
+        :rtype: str | None
+        """
+        session = self.session
+        if session is None:
+            return None
+        self.session = None
+
+        if session.timer is not None:
+            session.timer.cancel()
+
+        snapshot = None
+        if session.profile is not None:
+            session.profile.disable()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            if session.own_tracemalloc:
+                tracemalloc.stop()
+
+        name = f"{session.mode}-{session.action or 'all'}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        try:
+            os.makedirs(CONFIG["PROFILE_DIR"], exist_ok=True)
+            if snapshot is None:
+                path = os.path.join(CONFIG["PROFILE_DIR"], f"{name}.pstats")
+                session.profile.dump_stats(path)
+            else:
+                path = os.path.join(CONFIG["PROFILE_DIR"], f"{name}.snapshot")
+                snapshot.dump(path)
+        except OSError as ex:
+            log.error("Не удалось записать профиль: %s", ex)
+            return None
+
+        if snapshot is not None:
+            for stat in snapshot.compare_to(session.baseline, "lineno")[:10]:
+                log.info("tracemalloc: %s", stat)
+
+        self.last_result = path
+        log.warning("Профиль записан: %s", path, extra={"profiled_calls": session.profiled})
+        return path
+
+    def status(self) -> dict:
+        """
+        Состояние профилировщика.
+
+        :return: Текущая сессия, последний файл результата и порог журнала медленных запросов.
+        :rtype: dict
+        """
+        return {
+            "session": self.session.describe() if self.session else None,
+            "last_result": self.last_result,
+            "slow_threshold_ms": CONFIG["SLOW_THRESHOLD"] * 1000,
+        }
+
+
+profiler = Profiler()
+"""Профилировщик текущего процесса."""
+
+
+def _admin_profile(params: Dict[str, str]) -> dict:
+    """
+    Админ эндпоинт `/profile`: без параметров - состояние, с `calls` или `seconds` - запуск.
+
+    Параметры: `mode` (cprofile, tracemalloc), `action`, `calls`, `seconds`.
+
+    :param params: Параметры запроса.
+    :type params: Dict[str, str]
+    :return: Состояние профилировщика.
+    :rtype: dict
+    :raises ValueError: Если параметры некорректны.
+    """
+    if "calls" in params or "seconds" in params:
+        profiler.start(
+            params.get("mode", MODE_CPROFILE),
+            params.get("action") or None,
+            int(params["calls"]) if "calls" in params else None,
+            float(params["seconds"]) if "seconds" in params else None,
+        )
+    return profiler.status()
+
+
+def _admin_profile_stop(params: Dict[str, str]) -> dict:
+    """
+    Админ эндпоинт `/profile/stop`: досрочная остановка с записью результата.
+
+    :param params: Параметры запроса.
+    :type params: Dict[str, str]
+    :return: Состояние профилировщика.
+    :rtype: dict
+    """
+    profiler.stop()
+    return profiler.status()
+
+
+def _admin_slowlog(params: Dict[str, str]) -> dict:
+    """
+    Админ эндпоинт `/slowlog`: `threshold_ms` меняет порог журнала медленных запросов (0 - выключить).
+
+    :param params: Параметры запроса.
+    :type params: Dict[str, str]
+    :return: Состояние профилировщика.
+    :rtype: dict
+    :raises ValueError: Если порог некорректен.
+    """
+    if "threshold_ms" in params:
+        threshold_ms = float(params["threshold_ms"])
+        if threshold_ms < 0:
+            raise ValueError("threshold_ms не может быть отрицательным")
+        CONFIG["SLOW_THRESHOLD"] = threshold_ms / 1000
+    return profiler.status()
+
+
+ADMIN_ROUTES: Dict[str, Callable[[Dict[str, str]], dict]] = {
+    "/profile": _admin_profile,
+    "/profile/stop": _admin_profile_stop,
+    "/slowlog": _admin_slowlog,
+}
+"""Админ эндпоинты профилирования для listener метрик."""
@@ -0,0 +1,275 @@
+"""
+Поиск по индексам SQLite FTS5.
+
+Таблицы FTS5 создаются миграцией (`server.migrations`), если сборка SQLite
+поддерживает FTS5 (и trigram для пользователей). Иначе поиск работает через
+LIKE '%q%' по исходной таблице - медленнее (полный просмотр). Пользователи
+ищутся по подстроке (trigram, от 3 символов, более короткие запросы тоже
+идут через LIKE), сообщения - по словам.
+"""
+
+import re
+import weakref
+
+from sqlalchemy import text, table, column, case, or_, and_, literal_column
+from sqlmodel import select, col
+
+from server.db_models import User, Message, conversation_key
+from server.exceptions import PacketValidationError
+
+USER_SEARCH_TABLE = "user_search"
+"""FTS5 таблица по login и username пользователей (rowid = User.id)."""
+
+MESSAGE_SEARCH_TABLE = "message_search"
+"""FTS5 таблица по тексту и участникам сообщений (rowid = Message.id)."""
+
+SNIPPET_TOKENS = 12
+"""Слов во фрагменте найденного сообщения."""
+
+MAX_SEARCH_TERMS = 8
+"""Максимум слов в запросе поиска сообщений."""
+
+MIN_TRIGRAM_QUERY = 3
+"""Минимальная длина запроса для поиска по trigram индексу."""
+
+RANK_EXACT, RANK_PREFIX, RANK_SUBSTRING = 0, 1, 2
+"""Ранги совпадения: весь login/username, начало, подстрока."""
+
+_available: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+"""Кеш наличия FTS таблиц: движок -> {таблица: есть ли}."""
+
+
+async def fts_available(session, name: str) -> bool:
+    """
+    Есть ли FTS таблица в базе сессии (проверка кешируется на движок).
+
+    :param session: Асинхронная сессия БД.
+    :param name: Имя FTS таблицы.
+    :type name: str
+    :return: True, если таблица создана миграцией.
+    :rtype: bool
+    """
+    tables = _available.setdefault(session.bind.sync_engine, {})
+    if name not in tables:
+        result = await session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": name},
+        )
+        tables[name] = result.scalar() is not None
+    return tables[name]
+
+
+def escape_like(value: str) -> str:
+    """
+    Экранирует спецсимволы LIKE (escape-символ - обратный слеш).
+
+    :param value: Строка поиска.
+    :type value: str
+    :return: Строка без подстановочных символов.
+    :rtype: str
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fts_phrase(value: str) -> str:
+    """
+    Строка запроса FTS5 как одна фраза (операторы FTS5 не разбираются).
+
+    :param value: Строка поиска.
+    :type value: str
+    :return: Фраза в двойных кавычках.
+    :rtype: str
+    """
+    return '"' + value.replace('"', '""') + '"'
+
+
+def user_rank(query: str):
+    """
+    Ранг совпадения пользователя с запросом (без учёта регистра ASCII).
+
+    :param query: Строка поиска.
+    :type query: str
+    :return: SQL выражение RANK_EXACT / RANK_PREFIX / RANK_SUBSTRING.
+    """
+    exact = escape_like(query)
+    prefix = exact + "%"
+    return case(
+        (
+            or_(
+                col(User.login).like(exact, escape="\\"),
+                col(User.username).like(exact, escape="\\"),
+            ),
+            RANK_EXACT,
+        ),
+        (
+            or_(
+                col(User.login).like(prefix, escape="\\"),
+                col(User.username).like(prefix, escape="\\"),
+            ),
+            RANK_PREFIX,
+        ),
+        else_=RANK_SUBSTRING,
+    )
+
+
+def user_search_query(
+    query: str, use_fts: bool, after: tuple[int, int] | None = None
+):
+    """
+    Запрос поиска пользователей по подстроке login или username.
+
+    Результаты упорядочены по рангу (точное совпадение, начало, подстрока),
+    внутри ранга - по ID, поэтому страницы листаются курсором по (ранг, ID).
+
+    :param query: Строка поиска.
+    :type query: str
+    :param use_fts: Искать по таблице USER_SEARCH_TABLE (иначе LIKE).
+    :type use_fts: bool
+    :param after: (ранг, ID) последней записи прошлой страницы.
+    :type after: tuple[int, int] | None
+    :return: SELECT (User, ранг) без LIMIT.
+    """
+    rank = user_rank(query).label("rank")
+    statement = select(User, rank)
+
+    if use_fts and len(query) >= MIN_TRIGRAM_QUERY:
+        index = table(USER_SEARCH_TABLE, column("rowid"))
+        statement = statement.join(index, index.c.rowid == User.id).where(
+            text(f"{USER_SEARCH_TABLE} MATCH :phrase").bindparams(phrase=fts_phrase(query))
+        )
+    else:
+        pattern = f"%{escape_like(query)}%"
+        statement = statement.where(
+            or_(
+                col(User.login).like(pattern, escape="\\"),
+                col(User.username).like(pattern, escape="\\"),
+            )
+        )
+
+    if after is not None:
+        last_rank, last_id = after
+        statement = statement.where(
+            or_(rank > last_rank, and_(rank == last_rank, User.id > last_id))
+        )
+    return statement.order_by(rank, col(User.id))
+
+
+def search_terms(query: str) -> list[str]:
+    """
+    Слова запроса поиска сообщений (без знаков препинания).
+
+    :param query: Строка поиска.
+    :type query: str
+    :return: Слова (не больше MAX_SEARCH_TERMS).
+    :rtype: list[str]
+    :raises PacketValidationError: Если в запросе нет слов.
+    """
+    terms = re.findall(r"\w+", query)[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise PacketValidationError("Пустой поисковый запрос")
+    return terms
+
+
+def participant_token(user_id: int) -> str:
+    """
+    Токен участника диалога в индексе MESSAGE_SEARCH_TABLE.
+
+    :param user_id: ID пользователя.
+    :type user_id: int
+    :return: Токен "u<ID>".
+    :rtype: str
+    """
+    return f"u{user_id}"
+
+
+def message_match(terms: list[str], user_id: int, target_id: int | None = None) -> str:
+    """
+    Запрос FTS5: все слова запроса в диалогах пользователя.
+
+    Слова ищутся целиком: поиск по началу слова (`"сло"*`) объединяет
+    списки всех подходящих слов и на частых словах в разы медленнее.
+
+    :param terms: Слова запроса.
+    :type terms: list[str]
+    :param user_id: ID пользователя, в чьих диалогах искать.
+    :type user_id: int
+    :param target_id: Только диалог с этим собеседником.
+    :type target_id: int | None
+    :return: Строка для MATCH.
+    :rtype: str
+    """
+    phrases = [fts_phrase(term) for term in terms]
+    participants = [fts_phrase(participant_token(user_id))]
+    if target_id is not None:
+        participants.append(fts_phrase(participant_token(target_id)))
+    return " AND ".join(
+        [f"participants : {phrase}" for phrase in participants]
+        + [f"content : ({' '.join(phrases)})"]
+    )
+
+
+def message_search_query(
+    query: str,
+    user_id: int,
+    use_fts: bool,
+    target_id: int | None = None,
+    before_id: int | None = None,
+):
+    """
+    Запрос поиска сообщений в диалогах пользователя, от новых к старым.
+
+    С FTS5 выборка идёт по индексу в порядке rowid: участники и слова
+    пересекаются в индексе, LIMIT останавливает поиск на первой странице.
+
+    :param query: Строка поиска.
+    :type query: str
+    :param user_id: ID текущего пользователя.
+    :type user_id: int
+    :param use_fts: Искать по таблице MESSAGE_SEARCH_TABLE (иначе LIKE).
+    :type use_fts: bool
+    :param target_id: Только диалог с этим собеседником.
+    :type target_id: int | None
+    :param before_id: Только сообщения с меньшим ID (курсор).
+    :type before_id: int | None
+    :return: SELECT (Message, User.login отправителя, фрагмент) без LIMIT.
+    :raises PacketValidationError: Если в запросе нет слов.
+    """
+    terms = search_terms(query)
+
+    if use_fts:
+        index = table(MESSAGE_SEARCH_TABLE, column("rowid"))
+        snippet = literal_column(
+            f"snippet({MESSAGE_SEARCH_TABLE}, 0, '[', ']', '...', {SNIPPET_TOKENS})"
+        )
+        statement = (
+            select(Message, User.login, snippet.label("snippet"))
+            .select_from(index)
+            .join(Message, Message.id == index.c.rowid)
+            .join(User, User.id == Message.sender_id)
+            .where(
+                text(f"{MESSAGE_SEARCH_TABLE} MATCH :match").bindparams(
+                    match=message_match(terms, user_id, target_id)
+                )
+            )
+        )
+        if before_id is not None:
+            statement = statement.where(index.c.rowid < before_id)
+        return statement.order_by(index.c.rowid.desc())
+
+    statement = (
+        select(Message, User.login, col(Message.content).label("snippet"))
+        .join(User, User.id == Message.sender_id)
+        .where(*(col(Message.content).like(f"%{escape_like(term)}%", escape="\\") for term in terms))
+    )
+    if target_id is not None:
+        low, high = conversation_key(user_id, target_id)
+        statement = statement.where(
+            Message.conversation_low == low, Message.conversation_high == high
+        )
+    else:
+        statement = statement.where(
+            or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+        )
+    if before_id is not None:
+        statement = statement.where(Message.id < before_id)
+    return statement.order_by(col(Message.id).desc())
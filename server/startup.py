@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """
+    Замер фаз холодного старта сервера.
+    """
+
+    def __init__(self, started_at: float | None = None):
+        """
+        Создаёт профиль старта.
+
+        :param started_at: Момент начала отсчёта (`time.perf_counter`).
+        :type started_at: float | None
+        """
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    def add(self, name: str, duration: float):
+        """
+        Добавляет уже замеренную фазу.
+
+        :param name: Название фазы.
+        :type name: str
+        :param duration: Длительность (секунды).
+        :type duration: float
+        """
+        self.phases.append((name, duration))
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Контекстный менеджер замера фазы.
+
+        :param name: Название фазы.
+        :type name: str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def total(self) -> float:
+        """
+        Время от начала отсчёта до текущего момента.
+
+        :return: Длительность (секунды).
+        :rtype: float
+        """
+        return time.perf_counter() - self.started_at
+
+    def report(self) -> str:
+        """
+        Формирует текстовый отчёт по фазам.
+
+        :return: Отчёт.
+        :rtype: str
+        """
+        lines = ["[STARTUP] Профиль холодного старта:"]
+        for name, duration in self.phases:
+            lines.append(f"[STARTUP]   {name:<20} {duration * 1000:8.1f} ms")
+        lines.append(f"[STARTUP]   {'total':<20} {self.total() * 1000:8.1f} ms")
+        return "\n".join(lines)
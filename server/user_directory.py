@@ -0,0 +1,242 @@
+"""
+Кэш справочника пользователей в памяти процесса: ID -> login, username.
+
+Отправка сообщения проверяет, что получатель существует, и берёт логин
+отправителя для `new_message`. Эти данные почти не меняются, поэтому
+горячий путь отправки берёт их из LRU кэша, а не из таблицы user.
+Кэш заполняется при регистрации и входе, по промахам (лениво) и, по флагу
+сервера, при старте (`warm`). Отсутствующие пользователи не кэшируются:
+пользователь мог зарегистрироваться в другом воркере.
+
+Кэш свой у каждого процесса. Код, меняющий login/username или удаляющий
+пользователя, должен вызвать `invalidate` (или `put` с новыми данными).
+"""
+
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from sqlmodel import select, col
+
+from server import metrics
+from server.db_models import User
+
+DEFAULT_USER_CACHE_SIZE = 100_000
+"""Максимум пользователей в кэше по умолчанию."""
+
+
+class DirectoryEntry:
+    """
+    Запись справочника: неизменяемые на горячем пути поля пользователя.
+    """
+
+    __slots__ = ("id", "login", "username")
+
+    def __init__(self, user_id: int, login: str, username: str):
+        """
+        Создаёт запись.
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        :param login: Логин.
+        :type login: str
+        :param username: Имя пользователя.
+        :type username: str
+        """
+        self.id = user_id
+        self.login = login
+        self.username = username
+
+
+class UserDirectory:
+    """
+    LRU кэш пользователей процесса с подгрузкой промахов из БД.
+
+    Используется только из event loop, поэтому без блокировок.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_USER_CACHE_SIZE):
+        """
+        Создаёт пустой кэш.
+
+        :param max_size: Максимум записей (0 - кэш отключён, всё читается из БД).
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self._entries: OrderedDict[int, DirectoryEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> DirectoryEntry | None:
+        """
+        Возвращает пользователя из кэша (без обращения к БД).
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        :return: Запись или None, если пользователя нет в кэше.
+        :rtype: DirectoryEntry | None
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            metrics.user_directory_lookups.inc("miss")
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        metrics.user_directory_lookups.inc("hit")
+        return entry
+
+    def put(self, user_id: int, login: str, username: str) -> DirectoryEntry:
+        """
+        Запоминает (или обновляет) пользователя.
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        :param login: Логин.
+        :type login: str
+        :param username: Имя пользователя.
+        :type username: str
+        :return: Запись.
+        :rtype: DirectoryEntry
+        """
+        entry = DirectoryEntry(user_id, login, username)
+        if self.max_size <= 0:
+            return entry
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        metrics.user_directory_size.set(len(self._entries))
+        return entry
+
+    def put_user(self, user: User) -> DirectoryEntry:
+        """
+        Запоминает пользователя из модели БД.
+
+        :param user: Пользователь.
+        :type user: User
+        :return: Запись.
+        :rtype: DirectoryEntry
+        """
+        return self.put(user.id, user.login, user.username)
+
+    def invalidate(self, user_id: int):
+        """
+        Забывает пользователя (после смены login/username или удаления).
+
+        :param user_id: ID пользователя.
+        :type user_id: int
+        """
+        self._entries.pop(user_id, None)
+        metrics.user_directory_size.set(len(self._entries))
+
+    async def resolve(
+        self, session_maker: Callable, user_ids: Iterable[int]
+    ) -> dict[int, DirectoryEntry]:
+        """
+        Пользователи по ID: из кэша, промахи - одним запросом к БД.
+
+        :param session_maker: Фабрика сессий для чтения.
+        :type session_maker: Callable
+        :param user_ids: ID пользователей.
+        :type user_ids: Iterable[int]
+        :return: Найденные пользователи по ID (несуществующих в словаре нет).
+        :rtype: dict[int, DirectoryEntry]
+        """
+        found = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            entry = self.get(user_id)
+            if entry is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = entry
+
+        if missing:
+            async with session_maker() as session:
+                result = await session.execute(
+                    select(User.id, User.login, User.username).where(col(User.id).in_(missing))
+                )
+                for user_id, login, username in result.all():
+                    found[user_id] = self.put(user_id, login, username)
+        return found
+
+    async def warm(self, session_maker: Callable) -> int:
+        """
+        Загружает в кэш последних зарегистрированных пользователей (до max_size).
+
+        :param session_maker: Фабрика сессий для чтения.
+        :type session_maker: Callable
+        :return: Загружено пользователей.
+        :rtype: int
+        """
+        if self.max_size <= 0:
+            return 0
+        async with session_maker() as session:
+            result = await session.execute(
+                select(User.id, User.login, User.username)
+                .order_by(col(User.id).desc())
+                .limit(self.max_size)
+            )
+            rows = result.all()
+        # Старые идут первыми, чтобы новые вытеснялись последними
+        for user_id, login, username in reversed(rows):
+            self.put(user_id, login, username)
+        return len(rows)
+
+    def clear(self):
+        """
+        Очищает кэш.
+        """
+        self._entries.clear()
+        metrics.user_directory_size.set(0)
+
+    def reset_stats(self):
+        """
+        Обнуляет счётчики попаданий.
+        """
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Снимок счётчиков.
+
+        :return: Попадания, промахи, доля попаданий и размер кэша.
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+
+directory = UserDirectory()
+"""Справочник пользователей текущего процесса."""
+
+
+def setup_user_directory(max_size: int = DEFAULT_USER_CACHE_SIZE) -> UserDirectory:
+    """
+    Настройка размера кэша пользователей (кэш очищается).
+
+    :param max_size: Максимум записей (0 - отключить кэш).
+    :type max_size: int
+    :return: Справочник процесса.
+    :rtype: UserDirectory
+    """
+    directory.max_size = max_size
+    directory.clear()
+    directory.reset_stats()
+    return directory
+
+
+def invalidate(user_id: int):
+    """
+    Хук для кода, меняющего login/username или удаляющего пользователя.
+
+    :param user_id: ID пользователя.
+    :type user_id: int
+    """
+    directory.invalidate(user_id)
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from server.bus import BusClient, DeliveryBroker
+
+
+class Inbox:
+    """Локальная доставка воркера: запоминает ответы подключенных пользователей."""
+
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.received = []
+
+    async def deliver(self, user_id, status, data):
+        if user_id not in self.user_ids:
+            return False
+        self.received.append((user_id, status, data))
+        return True
+
+
+@pytest.fixture
+async def broker(tmp_path):
+    """Брокер доставки на временном Unix сокете."""
+    broker = DeliveryBroker(str(tmp_path / "bus.sock"))
+    await broker.start()
+    yield broker
+    await broker.close()
+
+
+async def connect(broker, inbox):
+    client = BusClient(broker.socket_path, inbox.deliver)
+    await client.connect()
+    return client
+
+
+async def test_deliver_to_other_worker(broker):
+    """Тест: доставка уходит в воркер, где подключен получатель, и подтверждается"""
+    inbox_a, inbox_b = Inbox([]), Inbox([2])
+    worker_a = await connect(broker, inbox_a)
+    worker_b = await connect(broker, inbox_b)
+
+    worker_b.online(2)
+    await asyncio.sleep(0.05)
+
+    assert await worker_a.deliver(2, "new_message", "x" * 200_000, timeout=2) is True
+    assert inbox_b.received == [(2, "new_message", "x" * 200_000)]
+    assert broker.routed == 1
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_deliver_to_offline_user(broker):
+    """Тест: доставка пользователю без соединения подтверждается как неуспешная"""
+    inbox_a, inbox_b = Inbox([]), Inbox([2])
+    worker_a = await connect(broker, inbox_a)
+    worker_b = await connect(broker, inbox_b)
+
+    worker_b.online(2)
+    worker_b.offline(2)
+    await asyncio.sleep(0.05)
+
+    assert await worker_a.deliver(2, "new_message", "hi", timeout=2) is False
+    assert inbox_b.received == []
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_worker_disconnect_forgets_users(broker):
+    """Тест: после отключения воркера его пользователи считаются оффлайн"""
+    worker_a = await connect(broker, Inbox([]))
+    worker_b = await connect(broker, Inbox([2]))
+
+    worker_b.online(2)
+    await asyncio.sleep(0.05)
+    await worker_b.close()
+    await asyncio.sleep(0.05)
+
+    assert await worker_a.deliver(2, "new_message", "hi", timeout=2) is False
+
+    await worker_a.close()
+
+
+class SlowInbox(Inbox):
+    """Локальная доставка, которая подтверждает позже таймаута отправителя."""
+
+    async def deliver(self, user_id, status, data):
+        await asyncio.sleep(0.2)
+        return await super().deliver(user_id, status, data)
+
+
+async def test_unconfirmed_delivery_is_unknown(broker):
+    """Тест: без подтверждения доставка не считается неуспешной - брокер мог её переслать"""
+    inbox_b = SlowInbox([2])
+    worker_a = await connect(broker, Inbox([]))
+    worker_b = await connect(broker, inbox_b)
+
+    worker_b.online(2)
+    await asyncio.sleep(0.05)
+
+    assert await worker_a.deliver(2, "new_message", "hi", timeout=0.05) is None
+    await asyncio.sleep(0.3)
+    assert inbox_b.received == [(2, "new_message", "hi")]
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_stalled_worker_bounds_write_buffers(broker):
+    """Негативный тест: воркер, переставший читать, не раздувает буферы брокера и отправителя"""
+    worker_a = await connect(broker, Inbox([]))
+    worker_b = await connect(broker, Inbox([2]))
+
+    worker_b.online(2)
+    await asyncio.sleep(0.05)
+    worker_b._listener.cancel()
+    await asyncio.sleep(0)
+
+    data = "x" * 256 * 1024
+    for _ in range(40):
+        assert await worker_a.deliver(2, "new_message", data, timeout=0.05) is None
+
+    sent = 40 * len(data)
+    assert worker_a.writer.transport.get_write_buffer_size() < sent / 4
+    assert broker.user_workers[2].transport.get_write_buffer_size() < sent / 4
+
+    await worker_a.close()
+    await worker_b.close()
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import patch
 
 from client.framework import CommandRouter, Context, command
+from dto.models import UserListRequest
 from client.exceptions import (
     ValueErrorCommandException,
     ArgumentMismatchCommandException,
@@ -14,6 +15,9 @@ class MockWriter:
     def write(self, data):
         pass
 
+    def writelines(self, parts):
+        pass
+
     async def drain(self):
         pass
 
@@ -149,3 +153,57 @@ async def test_dispatch_wrong_argument_count():
 
     with pytest.raises(ArgumentMismatchCommandException):
         await router.dispatch("/math")
+
+
+async def test_request_future_resolved_by_request_id():
+    """Тест: ответ сервера попадает в future запроса с тем же request_id"""
+    ctx = Context(MockWriter())
+
+    first = await ctx.request(UserListRequest())
+    second = await ctx.request(UserListRequest())
+
+    assert ctx.resolve({"action": "success", "request_id": 2, "data": "second"})
+    assert ctx.resolve({"action": "success", "request_id": 1, "data": "first"})
+
+    assert (await second)["data"] == "second"
+    assert (await first)["data"] == "first"
+    assert ctx.pending == {}
+
+
+async def test_resolve_unknown_request_id():
+    """Негативный тест: ответ без ожидающего запроса не резолвится"""
+    ctx = Context(MockWriter())
+
+    assert ctx.resolve({"action": "new_message", "request_id": None}) is False
+
+
+async def test_fail_pending_on_disconnect():
+    """Негативный тест: при разрыве соединения ожидающие запросы получают ошибку"""
+    ctx = Context(MockWriter())
+    future = await ctx.request(UserListRequest())
+
+    ctx.fail_pending(ConnectionError("closed"))
+
+    with pytest.raises(ConnectionError):
+        await future
+
+
+async def test_next_pages_follow_cursor():
+    """Тест: ответ с курсором готовит запрос следующей страницы, без курсора - убирает его"""
+    ctx = Context(MockWriter())
+    ctx.token = "token"
+    request = UserListRequest(search_query="ali")
+    ctx.start_pages("user_list_result", request)
+    await ctx.send(request)
+
+    ctx.advance_pages("user_list_result", "YTU")
+    next_request = ctx.next_pages["user_list_result"]
+    assert next_request.cursor == "YTU"
+    assert next_request.search_query == "ali"
+    assert next_request.request_id is None and next_request.token is None
+
+    ctx.advance_pages("message_history_result", "YjE")
+    assert "message_history_result" not in ctx.next_pages
+
+    ctx.advance_pages("user_list_result", None)
+    assert "user_list_result" not in ctx.next_pages
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from server.crypto_executor import CryptoExecutor
+
+
+@pytest.fixture
+def executor():
+    """Создаёт пул из двух потоков с порогом 1 KiB."""
+    pool = CryptoExecutor(max_workers=2, threshold=1024)
+    yield pool
+    pool.shutdown()
+
+
+async def test_small_operation_runs_inline(executor):
+    """Тест: операция меньше порога выполняется в потоке event loop"""
+    result = await executor.run(threading.current_thread, size=10)
+
+    assert result is threading.current_thread()
+    assert executor.stats()["inline_calls"] == 1
+    assert executor.stats()["offloaded_calls"] == 0
+
+
+async def test_large_operation_is_offloaded(executor):
+    """Тест: операция больше порога выносится в пул"""
+    result = await executor.run(threading.current_thread, size=4096)
+
+    assert result is not threading.current_thread()
+    stats = executor.stats()
+    assert stats["offloaded_calls"] == 1
+    assert stats["queue_depth"] == 0
+
+
+async def test_unsized_operation_is_offloaded(executor):
+    """Тест: операция без размера (RSA) всегда выносится в пул"""
+    result = await executor.run(lambda a, b: a + b, 2, 3)
+
+    assert result == 5
+    assert executor.stats()["offloaded_calls"] == 1
+
+
+async def test_disabled_pool_runs_inline():
+    """Тест: без потоков всё выполняется на месте"""
+    pool = CryptoExecutor(max_workers=0)
+
+    result = await pool.run(threading.current_thread)
+
+    assert result is threading.current_thread()
+    assert pool.stats()["inline_calls"] == 1
+
+
+async def test_offloaded_exception_propagates(executor):
+    """Негативный тест: исключение из потока пробрасывается вызывающему"""
+
+    def fail():
+        raise ValueError("fail")
+
+    with pytest.raises(ValueError):
+        await executor.run(fail)
+
+    assert executor.stats()["queue_depth"] == 0
@@ -1,7 +1,7 @@
 import pytest
 from pydantic import ValidationError
 
-from dto.models import RegisterRequest, LoginRequest
+from dto.models import RegisterRequest, LoginRequest, ServerResponse
 
 
 def test_register_request_valid():
@@ -44,3 +44,16 @@ def test_login_request_short_hash():
     """Негативный тест: короткий хеш пароля"""
     with pytest.raises(ValidationError):
         LoginRequest(login="user", password_hash="short")  # Меньше 20 символов хеш пароля
+
+
+def test_server_response_next_cursor_only_when_set():
+    """Тест: next_cursor попадает в ответ только для списков с продолжением"""
+    assert "next_cursor" not in ServerResponse(action="success", data="ok").model_dump_json()
+    response = ServerResponse(action="user_list_result", data=[], next_cursor="YTU")
+    assert response.model_dump(mode="json")["next_cursor"] == "YTU"
+
+
+def test_server_response_accepts_every_reply_action():
+    """Тест: ответы всех эндпоинтов со списками проходят валидацию пакета"""
+    for action in ("user_list_result", "message_history_result", "message_search_result"):
+        assert ServerResponse(action=action, data=[]).action == action
@@ -0,0 +1,34 @@
+import sys
+
+import pytest
+
+import event_loop
+
+
+def test_asyncio_loop_runs_coroutine():
+    """Тест: стандартный loop выполняет корутину и возвращает результат"""
+
+    async def main():
+        return event_loop.current_loop_name()
+
+    assert event_loop.run(main(), event_loop.LOOP_ASYNCIO) == event_loop.LOOP_ASYNCIO
+
+
+def test_uvloop_falls_back_when_missing(monkeypatch):
+    """Тест: без uvloop выбирается стандартный asyncio"""
+    monkeypatch.setitem(sys.modules, "uvloop", None)
+
+    name, factory = event_loop.get_loop_factory(event_loop.LOOP_UVLOOP)
+
+    assert name == event_loop.LOOP_ASYNCIO
+    assert factory is None
+
+
+def test_uvloop_is_used_when_installed():
+    """Тест: при установленном uvloop корутина выполняется на нём"""
+    pytest.importorskip("uvloop")
+
+    async def main():
+        return event_loop.current_loop_name()
+
+    assert event_loop.run(main(), event_loop.LOOP_UVLOOP) == event_loop.LOOP_UVLOOP
@@ -0,0 +1,191 @@
+import json
+import base64
+import asyncio
+import itertools
+
+import pytest
+from cryptography.fernet import Fernet
+
+import security
+import main_server
+import main_client
+from client.framework import Context
+from dto.models import UserListRequest, SendMessageRequest
+from protocol import framing, handshake, compression, codecs
+from server.exceptions import HandshakeError
+
+SERVER_KEY = security.generate_rsa_keys()[0]
+ATTACKER_KEY = security.generate_rsa_keys()[0]
+
+
+@pytest.fixture
+async def server_port():
+    """Поднимает сервер с `handle_client` на loopback и возвращает порт."""
+    main_server.set_server_key(SERVER_KEY)
+    server = await asyncio.start_server(
+        lambda r, w: main_server.handle_client(r, w, None), "127.0.0.1", 0
+    )
+    yield server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+
+async def connect(port: int, **kwargs):
+    """Подключается и проводит handshake клиента."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    ctx = Context(writer)
+    server_key = await main_client.perform_handshake(reader, writer, ctx, **kwargs)
+    return reader, writer, ctx, server_key
+
+
+async def roundtrip(reader, ctx) -> dict:
+    """Отправляет запрос по согласованному каналу и читает ответ."""
+    await ctx.send(UserListRequest(token="bad", page=1, page_size=10))
+    frame = await framing.FrameReader(reader, ctx.framing).read()
+    return ctx.codec.load(ctx.open_payload(frame.payload, frame.flags))
+
+
+async def test_x25519_handshake_is_signed_by_server_key(server_port):
+    """Тест: X25519 handshake проверяется подписью ключа сервера"""
+    reader, writer, ctx, server_key = await connect(server_port, kexes=(security.KEX_X25519,))
+
+    assert security.public_key_fingerprint(server_key) == main_server.SERVER_KEY_ID
+    assert (await roundtrip(reader, ctx))["action"] == "error"
+    writer.close()
+
+
+@pytest.mark.parametrize("known", [False, True])
+async def test_server_key_sent_only_when_unknown(server_port, known):
+    """Тест: ключ сервера не пересылается клиенту, у которого он уже есть"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port)
+    _, public_key = security.generate_x25519_keys()
+    hello = {
+        "kex": [security.KEX_X25519],
+        "public_key": base64.b64encode(security.x25519_public_bytes(public_key)).decode(),
+    }
+    if known:
+        hello["key_id"] = main_server.SERVER_KEY_ID
+    hello_line = handshake.encode_hello(hello)
+    writer.write(hello_line)
+
+    server_hello = handshake.decode_hello(await reader.readline())
+
+    assert ("server_key" in server_hello) is not known
+    security.verify_rsa(
+        SERVER_KEY.public_key(),
+        handshake.transcript(hello_line, server_hello),
+        server_hello["signature"].encode(),
+    )
+    writer.close()
+
+
+@pytest.mark.parametrize("known", [False, True])
+async def test_rsa_handshake(server_port, known):
+    """Тест: RSA обмен с ключом в приветствии (ключ известен) и отдельной строкой"""
+    server_key = SERVER_KEY.public_key() if known else None
+    reader, writer, ctx, _ = await connect(
+        server_port, kexes=(security.KEX_RSA,), server_key=server_key
+    )
+
+    assert (await roundtrip(reader, ctx))["action"] == "error"
+    writer.close()
+
+
+async def test_pinned_key_mismatch_rejected(server_port):
+    """Негативный тест: сервер с другим ключом не проходит закрепление"""
+    main_server.set_server_key(ATTACKER_KEY)
+
+    with pytest.raises(HandshakeError):
+        await connect(server_port, server_key=SERVER_KEY.public_key())
+
+
+async def test_forged_signature_rejected(server_port, monkeypatch):
+    """Негативный тест: подмена X25519 ключа без приватного ключа сервера не проходит"""
+    main_server.set_server_key(ATTACKER_KEY)
+    monkeypatch.setattr(
+        main_server, "SERVER_KEY_ID", security.public_key_fingerprint(SERVER_KEY.public_key())
+    )
+
+    with pytest.raises(HandshakeError):
+        await connect(
+            server_port, kexes=(security.KEX_X25519,), server_key=SERVER_KEY.public_key()
+        )
+
+
+async def test_line_framing_uses_fernet(server_port):
+    """Тест: в строковом фрейминге двоичные AEAD шифры не выбираются"""
+    reader, writer, ctx, _ = await connect(
+        server_port,
+        framings=(framing.FRAMING_LINE,),
+        ciphers=(security.CIPHER_AES_GCM, security.CIPHER_FERNET),
+    )
+
+    assert ctx.cipher.name == security.CIPHER_FERNET
+    assert (await roundtrip(reader, ctx))["action"] == "error"
+    writer.close()
+
+
+async def test_legacy_client(server_port, monkeypatch):
+    """Тест: старый клиент (PEM строка, RSA + Fernet, строки, json-legacy)"""
+    monkeypatch.setattr(main_server, "CLIENT_HELLO_WAIT", 0.01)
+    reader, writer = await asyncio.open_connection("127.0.0.1", server_port)
+
+    server_key = security.pem_to_public_key(base64.b64decode(await reader.readline()))
+    session_key = security.generate_fernet_key()
+    writer.write(security.encrypt_rsa(server_key, session_key) + b"\n")
+    fernet = Fernet(session_key)
+    request = UserListRequest(token="bad", page=1, page_size=10)
+    writer.write(fernet.encrypt(request.model_dump_json().encode()) + b"\n")
+
+    response = json.loads(fernet.decrypt(await reader.readline()))
+
+    assert response["action"] == "error"
+    assert isinstance(response["data"], str)
+    writer.close()
+
+
+COMBINATIONS = [
+    (framing_name, cipher, compression_name, codec)
+    for framing_name, cipher, compression_name, codec in itertools.product(
+        framing.SUPPORTED_FRAMINGS,
+        security.SUPPORTED_CIPHERS,
+        compression.SUPPORTED_COMPRESSIONS,
+        codecs.SUPPORTED_CODECS + (codecs.CODEC_LEGACY,),
+    )
+    # Строковый фрейминг - только Fernet и без сжатия
+    if framing_name == framing.FRAMING_BINARY
+    or (cipher == security.CIPHER_FERNET and compression_name == compression.COMPRESSION_NONE)
+]
+
+
+@pytest.mark.parametrize("framing_name, cipher, compression_name, codec", COMBINATIONS)
+async def test_negotiated_channel(
+    server_port, monkeypatch, framing_name, cipher, compression_name, codec
+):
+    """Тест: обмен пакетами для каждой согласуемой комбинации параметров"""
+    monkeypatch.setitem(compression.CONFIG, "THRESHOLD", 64)
+    reader, writer, ctx, _ = await connect(
+        server_port,
+        framings=(framing_name,),
+        ciphers=(cipher,),
+        compressions=(compression_name,),
+        # json-legacy не предлагается: его получает клиент, не предложивший кодек
+        codecs_offered=() if codec == codecs.CODEC_LEGACY else (codec,),
+    )
+
+    assert (ctx.framing, ctx.cipher.name, ctx.compressor.name, ctx.codec.name) == (
+        framing_name,
+        cipher,
+        compression_name,
+        codec,
+    )
+    decompressed = compression.stats.stats()["decompressed_frames"]
+    await ctx.send(SendMessageRequest(token="bad", receiver_id=2, content="x" * 4096))
+    frame = await framing.FrameReader(reader, ctx.framing).read()
+    response = ctx.codec.load(ctx.open_payload(frame.payload, frame.flags))
+
+    assert response["action"] == "error"
+    if compression_name != compression.COMPRESSION_NONE:
+        assert compression.stats.stats()["decompressed_frames"] > decompressed
+    assert (await roundtrip(reader, ctx))["action"] == "error"
+    writer.close()
@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+
+import pytest
+
+from server import logger
+
+
+@pytest.fixture
+def output():
+    """Поток вывода логов, после теста логирование останавливается."""
+    stream = io.StringIO()
+    yield stream
+    logger.shutdown_logging()
+
+
+def make_record(category: str, level: int = logging.INFO) -> logging.LogRecord:
+    """Создаёт запись категории."""
+    return logging.makeLogRecord(
+        {"name": f"{logger.ROOT}.{category}", "levelno": level, "msg": "test"}
+    )
+
+
+def test_records_written_by_listener_thread(output):
+    """Тест: записи проходят через очередь и пишутся с полями extra"""
+    logger.setup_logging("INFO", stream=output)
+
+    logger.get_logger(logger.CATEGORY_CONNECTIONS).info("Подключение", extra={"peer": "1.2.3.4:5"})
+    logger.get_logger(logger.CATEGORY_CONNECTIONS).debug("не пишется")
+    logger.shutdown_logging()
+
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 1
+    assert "INFO [messager.connections] Подключение peer=1.2.3.4:5" in lines[0]
+
+
+def test_json_format(output):
+    """Тест: формат JSON Lines со структурными полями"""
+    logger.setup_logging("INFO", logger.FORMAT_JSON, stream=output)
+
+    logger.get_logger(logger.CATEGORY_ROUTER).warning("Ошибка %s", 1, extra={"user_id": 7})
+    logger.shutdown_logging()
+
+    entry = json.loads(output.getvalue())
+    assert entry["level"] == "WARNING"
+    assert entry["category"] == "messager.router"
+    assert entry["message"] == "Ошибка 1"
+    assert entry["user_id"] == 7
+
+
+def test_payload_logging_off_by_default_and_switchable(output):
+    """Тест: отладка пакетов и SQL выключены по умолчанию и переключаются на лету"""
+    logger.setup_logging("DEBUG", stream=output)
+    assert not logger.payload_logging_enabled()
+    assert not logger.sql_echo_enabled()
+
+    logger.set_payload_logging(True)
+    logger.set_sql_echo(True)
+    assert logger.payload_logging_enabled()
+    assert logging.getLogger("sqlalchemy.engine.Engine").isEnabledFor(logging.INFO)
+
+    logger.set_payload_logging(False)
+    logger.set_sql_echo(False)
+    assert not logger.payload_logging_enabled()
+    assert not logger.sql_echo_enabled()
+
+
+def test_sampling_keeps_every_nth_record():
+    """Тест: сэмплирование пропускает каждую N-ю запись категории"""
+    limiter = logger.CategoryLimiter(rate_limit=0, sampling={"packets": 10})
+
+    passed = sum(limiter.filter(make_record("packets")) for _ in range(100))
+    assert passed == 10
+    assert all(limiter.filter(make_record("router")) for _ in range(10))
+
+
+def test_rate_limit_counts_suppressed_records(monkeypatch):
+    """Тест: сверх лимита записи отбрасываются, их число добавляется в следующую запись"""
+    now = [100.0]
+    monkeypatch.setattr(logger.time, "monotonic", lambda: now[0])
+    limiter = logger.CategoryLimiter(rate_limit=5)
+
+    results = [limiter.filter(make_record("connections")) for _ in range(8)]
+    assert results == [True] * 5 + [False] * 3
+    assert limiter.filter(make_record("connections", logging.ERROR))
+
+    now[0] += 1
+    record = make_record("connections")
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+
+
+def test_parse_sampling():
+    """Тест: разбор аргументов --log-sample"""
+    assert logger.parse_sampling(["packets=100", "router=2"]) == {"packets": 100, "router": 2}
+    with pytest.raises(ValueError):
+        logger.parse_sampling(["packets"])
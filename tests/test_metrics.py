@@ -0,0 +1,288 @@
+import json
+import asyncio
+from typing import Literal
+
+import pytest
+
+import security
+from server import metrics, crypto_executor
+from protocol import compression
+from server.exceptions import UnknownActionError
+from server.framework import ServerRouter, ServerContext, BaseController, action
+from dto.models import BasePacket
+
+
+class MockWriter:
+    """Mock для asyncio.StreamWriter"""
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 0)
+
+    def writelines(self, parts):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PingRequest(BasePacket):
+    """Тестовый пакет"""
+
+    action: Literal["ping"] = "ping"
+    fail: bool = False
+
+
+class PingController(BaseController):
+    """Тестовый контроллер"""
+
+    @action("ping")
+    async def ping(self, req: PingRequest):
+        if req.fail:
+            raise UnknownActionError("нет")
+        await self.ctx.reply("success", "pong")
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Обнуляет метрики процесса до и после теста."""
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+def test_counter_and_gauge_render():
+    """Тест: счётчик и gauge в текстовом формате Prometheus"""
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("test_total", "Счётчик", ("action",)))
+    gauge = registry.register(metrics.Gauge("test_online", "Онлайн", callback=lambda: 3))
+
+    counter.inc("login")
+    counter.inc("login")
+    counter.inc('a"b')
+
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{action="login"} 2' in text
+    assert 'test_total{action="a\\"b"} 1' in text
+    assert "# TYPE test_online gauge" in text
+    assert "test_online 3" in text
+    assert gauge.values[()] == 3
+
+
+def test_histogram_buckets_and_quantiles():
+    """Тест: корзины гистограммы кумулятивные, квантили оцениваются по корзинам"""
+    histogram = metrics.Histogram("test_seconds", "Задержка", ("action",), buckets=(0.1, 0.2, 0.4))
+
+    for value in [0.05] * 50 + [0.15] * 45 + [0.3] * 4 + [1.0]:
+        histogram.observe(value, "ping")
+
+    assert histogram.count("ping") == 100
+    assert histogram.quantile(0.5, "ping") == pytest.approx(0.1)
+    assert 0.1 < histogram.quantile(0.95, "ping") <= 0.2
+    assert 0.2 < histogram.quantile(0.99, "ping") <= 0.4
+    assert histogram.quantile(0.5, "other") == 0.0
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{action="ping",le="0.1"} 50' in lines
+    assert 'test_seconds_bucket{action="ping",le="0.4"} 99' in lines
+    assert 'test_seconds_bucket{action="ping",le="+Inf"} 100' in lines
+    assert 'test_seconds_count{action="ping"} 100' in lines
+    assert any(line.startswith('test_seconds_quantile{action="ping",quantile="0.99"}') for line in lines)
+
+
+async def test_dispatch_records_requests_errors_and_bytes():
+    """Тест: роутер учитывает запросы, ошибки по классам исключений и отправленные байты"""
+    router = ServerRouter()
+    router.register(PingController)
+    ctx = ServerContext(None, MockWriter(), None)
+
+    await router.submit(ctx, json.dumps({"action": "ping"}).encode())
+    await router.submit(ctx, json.dumps({"action": "ping", "fail": True}).encode())
+    await router.submit(ctx, json.dumps({"action": "nope"}).encode())
+    await ctx.flush()
+
+    assert metrics.requests_total.values[("ping",)] == 2
+    assert metrics.request_latency.count("ping") == 2
+    assert metrics.errors_total.values[("ping", "UnknownActionError")] == 1
+    assert metrics.errors_total.values[("", "UnknownActionError")] == 1
+    assert metrics.responses_total.values[("success",)] == 1
+    assert metrics.responses_total.values[("error",)] == 2
+    assert metrics.bytes_out.values[()] > 0
+
+
+async def test_instrumented_sessions():
+    """Тест: фабрика сессий БД считает сессии и время их жизни"""
+
+    class FakeSession:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    create_session = metrics.instrument_sessions(FakeSession)
+    async with create_session() as session:
+        assert isinstance(session, FakeSession)
+        assert metrics.active_db_sessions.values[()] == 1
+
+    assert metrics.active_db_sessions.values[()] == 0
+    assert metrics.db_sessions_total.values[()] == 1
+    assert metrics.db_session_latency.count() == 1
+
+
+async def test_scrape_listener():
+    """Тест: HTTP listener отдаёт метрики по /metrics и 404 на остальное"""
+    metrics.requests_total.inc("ping")
+    server = await metrics.start_listener("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    try:
+        response = await get("/metrics")
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert b"text/plain; version=0.0.4" in response
+        assert b'messager_requests_total{action="ping"} 1' in response
+
+        assert (await get("/")).startswith(b"HTTP/1.1 404")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_admin_routes_require_access(monkeypatch):
+    """Тест: админ эндпоинты - только loopback без токена, с токеном - только по токену"""
+    monkeypatch.setitem(metrics.ADMIN_ROUTES, "/admin", lambda params: {"ok": True})
+    server = await metrics.start_listener("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str, header: str = "") -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{header}\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    try:
+        assert (await get("/admin")).startswith(b"HTTP/1.1 200 OK")
+
+        metrics.setup_admin("secret")
+        assert (await get("/admin")).startswith(b"HTTP/1.1 403")
+        assert (await get("/admin", "Authorization: Bearer wrong\r\n")).startswith(b"HTTP/1.1 403")
+        assert (await get("/admin", "Authorization: Bearer secret\r\n")).startswith(b"HTTP/1.1 200 OK")
+        assert (await get("/metrics")).startswith(b"HTTP/1.1 200 OK")
+    finally:
+        metrics.setup_admin(None)
+        server.close()
+        await server.wait_closed()
+
+
+async def test_admin_route_error_returns_500(monkeypatch, caplog):
+    """Негативный тест: исключение админ обработчика - 500 и запись в журнал, listener жив"""
+
+    def broken(params):
+        raise KeyError("boom")
+
+    monkeypatch.setitem(metrics.ADMIN_ROUTES, "/broken", broken)
+    server = await metrics.start_listener("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    try:
+        response = await get("/broken")
+        assert response.startswith(b"HTTP/1.1 500")
+        assert json.loads(response.split(b"\r\n\r\n", 1)[1]) == {"error": "internal error"}
+        assert any("/broken" in record.getMessage() for record in caplog.records)
+        assert (await get("/metrics")).startswith(b"HTTP/1.1 200 OK")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_admin_routes_reject_remote_peer_without_token():
+    """Негативный тест: без токена админ эндпоинты не отвечают удалённому адресу"""
+
+    class RemoteWriter:
+        def get_extra_info(self, name):
+            return ("10.0.0.5", 40000)
+
+    assert not metrics._admin_allowed(RemoteWriter(), {})
+
+
+async def scrape() -> str:
+    """Снимает /metrics через HTTP listener."""
+    server = await metrics.start_listener("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+    return response.decode()
+
+
+async def test_compression_stats_in_scrape():
+    """Тест: объём и CPU время сжатия по алгоритмам попадают в /metrics"""
+    compression.stats.reset()
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=64)
+    payload, flags = compressor.compress(b"0" * 10_000)
+    compressor.decompress(payload, flags)
+
+    body = await scrape()
+
+    assert 'messager_compression_raw_bytes_total{algorithm="zlib"} 10000' in body
+    assert f'messager_compression_compressed_bytes_total{{algorithm="zlib"}} {len(payload)}' in body
+    assert 'messager_compression_frames_total{algorithm="zlib",result="decompressed"} 1' in body
+    assert 'messager_compression_ratio{algorithm="zlib"}' in body
+    assert 'messager_compress_cpu_seconds_total{algorithm="zlib"}' in body
+    assert 'messager_decompress_cpu_seconds_total{algorithm="zlib"}' in body
+
+
+async def test_crypto_executor_stats_in_scrape():
+    """Тест: вызовы пула криптографии и его очередь попадают в /metrics"""
+    crypto_executor.setup_crypto_executor(2, threshold=100)
+    try:
+        await crypto_executor.executor.run(len, b"x", size=1)
+        await crypto_executor.executor.run(len, b"x" * 200, size=200)
+        body = await scrape()
+    finally:
+        crypto_executor.setup_crypto_executor(0)
+
+    assert 'messager_crypto_calls_total{mode="inline"} 1' in body
+    assert 'messager_crypto_calls_total{mode="offloaded"} 1' in body
+    assert "messager_crypto_queue_depth 0" in body
+    assert "messager_crypto_max_queue_depth 1" in body
+    assert "messager_crypto_wait_seconds_total" in body
+
+
+async def test_token_cache_stats_in_scrape():
+    """Тест: попадания и промахи кэша проверенных токенов попадают в /metrics"""
+    security.token_cache.clear()
+    security.token_cache.reset_stats()
+    token = security.create_jwt(1, "User 1")
+    security.verify_jwt(token)
+    security.verify_jwt(token)
+
+    body = await scrape()
+
+    assert 'messager_token_cache_lookups_total{result="hit"} 1' in body
+    assert 'messager_token_cache_lookups_total{result="miss"} 1' in body
+    assert "messager_token_cache_hit_rate 0.5" in body
+    assert "messager_token_cache_size 1" in body
@@ -0,0 +1,181 @@
+import json
+import pstats
+import asyncio
+import logging
+import tracemalloc
+from typing import Literal
+
+import pytest
+
+from server import profiling
+from server.framework import ServerRouter, ServerContext, BaseController, action
+from dto.models import BasePacket
+
+
+class MockWriter:
+    """Mock для asyncio.StreamWriter"""
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 5000)
+
+    def writelines(self, parts):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WorkRequest(BasePacket):
+    """Тестовый пакет"""
+
+    action: Literal["work"] = "work"
+    delay: float = 0
+
+
+class OtherRequest(BasePacket):
+    """Тестовый пакет другого действия"""
+
+    action: Literal["other"] = "other"
+
+
+class WorkController(BaseController):
+    """Тестовый контроллер"""
+
+    @action("work")
+    async def work(self, req: WorkRequest):
+        await asyncio.sleep(req.delay)
+        profiling.add_phase("db", req.delay / 2)
+        await self.ctx.reply("success", sum(range(1000)))
+
+    @action("other")
+    async def other(self, req: OtherRequest):
+        await self.ctx.reply("success")
+
+
+@pytest.fixture
+def router(tmp_path):
+    """Роутер с тестовым контроллером, результаты профилирования - во временный каталог."""
+    router = ServerRouter()
+    router.register(WorkController)
+    profiling.setup_profiling(str(tmp_path), 0, router.routes)
+    yield router
+    profiling.profiler.stop()
+    profiling.setup_profiling(profiling.DEFAULT_PROFILE_DIR, 0)
+
+
+def packet(fields: dict) -> bytes:
+    """Кодирует пакет так, как он приходит после расшифровки."""
+    return json.dumps(fields).encode()
+
+
+async def test_cprofile_next_calls_of_action(router, tmp_path):
+    """Тест: профилируются только следующие N вызовов указанного действия"""
+    ctx = ServerContext(None, MockWriter(), None)
+    profiling.profiler.start(profiling.MODE_CPROFILE, action="work", calls=2)
+
+    await router.submit(ctx, packet({"action": "other"}))
+    assert profiling.profiler.session.profiled == 0
+
+    for _ in range(3):
+        await router.submit(ctx, packet({"action": "work"}))
+
+    assert profiling.profiler.session is None
+    result = profiling.profiler.last_result
+    assert result.startswith(str(tmp_path)) and result.endswith(".pstats")
+    stats = pstats.Stats(result)
+    assert any(name == "work" for _, _, name in stats.stats)
+
+
+async def test_tracemalloc_time_window(router):
+    """Тест: снимок tracemalloc за окно времени записывается в файл"""
+    was_tracing = tracemalloc.is_tracing()
+    profiling.profiler.start(profiling.MODE_TRACEMALLOC, seconds=60)
+    assert not profiling.profiler.active
+
+    data = [bytes(1000) for _ in range(100)]
+    path = profiling.profiler.stop()
+
+    assert path.endswith(".snapshot")
+    assert isinstance(tracemalloc.Snapshot.load(path), tracemalloc.Snapshot)
+    assert tracemalloc.is_tracing() == was_tracing
+    assert data
+
+
+async def test_profiler_rejects_invalid_start(router):
+    """Негативный тест: некорректные параметры и повторный запуск"""
+    with pytest.raises(ValueError):
+        profiling.profiler.start("perf", calls=1)
+    with pytest.raises(ValueError):
+        profiling.profiler.start(profiling.MODE_CPROFILE)
+    with pytest.raises(ValueError):
+        profiling.profiler.start(profiling.MODE_CPROFILE, calls=0)
+    with pytest.raises(ValueError):
+        profiling.profiler.start(profiling.MODE_CPROFILE, action="../../etc/x", calls=1)
+    assert profiling.profiler.session is None
+
+    profiling.profiler.start(profiling.MODE_CPROFILE, calls=1)
+    with pytest.raises(ValueError):
+        profiling.profiler.start(profiling.MODE_CPROFILE, calls=1)
+
+
+async def test_profile_write_error_does_not_fail_request(router, tmp_path, caplog):
+    """Негативный тест: ошибка записи профиля логируется, запрос и роутер не ломаются"""
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    profiling.setup_profiling(str(blocker / "profiles"), 0, router.routes)
+    ctx = ServerContext(None, MockWriter(), None)
+    profiling.profiler.start(profiling.MODE_CPROFILE, action="work", calls=1)
+
+    with caplog.at_level(logging.ERROR, logger="messager.profiling"):
+        await router.submit(ctx, packet({"action": "work"}))
+
+    assert profiling.profiler.session is None
+    assert any(record.levelno == logging.ERROR for record in caplog.records)
+
+
+async def test_slow_request_log_breaks_down_phases(router, caplog):
+    """Тест: запрос дольше порога попадает в журнал с разбивкой по фазам"""
+    ctx = ServerContext(None, MockWriter(), None)
+    profiling.ADMIN_ROUTES["/slowlog"]({"threshold_ms": "20"})
+    assert profiling.slow_log_enabled()
+
+    with caplog.at_level(logging.WARNING, logger="messager.slow"):
+        await router.submit(
+            ctx, packet({"action": "work", "delay": 0}), profiling.RequestTimings(0.001)
+        )
+        await router.submit(
+            ctx, packet({"action": "work", "delay": 0.05}), profiling.RequestTimings(0.001)
+        )
+
+    assert len(caplog.records) == 1
+    record = caplog.records[0]
+    assert record.action == "work"
+    assert record.peer == "127.0.0.1:5000"
+    assert record.total_ms >= 50
+    assert record.decrypt_ms == 1.0
+    assert record.db_ms == 25.0
+    assert record.validate_ms > 0
+    assert record.reply_ms > 0
+    assert record.handler_ms >= 25
+
+
+def test_admin_routes(router):
+    """Тест: админ эндпоинты запускают профилирование и меняют порог журнала"""
+    status = profiling.ADMIN_ROUTES["/slowlog"]({"threshold_ms": "150"})
+    assert status["slow_threshold_ms"] == 150
+
+    with pytest.raises(ValueError):
+        profiling.ADMIN_ROUTES["/slowlog"]({"threshold_ms": "-1"})
+    with pytest.raises(ValueError):
+        profiling.ADMIN_ROUTES["/profile"]({"calls": "many"})
+
+    status = profiling.ADMIN_ROUTES["/profile"]({"action": "work", "calls": "5"})
+    assert status["session"]["action"] == "work"
+    assert status["session"]["remaining_calls"] == 5
+
+    status = profiling.ADMIN_ROUTES["/profile/stop"]({})
+    assert status["session"] is None
+    assert status["last_result"].endswith(".pstats")
@@ -0,0 +1,277 @@
+import json
+import asyncio
+
+import pytest
+
+from protocol import framing, handshake, compression, codecs
+from dto.models import ServerResponse
+from server.exceptions import FrameTooLargeError, HandshakeError, CompressionError, CodecError
+
+
+def make_reader(*chunks: bytes) -> asyncio.StreamReader:
+    """Создаёт StreamReader с заранее записанными данными."""
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return reader
+
+
+# region Фрейминг
+async def test_binary_frame_roundtrip():
+    """Тест: бинарный фрейм читается с теми же флагами и нагрузкой"""
+    parts = framing.encode_frame(b"payload", framing.FRAMING_BINARY, flags=3)
+    reader = framing.FrameReader(make_reader(*parts), framing.FRAMING_BINARY)
+
+    frame = await reader.read()
+
+    assert bytes(frame.payload) == b"payload"
+    assert frame.flags == 3
+    assert frame.frame_type == framing.FRAME_DATA
+    assert await reader.read() is None
+
+
+async def test_binary_frame_larger_than_stream_limit():
+    """Тест: бинарный фрейм больше лимита строки StreamReader (64 KiB)"""
+    payload = b"x" * (256 * 1024)
+    parts = framing.encode_frame(payload, framing.FRAMING_BINARY)
+    reader = framing.FrameReader(make_reader(*parts), framing.FRAMING_BINARY)
+
+    frame = await reader.read()
+
+    assert isinstance(frame.payload, memoryview)
+    assert len(frame.payload) == len(payload)
+
+
+async def test_line_frames_skip_empty_lines():
+    """Тест: строковый режим пропускает пустые строки"""
+    reader = framing.FrameReader(make_reader(b"\n", b"token\n"), framing.FRAMING_LINE)
+
+    frame = await reader.read()
+
+    assert bytes(frame.payload) == b"token"
+    assert await reader.read() is None
+
+
+async def test_binary_frame_too_large_raises():
+    """Негативный тест: заявленный размер больше лимита"""
+    header = framing.HEADER.pack(1024, 0, framing.FRAME_DATA)
+    reader = framing.FrameReader(make_reader(header), framing.FRAMING_BINARY, max_size=16)
+
+    with pytest.raises(FrameTooLargeError):
+        await reader.read()
+
+
+async def test_binary_frame_truncated_returns_none():
+    """Негативный тест: обрыв соединения посреди фрейма"""
+    header = framing.HEADER.pack(10, 0, framing.FRAME_DATA)
+    reader = framing.FrameReader(make_reader(header, b"abc"), framing.FRAMING_BINARY)
+
+    assert await reader.read() is None
+
+
+# endregion
+
+
+# region Handshake
+def test_hello_detection():
+    """Тест: JSON приветствие отличается от base64 ключа старого клиента"""
+    assert handshake.is_client_hello(handshake.encode_hello({"framing": ["binary"]}))
+    assert not handshake.is_client_hello(b"c29tZS1rZXk=\n")
+
+
+def test_select_option_prefers_client_order():
+    """Тест: выбирается первый поддерживаемый вариант клиента"""
+    selected = handshake.select_option(["unknown", "line", "binary"], ("binary", "line"), "line")
+    assert selected == "line"
+
+
+def test_select_option_default_when_not_offered():
+    """Тест: без предложений клиента используется значение по умолчанию"""
+    assert handshake.select_option(None, ("binary", "line"), "line") == "line"
+
+
+def test_select_option_no_common_raises():
+    """Негативный тест: нет общих вариантов"""
+    with pytest.raises(HandshakeError):
+        handshake.select_option(["unknown"], ("binary", "line"), "line")
+
+
+def test_decode_hello_invalid_raises():
+    """Негативный тест: некорректное приветствие"""
+    with pytest.raises(HandshakeError):
+        handshake.decode_hello(b"[1, 2]\n")
+
+
+# endregion
+
+
+# region Сжатие
+HISTORY_PAGE = (
+    b'[' + b",".join(b'{"id":%d,"sender_id":1,"content":"hello","is_readed":true}' % i for i in range(50)) + b"]"
+)
+
+
+def test_zlib_roundtrip_sets_flag():
+    """Тест: большой пакет сжимается, ставится флаг, распаковка возвращает исходник"""
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=64)
+
+    payload, flags = compressor.compress(HISTORY_PAGE)
+
+    assert flags & framing.FLAG_COMPRESSED
+    assert len(payload) < len(HISTORY_PAGE)
+    assert compressor.decompress(payload, flags) == HISTORY_PAGE
+
+
+@pytest.mark.parametrize("name", compression.SUPPORTED_COMPRESSIONS)
+def test_every_supported_algorithm_roundtrip(name):
+    """Тест: все доступные алгоритмы (zstd/lz4 - если установлены) восстанавливают пакет"""
+    compressor = compression.Compressor(name, threshold=64)
+
+    payload, flags = compressor.compress(HISTORY_PAGE)
+
+    assert compressor.decompress(payload, flags) == HISTORY_PAGE
+
+
+def test_small_payload_is_not_compressed():
+    """Тест: пакет меньше порога уходит как есть"""
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=1024)
+
+    assert compressor.compress(b'{"action":"message"}') == (b'{"action":"message"}', 0)
+
+
+def test_incompressible_payload_is_not_compressed():
+    """Тест: если сжатие не даёт выигрыша, пакет уходит без флага"""
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=16)
+    payload = bytes(range(256))
+
+    assert compressor.compress(payload) == (payload, 0)
+
+
+def test_compression_stats_ratio():
+    """Тест: счётчики учитывают коэффициент сжатия"""
+    compression.stats.reset()
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=64)
+
+    compressor.compress(HISTORY_PAGE)
+    compressor.compress(b"short")
+
+    stats = compression.stats.stats()
+    assert stats["compressed_frames"] == 1
+    assert stats["skipped_frames"] == 1
+    assert stats["bytes_in"] == len(HISTORY_PAGE)
+    assert stats["ratio"] > 1
+
+
+def test_decompress_over_limit_raises():
+    """Негативный тест: распаковка сверх лимита (zip-бомба) прерывается"""
+    compressor = compression.Compressor(compression.COMPRESSION_ZLIB, threshold=64)
+    payload, flags = compressor.compress(b"0" * 100_000)
+
+    with pytest.raises(CompressionError):
+        compressor.decompress(payload, flags, max_size=1000)
+
+
+def test_compressed_frame_without_negotiation_raises():
+    """Негативный тест: флаг сжатия без согласованного алгоритма"""
+    with pytest.raises(CompressionError):
+        compression.Compressor().decompress(b"data", framing.FLAG_COMPRESSED)
+
+
+ALGORITHMS = [name for name in compression.SUPPORTED_COMPRESSIONS if name != compression.COMPRESSION_NONE]
+
+
+@pytest.mark.parametrize("name", ALGORITHMS)
+def test_corrupted_compressed_frame_raises(name):
+    """Негативный тест: повреждённые сжатые данные любого алгоритма"""
+    compressor = compression.Compressor(name)
+
+    with pytest.raises(CompressionError):
+        compressor.decompress(b"not compressed data", framing.FLAG_COMPRESSED)
+
+
+@pytest.mark.parametrize("name", ALGORITHMS)
+def test_truncated_compressed_frame_raises(name):
+    """Негативный тест: обрезанный сжатый фрейм не принимается"""
+    compressor = compression.Compressor(name, threshold=64)
+    payload, flags = compressor.compress(HISTORY_PAGE)
+
+    with pytest.raises(CompressionError):
+        compressor.decompress(payload[: len(payload) // 2], flags)
+
+
+# endregion
+
+
+# region Кодеки
+USERS = [{"id": 1, "login": "alice", "username": "Alice"}]
+
+
+def test_json_codec_keeps_structured_data():
+    """Тест: `data` передаётся структурой, без строки JSON внутри JSON"""
+    codec = codecs.get_codec(codecs.CODEC_JSON)
+
+    payload = codec.dump(ServerResponse(action="user_list_result", data=USERS))
+
+    assert b'"data":[{' in payload
+    assert codec.load(payload)["data"] == USERS
+
+
+def test_legacy_codec_stringifies_structured_data():
+    """Тест: старые клиенты получают `data` строкой JSON, как раньше"""
+    codec = codecs.get_codec(codecs.CODEC_LEGACY)
+
+    packet = codec.load(codec.dump(ServerResponse(action="user_list_result", data=USERS)))
+
+    assert isinstance(packet["data"], str)
+    assert json.loads(packet["data"]) == USERS
+
+
+def test_legacy_codec_keeps_text_data():
+    """Тест: текстовые ответы старый кодек не меняет"""
+    codec = codecs.get_codec(codecs.CODEC_LEGACY)
+
+    packet = codec.load(codec.dump(ServerResponse(action="success", data="ok")))
+
+    assert packet["data"] == "ok"
+
+
+@pytest.mark.parametrize("name", codecs.SUPPORTED_CODECS)
+def test_every_supported_codec_roundtrip(name):
+    """Тест: все доступные кодеки (msgpack/CBOR - если установлены) восстанавливают пакет"""
+    codec = codecs.get_codec(name)
+    response = ServerResponse(action="message_history_result", data=USERS, request_id=7)
+
+    assert codec.load(codec.dump(response)) == response.model_dump(mode="json")
+
+
+def test_codec_requires_dump_and_load():
+    """Негативный тест: кодек без load не создаётся"""
+
+    class DumpOnlyCodec(codecs.Codec):
+        def dump(self, packet):
+            return b""
+
+    with pytest.raises(TypeError):
+        DumpOnlyCodec()
+
+
+def test_json_codec_rejects_non_object():
+    """Негативный тест: пакет должен быть JSON объектом"""
+    with pytest.raises(CodecError):
+        codecs.get_codec(codecs.CODEC_JSON).load(b"[1, 2]")
+
+
+def test_json_codec_rejects_invalid_json():
+    """Негативный тест: недействительный JSON"""
+    with pytest.raises(CodecError):
+        codecs.get_codec(codecs.CODEC_JSON).load(b"{not json")
+
+
+def test_unknown_codec_raises():
+    """Негативный тест: недоступный кодек"""
+    with pytest.raises(CodecError):
+        codecs.get_codec("xml")
+
+
+# endregion
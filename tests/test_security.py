@@ -4,10 +4,12 @@ import pytest
 
 from cryptography.fernet import Fernet
 from cryptography.fernet import InvalidToken
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.asymmetric import rsa
 
 from server.exceptions import InvalidTokenServerError, ExpiredSignatureServerError
 import security
+from protocol import framing
 
 
 # region RSA Тесты
@@ -63,6 +65,68 @@ def test_rsa_keys_generation_failure(monkeypatch):
         security.generate_rsa_keys()
 
 
+def test_server_key_created_once_and_reloaded(tmp_path):
+    """Тест: ключ сервера сохраняется при первом старте и загружается при следующем"""
+    key_path = tmp_path / "keys" / "server.pem"
+
+    private_1, public_1, created_1 = security.load_or_create_rsa_keys(str(key_path))
+    private_2, public_2, created_2 = security.load_or_create_rsa_keys(str(key_path))
+
+    assert created_1 is True
+    assert created_2 is False
+    assert security.public_key_fingerprint(public_1) == security.public_key_fingerprint(
+        public_2
+    )
+    assert (key_path.stat().st_mode & 0o777) == 0o600
+
+
+def test_server_key_wrong_type_raises(tmp_path):
+    """Негативный тест: в файле лежит не RSA ключ"""
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    key_path = tmp_path / "server.pem"
+    key_path.write_bytes(
+        security.private_key_to_pem(ed25519.Ed25519PrivateKey.generate())
+    )
+
+    with pytest.raises(ValueError):
+        security.load_or_create_rsa_keys(str(key_path))
+
+
+# endregion
+
+
+# region X25519 Тесты
+def test_x25519_both_sides_derive_same_secret():
+    """Тест: клиент и сервер получают одинаковый секрет сессии"""
+    client_private, client_public = security.generate_x25519_keys()
+    server_private, server_public = security.generate_x25519_keys()
+
+    client_secret = security.x25519_session_secret(
+        client_private, security.x25519_public_bytes(server_public)
+    )
+    server_secret = security.x25519_session_secret(
+        server_private, security.x25519_public_bytes(client_public)
+    )
+
+    assert client_secret == server_secret
+    Fernet(client_secret)
+
+
+def test_x25519_public_blob_is_small():
+    """Тест: публичный ключ X25519 занимает 32 байта"""
+    _, public = security.generate_x25519_keys()
+    assert len(security.x25519_public_bytes(public)) == 32
+
+
+def test_x25519_invalid_public_key_raises():
+    """Негативный тест: публичный ключ неверной длины"""
+    private, _ = security.generate_x25519_keys()
+
+    with pytest.raises(ValueError):
+        security.x25519_session_secret(private, b"short")
+
+
 # endregion
 
 
@@ -94,6 +158,123 @@ def test_fernet_decrypt_wrong_key_fails():
 # endregion
 
 
+# region Шифры сессии Тесты
+@pytest.mark.parametrize("name", security.SUPPORTED_CIPHERS)
+def test_session_cipher_roundtrip(name):
+    """Тест: клиент и сервер с одним секретом понимают друг друга"""
+    secret = security.generate_fernet_key()
+    client = security.create_session_cipher(name, secret, security.DIRECTION_CLIENT)
+    server = security.create_session_cipher(name, secret, security.DIRECTION_SERVER)
+
+    encrypted = client.encrypt(b"ping")
+    assert server.decrypt(memoryview(encrypted)) == b"ping"
+
+    encrypted = server.encrypt(b"pong")
+    assert client.decrypt(encrypted) == b"pong"
+
+
+def test_aead_nonces_are_unique():
+    """Тест: nonce AEAD берётся из счётчика и не повторяется"""
+    secret = security.generate_fernet_key()
+    cipher = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_CLIENT
+    )
+
+    first = cipher.encrypt(b"same")
+    second = cipher.encrypt(b"same")
+
+    assert first[: security.NONCE.size] != second[: security.NONCE.size]
+    assert first != second
+
+
+def test_aead_reflected_frame_rejected():
+    """Негативный тест: свой же фрейм, отправленный обратно, не принимается"""
+    secret = security.generate_fernet_key()
+    cipher = security.create_session_cipher(
+        security.CIPHER_CHACHA20, secret, security.DIRECTION_SERVER
+    )
+
+    with pytest.raises(InvalidTag):
+        cipher.decrypt(cipher.encrypt(b"data"))
+
+
+def test_aead_tampered_frame_rejected():
+    """Негативный тест: изменённый шифртекст не проходит проверку тега"""
+    secret = security.generate_fernet_key()
+    client = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_CLIENT
+    )
+    server = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_SERVER
+    )
+
+    encrypted = bytearray(client.encrypt(b"data"))
+    encrypted[-1] ^= 1
+
+    with pytest.raises(InvalidTag):
+        server.decrypt(bytes(encrypted))
+
+
+def test_aead_replayed_and_reordered_frames_rejected():
+    """Негативный тест: повтор и перестановка перехваченных фреймов не принимаются"""
+    secret = security.generate_fernet_key()
+    client = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_CLIENT
+    )
+    server = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_SERVER
+    )
+
+    first, second, third = (client.encrypt(data) for data in (b"1", b"2", b"3"))
+    assert server.decrypt(first) == b"1"
+    with pytest.raises(InvalidTag):
+        server.decrypt(first)
+
+    assert server.decrypt(third) == b"3"
+    with pytest.raises(InvalidTag):
+        server.decrypt(second)
+
+
+def test_aead_forged_frame_does_not_advance_counter():
+    """Тест: повреждённый фрейм с большим счётчиком не сдвигает окно приёма"""
+    secret = security.generate_fernet_key()
+    client = security.create_session_cipher(
+        security.CIPHER_CHACHA20, secret, security.DIRECTION_CLIENT
+    )
+    server = security.create_session_cipher(
+        security.CIPHER_CHACHA20, secret, security.DIRECTION_SERVER
+    )
+
+    forged = bytearray(security.NONCE.pack(security.DIRECTION_CLIENT, 100) + b"x" * 32)
+    with pytest.raises(InvalidTag):
+        server.decrypt(bytes(forged))
+    assert server.decrypt(client.encrypt(b"data")) == b"data"
+
+
+@pytest.mark.parametrize("name", security.SUPPORTED_CIPHERS)
+def test_session_cipher_authenticates_frame_header(name):
+    """Негативный тест: изменённые флаги заголовка фрейма не проходят проверку"""
+    secret = security.generate_fernet_key()
+    client = security.create_session_cipher(name, secret, security.DIRECTION_CLIENT)
+    server = security.create_session_cipher(name, secret, security.DIRECTION_SERVER)
+
+    header = framing.frame_aad(framing.FRAMING_BINARY, framing.FLAG_COMPRESSED)
+    assert server.decrypt(client.encrypt(b"data", header), header) == b"data"
+
+    encrypted = client.encrypt(b"data", header)
+    with pytest.raises((InvalidTag, InvalidToken)):
+        server.decrypt(encrypted, framing.frame_aad(framing.FRAMING_BINARY, 0))
+
+
+def test_unknown_session_cipher_raises():
+    """Негативный тест: неизвестный шифр"""
+    with pytest.raises(ValueError):
+        security.create_session_cipher("rot13", b"secret", security.DIRECTION_CLIENT)
+
+
+# endregion
+
+
 # region JWT Тесты
 def test_jwt_success():
     """Тест: создание и проверка токена"""
@@ -143,4 +324,64 @@ def test_jwt_malformed_token_returns_none():
         security.verify_jwt("not-a-jwt")
 
 
+def test_jwt_cache_hit_skips_decode(monkeypatch):
+    """Тест: повторная проверка токена берётся из кэша"""
+    security.setup_jwt("secret", "HS256", 1)
+    security.token_cache.reset_stats()
+    token = security.create_jwt(7, "User")
+
+    assert security.verify_jwt(token)["sub"] == "7"
+
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("jwt.decode не должен вызываться")
+
+    monkeypatch.setattr(security.jwt, "decode", fail_decode)
+    assert security.verify_jwt(token)["sub"] == "7"
+
+    stats = security.token_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_jwt_cache_respects_expiry(monkeypatch):
+    """Негативный тест: закэшированный токен после exp снова проверяется и отклоняется"""
+    security.setup_jwt("secret", "HS256", 1)
+    token = security.create_jwt(7, "User")
+    security.verify_jwt(token)
+
+    later = security.time.time() + 2 * 3600
+    monkeypatch.setattr(security.time, "time", lambda: later)
+
+    def expired_decode(*args, **kwargs):
+        raise jwt.ExpiredSignatureError()
+
+    monkeypatch.setattr(security.jwt, "decode", expired_decode)
+    with pytest.raises(ExpiredSignatureServerError):
+        security.verify_jwt(token)
+
+
+def test_jwt_cache_invalidated_by_key_rotation():
+    """Негативный тест: после смены секрета закэшированный токен не принимается"""
+    security.setup_jwt("secret_A", "HS256", 1)
+    token = security.create_jwt(1, "User")
+    security.verify_jwt(token)
+
+    security.setup_jwt("secret_B", "HS256", 1)
+    with pytest.raises(InvalidTokenServerError):
+        security.verify_jwt(token)
+
+
+def test_jwt_cache_is_bounded():
+    """Тест: кэш вытесняет самые старые токены"""
+    security.setup_jwt("secret", "HS256", 1)
+    security.setup_auth(security.AUTH_TOKEN, cache_size=2)
+    try:
+        for user_id in range(5):
+            security.verify_jwt(security.create_jwt(user_id, "User"))
+        assert security.token_cache.stats()["size"] == 2
+    finally:
+        security.setup_auth(security.AUTH_TOKEN)
+
+
 # endregion
@@ -1,15 +1,36 @@
+import logging
+import asyncio
+
 import pytest
 
+from sqlalchemy import text, event
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel, select
 
 import security
+from server import database, migrations, pagination, search, message_writer, user_directory
 from server.controllers.auth import AuthController
-from server.controllers.chat import ChatController
+from server.controllers.chat import ChatController, history_query
+from server.controllers.users import UsersController
+from server.framework import ServerContext, CONNECTED_USERS, OVERFLOW_DROP, OVERFLOW_SPILL
 from server.db_models import User, Message
-from server.exceptions import UnauthorizedError
-from dto.models import RegisterRequest, SendMessageRequest
+from server.exceptions import UnauthorizedError, PacketValidationError
+from dto.models import (
+    RegisterRequest,
+    SendMessageRequest,
+    HistoryRequest,
+    UserListRequest,
+    SearchMessagesRequest,
+)
+
+
+class MockWriter:
+    """Mock для asyncio.StreamWriter"""
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 0)
 
 
 class MockServerContext:
@@ -19,13 +40,23 @@ class MockServerContext:
         self.db_session_maker = session_maker
         self.replies = []
         self.user_id = None
+        self.auth_token = None
+        self.auth_expires_at = 0.0
+        self.auth_generation = -1
         self.connected_users = {}
 
+    bind_auth = ServerContext.bind_auth
+    authenticate = ServerContext.authenticate
+
     def create_session(self):
         return self.db_session_maker()
 
-    async def reply(self, status, data=None):
+    def create_read_session(self):
+        return self.db_session_maker()
+
+    async def reply(self, status, data=None, next_cursor=None):
         self.replies.append((status, data))
+        self.next_cursor = next_cursor
 
     async def reply_error(self, message):
         self.replies.append(("error", message))
@@ -37,6 +68,7 @@ class MockServerContext:
 @pytest.fixture
 async def db_session_maker():
     """Создаёт БД сессию."""
+    user_directory.setup_user_directory()
     engine = create_async_engine("sqlite+aiosqlite:///:memory:")
 
     async with engine.begin() as connection:
@@ -162,3 +194,733 @@ async def test_chat_receiver_not_found(db_session_maker):
     async with db_session_maker() as session:
         result = await session.execute(select(Message))
         assert result.scalars().all() == []
+
+
+@pytest.fixture
+async def file_database(tmp_path):
+    """Настраивает БД в файле с писателем и пулом читателей."""
+    user_directory.setup_user_directory()
+    database.setup_database((tmp_path / "test.db").as_posix(), readers=2)
+    await database.init_db()
+    yield database
+    await database.dispose()
+
+
+async def test_setup_database_applies_pragmas(file_database):
+    """Тест: PRAGMA применяются к соединениям писателя и читателей"""
+    async with database.async_session() as session:
+        assert (await session.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await session.execute(text("PRAGMA synchronous"))).scalar() == 1
+        assert (await session.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+
+    async with database.read_session() as session:
+        assert (await session.execute(text("PRAGMA temp_store"))).scalar() == 2
+        assert (await session.execute(text("PRAGMA query_only"))).scalar() == 1
+
+
+async def test_readers_see_writes_and_cannot_write(file_database):
+    """Тест: читатели видят закоммиченные записи писателя, но сами не пишут"""
+    ctx = ServerContext(
+        None, MockWriter(), database.async_session, read_session_maker=database.read_session
+    )
+    async with ctx.create_session() as session:
+        session.add(User(login="reader", username="Reader", password_hash="123"))
+        await session.commit()
+
+    async with ctx.create_read_session() as session:
+        result = await session.execute(select(User).where(User.login == "reader"))
+        assert result.scalars().first() is not None
+
+        session.add(User(login="other", username="Other", password_hash="123"))
+        with pytest.raises(OperationalError):
+            await session.commit()
+
+
+def test_no_db_tuning_keeps_busy_timeout_for_workers(tmp_path, monkeypatch):
+    """Тест: --no-db-tuning с несколькими воркерами всё равно задаёт busy_timeout"""
+    import main_server
+
+    applied = []
+    monkeypatch.setattr(
+        database, "setup_database", lambda path, pragmas, readers: applied.append(pragmas)
+    )
+    for workers in (1, 2):
+        monkeypatch.setattr(
+            "sys.argv",
+            ["main_server.py", "--no-db-tuning", "--workers", str(workers),
+             "--db-path", str(tmp_path / "t.db")],
+        )
+        main_server.setup_server_database(main_server.parse_args())
+
+    assert applied == [{}, {"busy_timeout": "5000"}]
+
+
+def test_parse_pragmas():
+    """Тест: разбор переопределений --db-pragma"""
+    pragmas = database.parse_pragmas(["synchronous=FULL", "Cache_Size=-4000"])
+    assert pragmas["synchronous"] == "FULL"
+    assert pragmas["cache_size"] == "-4000"
+    assert pragmas["journal_mode"] == "WAL"
+
+    with pytest.raises(ValueError):
+        database.parse_pragmas(["synchronous"])
+    with pytest.raises(ValueError):
+        database.parse_pragmas(["a;b=1"])
+
+
+async def query_plan(session_maker, query) -> list[str]:
+    """Шаги EXPLAIN QUERY PLAN запроса."""
+    sql = query.compile(compile_kwargs={"literal_binds": True})
+    async with session_maker() as session:
+        result = await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        return [row[3] for row in result]
+
+
+async def test_history_query_uses_conversation_index(db_session_maker):
+    """Тест: история - поиск по индексу диалога без сортировки во временном B-tree"""
+    for query in (
+        history_query(2, 1, 20),
+        history_query(2, 1, 20, before_id=1000),
+        history_query(2, 1, 20, after_id=1000),
+    ):
+        plan = await query_plan(db_session_maker, query)
+
+        assert any("message USING INDEX ix_message_conversation" in step for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+async def test_history_returns_conversation_in_order(db_session_maker):
+    """Тест: история диалога в обе стороны, в порядке отправки, без чужих диалогов"""
+    async with db_session_maker() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="123")
+            for index in (1, 2, 3)
+        )
+        await session.commit()
+        session.add_all(
+            [
+                Message(sender_id=1, receiver_id=2, content="1"),
+                Message(sender_id=3, receiver_id=1, content="чужое"),
+                Message(sender_id=2, receiver_id=1, content="2"),
+                Message(sender_id=1, receiver_id=2, content="3"),
+            ]
+        )
+        await session.commit()
+
+    ctx = MockServerContext(db_session_maker)
+    ctx.user_id = 2
+    security.setup_jwt("secret", "HS256", 1)
+    await ChatController(ctx).get_history(
+        HistoryRequest(token=security.create_jwt(2, "User 2"), target_user_id=1, limit=20)
+    )
+
+    status, history = ctx.replies[0]
+    assert status == "message_history_result"
+    assert [item["content"] for item in history] == ["1", "2", "3"]
+    assert [item["is_me"] for item in history] == [False, True, False]
+
+
+async def test_migration_backfills_conversation_key(tmp_path):
+    """Тест: миграция старой базы добавляет ключ диалога, заполняет его и строит индекс"""
+    path = (tmp_path / "old.db").as_posix()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as connection:
+        await connection.execute(
+            text("CREATE TABLE user (id INTEGER PRIMARY KEY, login VARCHAR, username VARCHAR, password_hash VARCHAR)")
+        )
+        await connection.execute(
+            text(
+                "CREATE TABLE message (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, "
+                "content VARCHAR, is_readed BOOLEAN, timestamp DATETIME)"
+            )
+        )
+        await connection.execute(
+            text(
+                "INSERT INTO message (sender_id, receiver_id, content, is_readed, timestamp) "
+                "VALUES (5, 3, 'a', 0, '2024-01-01'), (3, 5, 'b', 0, '2024-01-02')"
+            )
+        )
+    await engine.dispose()
+
+    database.setup_database(path, readers=0)
+    try:
+        await database.init_db()
+        async with database.async_session() as session:
+            keys = (
+                await session.execute(text("SELECT conversation_low, conversation_high FROM message"))
+            ).all()
+            indexes = (await session.execute(text("PRAGMA index_list(message)"))).all()
+            version = (await session.execute(text("PRAGMA user_version"))).scalar()
+
+        assert keys == [(3, 5), (3, 5)]
+        assert any(index[1] == "ix_message_conversation" for index in indexes)
+        assert version == len(migrations.MIGRATIONS)
+
+        await database.init_db()
+    finally:
+        await database.dispose()
+
+
+async def test_history_cursor_pagination(db_session_maker):
+    """Тест: курсор истории ведёт к более ранним сообщениям, after_id - к более новым"""
+    async with db_session_maker() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="123")
+            for index in (1, 2)
+        )
+        await session.commit()
+        session.add_all(
+            Message(sender_id=1 + index % 2, receiver_id=2 - index % 2, content=str(index))
+            for index in range(25)
+        )
+        await session.commit()
+
+    ctx = MockServerContext(db_session_maker)
+    ctx.user_id = 1
+    controller = ChatController(ctx)
+    token = security.create_jwt(1, "User 1")
+
+    pages = []
+    cursor = None
+    while True:
+        await controller.get_history(
+            HistoryRequest(token=token, target_user_id=2, limit=10, cursor=cursor)
+        )
+        pages.append([item["content"] for item in ctx.replies[-1][1]])
+        cursor = ctx.next_cursor
+        if cursor is None:
+            break
+
+    assert pages == [
+        [str(index) for index in range(15, 25)],
+        [str(index) for index in range(5, 15)],
+        [str(index) for index in range(5)],
+    ]
+
+    await controller.get_history(HistoryRequest(token=token, target_user_id=2, limit=3, after_id=20))
+    assert [item["content"] for item in ctx.replies[-1][1]] == ["20", "21", "22"]
+    await controller.get_history(
+        HistoryRequest(token=token, target_user_id=2, limit=3, cursor=ctx.next_cursor)
+    )
+    assert [item["content"] for item in ctx.replies[-1][1]] == ["23", "24"]
+    assert ctx.next_cursor is None
+
+    with pytest.raises(PacketValidationError):
+        await controller.get_history(
+            HistoryRequest(token=token, target_user_id=2, cursor="not a cursor")
+        )
+
+
+async def test_user_list_cursor_pagination(db_session_maker):
+    """Тест: список пользователей по курсору - стабильный порядок по ID без пропусков"""
+    async with db_session_maker() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="123")
+            for index in range(1, 13)
+        )
+        await session.commit()
+
+    ctx = MockServerContext(db_session_maker)
+    ctx.user_id = 1
+    controller = UsersController(ctx)
+    token = security.create_jwt(1, "User 1")
+
+    ids = []
+    cursor = None
+    while True:
+        await controller.get_users(UserListRequest(token=token, page_size=5, cursor=cursor))
+        ids.extend(user["id"] for user in ctx.replies[-1][1])
+        cursor = ctx.next_cursor
+        if cursor is None:
+            break
+
+    assert ids == list(range(1, 13))
+
+    with pytest.raises(PacketValidationError):
+        await controller.get_users(
+            UserListRequest(
+                token=token, page_size=5, cursor=pagination.encode_cursor(pagination.BEFORE, 6)
+            )
+        )
+
+
+async def search_users(controller, token: str, query: str, page_size: int = 20) -> list[str]:
+    """Все страницы поиска пользователей (логины по порядку)."""
+    logins = []
+    cursor = None
+    while True:
+        await controller.get_users(
+            UserListRequest(token=token, search_query=query, page_size=page_size, cursor=cursor)
+        )
+        logins.extend(user["login"] for user in controller.ctx.replies[-1][1])
+        cursor = controller.ctx.next_cursor
+        if cursor is None:
+            return logins
+
+
+SEARCH_USERS = [
+    ("joanna", "Joanna"),
+    ("annabel", "Bel"),
+    ("anna", "Anna"),
+    ("bob", "Bob_Anna%"),
+    ("an_", "Underscore"),
+]
+
+
+@pytest.mark.parametrize("fts", [True, False])
+async def test_user_search_ranked_pages(file_database, db_session_maker, fts):
+    """Тест: поиск - точные совпадения, затем по началу, затем по подстроке (FTS5 и LIKE)"""
+    session_maker = database.async_session if fts else db_session_maker
+    async with session_maker() as session:
+        session.add_all(
+            User(login=login, username=username, password_hash="123")
+            for login, username in SEARCH_USERS
+        )
+        await session.commit()
+
+    plan = await query_plan(session_maker, search.user_search_query("anna", fts))
+    assert any("VIRTUAL TABLE" in step for step in plan) is fts
+
+    ctx = MockServerContext(session_maker)
+    controller = UsersController(ctx)
+    token = security.create_jwt(1, "Joanna")
+
+    assert await search_users(controller, token, "ANNA", page_size=2) == [
+        "anna", "annabel", "joanna", "bob"
+    ]
+    assert await search_users(controller, token, "an_") == ["an_"]
+    assert await search_users(controller, token, "a%") == ["bob"]
+    assert await search_users(controller, token, "nn") == ["joanna", "annabel", "anna", "bob"]
+
+
+async def test_user_search_index_follows_changes(file_database):
+    """Тест: FTS индекс пользователей обновляется при регистрации, изменении и удалении"""
+    ctx = MockServerContext(database.async_session)
+    await AuthController(ctx).register(
+        RegisterRequest(login="first_user", username="Someone", password_hash="123" * 10)
+    )
+    controller = UsersController(ctx)
+    token = ctx.replies[-1][1]
+    assert await search_users(controller, token, "first") == ["first_user"]
+
+    async with database.async_session() as session:
+        user = (await session.execute(select(User))).scalars().one()
+        user.login = "renamed_user"
+        await session.commit()
+    assert await search_users(controller, token, "first") == []
+    assert await search_users(controller, token, "renamed") == ["renamed_user"]
+
+    async with database.async_session() as session:
+        await session.delete(await session.get(User, user.id))
+        await session.commit()
+    assert await search_users(controller, token, "renamed") == []
+
+
+async def test_migration_indexes_existing_rows(tmp_path):
+    """Тест: миграции строят поисковые индексы по уже существующим пользователям и сообщениям"""
+    path = (tmp_path / "old.db").as_posix()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+        await connection.execute(
+            text("INSERT INTO user (login, username, password_hash) VALUES ('old_login', 'Old', 'x')")
+        )
+        await connection.execute(
+            text(
+                "INSERT INTO message (sender_id, receiver_id, content, is_readed, timestamp, "
+                "conversation_low, conversation_high) VALUES (1, 1, 'old note', 0, '2024-01-01', 1, 1)"
+            )
+        )
+        await connection.execute(text("PRAGMA user_version = 1"))
+    await engine.dispose()
+
+    database.setup_database(path, readers=0)
+    try:
+        await database.init_db()
+        async with database.async_session() as session:
+            result = await session.execute(
+                text("SELECT rowid FROM user_search WHERE user_search MATCH '\"d_log\"'")
+            )
+            assert result.scalars().all() == [1]
+
+            result = await session.execute(
+                text("SELECT rowid FROM message_search WHERE message_search MATCH 'note'")
+            )
+            assert result.scalars().all() == [1]
+
+            await session.execute(
+                text("INSERT INTO message_search (message_search) VALUES ('delete-all')")
+            )
+            await session.commit()
+
+        assert await database.rebuild_search() == ["message_search", "user_search"]
+        async with database.async_session() as session:
+            result = await session.execute(
+                text("SELECT rowid FROM message_search WHERE message_search MATCH 'note'")
+            )
+            assert result.scalars().all() == [1]
+    finally:
+        await database.dispose()
+
+
+def test_ranked_cursor_roundtrip():
+    """Тест: курсор поиска хранит (ранг, ID) и отклоняет чужие курсоры"""
+    cursor = pagination.encode_ranked_cursor(2, 150)
+    assert pagination.decode_ranked_cursor(cursor) == (2, 150)
+
+    with pytest.raises(PacketValidationError):
+        pagination.decode_ranked_cursor(pagination.encode_cursor(pagination.AFTER, 5))
+    with pytest.raises(PacketValidationError):
+        pagination.decode_cursor(cursor)
+
+
+async def search_messages(controller, token: str, query: str, **kwargs) -> list[int]:
+    """Все страницы поиска сообщений (ID по порядку)."""
+    ids = []
+    cursor = None
+    while True:
+        await controller.search_messages(
+            SearchMessagesRequest(token=token, query=query, cursor=cursor, **kwargs)
+        )
+        ids.extend(item["id"] for item in controller.ctx.replies[-1][1])
+        cursor = controller.ctx.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("fts", [True, False])
+async def test_search_messages_in_own_conversations(file_database, db_session_maker, fts):
+    """Тест: поиск сообщений - только свои диалоги, от новых к старым, по страницам"""
+    session_maker = database.async_session if fts else db_session_maker
+    async with session_maker() as session:
+        session.add_all(
+            User(login=f"user{index}", username=f"User {index}", password_hash="123")
+            for index in range(1, 4)
+        )
+        await session.commit()
+        session.add_all(
+            [
+                Message(sender_id=1, receiver_id=2, content="привет, мир"),
+                Message(sender_id=3, receiver_id=1, content="мир труд май"),
+                Message(sender_id=2, receiver_id=3, content="секретный мир"),
+                Message(sender_id=2, receiver_id=1, content="мир и договор"),
+                Message(sender_id=1, receiver_id=3, content="просто текст"),
+            ]
+        )
+        await session.commit()
+
+    ctx = MockServerContext(session_maker)
+    controller = ChatController(ctx)
+    token = security.create_jwt(1, "User 1")
+
+    assert await search_messages(controller, token, "мир") == [4, 2, 1]
+    assert await search_messages(controller, token, "мир", limit=1) == [4, 2, 1]
+    assert await search_messages(controller, token, "мир", target_user_id=3) == [2]
+    assert await search_messages(controller, token, "труд, мир") == [2]
+    assert await search_messages(controller, token, "секретный") == []
+
+    if fts:
+        assert await search_messages(controller, token, "МИР ТРУД") == [2]
+        await controller.search_messages(SearchMessagesRequest(token=token, query="труд"))
+        assert ctx.replies[-1][1][0]["snippet"] == "мир [труд] май"
+        assert ctx.replies[-1][1][0]["sender_login"] == "user3"
+
+        plan = await query_plan(
+            session_maker, search.message_search_query("мир", 1, True, before_id=10)
+        )
+        assert any("VIRTUAL TABLE" in step for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+    with pytest.raises(PacketValidationError):
+        await controller.search_messages(SearchMessagesRequest(token=token, query="?!"))
+    with pytest.raises(PacketValidationError):
+        await controller.search_messages(
+            SearchMessagesRequest(
+                token=token, query="мир", cursor=pagination.encode_cursor(pagination.AFTER, 1)
+            )
+        )
+
+
+async def test_message_writer_groups_inserts(file_database):
+    """Тест: одновременные сообщения пишутся пачками, ID - в порядке постановки"""
+    writer = message_writer.MessageWriter(database.async_session, max_batch=8, max_wait_ms=5)
+    writer.start()
+    try:
+        results = await asyncio.gather(
+            *(writer.write(1 + index % 2, 2 - index % 2, f"пачка {index}") for index in range(20))
+        )
+        writer.mark_read(results[0][0])
+    finally:
+        await writer.close()
+
+    ids = [message_id for message_id, _ in results]
+    assert ids == sorted(ids) and len(set(ids)) == 20
+    assert writer.stats()["messages"] == 20
+    assert writer.stats()["batches"] == 3
+    assert writer.stats()["max_batch_seen"] == 8
+
+    async with database.async_session() as session:
+        messages = (await session.execute(select(Message).order_by(Message.id))).scalars().all()
+        found = await session.execute(
+            text("SELECT count(*) FROM message_search WHERE message_search MATCH 'пачка'")
+        )
+    assert [message.content for message in messages] == [f"пачка {index}" for index in range(20)]
+    assert all((m.conversation_low, m.conversation_high) == (1, 2) for m in messages)
+    assert [m.is_readed for m in messages] == [True] + [False] * 19
+    assert found.scalar() == 20
+
+    assert (await writer.write(1, 2, "после остановки"))[0] == ids[-1] + 1
+
+
+async def test_message_writer_fails_whole_batch(db_session_maker):
+    """Тест: ошибка транзакции пачки приходит каждому отправителю"""
+
+    class BrokenSession:
+        async def __aenter__(self):
+            raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+
+        async def __aexit__(self, *exc):
+            return False
+
+    writer = message_writer.MessageWriter(BrokenSession, max_batch=4, max_wait_ms=5)
+    writer.start()
+    try:
+        results = await asyncio.gather(
+            *(writer.write(1, 2, "x") for _ in range(3)), return_exceptions=True
+        )
+    finally:
+        await writer.close()
+
+    assert all(isinstance(result, OperationalError) for result in results)
+
+
+async def test_message_writer_retries_failed_batch_by_row(db_session_maker):
+    """Тест: одна плохая строка не отменяет пачку, отметки о прочтении пишутся без новых сообщений"""
+    writer = message_writer.MessageWriter(db_session_maker, max_batch=4, max_wait_ms=5)
+    first_id, _ = await writer.write(1, 2, "прочитано")
+    writer.start()
+    try:
+        writer.mark_read(first_id)
+        results = await asyncio.gather(
+            writer.write(1, 2, "хорошее"), writer.write(1, 2, None), return_exceptions=True
+        )
+
+        # Писатель простаивает: отметка записана сразу, а не со следующей пачкой
+        assert writer.read_ids == []
+        async with db_session_maker() as session:
+            messages = (
+                await session.execute(select(Message).order_by(Message.id))
+            ).scalars().all()
+    finally:
+        await writer.close()
+
+    assert isinstance(results[0], tuple)
+    assert isinstance(results[1], IntegrityError)
+    assert [(m.content, m.is_readed) for m in messages] == [("прочитано", True), ("хорошее", False)]
+    assert messages[0].timestamp.tzinfo is None
+
+
+async def test_message_writer_drops_failing_read_mark(db_session_maker, monkeypatch, caplog):
+    """Негативный тест: отметка, не записанная дважды, отбрасывается и не ломает следующие пачки"""
+    write_batch = message_writer.write_batch
+    calls = []
+
+    async def failing_read_mark(session_maker, rows, read_ids=()):
+        calls.append((len(rows), list(read_ids)))
+        if 999 in read_ids:
+            raise OperationalError("UPDATE", {}, Exception("disk I/O error"))
+        return await write_batch(session_maker, rows, read_ids)
+
+    monkeypatch.setattr(message_writer, "write_batch", failing_read_mark)
+    writer = message_writer.MessageWriter(db_session_maker, max_batch=4, max_wait_ms=5)
+    writer.start()
+    try:
+        with caplog.at_level(logging.ERROR):
+            writer.mark_read(999)
+            first = await writer.write(1, 2, "первое")
+        calls.clear()
+        second = await writer.write(1, 2, "второе")
+    finally:
+        await writer.close()
+
+    assert first[0] + 1 == second[0]
+    assert calls == [(1, [])]
+    assert writer.read_ids == []
+    assert any("999" in record.getMessage() for record in caplog.records)
+
+
+async def test_send_message_through_writer(db_session_maker):
+    """Тест: send_message пишет через групповую запись и отвечает после commit"""
+    async with db_session_maker() as session:
+        session.add_all(
+            [
+                User(login="sender", username="Sender", password_hash="123"),
+                User(login="receiver", username="Receiver", password_hash="123"),
+            ]
+        )
+        await session.commit()
+
+    message_writer.setup_message_writer(db_session_maker, max_batch=16, max_wait_ms=1)
+    try:
+        ctx = MockServerContext(db_session_maker)
+        controller = ChatController(ctx)
+        token = security.create_jwt(1, "Sender")
+        await asyncio.gather(
+            *(
+                controller.send_message(
+                    SendMessageRequest(token=token, receiver_id=2, content=f"m{index}")
+                )
+                for index in range(5)
+            )
+        )
+        stats = message_writer.writer.stats()
+    finally:
+        await message_writer.shutdown()
+
+    assert ctx.replies == [("success", "Сообщение отправлено!")] * 5
+    assert stats["messages"] == 5
+    async with db_session_maker() as session:
+        result = await session.execute(select(Message.content))
+        assert sorted(result.scalars().all()) == [f"m{index}" for index in range(5)]
+
+
+def test_user_directory_lru_and_update():
+    """Тест: кэш пользователей ограничен LRU, считает попадания и обновляется через put"""
+    directory = user_directory.UserDirectory(max_size=2)
+    directory.put(1, "alice", "Alice")
+    directory.put(2, "bob", "Bob")
+    assert directory.get(1).login == "alice"
+
+    directory.put(3, "carol", "Carol")
+    assert directory.get(2) is None
+    assert directory.get(3).username == "Carol"
+
+    directory.put(3, "carol", "Carolyn")
+    assert directory.get(3).username == "Carolyn"
+    assert directory.stats() == {"hits": 3, "misses": 1, "hit_rate": 0.75, "size": 2}
+
+    disabled = user_directory.UserDirectory(max_size=0)
+    disabled.put(1, "alice", "Alice")
+    assert disabled.get(1) is None
+
+
+async def test_user_directory_resolves_misses_from_db(db_session_maker):
+    """Тест: промахи читаются одним запросом, несуществующие пользователи не кэшируются"""
+    async with db_session_maker() as session:
+        session.add_all(
+            [
+                User(id=1, login="alice", username="Alice", password_hash="h"),
+                User(id=2, login="bob", username="Bob", password_hash="h"),
+            ]
+        )
+        await session.commit()
+
+    directory = user_directory.UserDirectory()
+    found = await directory.resolve(db_session_maker, [1, 2, 3, 1])
+    assert {user_id: entry.login for user_id, entry in found.items()} == {1: "alice", 2: "bob"}
+    assert directory.stats()["size"] == 2
+
+    directory.clear()
+    assert await directory.warm(db_session_maker) == 2
+    assert directory.get(2).username == "Bob"
+
+
+async def test_user_directory_invalidate_after_rename_and_delete(db_session_maker):
+    """Тест: после invalidate кэш перечитывает переименованного и забывает удалённого"""
+    async with db_session_maker() as session:
+        session.add_all(
+            [
+                User(id=1, login="alice", username="Alice", password_hash="h"),
+                User(id=2, login="bob", username="Bob", password_hash="h"),
+            ]
+        )
+        await session.commit()
+
+    directory = user_directory.setup_user_directory()
+    await directory.resolve(db_session_maker, [1, 2])
+
+    async with db_session_maker() as session:
+        (await session.get(User, 1)).login = "alice2"
+        await session.delete(await session.get(User, 2))
+        await session.commit()
+
+    assert (await directory.resolve(db_session_maker, [1]))[1].login == "alice"
+
+    user_directory.invalidate(1)
+    user_directory.invalidate(2)
+    found = await directory.resolve(db_session_maker, [1, 2])
+    assert found[1].login == "alice2"
+    assert 2 not in found
+
+
+async def test_send_message_skips_user_reads(db_session_maker):
+    """Тест: после регистрации отправка сообщения не читает таблицу user"""
+    ctx = MockServerContext(db_session_maker)
+    for login in ("alice", "bob"):
+        await AuthController(ctx).register(
+            RegisterRequest(login=login, username=login.title(), password_hash="h" * 64)
+        )
+    token = ctx.replies[-1][1]
+
+    statements = []
+    engine = db_session_maker.kw["bind"].sync_engine
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        await ChatController(ctx).send_message(
+            SendMessageRequest(token=token, receiver_id=1, content="Привет")
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert ctx.replies[-1] == ("success", "Сообщение отправлено!")
+    assert not [statement for statement in statements if "FROM user" in statement]
+
+    user_directory.directory.clear()
+    await ChatController(ctx).send_message(
+        SendMessageRequest(token=token, receiver_id=1, content="Ещё")
+    )
+    assert user_directory.directory.get(1).login == "alice"
+
+
+async def test_send_message_from_missing_sender(db_session_maker):
+    """Негативный тест: токен пользователя, которого нет в БД, - ошибка, а не KeyError"""
+    async with db_session_maker() as session:
+        session.add(User(id=1, login="alice", username="Alice", password_hash="h"))
+        await session.commit()
+
+    ctx = MockServerContext(db_session_maker)
+    await ChatController(ctx).send_message(
+        SendMessageRequest(token=security.create_jwt(99, "Ghost"), receiver_id=1, content="Привет")
+    )
+
+    assert ctx.replies[-1] == ("error", "Отправитель не найден!")
+    async with db_session_maker() as session:
+        assert (await session.execute(select(Message))).scalars().all() == []
+
+
+async def test_send_message_overflow_drop_marks_read(db_session_maker):
+    """Тест: при переполнении очереди получателя drop помечает сообщение прочитанным, spill - нет"""
+    async with db_session_maker() as session:
+        session.add_all(
+            [
+                User(id=1, login="sender", username="Sender", password_hash="h"),
+                User(id=2, login="receiver", username="Receiver", password_hash="h"),
+            ]
+        )
+        await session.commit()
+
+    ctx = MockServerContext(db_session_maker)
+    token = security.create_jwt(1, "Sender")
+    try:
+        for policy in (OVERFLOW_DROP, OVERFLOW_SPILL):
+            CONNECTED_USERS[2] = ServerContext(None, MockWriter(), None, 8, 0, policy)
+            await ChatController(ctx).send_message(
+                SendMessageRequest(token=token, receiver_id=2, content=policy)
+            )
+    finally:
+        CONNECTED_USERS.pop(2, None)
+
+    async with db_session_maker() as session:
+        messages = (await session.execute(select(Message).order_by(Message.id))).scalars().all()
+    assert [(m.content, m.is_readed) for m in messages] == [("drop", True), ("spill", False)]
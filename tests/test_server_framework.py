@@ -0,0 +1,518 @@
+import json
+import asyncio
+from typing import Literal
+
+import pytest
+
+from server.framework import (
+    ServerRouter,
+    ServerContext,
+    BaseController,
+    action,
+    authorized,
+    OVERFLOW_DROP,
+    OVERFLOW_DISCONNECT,
+    OVERFLOW_SPILL,
+    CONNECTED_USERS,
+    deliver_to_user,
+)
+import security
+from dto.models import BasePacket
+from server.exceptions import CodecError
+from protocol.compression import Compressor, COMPRESSION_ZLIB
+from protocol.framing import FLAG_COMPRESSED, FRAMING_BINARY, frame_aad
+from server import crypto_executor
+
+
+class MockWriter:
+    """Mock для asyncio.StreamWriter, собирающий ответы сервера"""
+
+    def __init__(self):
+        self.responses = []
+        self.batches = 0
+        self.closed = False
+        self.blocked = asyncio.Event()
+        self.blocked.set()
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 0)
+
+    def writelines(self, parts):
+        self.batches += 1
+        for line in b"".join(parts).splitlines():
+            self.responses.append(json.loads(line))
+
+    async def drain(self):
+        await self.blocked.wait()
+
+    def close(self):
+        self.closed = True
+
+
+class SleepRequest(BasePacket):
+    """Тестовый пакет с задержкой обработки"""
+
+    action: Literal["sleep"] = "sleep"
+    delay: float
+    key: int = 0
+
+
+class OrderedSleepRequest(SleepRequest):
+    """Тестовый пакет с задержкой и ключом порядка"""
+
+    action: Literal["ordered_sleep"] = "ordered_sleep"
+
+
+class PushRequest(BasePacket):
+    """Тестовый пакет отправки в чужое соединение"""
+
+    action: Literal["push"] = "push"
+
+
+class SleepController(BaseController):
+    """Тестовый контроллер"""
+
+    running = 0
+    max_running = 0
+
+    @action("sleep")
+    async def sleep(self, req: SleepRequest):
+        SleepController.running += 1
+        SleepController.max_running = max(SleepController.max_running, SleepController.running)
+        await asyncio.sleep(req.delay)
+        SleepController.running -= 1
+        await self.ctx.reply("success", str(req.delay))
+
+    @action("ordered_sleep", ordered_by="key")
+    async def ordered_sleep(self, req: OrderedSleepRequest):
+        await asyncio.sleep(req.delay)
+        await self.ctx.reply("success", str(req.delay))
+
+
+def make_context(
+    max_inflight: int = 8, queue_size: int = 256, policy: str = OVERFLOW_SPILL
+) -> tuple[ServerContext, MockWriter]:
+    """Создаёт серверный контекст с mock writer."""
+    writer = MockWriter()
+    return ServerContext(None, writer, None, max_inflight, queue_size, policy), writer
+
+
+def make_router() -> ServerRouter:
+    """Создаёт роутер с тестовым контроллером."""
+    SleepController.running = 0
+    SleepController.max_running = 0
+    router = ServerRouter()
+    router.register(SleepController)
+    return router
+
+
+def packet(fields: dict) -> bytes:
+    """Кодирует пакет так, как он приходит после расшифровки."""
+    return json.dumps(fields).encode()
+
+
+async def wait_all(ctx: ServerContext):
+    """Дожидается всех запросов соединения."""
+    while ctx.tasks:
+        await asyncio.gather(*ctx.tasks)
+    await ctx.flush()
+
+
+async def test_pipelined_responses_in_completion_order():
+    """Тест: быстрый запрос не ждёт медленный, ответы несут свой request_id"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"action": "sleep", "delay": 0.05, "request_id": 1}))
+    await router.submit(ctx, packet({"action": "sleep", "delay": 0, "request_id": 2}))
+    await wait_all(ctx)
+
+    assert [r["request_id"] for r in writer.responses] == [2, 1]
+
+
+async def test_ordered_by_keeps_order_for_same_key():
+    """Тест: запросы с одинаковым ключом порядка выполняются по очереди"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"action": "ordered_sleep", "delay": 0.05, "key": 1, "request_id": 1}))
+    await router.submit(ctx, packet({"action": "ordered_sleep", "delay": 0, "key": 1, "request_id": 2}))
+    await router.submit(ctx, packet({"action": "ordered_sleep", "delay": 0, "key": 2, "request_id": 3}))
+    await wait_all(ctx)
+
+    order = [r["request_id"] for r in writer.responses]
+    assert order.index(1) < order.index(2)
+    assert order[0] == 3
+    assert ctx.order_tails == {}
+
+
+async def test_max_inflight_bounds_concurrency():
+    """Тест: одновременно выполняется не больше max_inflight запросов"""
+    router = make_router()
+    ctx, writer = make_context(max_inflight=2)
+
+    for request_id in range(1, 6):
+        await router.submit(ctx, packet({"action": "sleep", "delay": 0.01, "request_id": request_id}))
+    await wait_all(ctx)
+
+    assert SleepController.max_running == 2
+    assert len(writer.responses) == 5
+
+
+async def test_request_without_id_is_sequential():
+    """Тест: запрос без request_id (старый клиент) выполняется сразу и без ID в ответе"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"action": "sleep", "delay": 0}))
+    await ctx.flush()
+
+    assert ctx.tasks == set()
+    assert writer.responses[0]["request_id"] is None
+
+
+async def test_pipelined_error_reply_has_request_id():
+    """Негативный тест: ошибка валидации возвращается с request_id запроса"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"action": "sleep", "request_id": 7}))
+    await wait_all(ctx)
+
+    assert writer.responses[0]["action"] == "error"
+    assert writer.responses[0]["request_id"] == 7
+
+
+async def test_push_to_other_connection_has_no_request_id():
+    """Тест: ответ в чужое соединение во время обработки запроса не получает его request_id"""
+    router = make_router()
+    ctx, _ = make_context()
+    other_ctx, other_writer = make_context()
+
+    class PushController(BaseController):
+        @action("push")
+        async def push(self, req: PushRequest):
+            await other_ctx.reply("new_message", "hi")
+
+    router.register(PushController)
+    await router.submit(ctx, packet({"action": "push", "request_id": 3}))
+    await wait_all(ctx)
+    await other_ctx.flush()
+
+    assert other_writer.responses[0]["request_id"] is None
+
+
+async def test_push_to_own_connection_is_not_a_reply():
+    """Тест: сообщение самому себе приходит push-фреймом без request_id и с лимитом очереди"""
+    router = make_router()
+    ctx, writer = make_context(queue_size=1, policy=OVERFLOW_DROP)
+    ctx.user_id = 42
+    delivered = []
+
+    class SelfPushController(BaseController):
+        @action("push")
+        async def push(self, req: PushRequest):
+            delivered.append(await deliver_to_user(42, "new_message", "hi"))
+            await self.ctx.reply("success", "sent")
+
+    router.register(SelfPushController)
+    CONNECTED_USERS[42] = ctx
+    writer.blocked.clear()
+    try:
+        await ctx.reply("new_message", "busy")
+        await asyncio.sleep(0)
+        await router.submit(ctx, packet({"action": "push", "request_id": 5}))
+        await router.submit(ctx, packet({"action": "push", "request_id": 6}))
+        while ctx.tasks:
+            await asyncio.gather(*ctx.tasks)
+        writer.blocked.set()
+        await ctx.flush()
+    finally:
+        del CONNECTED_USERS[42]
+
+    assert delivered == [True, True]
+    assert ctx.dropped_frames == 1
+    pushes = [r for r in writer.responses if r["action"] == "new_message"]
+    assert [r["request_id"] for r in pushes] == [None, None]
+    replies = [r["request_id"] for r in writer.responses if r["action"] == "success"]
+    assert replies == [5, 6]
+
+
+async def test_ready_frames_coalesced_into_one_write():
+    """Тест: все готовые фреймы уходят одним writelines"""
+    ctx, writer = make_context()
+
+    for i in range(5):
+        assert await ctx.reply("new_message", str(i))
+    assert ctx.outbound_depth == 5
+
+    await ctx.flush()
+
+    assert writer.batches == 1
+    assert [r["data"] for r in writer.responses] == ["0", "1", "2", "3", "4"]
+    assert ctx.outbound_depth == 0
+
+
+async def test_slow_receiver_does_not_block_sender():
+    """Тест: reply в зависшее соединение не ждёт drain"""
+    ctx, writer = make_context()
+    writer.blocked.clear()
+
+    await ctx.reply("new_message", "first")
+    await asyncio.sleep(0)
+    assert await asyncio.wait_for(ctx.reply("new_message", "second"), 0.1)
+
+    writer.blocked.set()
+    await ctx.flush()
+    assert len(writer.responses) == 2
+
+
+async def test_overflow_drop_and_spill_reject_push():
+    """Негативный тест: при переполнении push-фрейм не ставится в очередь"""
+    for policy, counter, delivered in (
+        (OVERFLOW_DROP, "dropped_frames", True),
+        (OVERFLOW_SPILL, "spilled_frames", False),
+    ):
+        ctx, writer = make_context(queue_size=1, policy=policy)
+        writer.blocked.clear()
+
+        assert await ctx.reply("new_message", "1")
+        await asyncio.sleep(0)
+        assert await ctx.reply("new_message", "2")
+        # drop: доставка считается выполненной, spill: сообщение остаётся непрочитанным
+        assert await ctx.reply("new_message", "3") is delivered
+
+        assert getattr(ctx, counter) == 1
+        assert writer.closed is False
+        writer.blocked.set()
+        await ctx.flush()
+        assert [r["data"] for r in writer.responses] == ["1", "2"]
+        await ctx.close_outbound()
+
+
+async def test_overflow_disconnect_closes_connection():
+    """Негативный тест: при переполнении с политикой disconnect соединение закрывается"""
+    ctx, writer = make_context(queue_size=1, policy=OVERFLOW_DISCONNECT)
+    writer.blocked.clear()
+
+    await ctx.reply("new_message", "1")
+    await asyncio.sleep(0)
+    await ctx.reply("new_message", "2")
+
+    assert await ctx.reply("new_message", "3") is False
+    assert writer.closed is True
+    assert await ctx.reply("new_message", "4") is False
+    await ctx.close_outbound(timeout=0)
+
+
+async def test_own_responses_ignore_queue_limit():
+    """Тест: ответы на собственные запросы соединения не отбрасываются"""
+    router = make_router()
+    ctx, writer = make_context(queue_size=1, policy=OVERFLOW_DROP)
+
+    for request_id in range(1, 4):
+        await router.submit(ctx, packet({"action": "sleep", "delay": 0, "request_id": request_id}))
+    await wait_all(ctx)
+
+    assert len(writer.responses) == 3
+    assert ctx.dropped_frames == 0
+
+
+async def test_seal_and_open_payload_with_compression():
+    """Тест: большой пакет сжимается до шифрования и восстанавливается на приёме"""
+    secret = security.generate_fernet_key()
+    ctx, _ = make_context()
+    ctx.compressor = Compressor(COMPRESSION_ZLIB, threshold=64)
+    ctx.cipher = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_SERVER
+    )
+    client_cipher = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_CLIENT
+    )
+    payload = json.dumps([{"id": i, "content": "hello"} for i in range(100)]).encode()
+
+    sealed, flags = ctx.seal_payload(payload)
+
+    assert flags & FLAG_COMPRESSED
+    assert len(sealed) < len(payload)
+    assert ctx.compressor.decompress(client_cipher.decrypt(sealed), flags) == payload
+
+    compressed, flags = ctx.compressor.compress(payload)
+    assert ctx.open_payload(client_cipher.encrypt(compressed), flags) == payload
+
+
+async def test_concurrent_replies_keep_nonce_order():
+    """Тест: ответы, зашифрованные в пуле параллельно, уходят в порядке счётчика nonce"""
+    secret = security.generate_fernet_key()
+    frames = []
+    writer = MockWriter()
+    writer.writelines = lambda parts: frames.append(parts)
+    ctx = ServerContext(None, writer, None)
+    ctx.framing = FRAMING_BINARY
+    ctx.cipher = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_SERVER
+    )
+    client_cipher = security.create_session_cipher(
+        security.CIPHER_AES_GCM, secret, security.DIRECTION_CLIENT
+    )
+
+    crypto_executor.setup_crypto_executor(4, threshold=0)
+    try:
+        await asyncio.gather(*(ctx.reply("success", "x" * (i * 5000)) for i in range(20, 0, -1)))
+        await ctx.close_outbound()
+    finally:
+        crypto_executor.setup_crypto_executor(0)
+
+    assert len(frames) == 20
+    for header, payload in frames:
+        flags = header[4]
+        client_cipher.decrypt(payload, frame_aad(FRAMING_BINARY, flags))
+
+
+async def test_missing_action_replies_error():
+    """Негативный тест: пакет без action"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"delay": 0, "request_id": 4}))
+    await ctx.flush()
+
+    assert writer.responses[0]["action"] == "error"
+    assert writer.responses[0]["data"].startswith("MissingActionError")
+    assert writer.responses[0]["request_id"] == 4
+
+
+async def test_unknown_action_replies_error():
+    """Негативный тест: незарегистрированный action"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    await router.submit(ctx, packet({"action": "nope"}))
+    await ctx.flush()
+
+    assert writer.responses[0]["data"].startswith("UnknownActionError")
+
+
+async def test_invalid_packet_raises_codec_error():
+    """Негативный тест: недействительный JSON не доходит до эндпоинтов"""
+    router = make_router()
+    ctx, _ = make_context()
+
+    with pytest.raises(CodecError):
+        await router.submit(ctx, b"{not json")
+    with pytest.raises(CodecError):
+        await router.submit(ctx, b"[1, 2]")
+
+
+async def test_route_is_precompiled_and_controller_reused():
+    """Тест: модель запроса вычисляется при регистрации, контроллер соединения переиспользуется"""
+    router = make_router()
+    ctx, writer = make_context()
+
+    route = router.routes["sleep"]
+    assert route.request_model is SleepRequest
+    assert route.arity == 1
+    assert router.routes["ordered_sleep"].ordered_by == "key"
+
+    await router.submit(ctx, packet({"action": "sleep", "delay": 0}))
+    await router.submit(ctx, packet({"action": "sleep", "delay": 0}))
+    await ctx.flush()
+
+    assert len(writer.responses) == 2
+    assert list(ctx.controllers) == [SleepController]
+
+
+async def test_untyped_route_receives_dict():
+    """Тест: эндпоинт без модели запроса получает словарь пакета"""
+    router = make_router()
+    ctx, writer = make_context()
+    received = []
+
+    class RawController(BaseController):
+        @action("raw")
+        async def raw(self, req: dict):
+            received.append(req)
+            await self.ctx.reply("success")
+
+    router.register(RawController)
+    await router.submit(ctx, packet({"action": "raw", "value": 1}))
+    await ctx.flush()
+
+    assert received == [{"action": "raw", "value": 1}]
+    assert writer.responses[0]["action"] == "success"
+
+
+class SecretRequest(BasePacket):
+    """Тестовый пакет, требующий авторизации"""
+
+    action: Literal["secret"] = "secret"
+
+
+class SecretController(BaseController):
+    """Тестовый контроллер с авторизацией"""
+
+    @action("secret")
+    @authorized
+    async def secret(self, req: SecretRequest):
+        await self.ctx.reply("success", str(self.ctx.user_id))
+
+
+def count_jwt_checks(monkeypatch) -> list:
+    """Подсчитывает вызовы verify_jwt."""
+    calls = []
+    verify_jwt = security.verify_jwt
+
+    def counting_verify(token):
+        calls.append(token)
+        return verify_jwt(token)
+
+    monkeypatch.setattr(security, "verify_jwt", counting_verify)
+    return calls
+
+
+async def test_connection_auth_skips_jwt_until_exp(monkeypatch):
+    """Тест: в режиме connection токен соединения проверяется один раз"""
+    security.setup_jwt("secret", "HS256", 1)
+    security.setup_auth(security.AUTH_CONNECTION)
+    try:
+        calls = count_jwt_checks(monkeypatch)
+        router = ServerRouter()
+        router.register(SecretController)
+        ctx, writer = make_context()
+        token = security.create_jwt(9, "User")
+
+        for _ in range(3):
+            await router.submit(ctx, packet({"action": "secret", "token": token}))
+        await ctx.flush()
+
+        assert [response["data"] for response in writer.responses] == ["9"] * 3
+        assert calls == [token]
+
+        monkeypatch.setattr(security.time, "time", lambda: ctx.auth_expires_at + 1)
+        await router.submit(ctx, packet({"action": "secret", "token": token}))
+        await ctx.flush()
+
+        assert len(calls) == 2
+    finally:
+        security.setup_auth(security.AUTH_TOKEN)
+
+
+async def test_connection_auth_rechecks_after_key_rotation(monkeypatch):
+    """Негативный тест: смена секрета отзывает авторизацию соединения"""
+    security.setup_jwt("secret_A", "HS256", 1)
+    security.setup_auth(security.AUTH_CONNECTION)
+    try:
+        router = ServerRouter()
+        router.register(SecretController)
+        ctx, writer = make_context()
+        token = security.create_jwt(9, "User")
+
+        await router.submit(ctx, packet({"action": "secret", "token": token}))
+        security.setup_jwt("secret_B", "HS256", 1)
+        await router.submit(ctx, packet({"action": "secret", "token": token}))
+        await ctx.flush()
+
+        assert writer.responses[0]["data"] == "9"
+        assert writer.responses[1]["data"].startswith("InvalidTokenServerError")
+    finally:
+        security.setup_auth(security.AUTH_TOKEN)